@@ -10,7 +10,9 @@ from typing import Optional, Dict, Any
 from database.users import is_admin_user
 from handlers.keyboards import get_back_inline_keyboard, get_confirmation_keyboard
 from database.core import get_exchange_rate
+from database.settings import get_settings, load_settings
 from api.client import get_api_client, set_api_token, close_api_client
+from api.catalog import get_catalog
 from cache import clear_cache
 
 logger = logging.getLogger(__name__)
@@ -86,8 +88,8 @@ async def list_api_services(callback: types.CallbackQuery, db_pool):
     await callback.answer()
     await callback.message.edit_text("⏳ جاري جلب الخدمات من Mousa Card...")
     
-    api = get_api_client()
-    products = await api.get_products()
+    catalog = await get_catalog()
+    products = catalog.products
     
     if not products:
         await callback.message.edit_text(
@@ -101,13 +103,8 @@ async def list_api_services(callback: types.CallbackQuery, db_pool):
         )
         return
     
-    # تجميع الخدمات حسب الفئة
-    categories = {}
-    for p in products:
-        cat_name = p.get('category_name', 'عام')
-        if cat_name not in categories:
-            categories[cat_name] = []
-        categories[cat_name].append(p)
+    # تجميع الخدمات حسب الفئة (محسوب مسبقاً في فهرس الكتالوج)
+    categories = catalog.categories
     
     # بناء النص
     text = f"📋 **خدمات Mousa Card**\n\n"
@@ -189,14 +186,9 @@ async def search_api_services_result(message: types.Message, state: FSMContext,
     
     await message.answer(f"⏳ جاري البحث عن '{keyword}'...")
     
-    api = get_api_client()
-    products = await api.get_products()
-    
-    # فلترة النتائج
-    results = []
-    for p in products:
-        if keyword in p['name'].lower() or keyword in str(p['id']):
-            results.append(p)
+    # بحث مرتب عبر فهرس الـ trigram (بدلاً من المرور على كل المنتجات)
+    catalog = await get_catalog()
+    results = catalog.search(keyword)
     
     if not results:
         await message.answer(
@@ -248,8 +240,12 @@ async def view_product_detail(callback: types.CallbackQuery, state: FSMContext,
     
     await callback.message.edit_text("⏳ جاري جلب تفاصيل الخدمة...")
     
-    api = get_api_client()
-    product = await api.get_product_details(service_id)
+    # البحث بالمعرف في الفهرس أولاً، ثم من API إذا لم تكن الخدمة مفهرسة
+    catalog = await get_catalog()
+    product = catalog.get(service_id)
+    if not product:
+        api = get_api_client()
+        product = await api.get_product_details(service_id)
     
     if not product:
         await callback.message.edit_text(
@@ -360,8 +356,12 @@ async def edit_service_profit_save(message: types.Message, state: FSMContext, db
             str(service_id)
         )
     
-    api = get_api_client()
-    product = await api.get_product_details(service_id)
+    # البحث بالمعرف في الفهرس أولاً، ثم من API إذا لم تكن الخدمة مفهرسة
+    catalog = await get_catalog()
+    product = catalog.get(service_id)
+    if not product:
+        api = get_api_client()
+        product = await api.get_product_details(service_id)
     
     exchange_rate = await get_exchange_rate(db_pool)
     selling_price = product['price'] * (1 + profit / 100) if product else 0
@@ -392,8 +392,12 @@ async def refresh_service_price(callback: types.CallbackQuery, db_pool):
     service_id = int(callback.data.split("_")[3])
     await callback.answer("🔄 جاري تحديث السعر...")
     
-    api = get_api_client()
-    product = await api.get_product_details(service_id)
+    # البحث بالمعرف في الفهرس أولاً، ثم من API إذا لم تكن الخدمة مفهرسة
+    catalog = await get_catalog()
+    product = catalog.get(service_id)
+    if not product:
+        api = get_api_client()
+        product = await api.get_product_details(service_id)
     
     if not product:
         await callback.answer("❌ فشل جلب السعر من API", show_alert=True)
@@ -606,10 +610,7 @@ async def sync_services_from_api(callback: types.CallbackQuery, db_pool):
     api = get_api_client()
     
     # جلب نسبة الربح الافتراضية من الإعدادات
-    async with db_pool.acquire() as conn:
-        default_profit = await conn.fetchval(
-            "SELECT value::int FROM bot_settings WHERE key = 'api_default_profit'"
-        ) or 10
+    default_profit = (await get_settings(db_pool)).api_default_profit or 10
     
     synced_count = await api.sync_services_to_db(db_pool, default_profit)
     
@@ -644,10 +645,7 @@ async def api_profit_settings(callback: types.CallbackQuery, db_pool):
     
     await callback.answer()
     
-    async with db_pool.acquire() as conn:
-        default_profit = await conn.fetchval(
-            "SELECT value::int FROM bot_settings WHERE key = 'api_default_profit'"
-        ) or 10
+    default_profit = (await get_settings(db_pool)).api_default_profit or 10
     
     builder = InlineKeyboardBuilder()
     builder.row(types.InlineKeyboardButton(
@@ -715,6 +713,7 @@ async def change_default_profit_save(message: types.Message, state: FSMContext,
             VALUES ('api_default_profit', $1, 'نسبة الربح الافتراضية لخدمات API')
             ON CONFLICT (key) DO UPDATE SET value = $1
         ''', str(profit))
+    await load_settings(db_pool)
     
     await message.answer(
         f"✅ **تم تحديث نسبة الربح الافتراضية إلى {profit}%**\n\n"
@@ -863,10 +862,8 @@ async def search_more(callback: types.CallbackQuery):
     """عرض المزيد من نتائج البحث"""
     keyword = callback.data.replace("search_more_", "")
     
-    api = get_api_client()
-    products = await api.get_products()
-    
-    results = [p for p in products if keyword in p['name'].lower() or keyword in str(p['id'])]
+    catalog = await get_catalog()
+    results = catalog.search(keyword)
     
     if not results:
         await callback.answer("لا توجد نتائج إضافية")
@@ -11,6 +11,7 @@ from datetime import datetime
 from utils import is_admin, is_owner, safe_edit_message, format_datetime
 from handlers.keyboards import get_confirmation_keyboard
 from cache import cached, clear_cache  # ✅ استيراد الكاش
+from telegram_gateway import send_priority
 
 logger = logging.getLogger(__name__)
 router = Router(name="admin_broadcast")
@@ -22,7 +23,7 @@ class BroadcastStates(StatesGroup):
 
 # ✅ ثوابت للإرسال
 BROADCAST_BATCH_SIZE = 20  # إرسال 20 رسالة في كل دفعة
-BROADCAST_DELAY = 0.03     # تأخير 30ms بين الرسائل
+BROADCAST_DELAY = 0.03     # الوقت التقديري لكل رسالة (السرعة الفعلية تحددها بوابة الإرسال)
 
 # ✅ كاش لعدد المستخدمين
 @cached(ttl=60, key_prefix="users_count")
@@ -196,8 +197,9 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
             
             tasks.append(send_single_message(bot, user_id, broadcast_text))
         
-        # ✅ انتظار انتهاء الدفعة
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # ✅ انتظار انتهاء الدفعة (بأولوية البث: لا تؤخر الردود على المستخدمين)
+        with send_priority('bulk'):
+            results = await asyncio.gather(*tasks, return_exceptions=True)
         
         # ✅ تحديث الإحصائيات
         for result in results:
@@ -218,9 +220,6 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
             f"✅ {success_count} نجح | ❌ {failed_count} فشل",
             parse_mode="HTML"
         )
-        
-        # ✅ تأخير بسيط بين الدفعات
-        await asyncio.sleep(BROADCAST_DELAY)
     
     # ✅ حساب الوقت المستغرق
     elapsed_time = time.time() - start_time
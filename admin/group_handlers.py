@@ -6,6 +6,7 @@ import asyncio
 from handlers.time_utils import get_damascus_time_now
 from utils import get_formatted_damascus_time, format_amount
 from database.cache_utils import invalidate_user_cache
+from database.wallet import credit, refund_order
 from database.points import get_points_per_order
 from database.vip import update_user_vip
 from api.client import get_api_client
@@ -74,41 +75,46 @@ async def process_deposit_approval(user_id: int, amount: float, callback: types.
     """معالجة موافقة الشحن في الخلفية"""
     try:
         async with db_pool.acquire() as conn:
-            # جلب المستخدم
-            user = await conn.fetchrow("SELECT username, balance FROM users WHERE user_id = $1", user_id)
-            
-            if not user:
-                await conn.execute(
-                    "INSERT INTO users (user_id, balance, created_at) VALUES ($1, 0, CURRENT_TIMESTAMP)", 
-                    user_id
-                )
-                user = {'username': None, 'balance': 0}
-            
-            new_balance = user['balance'] + amount
-            
-            # تحديث الرصيد
-            await conn.execute(
-                "UPDATE users SET balance = $1, total_deposits = total_deposits + $2, last_activity = CURRENT_TIMESTAMP WHERE user_id = $3",
-                new_balance, amount, user_id
-            )
-            
-            # تحديث طلب الشحن
-            await conn.execute('''
-                UPDATE deposit_requests 
-                SET status = 'approved', updated_at = CURRENT_TIMESTAMP
-                WHERE id = (
-                    SELECT id FROM deposit_requests 
-                    WHERE user_id = $1 AND status = 'pending' AND amount_syp = $2
-                    ORDER BY created_at DESC 
-                    LIMIT 1
-                )
-            ''', user_id, amount)
+            async with conn.transaction():
+                # تحديث طلب الشحن
+                deposit_id = await conn.fetchval('''
+                    UPDATE deposit_requests 
+                    SET status = 'approved', updated_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM deposit_requests 
+                        WHERE user_id = $1 AND status = 'pending' AND amount_syp = $2
+                        ORDER BY created_at DESC 
+                        LIMIT 1
+                    )
+                    RETURNING id
+                ''', user_id, amount)
+                
+                # لا يوجد طلب معلق (تمت معالجته من لوحة التحكم أو من مشرف آخر) - لا إضافة رصيد
+                if deposit_id is not None:
+                    # إضافة الرصيد مع قيد في السجل في استعلام واحد (ينشئ المستخدم إذا لم يكن موجوداً)
+                    new_balance = await credit(conn, user_id, amount, ref_id=deposit_id, deposit=True, create=True)
             
-            # ✅ مسح كاش المستخدم
-            await invalidate_user_cache(user_id)
+            if deposit_id is not None:
+                # ✅ مسح كاش المستخدم
+                await invalidate_user_cache(user_id)
         
         damascus_time = get_damascus_time_now().strftime('%Y-%m-%d %H:%M:%S')
         
+        if deposit_id is None:
+            logger.warning(f"⚠️ طلب شحن المستخدم {user_id} بمبلغ {amount} تمت معالجته مسبقاً - لم يُضف الرصيد")
+            try:
+                current_text = callback.message.text or callback.message.caption or ""
+                clean_text = current_text.replace("⏳ <b>جاري المعالجة...</b>", "")
+                new_text = f"{clean_text}\n\n⚠️ <b>الطلب تمت معالجته مسبقاً - لم يُضف أي رصيد</b>\n📅 <b>بتاريخ:</b> {damascus_time}"
+                
+                if callback.message.photo:
+                    await callback.message.edit_caption(caption=new_text, reply_markup=None, parse_mode="HTML")
+                else:
+                    await callback.message.edit_text(text=new_text, reply_markup=None, parse_mode="HTML")
+            except Exception as e:
+                logger.error(f"❌ فشل تحديث رسالة المجموعة: {e}")
+            return
+        
         # إرسال إشعار للمستخدم (في الخلفية)
         asyncio.create_task(notify_user_deposit_approved(
             bot, user_id, amount, new_balance, damascus_time
@@ -383,22 +389,11 @@ async def process_order_rejection(order_id: int, callback: types.CallbackQuery,
     """معالجة رفض الطلب في الخلفية"""
     try:
         async with db_pool.acquire() as conn:
-            order = await conn.fetchrow("SELECT id, user_id, total_amount_syp FROM orders WHERE id = $1", order_id)
+            # تغيير الحالة وإرجاع الرصيد في استعلام واحد (الرفض المكرر لا يعيد المبلغ مرتين)
+            order = await refund_order(conn, order_id, 'failed')
             
             if order:
-                logger.info(f"📝 جاري رفض الطلب #{order_id} للمستخدم {order['user_id']}")
-                
-                # إعادة الرصيد
-                await conn.execute(
-                    "UPDATE users SET balance = balance + $1 WHERE user_id = $2", 
-                    order['total_amount_syp'], order['user_id']
-                )
-                
-                # تحديث حالة الطلب
-                await conn.execute(
-                    "UPDATE orders SET status = 'failed', updated_at = CURRENT_TIMESTAMP WHERE id = $1", 
-                    order_id
-                )
+                logger.info(f"📝 تم رفض الطلب #{order_id} للمستخدم {order['user_id']}")
                 
                 # ✅ مسح كاش المستخدم
                 await invalidate_user_cache(order['user_id'])
@@ -508,27 +503,27 @@ async def process_order_completion(order_id: int, callback: types.CallbackQuery,
                 VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
             ''', order['user_id'], points, 'order_completed', f'نقاط من طلب مكتمل #{order_id}')
             
-            # تحديث VIP
-            from database.vip import update_user_vip
-            vip_info = await update_user_vip(db_pool, order['user_id'])
-            
-            if vip_info:
-                vip_discount = vip_info.get('discount', 0)
-                vip_level = vip_info.get('level', 0)
-            else:
-                vip_discount = 0
-                vip_level = 0
-                
-            vip_icons = ["⚪", "🔵", "🟣", "🟡"]
-            vip_icon = vip_icons[vip_level] if vip_level < len(vip_icons) else "⚪"
-            
             user_points = await conn.fetchval(
                 "SELECT total_points FROM users WHERE user_id = $1", 
                 order['user_id']
             ) or 0
+        
+        # تحديث VIP (بعد تحرير الاتصال - update_user_vip يحجز اتصاله الخاص)
+        from database.vip import update_user_vip
+        vip_info = await update_user_vip(db_pool, order['user_id'])
+        
+        if vip_info:
+            vip_discount = vip_info.get('discount', 0)
+            vip_level = vip_info.get('level', 0)
+        else:
+            vip_discount = 0
+            vip_level = 0
             
-            # ✅ مسح كاش المستخدم
-            await invalidate_user_cache(order['user_id'])
+        vip_icons = ["⚪", "🔵", "🟣", "🟡"]
+        vip_icon = vip_icons[vip_level] if vip_level < len(vip_icons) else "⚪"
+        
+        # ✅ مسح كاش المستخدم
+        await invalidate_user_cache(order['user_id'])
         
         # إرسال إشعار للمستخدم (يبقى Markdown للمستخدمين)
         asyncio.create_task(notify_user_order_completed(
@@ -602,24 +597,11 @@ async def process_order_failure(order_id: int, callback: types.CallbackQuery, db
     """معالجة فشل الطلب في الخلفية"""
     try:
         async with db_pool.acquire() as conn:
-            # ✅ أضف id للاستعلام
-            order = await conn.fetchrow("SELECT id, user_id, total_amount_syp FROM orders WHERE id = $1", order_id)
+            # تغيير الحالة وإرجاع الرصيد في استعلام واحد (الضغط المكرر لا يعيد المبلغ مرتين)
+            order = await refund_order(conn, order_id, 'failed')
             
             if order:
-                logger.info(f"📝 جاري معالجة فشل الطلب #{order_id} للمستخدم {order['user_id']}")
-                logger.info(f"📦 order data: {dict(order)}")  # للتأكد
-                
-                # إعادة الرصيد
-                await conn.execute(
-                    "UPDATE users SET balance = balance + $1 WHERE user_id = $2", 
-                    order['total_amount_syp'], order['user_id']
-                )
-                
-                # تحديث حالة الطلب
-                await conn.execute(
-                    "UPDATE orders SET status = 'failed', updated_at = CURRENT_TIMESTAMP WHERE id = $1", 
-                    order_id
-                )
+                logger.info(f"📝 تمت معالجة فشل الطلب #{order_id} للمستخدم {order['user_id']}")
                 
                 # ✅ مسح كاش المستخدم
                 await invalidate_user_cache(order['user_id'])
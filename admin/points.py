@@ -9,6 +9,7 @@ from typing import Optional, Dict, Any
 from utils import is_admin, format_amount, safe_edit_message, get_formatted_damascus_time
 from handlers.keyboards import get_confirmation_keyboard
 from cache import cached, clear_cache  # ✅ استيراد الكاش
+from database.settings import get_settings, load_settings
 
 logger = logging.getLogger(__name__)
 router = Router(name="admin_points")
@@ -17,25 +18,18 @@ class PointsStates(StatesGroup):
     waiting_points_settings = State()
 
 # ✅ ثوابت للأداء
-CACHE_TTL_SETTINGS = 60  # 60 ثانية
 CACHE_TTL_REDEMPTIONS = 30  # 30 ثانية
 
-# ✅ كاش لإعدادات النقاط
-@cached(ttl=CACHE_TTL_SETTINGS, key_prefix="points_settings")
+# ✅ إعدادات النقاط من نسخة الإعدادات في الذاكرة
 async def get_cached_points_settings(db_pool) -> Dict[str, Any]:
-    """جلب إعدادات النقاط مع كاش دقيقة"""
-    async with db_pool.acquire() as conn:
-        points_per_order = await conn.fetchval("SELECT value FROM bot_settings WHERE key = 'points_per_order'")
-        points_per_referral = await conn.fetchval("SELECT value FROM bot_settings WHERE key = 'points_per_referral'")
-        points_to_usd = await conn.fetchval("SELECT value FROM bot_settings WHERE key = 'points_to_usd'")
-        redemption_rate = await conn.fetchval("SELECT value FROM bot_settings WHERE key = 'redemption_rate'")
-        
-        return {
-            'points_per_order': int(points_per_order) if points_per_order else 1,
-            'points_per_referral': int(points_per_referral) if points_per_referral else 1,
-            'points_to_usd': int(points_to_usd) if points_to_usd else 100,
-            'redemption_rate': int(redemption_rate) if redemption_rate else 100
-        }
+    """إعدادات النقاط من SettingsSnapshot (بدون استعلام بعد أول تحميل)"""
+    settings = await get_settings(db_pool)
+    return {
+        'points_per_order': settings.points_per_order,
+        'points_per_referral': settings.points_per_referral,
+        'points_to_usd': settings.points_to_usd,
+        'redemption_rate': settings.redemption_rate
+    }
 
 # ✅ كاش لطلبات الاسترداد المعلقة
 @cached(ttl=CACHE_TTL_REDEMPTIONS, key_prefix="pending_redemptions")
@@ -193,8 +187,8 @@ async def save_points_settings(message: types.Message, state: FSMContext, db_poo
             await conn.execute("UPDATE bot_settings SET value = $1 WHERE key = 'points_to_usd'", points_usd)
             await conn.execute("UPDATE bot_settings SET value = $1 WHERE key = 'redemption_rate'", redemption_rate)
         
-        # ✅ مسح الكاش
-        clear_cache("points_settings")
+        # ✅ تحديث نسخة الإعدادات فوراً (التنبيه يحدّث بقية النسخ)
+        await load_settings(db_pool)
         
         await message.answer(
             f"✅ **تم تحديث إعدادات النقاط بنجاح**\n\n"
@@ -273,7 +267,6 @@ async def approve_redemption(callback: types.CallbackQuery, state: FSMContext, d
             # ✅ مسح الكاش
             clear_cache("pending_redemptions")
             clear_cache("pending_count")
-            clear_cache("points_settings")
             
             elapsed_time = time.time() - start_time
             
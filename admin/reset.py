@@ -67,74 +67,86 @@ async def execute_reset_bot(message: types.Message, state: FSMContext, db_pool):
     admin_ids_str = ','.join([str(id) for id in admin_ids if id])
     
     async with db_pool.acquire() as conn:
-        # ✅ حذف بيانات المستخدمين والطلبات فقط
-        await conn.execute("DELETE FROM points_history")
-        await conn.execute("DELETE FROM redemption_requests")
-        await conn.execute("DELETE FROM deposit_requests")
-        await conn.execute("DELETE FROM orders")
+        # معاملة واحدة: التصفير يكتمل كاملاً أو لا يحدث
+        async with conn.transaction():
+            # ✅ حذف بيانات المستخدمين والطلبات فقط
+            await conn.execute("DELETE FROM points_history")
+            await conn.execute("DELETE FROM referrals")
+            await conn.execute("DELETE FROM wallet_snapshots")
+            await conn.execute("DELETE FROM wallet_ledger")
+            await conn.execute("DELETE FROM redemption_requests")
+            await conn.execute("DELETE FROM deposit_requests")
+            await conn.execute("DELETE FROM orders")
+            # الإحصائيات اليومية مبنية من الجداول المحذوفة - تُحذف مع علامة التحديث
+            # فيُعاد بناؤها من الصفر (التحديث التدريجي لا يعيد حساب أيام بلا صفوف)
+            await conn.execute("DELETE FROM daily_metrics")
+            await conn.execute("DELETE FROM metrics_watermarks")
         
-        # ✅ لا نحذف product_options ولا applications
-        # await conn.execute("DELETE FROM product_options")  # ❌ محذوف
-        # await conn.execute("DELETE FROM applications")     # ❌ محذوف
+            # ✅ لا نحذف product_options ولا applications
+            # await conn.execute("DELETE FROM product_options")  # ❌ محذوف
+            # await conn.execute("DELETE FROM applications")     # ❌ محذوف
         
-        # ✅ إعادة ضبط sequences للجداول التي تم حذفها فقط
-        sequences = [
-            "orders_id_seq",
-            "deposit_requests_id_seq", 
-            "redemption_requests_id_seq",
-            "points_history_id_seq"
-            # "product_options_id_seq",  # ❌ محذوف
-            # "applications_id_seq",      # ❌ محذوف
-            # "categories_id_seq"         # ❌ محذوف (الأقسام تبقى)
-        ]
+            # ✅ إعادة ضبط sequences للجداول التي تم حذفها فقط
+            sequences = [
+                "orders_id_seq",
+                "deposit_requests_id_seq", 
+                "redemption_requests_id_seq",
+                "points_history_id_seq",
+                "wallet_ledger_id_seq"
+                # "product_options_id_seq",  # ❌ محذوف
+                # "applications_id_seq",      # ❌ محذوف
+                # "categories_id_seq"         # ❌ محذوف (الأقسام تبقى)
+            ]
         
-        for seq in sequences:
-            try:
-                await conn.execute(f"ALTER SEQUENCE {seq} RESTART WITH 1")
-                logger.info(f"✅ تم تصفير {seq}")
-            except Exception as e:
-                logger.warning(f"⚠️ لم يتم تصفير {seq}: {e}")
+            for seq in sequences:
+                try:
+                    # نقطة حفظ: فشل تصفير تسلسل لا يلغي المعاملة كلها
+                    async with conn.transaction():
+                        await conn.execute(f"ALTER SEQUENCE {seq} RESTART WITH 1")
+                    logger.info(f"✅ تم تصفير {seq}")
+                except Exception as e:
+                    logger.warning(f"⚠️ لم يتم تصفير {seq}: {e}")
         
-        # حذف المستخدمين مع الاحتفاظ بالمشرفين
-        if admin_ids_str:
-            await conn.execute(f"DELETE FROM users WHERE user_id NOT IN ({admin_ids_str})")
+            # حذف المستخدمين مع الاحتفاظ بالمشرفين
+            if admin_ids_str:
+                await conn.execute(f"DELETE FROM users WHERE user_id NOT IN ({admin_ids_str})")
             
-            for admin_id in admin_ids:
-                if admin_id:
-                    await conn.execute('''
-                        UPDATE users 
-                        SET balance = 0, total_points = 0, total_deposits = 0, total_orders = 0,
-                            referral_count = 0, referral_earnings = 0, total_points_earned = 0,
-                            total_points_redeemed = 0, vip_level = 0, total_spent = 0,
-                            discount_percent = 0, manual_vip = FALSE, last_activity = CURRENT_TIMESTAMP
-                        WHERE user_id = $1
-                    ''', admin_id)
-        else:
-            await conn.execute("DELETE FROM users")
+                for admin_id in admin_ids:
+                    if admin_id:
+                        await conn.execute('''
+                            UPDATE users 
+                            SET balance = 0, total_points = 0, total_deposits = 0, total_orders = 0,
+                                referral_count = 0, referral_earnings = 0, total_points_earned = 0,
+                                total_points_redeemed = 0, vip_level = 0, total_spent = 0,
+                                discount_percent = 0, manual_vip = FALSE, last_activity = CURRENT_TIMESTAMP
+                            WHERE user_id = $1
+                        ''', admin_id)
+            else:
+                await conn.execute("DELETE FROM users")
         
-        # تحديث الإعدادات
-        await conn.execute('''
-            INSERT INTO bot_settings (key, value, description) 
-            VALUES ('usd_to_syp', $1, 'سعر صرف الدولار مقابل الليرة')
-            ON CONFLICT (key) DO UPDATE SET value = $1
-        ''', str(new_rate))
+            # تحديث الإعدادات
+            await conn.execute('''
+                INSERT INTO bot_settings (key, value, description) 
+                VALUES ('usd_to_syp', $1, 'سعر صرف الدولار مقابل الليرة')
+                ON CONFLICT (key) DO UPDATE SET value = $1
+            ''', str(new_rate))
         
-        await conn.execute("UPDATE bot_settings SET value = '1' WHERE key IN ('points_per_order', 'points_per_referral')")
-        await conn.execute("UPDATE bot_settings SET value = '100' WHERE key = 'redemption_rate'")
+            await conn.execute("UPDATE bot_settings SET value = '1' WHERE key IN ('points_per_order', 'points_per_referral')")
+            await conn.execute("UPDATE bot_settings SET value = '100' WHERE key = 'redemption_rate'")
         
-        # إعادة ضبط مستويات VIP (تبقى نفسها)
-        await conn.execute('''
-            INSERT INTO vip_levels (level, name, min_spent, discount_percent, icon) 
-            VALUES 
-                (0, 'VIP 0', 0, 0, '⚪'),
-                (1, 'VIP 1', 3500, 1, '🔵'),
-                (2, 'VIP 2', 6500, 2, '🟣'),
-                (3, 'VIP 3', 12000, 3, '🟡')
-            ON CONFLICT (level) DO UPDATE SET 
-                min_spent = EXCLUDED.min_spent,
-                discount_percent = EXCLUDED.discount_percent,
-                icon = EXCLUDED.icon;
-        ''')
+            # إعادة ضبط مستويات VIP (تبقى نفسها)
+            await conn.execute('''
+                INSERT INTO vip_levels (level, name, min_spent, discount_percent, icon) 
+                VALUES 
+                    (0, 'VIP 0', 0, 0, '⚪'),
+                    (1, 'VIP 1', 3500, 1, '🔵'),
+                    (2, 'VIP 2', 6500, 2, '🟣'),
+                    (3, 'VIP 3', 12000, 3, '🟡')
+                ON CONFLICT (level) DO UPDATE SET 
+                    min_spent = EXCLUDED.min_spent,
+                    discount_percent = EXCLUDED.discount_percent,
+                    icon = EXCLUDED.icon;
+            ''')
     
     await message.answer(
         f"✅ **تم تصفير البوت بنجاح!**\n\n"
@@ -22,6 +22,7 @@ from database.core import (
     set_bot_status
 )
 from handlers.middleware import refresh_bot_status_cache
+from telegram_gateway import fan_out, run_in_background
 
 logger = logging.getLogger(__name__)
 router = Router(name="admin_settings")
@@ -90,19 +91,15 @@ async def toggle_bot(callback: types.CallbackQuery, db_pool):
         f"⚡ وقت المعالجة: {elapsed_time:.2f} ثانية"
     )
     
-    # إشعار المشرفين
-    admin_ids = [ADMIN_ID] + MODERATORS
-    for admin_id in admin_ids:
-        if admin_id and admin_id != callback.from_user.id:
-            try:
-                await callback.bot.send_message(
-                    admin_id,
-                    f"ℹ️ تم {action_text} البوت بواسطة @{callback.from_user.username or 'مشرف'}\n"
-                    f"🕐 {get_formatted_damascus_time()}",
-                    parse_mode="Markdown"
-                )
-            except:
-                pass
+    # إشعار المشرفين (بالتوازي وفي الخلفية)
+    notice = (
+        f"ℹ️ تم {action_text} البوت بواسطة @{callback.from_user.username or 'مشرف'}\n"
+        f"🕐 {get_formatted_damascus_time()}"
+    )
+    run_in_background(fan_out(
+        [admin_id for admin_id in [ADMIN_ID] + MODERATORS if admin_id != callback.from_user.id],
+        lambda admin_id: callback.bot.send_message(admin_id, notice, parse_mode="Markdown")
+    ), name='notify_bot_status')
 
 # رسالة الصيانة
 @router.callback_query(F.data == "edit_maintenance")
@@ -314,19 +311,16 @@ async def update_exchange_rate(message: types.Message, state: FSMContext, db_poo
         f"⚡ وقت المعالجة: {elapsed_time:.2f} ثانية"
     )
     
-    # إشعار المشرفين
-    for mod_id in MODERATORS:
-        if mod_id and mod_id != message.from_user.id:
-            try:
-                await message.bot.send_message(
-                    mod_id,
-                    f"ℹ️ تم تغيير سعر الصرف إلى {new_rate:,.0f} ل.س\n"
-                    f"👤 بواسطة: @{message.from_user.username or 'مشرف'}\n"
-                    f"🕐 {get_formatted_damascus_time()}",
-                    parse_mode="Markdown"
-                )
-            except:
-                pass
+    # إشعار المشرفين (بالتوازي وفي الخلفية)
+    notice = (
+        f"ℹ️ تم تغيير سعر الصرف إلى {new_rate:,.0f} ل.س\n"
+        f"👤 بواسطة: @{message.from_user.username or 'مشرف'}\n"
+        f"🕐 {get_formatted_damascus_time()}"
+    )
+    run_in_background(fan_out(
+        [mod_id for mod_id in MODERATORS if mod_id != message.from_user.id],
+        lambda mod_id: message.bot.send_message(mod_id, notice, parse_mode="Markdown")
+    ), name='notify_exchange_rate')
     
     await state.clear()
 
@@ -1,13 +1,18 @@
 # admin/stats.py
 from aiogram import Router, F, types
+from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+import html
 import logging
 import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from utils import is_admin, format_amount, safe_edit_message, get_formatted_damascus_time
 from database.stats import get_bot_stats
+from database.metrics import refresh_daily_metrics, get_daily_metrics, get_metrics_top_apps
+from handlers.time_utils import get_damascus_time_now
 from database.core import get_bot_status, get_exchange_rate
+from database.query_stats import get_query_stats, reset_query_stats
 from cache import cached, clear_cache  # ✅ استيراد الكاش
 
 logger = logging.getLogger(__name__)
@@ -17,6 +22,7 @@ router = Router(name="admin_stats")
 CACHE_TTL_STATS = 60  # 60 ثانية
 CACHE_TTL_TOP_USERS = 120  # دقيقتين
 TOP_USERS_LIMIT = 15
+QUERY_STATS_LIMIT = 10
 
 # ✅ كاش للإحصائيات العامة
 @cached(ttl=CACHE_TTL_STATS, key_prefix="bot_stats")
@@ -166,9 +172,10 @@ async def refresh_stats(callback: types.CallbackQuery, db_pool):
     # ✅ إطفاء الزر فوراً
     await callback.answer("🔄 جاري التحديث...")
     
-    # ✅ مسح الكاش
+    # ✅ مسح الكاش وتحديث الإحصائيات اليومية
     clear_cache("bot_stats")
     clear_cache("vip_stats")
+    await refresh_daily_metrics(db_pool)
     
     # ✅ العودة للإحصائيات
     await show_bot_stats(callback, db_pool)
@@ -182,36 +189,27 @@ async def stats_details(callback: types.CallbackQuery, db_pool):
     # ✅ إطفاء الزر فوراً
     await callback.answer()
     
-    async with db_pool.acquire() as conn:
-        # إحصائيات اليوم
-        today = datetime.now().date()
-        yesterday = today - timedelta(days=1)
-        
-        today_stats = await conn.fetchrow('''
-            SELECT 
-                (SELECT COUNT(*) FROM users WHERE DATE(created_at) = $1) as new_users,
-                (SELECT COUNT(*) FROM deposit_requests WHERE DATE(created_at) = $1) as deposits,
-                (SELECT COALESCE(SUM(amount_syp), 0) FROM deposit_requests WHERE DATE(created_at) = $1 AND status = 'approved') as deposit_amount,
-                (SELECT COUNT(*) FROM orders WHERE DATE(created_at) = $1) as orders,
-                (SELECT COALESCE(SUM(total_amount_syp), 0) FROM orders WHERE DATE(created_at) = $1 AND status = 'completed') as order_amount
-        ''', today)
-        
-        # إحصائيات الأمس للمقارنة
-        yesterday_stats = await conn.fetchrow('''
-            SELECT 
-                (SELECT COUNT(*) FROM users WHERE DATE(created_at) = $1) as new_users,
-                (SELECT COUNT(*) FROM deposit_requests WHERE DATE(created_at) = $1) as deposits
-        ''', yesterday)
-        
-        # أكثر التطبيقات طلباً
-        top_apps = await conn.fetch('''
-            SELECT a.name, COUNT(o.id) as order_count, COALESCE(SUM(o.total_amount_syp), 0) as total_revenue
-            FROM applications a
-            LEFT JOIN orders o ON a.id = o.app_id AND o.status = 'completed'
-            GROUP BY a.id, a.name
-            ORDER BY order_count DESC
-            LIMIT 5
-        ''')
+    # ✅ القراءة من جدول daily_metrics بدل مسح جداول الطلبات والإيداعات
+    await refresh_daily_metrics(db_pool, max_age=60)
+    
+    today = get_damascus_time_now().date()
+    yesterday = today - timedelta(days=1)
+    
+    yesterday_stats, today_stats = await get_daily_metrics(db_pool, yesterday, today) or [{}, {}]
+    today_stats = {
+        'new_users': today_stats.get('new_users', 0),
+        'deposits': today_stats.get('deposits_count', 0),
+        'deposit_amount': today_stats.get('deposits_amount_syp', 0),
+        'orders': today_stats.get('orders_count', 0),
+        'order_amount': today_stats.get('revenue_syp', 0)
+    }
+    yesterday_stats = {
+        'new_users': yesterday_stats.get('new_users', 0),
+        'deposits': yesterday_stats.get('deposits_count', 0)
+    }
+    
+    # أكثر التطبيقات طلباً
+    top_apps = await get_metrics_top_apps(db_pool, limit=5)
     
     # حساب نسبة التغير
     users_change = 0
@@ -499,8 +497,83 @@ async def stats_menu(callback: types.CallbackQuery):
         types.InlineKeyboardButton(text="👑 VIP", callback_data="vip_stats")
     )
     builder.row(
-        types.InlineKeyboardButton(text="📊 تفاصيل اليوم", callback_data="stats_details")
+        types.InlineKeyboardButton(text="📊 تفاصيل اليوم", callback_data="stats_details"),
+        types.InlineKeyboardButton(text="🐢 الاستعلامات", callback_data="query_stats")
     )
     builder.row(types.InlineKeyboardButton(text="🔙 رجوع", callback_data="back_to_admin"))
     
     await safe_edit_message(callback.message, text, reply_markup=builder.as_markup())
+
+
+# ============= إحصائيات الاستعلامات =============
+
+def format_query_stats(sort: str = 'total', limit: int = QUERY_STATS_LIMIT) -> str:
+    """جدول أعلى الاستعلامات (HTML)"""
+    report = get_query_stats(limit, sort)
+    summary = report['summary']
+    since = datetime.fromtimestamp(summary['since']).strftime('%Y-%m-%d %H:%M')
+
+    lines = [
+        f"🐢 <b>أعلى الاستعلامات</b> (حسب {sort})\n",
+        f"• منذ: {since}",
+        f"• الاستعلامات: {summary['queries']:,} | الزمن الكلي: {summary['total_ms'] / 1000:,.1f}s",
+        f"• البصمات: {summary['fingerprints']} | البطيئة (>{summary['slow_threshold_ms']}ms): {summary['slow_queries']}",
+    ]
+    if summary['sample_every'] > 1:
+        lines.append(f"• عينة: 1 من كل {summary['sample_every']}")
+    lines.append("")
+
+    if not report['top']:
+        lines.append("لا توجد بيانات بعد")
+    for i, row in enumerate(report['top'], 1):
+        query = row['query'] if len(row['query']) <= 160 else row['query'][:157] + '...'
+        lines.append(
+            f"<b>{i}.</b> {row['total_ms'] / 1000:,.2f}s | {row['count']:,}× | "
+            f"p99 {row['p99_ms']:.1f}ms | {row['rows_per_call']} صف\n"
+            f"<code>{html.escape(query)}</code>\n"
+            f"↳ {html.escape(row['caller'])}"
+        )
+    return "\n".join(lines)
+
+
+def query_stats_keyboard(sort: str = 'total'):
+    builder = InlineKeyboardBuilder()
+    builder.row(*[
+        types.InlineKeyboardButton(text=("✅ " if key == sort else "") + label, callback_data=f"query_stats_{key}")
+        for key, label in (('total', 'الزمن'), ('count', 'العدد'), ('p99', 'p99'))
+    ])
+    builder.row(
+        types.InlineKeyboardButton(text="🔄 تصفير", callback_data="query_stats_reset"),
+        types.InlineKeyboardButton(text="🔙 رجوع", callback_data="stats_menu")
+    )
+    return builder.as_markup()
+
+
+@router.message(Command("dbstats"))
+async def query_stats_command(message: types.Message):
+    """أمر /dbstats [total|count|mean|p99|rows] - أعلى الاستعلامات"""
+    if not is_admin(message.from_user.id):
+        return
+
+    parts = (message.text or '').split()
+    sort = parts[1] if len(parts) > 1 else 'total'
+    await message.answer(format_query_stats(sort), parse_mode="HTML",
+                         reply_markup=query_stats_keyboard(sort))
+
+
+@router.callback_query(F.data.startswith("query_stats"))
+async def query_stats_callback(callback: types.CallbackQuery):
+    """عرض/ترتيب/تصفير إحصائيات الاستعلامات"""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("غير مصرح", show_alert=True)
+
+    action = callback.data[len("query_stats_"):] if callback.data != "query_stats" else 'total'
+    if action == 'reset':
+        reset_query_stats()
+        await callback.answer("✅ تم التصفير")
+        action = 'total'
+    else:
+        await callback.answer()
+
+    await safe_edit_message(callback.message, format_query_stats(action),
+                            reply_markup=query_stats_keyboard(action), parse_mode="HTML")
@@ -10,9 +10,11 @@ from utils import is_admin, format_amount, format_datetime, safe_edit_message, g
 from handlers.keyboards import get_confirmation_keyboard
 from database.users import get_user_profile, get_user_by_id
 from database.cache_utils import invalidate_user_cache
+from database.wallet import adjust, InsufficientFunds
 from database.core import get_exchange_rate
 from database.points import get_redemption_rate, get_user_points_summary
 from database.vip import get_next_vip_level
+from database.search import search_users as search_users_page
 from cache import cached, clear_cache
 
 logger = logging.getLogger(__name__)
@@ -34,39 +36,12 @@ async def get_cached_user_profile(db_pool, user_id: int) -> Optional[Dict[str, A
     return await get_user_profile(db_pool, user_id)
 
 # ✅ كاش للبحث عن المستخدمين
+SEARCH_PAGE_SIZE = 10
+
 @cached(ttl=30, key_prefix="user_search")
-async def search_users(db_pool, query: str, limit: int = 10):
-    """البحث عن المستخدمين بالآيدي أو اليوزرنيم"""
-    async with db_pool.acquire() as conn:
-        # البحث بالآيدي
-        try:
-            user_id = int(query)
-            users = await conn.fetch('''
-                SELECT user_id, username, first_name, balance, is_banned 
-                FROM users WHERE user_id = $1
-                LIMIT $2
-            ''', user_id, limit)
-            if users:
-                return users
-        except ValueError:
-            pass
-        
-        # البحث باليوزرنيم
-        users = await conn.fetch('''
-            SELECT user_id, username, first_name, balance, is_banned 
-            FROM users 
-            WHERE username ILIKE $1 OR first_name ILIKE $1
-            ORDER BY 
-                CASE 
-                    WHEN username ILIKE $2 THEN 1
-                    WHEN username ILIKE $3 THEN 2
-                    ELSE 3
-                END,
-                balance DESC
-            LIMIT $4
-        ''', f'%{query}%', f'{query}%', f'%{query}', limit)
-        
-        return users
+async def search_users(db_pool, query: str, limit: int = SEARCH_PAGE_SIZE, offset: int = 0):
+    """البحث عن المستخدمين بالآيدي أو اليوزرنيم (خدمة البحث المشتركة مع لوحة التحكم)"""
+    return await search_users_page(db_pool, query, limit, offset)
 
 
 # ============= معلومات المستخدم =============
@@ -101,7 +76,8 @@ async def user_info_search(message: types.Message, state: FSMContext, db_pool):
     
     query = message.text.strip().replace('@', '')
     
-    users = await search_users(db_pool, query)
+    page = await search_users(db_pool, query)
+    users = page['items']
     
     if not users:
         await message.answer(
@@ -110,13 +86,14 @@ async def user_info_search(message: types.Message, state: FSMContext, db_pool):
         )
         return
     
-    if len(users) == 1:
+    if len(users) == 1 and not page['has_more']:
         await show_user_details(message, state, db_pool, users[0]['user_id'])
     else:
-        await show_user_search_results(message, state, users)
+        await state.update_data(search_query=query)
+        await show_user_search_results(message, state, users, page['next_offset'])
 
 
-async def show_user_search_results(message: types.Message, state: FSMContext, users):
+async def show_user_search_results(message: types.Message, state: FSMContext, users, next_offset: Optional[int] = None):
     """عرض نتائج البحث المتعددة"""
     text = "🔍 <b>نتائج البحث:</b>\n\n"
     
@@ -136,12 +113,40 @@ async def show_user_search_results(message: types.Message, state: FSMContext, us
             callback_data=f"select_user_{user['user_id']}"
         ))
     
+    if next_offset is not None:
+        builder.row(types.InlineKeyboardButton(
+            text="➡️ المزيد من النتائج",
+            callback_data=f"user_search_more_{next_offset}"
+        ))
     builder.row(types.InlineKeyboardButton(text="❌ إلغاء", callback_data="cancel_user_search"))
     
     await message.answer(text, reply_markup=builder.as_markup(), parse_mode="HTML")
     await state.set_state(UserStates.waiting_user_info)
 
 
+@router.callback_query(F.data.startswith("user_search_more_"))
+async def user_search_more(callback: types.CallbackQuery, state: FSMContext, db_pool):
+    """الصفحة التالية من نتائج البحث"""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("غير مصرح", show_alert=True)
+    
+    data = await state.get_data()
+    query = data.get('search_query')
+    if not query:
+        await callback.answer()
+        return await safe_edit_message(callback.message, "⚠️ انتهت جلسة البحث، ابدأ بحثاً جديداً.")
+    
+    offset = int(callback.data.replace("user_search_more_", ""))
+    page = await search_users(db_pool, query, SEARCH_PAGE_SIZE, offset)
+    
+    # رد واحد فقط على الزر (الرد الثاني يرفضه تليجرام)
+    if not page['items']:
+        return await callback.answer("لا توجد نتائج إضافية", show_alert=True)
+    await callback.answer()
+    
+    await show_user_search_results(callback.message, state, page['items'], page['next_offset'])
+
+
 @router.callback_query(F.data.startswith("select_user_"))
 async def select_user_from_search(callback: types.CallbackQuery, state: FSMContext, db_pool):
     """اختيار مستخدم من نتائج البحث"""
@@ -479,16 +484,15 @@ async def finalize_add_balance(message: types.Message, state: FSMContext, db_poo
                 if not user:
                     return await message.answer("❌ المستخدم غير موجود")
                 
-                new_balance = user['balance'] + amount
-                if new_balance < 0:
+                # تعديل مشروط بعدم صيرورة الرصيد سالباً، مع قيد في السجل (المرجع: المشرف)
+                try:
+                    new_balance = await adjust(
+                        conn, user_id, amount, ref_id=message.from_user.id, deposit=True
+                    )
+                except InsufficientFunds:
                     return await message.answer(
                         f"⚠️ لا يمكن خصم {abs(amount):.0f} ل.س لأن الرصيد الحالي {user['balance']:,.0f} ل.س"
                     )
-                
-                await conn.execute(
-                    "UPDATE users SET balance = balance + $1, total_deposits = total_deposits + $1 WHERE user_id = $2",
-                    amount, user_id
-                )
         
         await invalidate_user_cache(user_id)
         clear_cache(f"user_profile:{user_id}")
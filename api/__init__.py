@@ -1,9 +1,14 @@
 # api/__init__.py
 from .client import MousaCardAPI, get_api_client, set_api_token, close_api_client
+from .catalog import CatalogIndex, get_catalog, get_catalog_index, normalize_text
 
 __all__ = [
     'MousaCardAPI',
     'get_api_client',
     'set_api_token',
-    'close_api_client'
+    'close_api_client',
+    'CatalogIndex',
+    'get_catalog',
+    'get_catalog_index',
+    'normalize_text'
 ]
\ No newline at end of file
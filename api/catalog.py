@@ -0,0 +1,270 @@
+# api/catalog.py
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============= فهرس كتالوج Mousa Card في الذاكرة =============
+# يُبنى مرة واحدة لكل نسخة من نتيجة get_products (المخزنة في الكاش)
+# ويُحدَّث تدريجياً: فقط المنتجات التي تغيرت أو حُذفت يُعاد فهرستها
+
+# الحد الأدنى لتشابه الـ trigram حتى تظهر النتيجة التقريبية (عند عدم وجود تطابق جزئي)
+MIN_FUZZY_SCORE = 0.5
+
+# التشكيل والتطويل
+_ARABIC_DIACRITICS = re.compile('[\u064B-\u0652\u0670\u0640]')
+_NON_WORD = re.compile(r'[^\w]+', re.UNICODE)
+
+_CHAR_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+    '_': ' ',
+})
+
+
+def normalize_text(text) -> str:
+    """توحيد النص للبحث: أحرف صغيرة، توحيد الألف والتاء المربوطة والياء، أرقام لاتينية، بدون رموز"""
+    text = str(text or '').lower()
+    text = _ARABIC_DIACRITICS.sub('', text)
+    text = text.translate(_CHAR_FOLDING)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def trigrams(text: str) -> set:
+    """تقسيم النص الموحد إلى trigrams لكل كلمة (مع حشو المسافات مثل pg_trgm)"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _fingerprint(product: Dict) -> tuple:
+    """بصمة المنتج لمعرفة إذا تغير منذ آخر فهرسة"""
+    return (
+        product.get('name'),
+        product.get('price'),
+        product.get('category_name'),
+        product.get('available'),
+        product.get('min_quantity'),
+        product.get('max_quantity'),
+    )
+
+
+class CatalogIndex:
+    """فهرس مقلوب (trigram) + بحث بالمعرف + تجميع حسب الفئة لمنتجات Mousa Card"""
+
+    def __init__(self):
+        self._products: Dict[int, Dict] = {}
+        self._names: Dict[int, str] = {}
+        self._grams: Dict[int, set] = {}
+        self._fingerprints: Dict[int, tuple] = {}
+        self._postings: Dict[str, set] = defaultdict(set)
+        self._order: List[int] = []
+        self._categories: Optional[Dict[str, List[Dict]]] = None
+        # مرجع قوي لآخر قائمة (المقارنة بـ id وحدها تخطئ عندما يُعاد استخدام id قائمة محررة)
+        self._source: Optional[List[Dict]] = None
+        self.built_at: float = 0
+
+    def __len__(self):
+        return len(self._products)
+
+    # ---------- البناء والتحديث ----------
+    def _add(self, product: Dict):
+        product_id = product['id']
+        name = normalize_text(product.get('name'))
+        grams = trigrams(name)
+        self._products[product_id] = product
+        self._names[product_id] = name
+        self._grams[product_id] = grams
+        self._fingerprints[product_id] = _fingerprint(product)
+        for gram in grams:
+            self._postings[gram].add(product_id)
+
+    def _remove(self, product_id: int):
+        for gram in self._grams.pop(product_id, ()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[gram]
+        self._products.pop(product_id, None)
+        self._names.pop(product_id, None)
+        self._fingerprints.pop(product_id, None)
+
+    def update(self, products: List[Dict]) -> Dict[str, int]:
+        """
+        مزامنة الفهرس مع قائمة منتجات جديدة (إعادة فهرسة المتغير فقط)
+
+        Returns:
+            dict: عدد المضاف والمحدث والمحذوف
+        """
+        if products is not None and products is self._source:
+            return {'added': 0, 'updated': 0, 'removed': 0}
+
+        products = products or []
+        incoming = {p['id']: p for p in products}
+        stats = {'added': 0, 'updated': 0, 'removed': 0}
+
+        for product_id in [pid for pid in self._products if pid not in incoming]:
+            self._remove(product_id)
+            stats['removed'] += 1
+
+        for product_id, product in incoming.items():
+            old = self._fingerprints.get(product_id)
+            if old is None:
+                self._add(product)
+                stats['added'] += 1
+            elif old != _fingerprint(product):
+                self._remove(product_id)
+                self._add(product)
+                stats['updated'] += 1
+            else:
+                # نفس البيانات - نحتفظ بالنسخة الأحدث من القاموس دون إعادة فهرسة
+                self._products[product_id] = product
+
+        self._order = list(incoming)
+        self._source = products
+        self.built_at = time.time()
+        if stats['added'] or stats['updated'] or stats['removed']:
+            self._categories = None
+            logger.info(
+                f"🔎 تحديث فهرس الكتالوج: +{stats['added']} ~{stats['updated']} -{stats['removed']} "
+                f"(الإجمالي {len(self._products)})"
+            )
+        return stats
+
+    # ---------- القراءة ----------
+    @property
+    def products(self) -> List[Dict]:
+        """المنتجات بنفس ترتيب API"""
+        return [self._products[pid] for pid in self._order if pid in self._products]
+
+    def get(self, product_id) -> Optional[Dict]:
+        """جلب منتج بالمعرف"""
+        try:
+            return self._products.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def categories(self) -> Dict[str, List[Dict]]:
+        """المنتجات مجمعة حسب الفئة (تُحسب مرة واحدة لكل تغيير في الكتالوج)"""
+        if self._categories is None:
+            categories = {}
+            for product in self.products:
+                categories.setdefault(product.get('category_name') or 'عام', []).append(product)
+            self._categories = categories
+        return self._categories
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        بحث مرتب في الكتالوج
+
+        الترتيب: المعرف المطابق، ثم الاسم المطابق، ثم الاسم الذي يبدأ بالكلمة،
+        ثم الاسم الذي يحتوي الكلمة، ثم النتائج التقريبية حسب تشابه الـ trigram
+        """
+        q = normalize_text(query)
+        if not q:
+            return []
+
+        ranked = []
+        seen = set()
+
+        if q.isdigit():
+            exact = self._products.get(int(q))
+            if exact:
+                ranked.append((0, 0.0, exact['id']))
+                seen.add(exact['id'])
+            # المعرفات التي تحتوي الرقم (نفس سلوك البحث القديم)
+            for product_id in self._order:
+                if product_id not in seen and q in str(product_id):
+                    ranked.append((1, 0.0, product_id))
+                    seen.add(product_id)
+
+        # مرشحو التطابق الجزئي: كل trigram داخلي من كلمات البحث يجب أن يظهر في الاسم
+        inner = [w[i:i + 3] for w in q.split() for i in range(len(w) - 2)]
+        if inner:
+            candidates = set(self._postings.get(inner[0], ()))
+            for gram in inner[1:]:
+                candidates &= self._postings.get(gram, set())
+                if not candidates:
+                    break
+        else:
+            # كلمة قصيرة جداً (حرفان) - مسح للأسماء الموحدة المحفوظة في الذاكرة
+            candidates = self._names.keys()
+
+        q_grams = trigrams(q)
+        for product_id in candidates:
+            name = self._names[product_id]
+            if product_id in seen or q not in name:
+                continue
+            score = len(q_grams & self._grams[product_id]) / len(q_grams | self._grams[product_id])
+            if name == q:
+                rank = 2
+            elif name.startswith(q):
+                rank = 3
+            else:
+                rank = 4
+            ranked.append((rank, -score, product_id))
+            seen.add(product_id)
+
+        # النتائج التقريبية (أخطاء إملائية بسيطة) حسب عدد الـ trigrams المشتركة
+        counts = defaultdict(int)
+        for gram in q_grams:
+            for product_id in self._postings.get(gram, ()):
+                counts[product_id] += 1
+
+        for product_id, shared in counts.items():
+            if product_id in seen:
+                continue
+            # نسبة trigrams البحث الموجودة في الاسم (مثل word_similarity في pg_trgm)
+            score = shared / len(q_grams)
+            if score >= MIN_FUZZY_SCORE:
+                ranked.append((5, -score, product_id))
+
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self._products[product_id] for _, _, product_id in ranked]
+
+    def stats(self) -> Dict:
+        """إحصائيات الفهرس"""
+        return {
+            'products': len(self._products),
+            'trigrams': len(self._postings),
+            'categories': len(self.categories),
+            'built_at': self.built_at,
+        }
+
+
+_catalog_index = CatalogIndex()
+
+
+def get_catalog_index() -> CatalogIndex:
+    """الحصول على فهرس الكتالوج (Singleton)"""
+    return _catalog_index
+
+
+async def get_catalog(api=None) -> CatalogIndex:
+    """
+    جلب الكتالوج مفهرساً
+
+    get_products مخزن في الكاش، فطالما لم تنتهِ صلاحيته يعود نفس الكائن
+    ولا يُعاد بناء أي شيء. عند تجدده يُعاد فهرسة المنتجات المتغيرة فقط.
+    """
+    if api is None:
+        from .client import get_api_client
+        api = get_api_client()
+    products = await api.get_products()
+    if products:
+        _catalog_index.update(products)
+    return _catalog_index
@@ -6,6 +6,7 @@ import uuid
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from cache import cached
+from .catalog import get_catalog_index
 
 logger = logging.getLogger(__name__)
 
@@ -305,6 +306,9 @@ class MousaCardAPI:
             logger.error("❌ لا توجد منتجات للمزامنة من Mousa Card")
             return 0
         
+        # تحديث فهرس الكتالوج بالمنتجات المتغيرة فقط
+        get_catalog_index().update(products)
+        
         synced_count = 0
         updated_count = 0
         
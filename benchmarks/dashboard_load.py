@@ -0,0 +1,115 @@
+# benchmarks/dashboard_load.py
+"""
+قياس تحميل صفحات لوحة التحكم بشكل متزامن
+
+يقارن الوضعين على نفس قاعدة البيانات:
+
+    # 1) الوضع الحالي: gunicorn + Flask (عمال متزامنون)
+    gunicorn run_dashboard:app -w 4 -b 127.0.0.1:5000
+    python benchmarks/dashboard_load.py --url http://127.0.0.1:5000 --concurrency 50
+
+    # 2) الوضع غير المتزامن داخل خادم البوت (asyncpg)
+    DASHBOARD_ASYNC=true python run_bot_webhook.py
+    python benchmarks/dashboard_load.py --url http://127.0.0.1:8000 --concurrency 50
+
+كوكي الجلسة يُرسل يدوياً في ترويسة Cookie لأن SESSION_COOKIE_SECURE مفعّل
+ولا يقبله عميل HTTP عبر http محلياً.
+
+لا توجد نتائج مسجلة للمقارنة بعد: الوضع غير المتزامن لا يُفترض أنه أسرع حتى
+يُشغَّل هذا القياس على قاعدة بيانات حقيقية وتُرفق نتائجه.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+DEFAULT_PATHS = ['/', '/users', '/deposits', '/orders', '/statistics', '/search?q=test']
+
+
+async def login(session: aiohttp.ClientSession, url: str, username: str, password: str):
+    """تسجيل الدخول مرة واحدة - يعيد ترويسة الكوكي المشتركة بين كل الطلبات"""
+    async with session.post(f"{url}/login", data={'username': username, 'password': password},
+                            allow_redirects=False) as resp:
+        cookie = resp.cookies.get('session')
+        if resp.status not in (302, 303) or cookie is None:
+            return None
+        return {'Cookie': f"session={cookie.value}"}
+
+
+async def worker(session, url, headers, paths, deadline, latencies, errors, index):
+    """عامل يكرر تحميل الصفحات حتى انتهاء المدة"""
+    i = index
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            async with session.get(f"{url}{path}", headers=headers, allow_redirects=False) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors[path] = errors.get(path, 0) + 1
+                    continue
+        except Exception:
+            errors[path] = errors.get(path, 0) + 1
+            continue
+        latencies.setdefault(path, []).append(time.perf_counter() - started)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+async def run(args):
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        headers = await login(session, args.url, args.username, args.password)
+        if not headers:
+            print("❌ فشل تسجيل الدخول - تحقق من WEB_USERNAME / WEB_PASSWORD")
+            return
+
+        latencies, errors = {}, {}
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            worker(session, args.url, headers, args.paths, deadline, latencies, errors, n)
+            for n in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in latencies.values() for v in values]
+    total = len(all_latencies)
+    print(f"\n📊 {args.url} | التزامن: {args.concurrency} | المدة: {elapsed:.1f}s")
+    print(f"   الطلبات الناجحة: {total} ({total / elapsed:.1f} طلب/ثانية) | الأخطاء: {sum(errors.values())}")
+    print(f"   {'المسار':<20} {'عدد':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for path in args.paths:
+        values = latencies.get(path, [])
+        print(f"   {path:<20} {len(values):>6} "
+              f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f} "
+              f"{percentile(values, 99) * 1000:>9.1f}")
+    if all_latencies:
+        print(f"   {'الإجمالي':<20} {total:>6} "
+              f"{statistics.median(all_latencies) * 1000:>9.1f} {percentile(all_latencies, 95) * 1000:>9.1f} "
+              f"{percentile(all_latencies, 99) * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس تحميل صفحات لوحة التحكم")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# benchmarks/fake_telegram.py
+"""
+خادم Bot API وهمي لاختبارات التحميل
+
+يقبل /bot<token>/<method> كما يرسلها aiogram (form-data) ويعيد ردوداً صالحة:
+sendMessage / editMessageText / sendPhoto ... تعيد Message، getChatMember يعيد
+عضواً مشتركاً (حتى يمر فحص القناة في /start)، وباقي الطرق تعيد True.
+
+    python benchmarks/fake_telegram.py --port 8081 --latency-ms 40 --jitter-ms 20 --rate-429 0.01
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python run_bot_webhook.py
+
+--rate-429 يعيد نسبة من الطلبات بخطأ 429 مع retry_after لاختبار سلوك البوت تحت flood control.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'load_test_bot'}
+
+MESSAGE_METHODS = {
+    'sendmessage', 'editmessagetext', 'editmessagecaption', 'editmessagereplymarkup',
+    'sendphoto', 'senddocument', 'copymessage', 'forwardmessage', 'sendmediagroup',
+}
+
+
+class FakeTelegram:
+    """حالة الخادم: الإعدادات وعدادات الطلبات لكل طريقة"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.message_ids = itertools.count(1000)
+        self.calls = Counter()
+        self.rejected = Counter()
+        self.started = time.time()
+
+    def _message(self, form):
+        chat_id = form.get('chat_id') or form.get('from_chat_id') or 0
+        try:
+            chat_id = int(chat_id)
+        except ValueError:
+            pass
+        chat_type = 'private' if isinstance(chat_id, int) and chat_id > 0 else 'supergroup'
+        message = {
+            'message_id': int(form.get('message_id') or next(self.message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': chat_type},
+            'from': BOT_USER,
+        }
+        if form.get('text'):
+            message['text'] = form['text']
+        if form.get('caption'):
+            message['caption'] = form['caption']
+        return message
+
+    def result_for(self, method, form):
+        if method in MESSAGE_METHODS:
+            if method == 'sendmediagroup':
+                return [self._message(form)]
+            return self._message(form)
+        if method == 'getme':
+            return BOT_USER
+        if method == 'getchatmember':
+            user_id = int(form.get('user_id') or 0)
+            return {'status': 'member', 'user': {'id': user_id, 'is_bot': False, 'first_name': 'user'}}
+        if method == 'getchat':
+            return {'id': int(form.get('chat_id') or 0), 'type': 'private'}
+        if method == 'getwebhookinfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method'].lower()
+        form = dict(await request.post())
+        self.calls[method] += 1
+
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.rate_429 and self.random.random() < self.rate_429:
+            self.rejected[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            })
+        return web.json_response({'ok': True, 'result': self.result_for(method, form)})
+
+    async def stats(self, request: web.Request):
+        return web.json_response({
+            'uptime': round(time.time() - self.started, 1),
+            'calls': dict(self.calls),
+            'rejected_429': dict(self.rejected),
+        })
+
+    async def reset(self, request: web.Request):
+        self.calls.clear()
+        self.rejected.clear()
+        return web.json_response({'ok': True})
+
+
+def create_app(fake: FakeTelegram) -> web.Application:
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', fake.handle)
+    app.router.add_get('/bot{token}/{method}', fake.handle)
+    app.router.add_get('/_stats', fake.stats)
+    app.router.add_post('/_reset', fake.reset)
+    return app
+
+
+def run(port=8081, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1, seed=None):
+    """تشغيل الخادم (يُستدعى أيضاً من webhook_load.py في عملية منفصلة)"""
+    fake = FakeTelegram(latency_ms, jitter_ms, rate_429, retry_after, seed)
+    web.run_app(create_app(fake), host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خادم Bot API وهمي")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-429', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    print(f"🤖 Bot API وهمي على 127.0.0.1:{args.port} "
+          f"(تأخير {args.latency_ms}±{args.jitter_ms}ms، 429: {args.rate_429:.1%})")
+    run(args.port, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.seed)
+
+
+if __name__ == '__main__':
+    main()
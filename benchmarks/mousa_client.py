@@ -0,0 +1,215 @@
+# benchmarks/mousa_client.py
+"""
+قياس أداء عميل Mousa Card (api/client.MousaCardAPI) مقابل المحاكي المحلي
+
+    python benchmarks/mousa_client.py --products 10000 --requests 2000 --concurrency 50 --latency-ms 20
+    python benchmarks/mousa_client.py --products 10000 --dsn postgres://.../charging_bot_test   # + المزامنة
+
+المراحل:
+    catalog   جلب كامل الكتالوج (بدون كاش @cached) وتوحيده - الزمن والحجم
+    profile   طلبات متزامنة على الجلسة المشتركة، ثم نفس العدد بجلسة جديدة لكل طلب
+              (الفرق = كلفة عدم إعادة استخدام الاتصال؛ عدد اتصالات TCP من المحاكي)
+    orders    إنشاء طلبات ثم الاستعلام عنها بدفعات عبر check_orders
+    sync      sync_services_to_db على الكتالوج كاملاً مرتين (إدخال ثم تحديث) - يتطلب --dsn
+
+⚠️ مرحلة sync تكتب في جدول applications - استخدم قاعدة اختبار.
+--error-rate و --slow-rate تُمرر للمحاكي لقياس سلوك العميل مع الأخطاء وانتهاء المهلة.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp
+
+import mousa_simulator
+from api.client import MousaCardAPI
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def sim_stats(session, base):
+    async with session.get(f"{base}/_stats") as resp:
+        return await resp.json()
+
+
+async def sim_reset(session, base):
+    async with session.post(f"{base}/_reset") as resp:
+        await resp.read()
+
+
+async def wait_for_simulator(session, base, attempts=100):
+    for _ in range(attempts):
+        try:
+            await sim_stats(session, base)
+            return True
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    return False
+
+
+async def run_concurrent(total, concurrency, call):
+    """تنفيذ call(i) total مرة بتوازي concurrency - يعيد (الأزمنة، الفشل، المدة)"""
+    timings, failures = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for i in counter:
+            started = time.perf_counter()
+            result = await call(i)
+            timings.append(time.perf_counter() - started)
+            if not result:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, failures, time.perf_counter() - started
+
+
+def report(name, timings, failures, elapsed, extra=''):
+    rate = len(timings) / elapsed if elapsed else 0
+    print(f"   {name:<28} {len(timings):>6} طلب  {rate:>8.1f}/s  p50 {percentile(timings, 50) * 1000:>7.1f}ms  "
+          f"p95 {percentile(timings, 95) * 1000:>7.1f}ms  p99 {percentile(timings, 99) * 1000:>7.1f}ms  "
+          f"فشل {failures}{extra}")
+
+
+async def bench_catalog(api, runs):
+    fetch = MousaCardAPI.get_products.__wrapped__  # بدون كاش @cached
+    timings, count = [], 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        products = await fetch(api)
+        timings.append(time.perf_counter() - started)
+        count = len(products)
+    print(f"\n📦 الكتالوج: {count} منتج | متوسط {statistics.mean(timings) * 1000:.0f}ms "
+          f"| أقصى {max(timings) * 1000:.0f}ms ({runs} مرات)")
+
+
+async def bench_profile(api, session, base, args):
+    print(f"\n👤 get_profile: {args.requests} طلب بتوازي {args.concurrency}")
+    await sim_reset(session, base)
+    timings, failures, elapsed = await run_concurrent(
+        args.requests, args.concurrency, lambda i: api.get_profile())
+    shared = await sim_stats(session, base)
+    report('جلسة مشتركة', timings, failures, elapsed, f"  اتصالات {shared['connections']}")
+
+    await sim_reset(session, base)
+
+    async def fresh(i):
+        client = MousaCardAPI(api.base_url, api.api_token)
+        try:
+            return await client.get_profile()
+        finally:
+            await client.close()
+
+    timings, failures, elapsed = await run_concurrent(args.requests, args.concurrency, fresh)
+    fresh_stats = await sim_stats(session, base)
+    report('جلسة لكل طلب', timings, failures, elapsed, f"  اتصالات {fresh_stats['connections']}")
+
+
+async def bench_orders(api, session, base, args):
+    print(f"\n🛒 create_order + check_orders: {args.orders} طلب")
+    products = await MousaCardAPI.get_products.__wrapped__(api)
+    eligible = [p for p in products if p['available']]
+    if not eligible:
+        print("   ⚠️ لا توجد منتجات متاحة")
+        return
+    await sim_reset(session, base)
+    order_ids = []
+
+    async def create(i):
+        product = eligible[i % len(eligible)]
+        result = await api.create_order(product['id'], 1, player_id=str(100000 + i))
+        if result.get('success'):
+            order_ids.append(str(result['order_id']))
+        return result.get('success')
+
+    timings, failures, elapsed = await run_concurrent(args.orders, args.concurrency, create)
+    report('create_order', timings, failures, elapsed)
+
+    batches = [order_ids[i:i + args.check_batch] for i in range(0, len(order_ids), args.check_batch)]
+    timings, failures, elapsed = await run_concurrent(
+        len(batches), min(args.concurrency, len(batches) or 1), lambda i: api.check_orders(batches[i]))
+    report(f'check_orders (دفعة {args.check_batch})', timings, failures, elapsed)
+    stats = await sim_stats(session, base)
+    print(f"   اتصالات {stats['connections']} | أخطاء محقونة {stats['injected']}")
+
+
+async def bench_sync(api, args):
+    import asyncpg
+    from cache import clear_cache
+
+    pool = await asyncpg.create_pool(dsn=args.dsn, min_size=1, max_size=2)
+    try:
+        print(f"\n🔄 sync_services_to_db ({args.products} منتج)")
+        for label in ('الأولى (إدخال)', 'الثانية (تحديث)'):
+            # المزامنة تجلب الكتالوج عبر get_products المخزن في الكاش
+            clear_cache()
+            started = time.perf_counter()
+            count = await api.sync_services_to_db(pool)
+            elapsed = time.perf_counter() - started
+            print(f"   {label:<18} {count:>6} منتج في {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f}/s)")
+    finally:
+        await pool.close()
+
+
+async def main(args):
+    base = f"http://127.0.0.1:{args.port}"
+    async with aiohttp.ClientSession() as session:
+        if not await wait_for_simulator(session, base):
+            sys.exit("❌ المحاكي لم يبدأ")
+        api = MousaCardAPI(base, 'simulator-token')
+        try:
+            await bench_catalog(api, args.catalog_runs)
+            await bench_profile(api, session, base, args)
+            await bench_orders(api, session, base, args)
+            if args.dsn:
+                await bench_sync(api, args)
+            else:
+                print("\nℹ️ تخطي المزامنة (حدد --dsn لقاعدة اختبار)")
+        finally:
+            await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="قياس عميل Mousa Card مقابل المحاكي")
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--check-batch', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--catalog-runs', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=5)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--slow-rate', type=float, default=0)
+    parser.add_argument('--slow-ms', type=float, default=35000)
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    args = parser.parse_args()
+
+    simulator = multiprocessing.Process(
+        target=mousa_simulator.run,
+        kwargs={'port': args.port, 'products': args.products, 'categories': args.categories,
+                'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'error_rate': args.error_rate,
+                'slow_rate': args.slow_rate, 'slow_ms': args.slow_ms, 'balance': 1e9},
+        daemon=True,
+    )
+    simulator.start()
+    try:
+        asyncio.run(main(args))
+    finally:
+        simulator.terminate()
@@ -0,0 +1,281 @@
+# benchmarks/mousa_simulator.py
+"""
+محاكي محلي لـ API موقع Mousa Card
+
+ينفذ نفس المسارات التي يستخدمها api/client.MousaCardAPI:
+
+    GET  /client/api/profile/                      الرصيد
+    GET  /client/api/products/[?products_id=..&base=1]
+    GET  /client/api/content/{category_id}/        تصنيفات فرعية + منتجات
+    POST /client/api/newOrder/{product_id}/params/?qt=..&order_uuid=..&playerId=..
+    GET  /client/api/check?orders=[id1,id2]/
+
+الكتالوج يُولد بشكل حتمي (--seed) بحجم قابل للضبط، والطلبات تنتقل من wait إلى
+accept (أو reject بنسبة --reject-rate) بعد --complete-after ثانية.
+
+    python benchmarks/mousa_simulator.py --port 8092 --products 10000 --latency-ms 80 \\
+        --error-rate 0.01 --slow-rate 0.005 --slow-ms 35000
+    API_BASE_URL=http://127.0.0.1:8092 python run_bot_webhook.py
+
+--slow-rate مع --slow-ms أكبر من مهلة العميل (30 ثانية) يختبر مسار انتهاء المهلة.
+GET /_stats يعيد عدد الطلبات لكل مسار وعدد اتصالات TCP (لقياس إعادة استخدام الاتصال).
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+PRODUCT_WORDS = ['PUBG', 'Free Fire', 'Likee', 'TikTok', 'Bigo', 'Yalla', 'Jawaker', 'Mobile Legends',
+                 'Netflix', 'Spotify', 'iTunes', 'Google Play', 'Steam', 'PlayStation', 'Xbox', 'Razer Gold',
+                 'شدات', 'جواهر', 'كوينز', 'الماس', 'نقاط', 'رصيد']
+UNITS = ['60', '325', '660', '1800', '3850', '8100', '100', '500', '1000', '5000']
+
+
+class MousaSimulator:
+    """حالة المحاكي: الكتالوج، الطلبات، الرصيد، والعدادات"""
+
+    def __init__(self, products=500, categories=20, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 slow_rate=0.0, slow_ms=35000.0, reject_rate=0.05, complete_after=2.0,
+                 balance=10000.0, token=None, seed=1):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow = slow_ms / 1000
+        self.reject_rate = reject_rate
+        self.complete_after = complete_after
+        self.balance = balance
+        self.token = token
+        self.random = random.Random(seed)
+        self.orders = {}
+        self.requests = Counter()
+        self.injected = Counter()
+        self.connections = set()
+        self.build_catalog(products, categories, seed)
+
+    # ---------- الكتالوج ----------
+    def build_catalog(self, products, categories, seed):
+        rng = random.Random(seed)
+        self.categories = [
+            {'id': i, 'name': f"{PRODUCT_WORDS[i % len(PRODUCT_WORDS)]} {i}",
+             'image_url': f"https://example.invalid/cat/{i}.png", 'parent_id': 0, 'sort_order': i}
+            for i in range(1, categories + 1)
+        ]
+        self.products = []
+        for i in range(1, products + 1):
+            category = self.categories[(i - 1) % len(self.categories)]
+            word = PRODUCT_WORDS[rng.randrange(len(PRODUCT_WORDS))]
+            price = round(rng.uniform(0.05, 120), 4)
+            self.products.append({
+                'id': i,
+                'name': f"{word} {UNITS[rng.randrange(len(UNITS))]} #{i}",
+                'price': price,
+                'base_price': round(price * 0.92, 4),
+                'category_name': category['name'],
+                'category_id': category['id'],
+                'available': rng.random() > 0.1,
+                'product_type': 'amount' if rng.random() < 0.3 else 'package',
+                'qty_values': {'min': 1, 'max': rng.choice([1, 10, 100, 1000])},
+                'params': ['playerId'],
+            })
+        self.by_id = {p['id']: p for p in self.products}
+
+    # ---------- حقن التأخير والأخطاء ----------
+    async def _disturb(self, request: web.Request):
+        """تأخير عادي أو بطيء أو خطأ 500 - يعيد رداً عند حقن خطأ"""
+        transport = request.transport
+        if transport is not None:
+            self.connections.add(id(transport))
+        if self.token:
+            auth = request.headers.get('Authorization', '')
+            if auth != f"Bearer {self.token}" and request.headers.get('api-token') != self.token:
+                self.injected['unauthorized'] += 1
+                return web.json_response({'status': 'ERROR', 'message': 'Unauthorized'}, status=401)
+
+        if self.slow_rate and self.random.random() < self.slow_rate:
+            self.injected['slow'] += 1
+            await asyncio.sleep(self.slow)
+        else:
+            delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.injected['error'] += 1
+            return web.json_response({'status': 'ERROR', 'message': 'Internal Server Error'}, status=500)
+        return None
+
+    # ---------- المسارات ----------
+    async def profile(self, request: web.Request):
+        self.requests['profile'] += 1
+        error = await self._disturb(request)
+        if error:
+            return error
+        return web.json_response({'balance': f"{self.balance:.4f}", 'email': 'simulator@example.invalid'})
+
+    async def products_list(self, request: web.Request):
+        self.requests['products'] += 1
+        error = await self._disturb(request)
+        if error:
+            return error
+        products = self.products
+        ids = request.query.get('products_id')
+        if ids:
+            wanted = {int(x) for x in ids.split(',') if x.strip().isdigit()}
+            products = [p for p in products if p['id'] in wanted]
+        if request.query.get('base') == '1':
+            products = [{'id': p['id'], 'name': p['name']} for p in products]
+        return web.json_response(products)
+
+    async def content(self, request: web.Request):
+        self.requests['content'] += 1
+        error = await self._disturb(request)
+        if error:
+            return error
+        category_id = int(request.match_info['category_id'])
+        if category_id == 0:
+            return web.json_response({'categories': self.categories})
+        result = {'categories': []}
+        for product in self.products:
+            if product['category_id'] == category_id:
+                result[product['name']] = {
+                    'id': product['id'],
+                    'price': product['price'],
+                    'base_price': product['base_price'],
+                    'available': product['available'],
+                    'product_type': product['product_type'],
+                }
+        return web.json_response(result)
+
+    async def new_order(self, request: web.Request):
+        self.requests['newOrder'] += 1
+        error = await self._disturb(request)
+        if error:
+            return error
+        product = self.by_id.get(int(request.match_info['product_id']))
+        if product is None or not product['available']:
+            return web.json_response({'status': 'ERROR', 'message': 'المنتج غير متوفر'})
+        try:
+            quantity = int(request.query.get('qt', 1))
+        except ValueError:
+            return web.json_response({'status': 'ERROR', 'message': 'كمية غير صحيحة'})
+        if not product['qty_values']['min'] <= quantity <= product['qty_values']['max']:
+            return web.json_response({'status': 'ERROR', 'message': 'الكمية خارج الحدود'})
+        price = round(product['price'] * quantity, 4)
+        if price > self.balance:
+            return web.json_response({'status': 'ERROR', 'message': 'الرصيد غير كافٍ'})
+
+        order_uuid = request.query.get('order_uuid') or str(uuid.uuid4())
+        existing = self.orders.get(order_uuid)
+        if existing is None:
+            self.balance -= price
+            existing = self.orders[order_uuid] = {
+                'ID': order_uuid,
+                'product': product,
+                'quantity': quantity,
+                'price': price,
+                'player_id': request.query.get('playerId'),
+                'created': time.time(),
+                'final': 'reject' if self.random.random() < self.reject_rate else 'accept',
+            }
+        return web.json_response({
+            'status': 'OK',
+            'data': {'ID': existing['ID'], 'status': 'wait', 'price': existing['price'],
+                     'data': {'playerId': existing['player_id']}},
+            'reply_api': [],
+        })
+
+    def _order_status(self, order):
+        if time.time() - order['created'] < self.complete_after:
+            return 'wait'
+        return order['final']
+
+    async def check(self, request: web.Request):
+        self.requests['check'] += 1
+        error = await self._disturb(request)
+        if error:
+            return error
+        raw = request.query.get('orders', '')
+        ids = [x.strip() for x in raw.strip('/').strip('[]').split(',') if x.strip()]
+        data = []
+        for order_id in ids:
+            order = self.orders.get(order_id)
+            if order is None:
+                continue
+            status = self._order_status(order)
+            data.append({
+                'order_id': order['ID'],
+                'quantity': order['quantity'],
+                'data': {'playerId': order['player_id']},
+                'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(order['created'])),
+                'product_name': order['product']['name'],
+                'price': order['price'],
+                'status': status,
+                'replay_api': [f"code-{order['ID'][:8]}"] if status == 'accept' else [],
+            })
+        return web.json_response({'status': 'OK', 'data': data})
+
+    async def stats(self, request: web.Request):
+        return web.json_response({
+            'requests': dict(self.requests),
+            'injected': dict(self.injected),
+            'connections': len(self.connections),
+            'orders': len(self.orders),
+            'balance': round(self.balance, 4),
+            'products': len(self.products),
+        })
+
+    async def reset(self, request: web.Request):
+        self.requests.clear()
+        self.injected.clear()
+        self.connections.clear()
+        return web.json_response({'ok': True})
+
+
+def create_app(sim: MousaSimulator) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/client/api/profile/', sim.profile)
+    app.router.add_get('/client/api/products/', sim.products_list)
+    app.router.add_get('/client/api/content/{category_id}/', sim.content)
+    app.router.add_post('/client/api/newOrder/{product_id}/params/', sim.new_order)
+    app.router.add_get('/client/api/check', sim.check)
+    app.router.add_get('/_stats', sim.stats)
+    app.router.add_post('/_reset', sim.reset)
+    return app
+
+
+def run(port=8092, **options):
+    """تشغيل المحاكي (يُستدعى أيضاً من mousa_client.py في عملية منفصلة)"""
+    sim = MousaSimulator(**options)
+    web.run_app(create_app(sim), host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="محاكي Mousa Card API")
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--slow-rate', type=float, default=0)
+    parser.add_argument('--slow-ms', type=float, default=35000)
+    parser.add_argument('--reject-rate', type=float, default=0.05)
+    parser.add_argument('--complete-after', type=float, default=2.0)
+    parser.add_argument('--balance', type=float, default=10000)
+    parser.add_argument('--token', default=None, help="رفض الطلبات بدون هذا التوكن (401)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    options = vars(args)
+    port = options.pop('port')
+    print(f"🛒 محاكي Mousa Card على 127.0.0.1:{port} ({args.products} منتج، {args.categories} تصنيف، "
+          f"تأخير {args.latency_ms}ms، أخطاء {args.error_rate:.1%}، بطيء {args.slow_rate:.1%})")
+    run(port, **options)
+
+
+if __name__ == '__main__':
+    main()
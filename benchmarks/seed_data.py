@@ -0,0 +1,420 @@
+# benchmarks/seed_data.py
+"""
+توليد بيانات اصطناعية بحجم الإنتاج لقاعدة PostgreSQL
+
+يملأ الجداول التي ينشئها database/connection.init_db (مستخدمون مع شبكة إحالات،
+أقسام/تطبيقات/خيارات، طلبات، طلبات شحن، سجل نقاط) باستخدام COPY، والنتيجة حتمية
+لنفس --seed ونفس الأحجام: كل جدول له مولد عشوائي مستقل، والتواريخ محسوبة من
+--end وليس من الوقت الحالي، فتبقى خطط الاستعلامات ونتائج القياس قابلة للمقارنة.
+
+    python benchmarks/seed_data.py --dsn postgres://.../charging_bot_bench --scale large --truncate
+    python benchmarks/seed_data.py --dsn ... --scale small --orders 200000 --seed 7
+
+الأحجام الجاهزة (--scale):
+    small   10k مستخدم، 100k طلب، 40k شحن، 200k نقاط
+    medium  100k مستخدم، 1M طلب، 400k شحن، 2M نقاط
+    large   500k مستخدم، 5M طلب، 2M شحن، 10M نقاط
+
+⚠️ --truncate يحذف كل بيانات المستخدمين والطلبات والشحن والنقاط والكتالوج.
+بعد التوليد: تحديث إجماليات المستخدمين (الصرف، الشحن، النقاط، VIP، عدد الإحالات)
+باستعلامات مجمعة، ضبط تسلسلات SERIAL، ثم ANALYZE.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import asyncpg
+
+SCALES = {
+    'small': {'users': 10_000, 'orders': 100_000, 'deposits': 40_000, 'points': 200_000,
+              'categories': 8, 'apps': 120},
+    'medium': {'users': 100_000, 'orders': 1_000_000, 'deposits': 400_000, 'points': 2_000_000,
+               'categories': 12, 'apps': 300},
+    'large': {'users': 500_000, 'orders': 5_000_000, 'deposits': 2_000_000, 'points': 10_000_000,
+              'categories': 16, 'apps': 600},
+}
+
+CHUNK = 50_000
+USER_ID_BASE = 1_000_000_000
+EXCHANGE_RATE = 118
+
+# الجداول التي يفرغها --truncate (بالترتيب المناسب للمفاتيح الأجنبية)
+SEED_TABLES = ('wallet_snapshots', 'wallet_ledger', 'referrals', 'points_history', 'orders',
+               'deposit_requests', 'redemption_requests', 'product_options', 'app_variants', 'applications', 'categories', 'users')
+
+CATEGORY_NAMES = [
+    ('chat_apps', 'تطبيقات دردشة', '💬'), ('games', 'ألعاب', '🎮'), ('social', 'تواصل اجتماعي', '📱'),
+    ('streaming', 'بث مباشر', '📺'), ('gift_cards', 'بطاقات هدايا', '🎁'), ('subscriptions', 'اشتراكات', '⭐'),
+    ('telecom', 'رصيد اتصالات', '📞'), ('music', 'موسيقى', '🎵'), ('vpn', 'VPN', '🛡'),
+    ('education', 'تعليم', '📚'), ('crypto', 'عملات رقمية', '🪙'), ('cloud', 'تخزين سحابي', '☁️'),
+]
+APP_WORDS = ['PUBG', 'Free Fire', 'Likee', 'TikTok', 'Bigo', 'Yalla', 'Jawaker', 'Mobile Legends', 'Netflix',
+             'Spotify', 'iTunes', 'Google Play', 'Steam', 'PlayStation', 'Xbox', 'Razer Gold', 'Telegram',
+             'Instagram', 'Snapchat', 'Ludo Star', 'Clash of Clans', 'Roblox', 'Fortnite', 'Shahid']
+APP_TYPES = (('game', 0.45), ('service', 0.35), ('subscription', 0.20))
+FIRST_NAMES = ['محمد', 'أحمد', 'علي', 'حسن', 'عمر', 'خالد', 'سارة', 'ريم', 'نور', 'لين', 'يوسف', 'Ali',
+               'Omar', 'Sam', 'Lara', 'Maya', 'Karim', 'Hadi', 'Rami', 'Dana']
+
+ORDER_STATUSES = (('completed', 0.80), ('processing', 0.06), ('pending', 0.03),
+                  ('failed', 0.05), ('rejected', 0.06))
+DEPOSIT_STATUSES = (('approved', 0.85), ('rejected', 0.10), ('pending', 0.05))
+DEPOSIT_METHODS = (('m_syr', 0.55), ('m_sham_syp', 0.25), ('m_sham_usd', 0.10), ('m_usdt', 0.10))
+POINT_ACTIONS = (('order_completed', 0.70), ('referral', 0.20), ('redemption', 0.05), ('admin_add', 0.05))
+
+# نسبة المستخدمين القادمين عبر إحالة
+REFERRED_SHARE = 0.3
+
+
+def weighted(rng, table):
+    """اختيار من ((قيمة، وزن)...)"""
+    roll = rng.random()
+    for value, weight in table:
+        roll -= weight
+        if roll < 0:
+            return value
+    return table[-1][0]
+
+
+def referral_code(index: int) -> str:
+    """كود إحالة فريد من 8 رموز (تبديل ثابت لرقم المستخدم في فضاء 36^8)"""
+    space = 36 ** 8
+    value = (index * 2_654_435_761 + 97_531) % space
+    alphabet = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    chars = []
+    for _ in range(8):
+        value, digit = divmod(value, 36)
+        chars.append(alphabet[digit])
+    return ''.join(chars)
+
+
+class Seeder:
+    def __init__(self, args):
+        self.args = args
+        self.end = datetime.strptime(args.end, '%Y-%m-%d')
+        self.span = timedelta(days=args.days).total_seconds()
+        self.user_ids = [USER_ID_BASE + i for i in range(args.users)]
+        self.user_created = []
+        self.cum_activity = []
+        self.options = []      # (option_id, app_id, app_name, name, quantity, price)
+        self.services = []     # (app_id, name, price) - تطبيقات الكمية (service)
+
+    def rng(self, table: str) -> random.Random:
+        """مولد مستقل لكل جدول (تغيير حجم جدول لا يغير بيانات جدول آخر)"""
+        return random.Random(f"{self.args.seed}:{table}")
+
+    def timestamp(self, rng, after=None) -> datetime:
+        """وقت عشوائي ضمن الفترة (أكثر كثافة في الأشهر الأخيرة - نمو المستخدمين)"""
+        start = self.end - timedelta(seconds=self.span)
+        if after is not None and after > start:
+            start = after
+        window = (self.end - start).total_seconds()
+        offset = window * (1 - rng.random() ** 1.5)
+        return (start + timedelta(seconds=offset)).replace(microsecond=0)
+
+    def pick_user(self, rng) -> int:
+        """مستخدم حسب النشاط (توزيع ذيل طويل: قلة من المستخدمين ينشئون معظم الطلبات)"""
+        return rng.choices(range(len(self.user_ids)), cum_weights=self.cum_activity)[0]
+
+    async def copy(self, pool, table, columns, rows, total, label):
+        """COPY على دفعات من مولد الصفوف"""
+        started = time.perf_counter()
+        written = 0
+        async with pool.acquire() as conn:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= CHUNK:
+                    await conn.copy_records_to_table(table, records=batch, columns=columns)
+                    written += len(batch)
+                    batch = []
+                    if written % (CHUNK * 10) == 0:
+                        print(f"   … {label}: {written:,}/{total:,}")
+            if batch:
+                await conn.copy_records_to_table(table, records=batch, columns=columns)
+                written += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"✅ {label}: {written:,} صف في {elapsed:.1f}s ({written / elapsed if elapsed else 0:,.0f}/s)")
+        return written
+
+    # ---------- الكتالوج ----------
+    def catalog_rows(self):
+        rng = self.rng('catalog')
+        categories = []
+        for i in range(self.args.categories):
+            name, display, icon = CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+            suffix = '' if i < len(CATEGORY_NAMES) else f"_{i}"
+            categories.append((i + 1, f"{name}{suffix}", f"{icon} {display}{suffix}", icon, i + 1))
+
+        apps, options = [], []
+        option_id = 1
+        for app_id in range(1, self.args.apps + 1):
+            word = APP_WORDS[(app_id - 1) % len(APP_WORDS)]
+            name = f"{word} {app_id}"
+            app_type = weighted(rng, APP_TYPES)
+            price = round(rng.uniform(0.002, 0.05) if app_type == 'service' else rng.uniform(0.5, 40), 6)
+            api_service_id = str(10_000 + app_id) if rng.random() < 0.4 else None
+            is_active = rng.random() > 0.08
+            category_id = 1 + (app_id - 1) % self.args.categories
+            apps.append((app_id, name, price, rng.choice((1, 10, 100, 1000)), 10.0, category_id,
+                         app_type, api_service_id, is_active))
+            if app_type == 'service':
+                self.services.append((app_id, name, price))
+                continue
+            for sort_order in range(rng.randint(3, 10)):
+                quantity = [60, 325, 660, 1800, 3850, 8100, 16200, 30, 90, 365][sort_order % 10]
+                option_price = round(price * (sort_order + 1) * rng.uniform(0.9, 1.1), 6)
+                option_name = f"{quantity} {'يوم' if app_type == 'subscription' else 'وحدة'}"
+                options.append((option_id, app_id, option_name, quantity, Decimal(str(option_price)), sort_order,
+                                rng.random() > 0.05))
+                self.options.append((option_id, app_id, name, option_name, quantity, option_price))
+                option_id += 1
+        return categories, apps, options
+
+    async def seed_catalog(self, pool):
+        categories, apps, options = self.catalog_rows()
+        async with pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                'categories', records=categories, columns=('id', 'name', 'display_name', 'icon', 'sort_order'))
+            await conn.copy_records_to_table(
+                'applications', records=apps,
+                columns=('id', 'name', 'unit_price_usd', 'min_units', 'profit_percentage', 'category_id',
+                         'type', 'api_service_id', 'is_active'))
+            await conn.copy_records_to_table(
+                'product_options', records=options,
+                columns=('id', 'product_id', 'name', 'quantity', 'price_usd', 'sort_order', 'is_active'))
+        print(f"✅ الكتالوج: {len(categories)} قسم، {len(apps)} تطبيق، {len(options)} خيار")
+
+    # ---------- المستخدمون وشبكة الإحالات ----------
+    def prepare_users(self):
+        """تواريخ التسجيل (مرتبة)، أوزان النشاط، والمُحيل لكل مستخدم"""
+        rng = self.rng('users')
+        count = len(self.user_ids)
+        self.user_created = sorted(self.timestamp(rng) for _ in range(count))
+
+        # نشاط بتوزيع log-normal (ذيل طويل)
+        total = 0.0
+        self.cum_activity = []
+        for _ in range(count):
+            total += rng.lognormvariate(0, 1.2)
+            self.cum_activity.append(total)
+
+        # شبكة الإحالات: ارتباط تفضيلي - من لديه إحالات أكثر يجذب إحالات أكثر
+        self.referred_by = [None] * count
+        attractors = []
+        for i in range(count):
+            if i and rng.random() < REFERRED_SHARE:
+                if attractors and rng.random() < 0.7:
+                    referrer = attractors[rng.randrange(len(attractors))]
+                else:
+                    referrer = rng.randrange(i)
+                self.referred_by[i] = referrer
+                attractors.append(referrer)
+
+    def user_rows(self):
+        rng = self.rng('user_rows')
+        for i, user_id in enumerate(self.user_ids):
+            created = self.user_created[i]
+            referrer = self.referred_by[i]
+            yield (
+                user_id,
+                f"user_{i}" if rng.random() < 0.7 else None,
+                FIRST_NAMES[rng.randrange(len(FIRST_NAMES))],
+                rng.random() < 0.003,
+                created,
+                referral_code(i),
+                self.user_ids[referrer] if referrer is not None else None,
+                self.timestamp(rng, after=created),
+            )
+
+    # ---------- الطلبات والشحن والنقاط ----------
+    def order_rows(self):
+        rng = self.rng('orders')
+        for order_id in range(1, self.args.orders + 1):
+            u = self.pick_user(rng)
+            created = self.timestamp(rng, after=self.user_created[u])
+            status = weighted(rng, ORDER_STATUSES)
+            if self.options and (not self.services or rng.random() < 0.7):
+                option_id, app_id, app_name, variant_name, quantity, price = \
+                    self.options[rng.randrange(len(self.options))]
+                total_usd = price
+            else:
+                app_id, app_name, price = self.services[rng.randrange(len(self.services))]
+                option_id, variant_name = None, None
+                quantity = rng.choice((100, 500, 1000, 5000, 10000))
+                total_usd = price * quantity
+            points = max(1, int(total_usd)) if status == 'completed' else 0
+            yield (
+                order_id, self.user_ids[u], f"user_{u}", app_id, app_name, option_id, variant_name,
+                quantity, price, round(total_usd * EXCHANGE_RATE, 2), str(rng.randrange(10**8, 10**10)),
+                status, points, created, created + timedelta(seconds=rng.randint(5, 3600)),
+            )
+
+    def deposit_rows(self):
+        rng = self.rng('deposits')
+        for deposit_id in range(1, self.args.deposits + 1):
+            u = self.pick_user(rng)
+            created = self.timestamp(rng, after=self.user_created[u])
+            method = weighted(rng, DEPOSIT_METHODS)
+            amount_syp = rng.choice((5000, 10000, 25000, 50000, 100000, 250000, 500000))
+            yield (
+                deposit_id, self.user_ids[u], f"user_{u}", method, round(amount_syp / EXCHANGE_RATE, 2),
+                float(amount_syp), str(rng.randrange(10**11, 10**12)), weighted(rng, DEPOSIT_STATUSES),
+                created, created + timedelta(seconds=rng.randint(30, 7200)),
+            )
+
+    def points_rows(self):
+        rng = self.rng('points')
+        for row_id in range(1, self.args.points + 1):
+            u = self.pick_user(rng)
+            action = weighted(rng, POINT_ACTIONS)
+            if action == 'redemption':
+                points, description = -100 * rng.randint(1, 5), 'استرداد نقاط'
+            elif action == 'referral':
+                points, description = rng.randint(1, 5), 'نقاط إحالة'
+            elif action == 'admin_add':
+                points, description = rng.randint(5, 100), 'إضافة من الأدمن'
+            else:
+                points, description = rng.randint(1, 20), 'نقاط طلب مكتمل'
+            yield (row_id, self.user_ids[u], points, action, description,
+                   self.timestamp(rng, after=self.user_created[u]))
+
+    # ---------- ما بعد التوليد ----------
+    async def finalize(self, pool):
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO referrals (referred_id, referrer_id, points, created_at)
+                SELECT user_id, referred_by, 1, created_at FROM users WHERE referred_by IS NOT NULL
+            ''')
+            await conn.execute('''
+                UPDATE users u SET referral_count = r.cnt
+                FROM (SELECT referred_by, COUNT(*) AS cnt FROM users
+                      WHERE referred_by IS NOT NULL GROUP BY referred_by) r
+                WHERE u.user_id = r.referred_by
+            ''')
+            await conn.execute('''
+                UPDATE users u SET total_spent = o.spent, total_orders = o.cnt
+                FROM (SELECT user_id, SUM(total_amount_syp) AS spent, COUNT(*) AS cnt
+                      FROM orders WHERE status = 'completed' GROUP BY user_id) o
+                WHERE u.user_id = o.user_id
+            ''')
+            await conn.execute('''
+                UPDATE users u SET total_deposits = d.total
+                FROM (SELECT user_id, SUM(amount_syp) AS total
+                      FROM deposit_requests WHERE status = 'approved' GROUP BY user_id) d
+                WHERE u.user_id = d.user_id
+            ''')
+            await conn.execute('''
+                UPDATE users u SET total_points = GREATEST(p.net, 0),
+                                   total_points_earned = p.earned,
+                                   total_points_redeemed = p.redeemed
+                FROM (SELECT user_id, SUM(points) AS net,
+                             SUM(points) FILTER (WHERE points > 0) AS earned,
+                             -COALESCE(SUM(points) FILTER (WHERE points < 0), 0) AS redeemed
+                      FROM points_history GROUP BY user_id) p
+                WHERE u.user_id = p.user_id
+            ''')
+            await conn.execute('''
+                UPDATE users u SET balance = GREATEST(u.total_deposits - u.total_spent, 0),
+                                   vip_level = v.level, discount_percent = v.discount_percent
+                FROM vip_levels v
+                WHERE v.level = (SELECT level FROM vip_levels
+                                 WHERE min_spent <= COALESCE(u.total_spent, 0)
+                                 ORDER BY min_spent DESC LIMIT 1)
+            ''')
+            # الرصيد الناتج يدخل سجل الحركات كقيد افتتاحي (مثل أرصدة ما قبل السجل)
+            await conn.execute('''
+                INSERT INTO wallet_ledger (user_id, delta, reason, balance_after)
+                SELECT user_id, balance, 'opening', balance FROM users WHERE balance <> 0
+            ''')
+
+            for table, column in (('categories', 'id'), ('applications', 'id'), ('product_options', 'id'),
+                                  ('orders', 'id'), ('deposit_requests', 'id'), ('points_history', 'id')):
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                    f"GREATEST((SELECT MAX({column}) FROM {table}), 1))")
+            await conn.execute('ANALYZE')
+        print(f"✅ الإجماليات والتسلسلات و ANALYZE في {time.perf_counter() - started:.1f}s")
+
+
+async def main(args):
+    pool = await asyncpg.create_pool(dsn=args.dsn, min_size=1, max_size=4, command_timeout=None)
+    try:
+        if args.init_schema:
+            # init_db يستورد config الذي يتطلب BOT_TOKEN
+            os.environ.setdefault('BOT_TOKEN', '0:seed')
+            os.environ.setdefault('DATABASE_URL', args.dsn)
+            from database.connection import init_db
+            await init_db(pool)
+
+        if not args.truncate:
+            # القسم الافتراضي الذي يضيفه init_db لا يمنع التوليد (لا تطبيقات تشير إليه)
+            filled = [t for t in SEED_TABLES if t != 'categories'
+                      and await pool.fetchval(f"SELECT EXISTS (SELECT 1 FROM {t})")]
+            if filled:
+                sys.exit(f"❌ جداول غير فارغة ({', '.join(filled)}) - استخدم --truncate لبيانات حتمية")
+            await pool.execute("DELETE FROM categories")
+        else:
+            await pool.execute(f"TRUNCATE {', '.join(SEED_TABLES)} RESTART IDENTITY CASCADE")
+            print("🗑 تم تفريغ الجداول")
+
+        seeder = Seeder(args)
+        started = time.perf_counter()
+        seeder.prepare_users()
+        await seeder.seed_catalog(pool)
+        await seeder.copy(pool, 'users', (
+            'user_id', 'username', 'first_name', 'is_banned', 'created_at', 'referral_code',
+            'referred_by', 'last_activity'), seeder.user_rows(), args.users, 'المستخدمون')
+
+        # الجداول المستقلة بالتوازي على اتصالات منفصلة
+        await asyncio.gather(
+            seeder.copy(pool, 'orders', (
+                'id', 'user_id', 'username', 'app_id', 'app_name', 'variant_id', 'variant_name', 'quantity',
+                'unit_price_usd', 'total_amount_syp', 'target_id', 'status', 'points_earned',
+                'created_at', 'updated_at'), seeder.order_rows(), args.orders, 'الطلبات'),
+            seeder.copy(pool, 'deposit_requests', (
+                'id', 'user_id', 'username', 'method', 'amount', 'amount_syp', 'tx_info', 'status',
+                'created_at', 'updated_at'), seeder.deposit_rows(), args.deposits, 'طلبات الشحن'),
+            seeder.copy(pool, 'points_history', (
+                'id', 'user_id', 'points', 'action', 'description', 'created_at'),
+                seeder.points_rows(), args.points, 'سجل النقاط'),
+        )
+        await seeder.finalize(pool)
+        print(f"\n🏁 اكتمل التوليد في {time.perf_counter() - started:.1f}s (seed={args.seed})")
+    finally:
+        await pool.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="توليد بيانات اصطناعية حتمية")
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for key in ('users', 'orders', 'deposits', 'points', 'categories', 'apps'):
+        parser.add_argument(f"--{key}", type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end', default='2026-01-01', help="نهاية الفترة الزمنية (YYYY-MM-DD)")
+    parser.add_argument('--days', type=int, default=540, help="طول الفترة بالأيام")
+    parser.add_argument('--truncate', action='store_true', help="تفريغ الجداول قبل التوليد")
+    parser.add_argument('--no-init-schema', dest='init_schema', action='store_false',
+                        help="عدم استدعاء init_db قبل التوليد")
+    args = parser.parse_args()
+    if not args.dsn:
+        sys.exit("❌ حدد --dsn أو DATABASE_URL")
+    for key, value in SCALES[args.scale].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    if args.categories < 1 or args.apps < 1 or args.users < 1:
+        sys.exit("❌ الأحجام يجب أن تكون موجبة")
+    return args
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
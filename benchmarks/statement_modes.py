@@ -0,0 +1,139 @@
+# benchmarks/statement_modes.py
+"""
+قياس زمن أكثر 20 استعلاماً تكراراً في الوضعين:
+
+    cached   - كاش asyncpg (statement مسماة، تُحضّر مرة واحدة لكل اتصال)
+    unnamed  - بدون كاش (parse + plan في كل استدعاء، الوضع الآمن خلف PgBouncer)
+
+    DATABASE_URL=postgres://... python benchmarks/statement_modes.py --iterations 2000
+
+الاستعلامات للقراءة فقط ومأخوذة من مسارات الأزرار الأكثر استخداماً
+(المستخدم، سعر الصرف، حالة البوت، الأقسام والتطبيقات والخيارات، الملف الشخصي).
+المعرفات تُؤخذ من أول صف موجود في كل جدول. لقياس تأثير PgBouncer مرر رابطه
+(بدون ?pgbouncer=true) - وضع cached قد يفشل خلف PgBouncer أقدم من 1.21.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+# نفس إعدادات database/statement_mode.statement_settings (بدون استيراد config الذي يتطلب BOT_TOKEN)
+MODE_SETTINGS = {
+    'unnamed': {'statement_cache_size': 0, 'max_cached_statement_lifetime': 0},
+    'cached': {'statement_cache_size': 512, 'max_cached_statement_lifetime': 300},
+}
+
+# (الاسم، الاستعلام، المعاملات كأسماء من العينة)
+STATEMENTS = [
+    ('user_by_id', "SELECT * FROM users WHERE user_id = $1", ('user_id',)),
+    ('user_ban', "SELECT is_banned FROM users WHERE user_id = $1", ('user_id',)),
+    ('user_balance', "SELECT balance FROM users WHERE user_id = $1", ('user_id',)),
+    ('user_points', "SELECT total_points FROM users WHERE user_id = $1", ('user_id',)),
+    ('user_basic', "SELECT is_banned, balance, total_points, referral_code, username, first_name, vip_level, "
+                   "discount_percent, total_spent FROM users WHERE user_id = $1", ('user_id',)),
+    ('exchange_rate', "SELECT value FROM bot_settings WHERE key = 'usd_to_syp'", ()),
+    ('bot_status', "SELECT value FROM bot_settings WHERE key = 'bot_status'", ()),
+    ('maintenance_message', "SELECT value FROM bot_settings WHERE key = 'maintenance_message'", ()),
+    ('categories', "SELECT * FROM categories ORDER BY sort_order", ()),
+    ('category_name', "SELECT display_name FROM categories WHERE id = $1", ('category_id',)),
+    ('category_apps', "SELECT * FROM applications WHERE category_id = $1 ORDER BY is_active DESC, name",
+     ('category_id',)),
+    ('app_by_id', "SELECT * FROM applications WHERE id = $1", ('app_id',)),
+    ('app_options', "SELECT * FROM product_options WHERE product_id = $1 "
+                    "ORDER BY is_active DESC, sort_order, price_usd", ('app_id',)),
+    ('active_options', "SELECT * FROM product_options WHERE product_id = $1 AND is_active = TRUE "
+                       "ORDER BY sort_order, price_usd", ('app_id',)),
+    ('option_by_id', "SELECT * FROM product_options WHERE id = $1", ('option_id',)),
+    ('referral_count', "SELECT COUNT(*) FROM users WHERE referred_by = $1", ('user_id',)),
+    ('referral_points', "SELECT COALESCE(SUM(points), 0) FROM points_history "
+                        "WHERE user_id = $1 AND action = 'referral'", ('user_id',)),
+    ('approved_deposits', "SELECT COUNT(*) FROM deposit_requests WHERE user_id = $1 AND status = 'approved'",
+     ('user_id',)),
+    ('completed_orders', "SELECT COUNT(*) FROM orders WHERE user_id = $1 AND status = 'completed'",
+     ('user_id',)),
+    ('recent_orders', "SELECT o.total_amount_syp, a.name as app_name, o.status, o.created_at "
+                      "FROM orders o JOIN applications a ON o.app_id = a.id "
+                      "WHERE o.user_id = $1 ORDER BY o.created_at DESC LIMIT 5", ('user_id',)),
+]
+
+SAMPLE_QUERIES = {
+    'user_id': "SELECT user_id FROM users ORDER BY user_id LIMIT 1",
+    'category_id': "SELECT id FROM categories ORDER BY sort_order LIMIT 1",
+    'app_id': "SELECT id FROM applications ORDER BY id LIMIT 1",
+    'option_id': "SELECT id FROM product_options ORDER BY id LIMIT 1",
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def load_sample(conn):
+    sample = {}
+    for key, query in SAMPLE_QUERIES.items():
+        sample[key] = await conn.fetchval(query) or 0
+    return sample
+
+
+async def run_mode(dsn, mode, sample, iterations, warmup):
+    """تشغيل كل استعلام iterations مرة على اتصال واحد - يعيد {name: [seconds...]}"""
+    conn = await asyncpg.connect(dsn=dsn, **MODE_SETTINGS[mode])
+    results = {}
+    try:
+        for name, query, param_names in STATEMENTS:
+            args = [sample[p] for p in param_names]
+            for _ in range(warmup):
+                await conn.fetch(query, *args)
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                await conn.fetch(query, *args)
+                timings.append(time.perf_counter() - started)
+            results[name] = timings
+    finally:
+        await conn.close()
+    return results
+
+
+async def main(args):
+    dsn = args.dsn
+    conn = await asyncpg.connect(dsn=dsn, statement_cache_size=0)
+    try:
+        sample = await load_sample(conn)
+    finally:
+        await conn.close()
+
+    modes = {}
+    for mode in ('unnamed', 'cached'):
+        modes[mode] = await run_mode(dsn, mode, sample, args.iterations, args.warmup)
+
+    print(f"\n📊 {args.iterations} تكرار لكل استعلام (بعد {args.warmup} إحماء) - الأزمنة بالمللي ثانية")
+    print(f"   {'الاستعلام':<20} {'unnamed p50':>12} {'p99':>8} {'cached p50':>12} {'p99':>8} {'التسريع':>8}")
+    total_unnamed = total_cached = 0.0
+    for name, _, _ in STATEMENTS:
+        unnamed, cached = modes['unnamed'][name], modes['cached'][name]
+        total_unnamed += sum(unnamed)
+        total_cached += sum(cached)
+        speedup = statistics.mean(unnamed) / statistics.mean(cached) if cached else 0
+        print(f"   {name:<20} {percentile(unnamed, 50) * 1000:>12.3f} {percentile(unnamed, 99) * 1000:>8.3f} "
+              f"{percentile(cached, 50) * 1000:>12.3f} {percentile(cached, 99) * 1000:>8.3f} {speedup:>7.2f}x")
+    print(f"\n   الإجمالي: unnamed {total_unnamed:.2f}s | cached {total_cached:.2f}s | "
+          f"التسريع {total_unnamed / total_cached if total_cached else 0:.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="مقارنة وضعي الـ prepared statements")
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    args = parser.parse_args()
+    if not args.dsn:
+        sys.exit("❌ حدد --dsn أو DATABASE_URL")
+    asyncio.run(main(args))
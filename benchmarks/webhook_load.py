@@ -0,0 +1,501 @@
+# benchmarks/webhook_load.py
+"""
+اختبار تحميل شامل لمسار الـ webhook: تحديثات تيليجرام حقيقية الشكل -> البوت -> Bot API وهمي
+
+يشغّل البوت الحقيقي داخل نفس العملية (نفس الراوترات والميدل وير وقاعدة البيانات)،
+ويوجهه إلى خادم Bot API وهمي (benchmarks/fake_telegram.py) عبر TELEGRAM_API_URL،
+ثم يرسل تحديثات POST إلى WEBHOOK_PATH كما يفعل تيليجرام، بمعدلات متصاعدة.
+
+    DATABASE_URL=postgres://.../charging_bot_load python benchmarks/webhook_load.py \\
+        --users 500 --rates 10,25,50,100,200 --duration 30 \\
+        --mix start=1,browse=4,buy=2,deposit=1,approve=1 --slo-ms 500
+
+⚠️ يكتب في قاعدة البيانات (مستخدمون وهميون، طلبات، شحنات، رصيد) - استخدم قاعدة اختبار.
+
+السيناريوهات (كل مستخدم وهمي ينفذ جلسة واحدة في كل مرة، والخطوات متتابعة):
+    start    /start
+    browse   الأقسام -> قسم -> تطبيق -> رجوع للأقسام
+    buy      تطبيق -> خيار (أو كمية) -> معرف الهدف -> تأكيد الشراء
+    deposit  طرق الشحن -> سيرياتل كاش -> المبلغ -> رقم العملية -> تأكيد
+    approve  موافقة المشرف على آخر شحن معلق لمستخدم وهمي
+
+التقرير: p50/p95/p99 ومتوسط استعلامات قاعدة البيانات لكل مسار هاندلر، الزمن الكلي،
+الأخطاء، طلبات Bot API وردود 429، وأعلى معدل تحديثات/ثانية يحقق الـ SLO:
+المعدل المحقق >= 95% من المطلوب، p95 ضمن --slo-ms، ولا تراكم (جلسات متأخرة).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp
+
+import fake_telegram
+
+BASE_USER_ID = 7_000_000_000
+FAKE_TOKEN = '123456:TESTloadTESTloadTESTloadTESTload000'
+TARGET_ID = '123456789'
+DEPOSIT_AMOUNT = 50000
+DEPOSIT_TX = '123456789012'
+
+SCENARIOS = ('start', 'browse', 'buy', 'deposit', 'approve')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="اختبار تحميل مسار الـ webhook")
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--users', type=int, default=200, help="عدد المستخدمين الوهميين")
+    parser.add_argument('--rates', default='10,25,50,100', help="معدلات التحديثات/ثانية (مراحل متتالية)")
+    parser.add_argument('--duration', type=float, default=20, help="مدة كل مرحلة بالثواني")
+    parser.add_argument('--mix', default='start=1,browse=4,buy=2,deposit=1,approve=1')
+    parser.add_argument('--slo-ms', type=float, default=500, help="حد p95 للزمن الكلي")
+    parser.add_argument('--timeout', type=float, default=30, help="مهلة انتظار معالجة التحديث")
+    parser.add_argument('--bot-port', type=int, default=8090)
+    parser.add_argument('--api-port', type=int, default=8091)
+    parser.add_argument('--api-latency-ms', type=float, default=30)
+    parser.add_argument('--api-jitter-ms', type=float, default=10)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.dsn:
+        sys.exit("❌ حدد --dsn أو DATABASE_URL (قاعدة اختبار)")
+    args.rates = [float(r) for r in args.rates.split(',') if r.strip()]
+    args.mix = parse_mix(args.mix)
+    return args
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            sys.exit(f"❌ سيناريو غير معروف: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def configure_env(args):
+    """متغيرات البيئة قبل استيراد config (يُقرأ مرة واحدة عند الاستيراد)"""
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['BOT_TOKEN'] = FAKE_TOKEN
+    os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{args.api_port}"
+    os.environ.setdefault('ADMIN_ID', str(BASE_USER_ID - 1))
+    os.environ['AUTO_SYNC_SERVICES'] = 'false'
+    os.environ.setdefault('API_BASE_URL', f"http://127.0.0.1:{args.api_port}/mousa")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# ============= تتبع اكتمال التحديثات =============
+
+class Tracker:
+    """مستقبل (future) لكل update_id يُكمله ميدل وير الاختبار عند انتهاء المعالجة"""
+
+    def __init__(self):
+        self.pending = {}
+        self.update_ids = itertools.count(1)
+
+    def expect(self, update_id):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[update_id] = future
+        return future
+
+    def resolve(self, update_id, result):
+        future = self.pending.pop(update_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+
+def make_harness_middleware(tracker):
+    from aiogram import BaseMiddleware
+
+    from database.query_stats import current_round_trips
+    from handlers.middleware import METRICS_ROUTE_KEY
+
+    class HarnessMiddleware(BaseMiddleware):
+        """داخل MetricsMiddleware: يقرأ مسار الهاندلر وعدد الاستعلامات ثم يكمل مستقبل التحديث"""
+
+        async def __call__(self, handler, event, data):
+            error = None
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                route = data.get(METRICS_ROUTE_KEY) or {}
+                tracker.resolve(event.update_id, {
+                    'route': f"{route.get('router', '?').rsplit('.', 1)[-1]}:{route.get('prefix', '-')}",
+                    'queries': current_round_trips() or 0,
+                    'error': error,
+                })
+
+    return HarnessMiddleware()
+
+
+# ============= المستخدمون الوهميون =============
+
+class VirtualUser:
+    def __init__(self, index):
+        self.id = BASE_USER_ID + index
+        self.user = {'id': self.id, 'is_bot': False, 'first_name': f"Load{index}", 'username': f"load_{index}"}
+        self.message_ids = itertools.count(1)
+
+    def _chat(self):
+        return {'id': self.id, 'type': 'private', 'first_name': self.user['first_name']}
+
+    def message(self, update_id, text):
+        message = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': self._chat(),
+            'from': self.user,
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def callback(self, update_id, data, chat=None):
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id),
+            'from': self.user,
+            'chat_instance': str(self.id),
+            'data': data,
+            'message': {
+                'message_id': next(self.message_ids),
+                'date': int(time.time()),
+                'chat': chat or self._chat(),
+                'from': fake_telegram.BOT_USER,
+                'text': 'load test',
+            },
+        }}
+
+
+class Catalog:
+    """معرفات حقيقية من قاعدة البيانات للسيناريوهات"""
+    category_id = None
+    app_id = None
+    app_type = 'service'
+    option_id = None
+
+
+async def discover_catalog(db_pool):
+    """قسم وتطبيق نشط (يُفضل بدون api_service_id حتى لا يُستدعى Mousa Card) وخيار نشط إن وجد"""
+    catalog = Catalog()
+    async with db_pool.acquire() as conn:
+        row = await conn.fetchrow('''
+            SELECT a.id, a.category_id, a.type, o.id AS option_id
+            FROM applications a
+            LEFT JOIN LATERAL (
+                SELECT id FROM product_options
+                WHERE product_id = a.id AND is_active = TRUE
+                ORDER BY sort_order, price_usd LIMIT 1
+            ) o ON TRUE
+            WHERE a.is_active = TRUE AND a.category_id IS NOT NULL
+            ORDER BY (a.api_service_id IS NOT NULL), (o.id IS NULL), a.id
+            LIMIT 1
+        ''')
+    if row:
+        catalog.category_id = row['category_id']
+        catalog.app_id = row['id']
+        catalog.app_type = row['type'] or 'service'
+        catalog.option_id = row['option_id']
+    return catalog
+
+
+async def prepare_users(db_pool, users):
+    """رصيد كبير للمستخدمين الوهميين (بعد /start) وتنظيف حالاتهم السابقة"""
+    ids = [user.id for user in users]
+    async with db_pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE users SET balance = 1000000000, is_banned = FALSE WHERE user_id = ANY($1::bigint[])", ids)
+
+
+# ============= السيناريوهات =============
+
+def scenario_steps(name, user, catalog, admin):
+    """خطوات السيناريو: ('msg', نص) أو ('cb', بيانات) أو ('admin_cb', بيانات)"""
+    if name == 'start':
+        return [('msg', '/start')]
+    if name == 'browse':
+        steps = [('cb', 'show_categories')]
+        if catalog.category_id:
+            steps.append(('cb', f"cat_{catalog.category_id}"))
+        if catalog.app_id:
+            steps.append(('cb', f"buy_{catalog.app_id}_{catalog.app_type}"))
+        steps.append(('cb', 'back_to_categories'))
+        return steps
+    if name == 'buy':
+        if not catalog.app_id:
+            return [('cb', 'show_categories')]
+        steps = [('cb', f"buy_{catalog.app_id}_{catalog.app_type}")]
+        if catalog.option_id:
+            steps.append(('cb', f"var_{catalog.option_id}"))
+        else:
+            steps.append(('msg', '1'))
+        steps += [('msg', TARGET_ID), ('cb', 'execute_buy')]
+        return steps
+    if name == 'deposit':
+        return [('cb', 'show_deposit_methods'), ('cb', 'm_syr'), ('msg', str(DEPOSIT_AMOUNT)),
+                ('msg', DEPOSIT_TX), ('cb', 'confirm_deposit')]
+    if name == 'approve':
+        return [('admin_cb', f"appr_dep_{user.id}_{DEPOSIT_AMOUNT}")]
+    raise ValueError(name)
+
+
+class Runner:
+    def __init__(self, args, tracker, users, admin, catalog, webhook_url, admin_chat):
+        self.args = args
+        self.tracker = tracker
+        self.users = users
+        self.admin = admin
+        self.catalog = catalog
+        self.webhook_url = webhook_url
+        self.admin_chat = admin_chat
+        self.random = random.Random(args.seed)
+        self.idle = list(users)
+        self.deposited = set()
+        self.reset()
+
+    def reset(self):
+        self.e2e = []
+        self.routes = defaultdict(list)
+        self.route_queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self.starved = 0
+        self.in_flight = 0
+
+    def pick_scenario(self):
+        names = list(self.args.mix)
+        name = self.random.choices(names, weights=[self.args.mix[n] for n in names])[0]
+        if name == 'approve' and not self.deposited:
+            name = 'deposit'
+        return name
+
+    async def send(self, session, payload):
+        update_id = payload['update_id']
+        future = self.tracker.expect(update_id)
+        started = time.perf_counter()
+        try:
+            async with session.post(self.webhook_url, data=json.dumps(payload),
+                                    headers={'Content-Type': 'application/json'}) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    self.tracker.pending.pop(update_id, None)
+                    self.errors[f"http_{resp.status}"] += 1
+                    return
+            result = await asyncio.wait_for(future, self.args.timeout)
+        except asyncio.TimeoutError:
+            self.tracker.pending.pop(update_id, None)
+            self.errors['timeout'] += 1
+            return
+        except aiohttp.ClientError as e:
+            self.tracker.pending.pop(update_id, None)
+            self.errors[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self.e2e.append(elapsed)
+        self.routes[result['route']].append(elapsed)
+        self.route_queries[result['route']].append(result['queries'])
+        if result['error']:
+            self.errors[result['error']] += 1
+
+    async def run_session(self, session, user, name):
+        self.in_flight += 1
+        try:
+            for kind, value in scenario_steps(name, user, self.catalog, self.admin):
+                update_id = next(self.tracker.update_ids)
+                if kind == 'msg':
+                    payload = user.message(update_id, value)
+                elif kind == 'cb':
+                    payload = user.callback(update_id, value)
+                else:
+                    payload = self.admin.callback(update_id, value, chat=self.admin_chat)
+                await self.send(session, payload)
+            if name == 'deposit':
+                self.deposited.add(user.id)
+            elif name == 'approve':
+                self.deposited.discard(user.id)
+        finally:
+            self.in_flight -= 1
+            self.idle.append(user)
+
+    def take_user(self, name):
+        if name == 'approve':
+            for index, user in enumerate(self.idle):
+                if user.id in self.deposited:
+                    return self.idle.pop(index)
+            return None
+        if not self.idle:
+            return None
+        return self.idle.pop(self.random.randrange(len(self.idle)))
+
+    async def run_stage(self, session, rate, duration):
+        """جلسات تصل بمعدل ثابت (حلقة مفتوحة) بحيث يقارب معدل التحديثات الهدف"""
+        self.reset()
+        mean_steps = sum(
+            len(scenario_steps(n, self.users[0], self.catalog, self.admin)) * w
+            for n, w in self.args.mix.items()
+        ) / sum(self.args.mix.values())
+        interval = mean_steps / rate
+        tasks = set()
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at += interval
+            name = self.pick_scenario()
+            user = self.take_user(name)
+            if user is None:
+                self.starved += 1
+                continue
+            task = asyncio.create_task(self.run_session(session, user, name))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        elapsed = time.perf_counter() - started
+        backlog = self.in_flight
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.args.timeout)
+        return elapsed, backlog
+
+
+def print_stage(runner, rate, elapsed, backlog, api_stats, slo):
+    achieved = runner.completed / elapsed if elapsed else 0
+    p95 = percentile(runner.e2e, 95)
+    ok = achieved >= rate * 0.95 and p95 * 1000 <= slo and backlog == 0 and runner.starved == 0
+    calls = sum(api_stats.get('calls', {}).values())
+    rejected = sum(api_stats.get('rejected_429', {}).values())
+    print(f"\n📈 المعدل المطلوب {rate:.0f}/s: المحقق {achieved:.1f}/s | "
+          f"p50 {percentile(runner.e2e, 50) * 1000:.0f}ms p95 {p95 * 1000:.0f}ms "
+          f"p99 {percentile(runner.e2e, 99) * 1000:.0f}ms | "
+          f"أخطاء {sum(runner.errors.values())} | مستخدمون مشغولون {runner.starved} | "
+          f"متأخرة {backlog} | Bot API {calls} (429: {rejected}) | {'✅' if ok else '❌'}")
+    print(f"   {'المسار':<40} {'العدد':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'استعلامات':>10}")
+    for route, values in sorted(runner.routes.items(), key=lambda item: -percentile(item[1], 95)):
+        queries = runner.route_queries[route]
+        print(f"   {route:<40} {len(values):>7} {percentile(values, 50) * 1000:>7.0f} "
+              f"{percentile(values, 95) * 1000:>7.0f} {percentile(values, 99) * 1000:>7.0f} "
+              f"{sum(queries) / len(queries):>10.1f}")
+    if runner.errors:
+        print(f"   ❌ الأخطاء: {dict(runner.errors)}")
+    return ok, achieved
+
+
+async def fetch_api_stats(session, base):
+    try:
+        async with session.get(f"{base}/_stats") as resp:
+            return await resp.json()
+    except Exception:
+        return {}
+
+
+async def wait_for_port(session, url, attempts=50):
+    for _ in range(attempts):
+        try:
+            async with session.get(url) as resp:
+                await resp.read()
+                return True
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    return False
+
+
+async def main(args):
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    import run_bot_webhook as bot_app
+    from config import ADMIN_ID, DEPOSIT_GROUP, WEBHOOK_PATH
+
+    api_base = os.environ['TELEGRAM_API_URL']
+    async with aiohttp.ClientSession() as session:
+        if not await wait_for_port(session, f"{api_base}/_stats"):
+            sys.exit("❌ خادم Bot API الوهمي لم يبدأ")
+
+        if not await bot_app.init_database():
+            sys.exit("❌ فشل الاتصال بقاعدة البيانات")
+        db_pool = bot_app.db_pool
+        await bot_app.load_exchange_rate(db_pool)
+        await bot_app.load_bot_settings(db_pool)
+        await bot_app.load_api_settings(db_pool)
+        if not await bot_app.init_bot():
+            sys.exit("❌ فشل تهيئة البوت")
+        await bot_app.refresh_bot_status_cache(db_pool)
+
+        tracker = Tracker()
+        bot_app.dp.update.outer_middleware(make_harness_middleware(tracker))
+        base_url = f"http://127.0.0.1:{args.bot_port}"
+        await bot_app.create_web_app(base_url)
+        runner_app = await bot_app.start_server(args.bot_port)
+
+        users = [VirtualUser(i) for i in range(args.users)]
+        admin = VirtualUser(0)
+        admin.id = ADMIN_ID
+        admin.user = dict(admin.user, id=ADMIN_ID, first_name='Admin', username='load_admin')
+        admin_chat = ({'id': DEPOSIT_GROUP, 'type': 'supergroup', 'title': 'deposits'}
+                      if DEPOSIT_GROUP else {'id': ADMIN_ID, 'type': 'private', 'first_name': 'Admin'})
+
+        webhook_url = f"{base_url}{WEBHOOK_PATH}"
+        catalog = await discover_catalog(db_pool)
+        runner = Runner(args, tracker, users, admin, catalog, webhook_url, admin_chat)
+
+        print(f"👥 تسجيل {len(users)} مستخدم وهمي...")
+        await asyncio.gather(*(runner.send(session, user.message(next(tracker.update_ids), '/start'))
+                               for user in users))
+        await prepare_users(db_pool, users)
+        print(f"📦 القسم {catalog.category_id} | التطبيق {catalog.app_id} ({catalog.app_type}) | "
+              f"الخيار {catalog.option_id}")
+
+        best = None
+        for rate in args.rates:
+            async with session.post(f"{api_base}/_reset") as resp:
+                await resp.read()
+            elapsed, backlog = await runner.run_stage(session, rate, args.duration)
+            api_stats = await fetch_api_stats(session, api_base)
+            ok, achieved = print_stage(runner, rate, elapsed, backlog, api_stats, args.slo_ms)
+            if ok:
+                best = achieved
+            await asyncio.sleep(1)
+
+        print(f"\n🏁 أعلى معدل مستدام ضمن SLO p95 <= {args.slo_ms:.0f}ms: "
+              f"{f'{best:.1f} تحديث/ثانية' if best else 'لا يوجد (حتى أدنى معدل تجاوز الحد)'}")
+
+        await runner_app.cleanup()
+        await bot_app.bot.session.close()
+        await bot_app.db_pool.close()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_env(args)
+    api = multiprocessing.Process(
+        target=fake_telegram.run,
+        kwargs={'port': args.api_port, 'latency_ms': args.api_latency_ms,
+                'jitter_ms': args.api_jitter_ms, 'rate_429': args.rate_429, 'seed': args.seed},
+        daemon=True,
+    )
+    api.start()
+    try:
+        asyncio.run(main(args))
+    finally:
+        api.terminate()
@@ -8,6 +8,8 @@ from functools import wraps
 from typing import Any, Callable, Dict, Optional, List, Union
 from collections import OrderedDict
 
+from monitoring import CACHE_REQUESTS
+
 logger = logging.getLogger(__name__)
 
 # ============= إعدادات الكاش =============
@@ -166,6 +168,9 @@ def cached(ttl: int = DEFAULT_TTL, key_prefix: str = ""):
         Callable: الدالة المزخرفة
     """
     def decorator(func: Callable) -> Callable:
+        # تسمية المقياس: البادئة إن وجدت وإلا اسم الدالة
+        metric_prefix = key_prefix or func.__qualname__
+        
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
             # بناء مفتاح الكاش
@@ -174,10 +179,12 @@ def cached(ttl: int = DEFAULT_TTL, key_prefix: str = ""):
             # محاولة الحصول من الكاش
             cached_value = _cache_instance.get(cache_key)
             if cached_value is not None:
+                CACHE_REQUESTS.inc(metric_prefix, 'hit')
                 logger.debug(f"✅ Cache hit: {cache_key}")
                 return cached_value
             
             # تنفيذ الدالة
+            CACHE_REQUESTS.inc(metric_prefix, 'miss')
             logger.debug(f"❌ Cache miss: {cache_key}")
             start_time = time.time()
             result = await func(*args, **kwargs)
@@ -198,8 +205,10 @@ def cached(ttl: int = DEFAULT_TTL, key_prefix: str = ""):
             
             cached_value = _cache_instance.get(cache_key)
             if cached_value is not None:
+                CACHE_REQUESTS.inc(metric_prefix, 'hit')
                 return cached_value
             
+            CACHE_REQUESTS.inc(metric_prefix, 'miss')
             start_time = time.time()
             result = func(*args, **kwargs)
             elapsed = time.time() - start_time
@@ -319,8 +328,10 @@ def cached_ttl_by_args(ttl_func: Callable):
             
             cached_value = _cache_instance.get(cache_key)
             if cached_value is not None:
+                CACHE_REQUESTS.inc(func.__qualname__, 'hit')
                 return cached_value
             
+            CACHE_REQUESTS.inc(func.__qualname__, 'miss')
             result = await func(*args, **kwargs)
             _cache_instance.set(cache_key, result, ttl)
             return result
@@ -332,8 +343,10 @@ def cached_ttl_by_args(ttl_func: Callable):
             
             cached_value = _cache_instance.get(cache_key)
             if cached_value is not None:
+                CACHE_REQUESTS.inc(func.__qualname__, 'hit')
                 return cached_value
             
+            CACHE_REQUESTS.inc(func.__qualname__, 'miss')
             result = func(*args, **kwargs)
             _cache_instance.set(cache_key, result, ttl)
             return result
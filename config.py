@@ -95,6 +95,10 @@ MODERATORS = get_env_list_int("MODERATORS", [])
 if ADMIN_ID and ADMIN_ID not in MODERATORS:
     MODERATORS.append(ADMIN_ID)
 
+# مفتاح تبديل أكواد الإحالة (الافتراضي مشتق من التوكن). تغييره لا يبطل الأكواد
+# المحفوظة، لكن الأكواد الجديدة تُولد بالمفتاح الجديد
+REFERRAL_CODE_KEY = os.getenv("REFERRAL_CODE_KEY") or TOKEN
+
 # ============= إعدادات قاعدة البيانات =============
 
 # رابط قاعدة البيانات (الأولوية القصوى)
@@ -107,8 +111,8 @@ if DATABASE_URL:
     # استخدام الرابط المباشر (مناسب لـ Supabase, Render, إلخ)
     DB_CONFIG = {
         "dsn": DATABASE_URL,
-        "min_size": get_env_int("DB_POOL_MIN_SIZE", 1),
-        "max_size": get_env_int("DB_POOL_MAX_SIZE", 10),
+        "min_size": get_env_int("DB_POOL_MIN_SIZE", 5),
+        "max_size": get_env_int("DB_POOL_MAX_SIZE", 20),
         "command_timeout": get_env_int("DB_COMMAND_TIMEOUT", 60),
     }
     print(f"✅ استخدام قاعدة بيانات عبر الرابط: {DATABASE_URL[:30]}...")
@@ -126,6 +130,27 @@ else:
     }
     print(f"✅ استخدام قاعدة بيانات محلية: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
 
+# مجمع الاتصالات المتكيف (database/pool.py): الحد النشط بين min_size و max_size
+# أقصى انتظار لاتصال قبل الرد على المستخدم بـ "مشغول، أعد المحاولة"
+DB_ACQUIRE_TIMEOUT = get_env_float("DB_ACQUIRE_TIMEOUT", 5.0)
+# أقصى عدد للطلبات المنتظرة لاتصال (ما بعده يُرفض فوراً)
+DB_POOL_MAX_WAITERS = get_env_int("DB_POOL_MAX_WAITERS", 200)
+# متوسط الانتظار الذي يُعتبر بعده المجمع تحت ضغط
+DB_POOL_TARGET_WAIT_MS = get_env_int("DB_POOL_TARGET_WAIT_MS", 50)
+# فترة مراجعة الحد النشط بالثواني
+DB_POOL_ADJUST_SECONDS = get_env_int("DB_POOL_ADJUST_SECONDS", 15)
+
+# وضع الـ prepared statements (database/statement_mode.py): auto / cached / unnamed / protocol
+DB_STATEMENT_MODE = os.getenv("DB_STATEMENT_MODE", "auto")
+# حجم كاش الـ statements لكل اتصال (في وضعي cached و protocol)
+DB_STATEMENT_CACHE_SIZE = get_env_int("DB_STATEMENT_CACHE_SIZE", 512)
+# رابط اتصال مباشر لـ LISTEN (تنبيهات تغيير الإعدادات) عندما يمر DATABASE_URL عبر PgBouncer بوضع transaction
+DB_LISTEN_URL = os.getenv("DB_LISTEN_URL", "")
+# فحص دوري لتغيّر bot_settings (max(updated_at)) احتياطاً إذا فاتت التنبيهات أو لم تصل خلف pooler
+SETTINGS_POLL_SECONDS = get_env_int("SETTINGS_POLL_SECONDS", 60)
+# أقصى عمر لنسخة الإعدادات في الذاكرة قبل إعادة تحميلها في الخلفية (حتى لو توقف المستمع)
+SETTINGS_MAX_AGE_SECONDS = get_env_int("SETTINGS_MAX_AGE_SECONDS", 300)
+
 # ============= أرقام الدفع =============
 
 SYRIATEL_NUMS = get_env_list("SYRIATEL_NUMS", [])
@@ -149,9 +174,36 @@ WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
 WEBHOOK_PORT = get_env_int("PORT", 8000)  # Render يستخدم PORT
 WEBHOOK_HOST = os.getenv("RENDER_EXTERNAL_URL", os.getenv("WEBHOOK_HOST", ""))
 
+# خادم Bot API بديل (Local Bot API Server أو الخادم الوهمي في benchmarks/fake_telegram.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# طوابير معالجة التحديثات: الرد على تيليجرام فوراً ثم المعالجة في طوابير مرتبة لكل مستخدم
+WEBHOOK_QUEUE_ENABLED = get_env_bool("WEBHOOK_QUEUE_ENABLED", True)
+# عدد الطوابير (= عدد العمال المتوازين)
+WEBHOOK_WORKERS = get_env_int("WEBHOOK_WORKERS", 16)
+# أقصى عدد تحديثات منتظرة في كل طابور
+WEBHOOK_QUEUE_SIZE = get_env_int("WEBHOOK_QUEUE_SIZE", 100)
+# عند امتلاء الطابور: reject (503 - تيليجرام يعيد الإرسال لاحقاً) / drop_new / drop_oldest
+WEBHOOK_QUEUE_POLICY = os.getenv("WEBHOOK_QUEUE_POLICY", "reject")
+# مدة انتظار مكان في الطابور قبل تطبيق السياسة (ثوانٍ)
+WEBHOOK_ENQUEUE_TIMEOUT = get_env_float("WEBHOOK_ENQUEUE_TIMEOUT", 2.0)
+
+# حدود إرسال الرسائل (بوابة الإرسال): عام بالثانية، لكل محادثة خاصة بالثانية، لكل مجموعة بالدقيقة
+TELEGRAM_GLOBAL_RATE = get_env_float("TELEGRAM_GLOBAL_RATE", 30)
+TELEGRAM_CHAT_RATE = get_env_float("TELEGRAM_CHAT_RATE", 1)
+TELEGRAM_GROUP_RATE_PER_MINUTE = get_env_float("TELEGRAM_GROUP_RATE_PER_MINUTE", 20)
+# عدد مرات إعادة المحاولة تلقائياً بعد 429 (retry_after)
+TELEGRAM_MAX_RETRIES = get_env_int("TELEGRAM_MAX_RETRIES", 3)
+
 WEB_USERNAME = os.getenv("WEB_USERNAME", "admin")
 WEB_PASSWORD = os.getenv("WEB_PASSWORD", "admin")
 
+# تشغيل لوحة التحكم داخل خادم البوت (aiohttp + asyncpg) بدلاً من gunicorn منفصل
+# (صفحة حالة البوت تنتقل إلى /status - قارن الوضعين بـ benchmarks/dashboard_load.py قبل التفعيل)
+DASHBOARD_ASYNC = get_env_bool("DASHBOARD_ASYNC", False)
+# عدد الخيوط لمسارات Flask التي تمر عبر جسر WSGI (تسجيل الدخول والإجراءات)
+DASHBOARD_WSGI_THREADS = get_env_int("DASHBOARD_WSGI_THREADS", 4)
+
 # ============= إعدادات البوت =============
 
 # سعر الصرف الافتراضي (سيتم تحديثه من قاعدة البيانات لاحقاً)
@@ -190,6 +242,38 @@ SYNC_INTERVAL_HOURS = get_env_int("SYNC_INTERVAL_HOURS", 6)
 # نسبة الربح الافتراضية للمنتجات المستوردة من API
 DEFAULT_API_PROFIT = get_env_int("DEFAULT_API_PROFIT", 10)
 
+# ============= إعدادات الإحصائيات =============
+
+# فترة تحديث جدول الإحصائيات اليومية (daily_metrics) بالدقائق
+METRICS_REFRESH_MINUTES = get_env_int("METRICS_REFRESH_MINUTES", 5)
+# عدد الأيام الأخيرة التي يُعاد حسابها مع كل تحديث حتى لو لم تظهر فيها صفوف متغيرة
+# (تعديلات السعر/الخصم/الربح على الطلبات لا تحدّث updated_at دائماً)
+METRICS_TRAILING_DAYS = get_env_int("METRICS_TRAILING_DAYS", 7)
+
+# فترة حفظ لقطات الأرصدة من سجل الحركات (wallet_snapshots) بالدقائق
+WALLET_SNAPSHOT_MINUTES = get_env_int("WALLET_SNAPSHOT_MINUTES", 60)
+
+# فترة تجديد/محاولة قفل قيادة الجدولة بين نسخ البوت (ثوانٍ)
+SCHEDULER_LEADER_RENEW_SECONDS = get_env_int("SCHEDULER_LEADER_RENEW_SECONDS", 15)
+
+# صلاحية حالة الاشتراك في القناة المحفوظة قبل إعادة التحقق عبر get_chat_member (بالدقائق)
+SUBSCRIPTION_TTL_MINUTES = get_env_int("SUBSCRIPTION_TTL_MINUTES", 360)
+# صلاحية حالة "غير مشترك" (بالثواني) - قصيرة لأن الانضمام قد يصل لنسخة أخرى من البوت
+SUBSCRIPTION_NEGATIVE_TTL_SECONDS = get_env_int("SUBSCRIPTION_NEGATIVE_TTL_SECONDS", 60)
+# أقصى عدد من المستخدمين في ذاكرة حالة الاشتراك (يُحذف الأقدم عند التجاوز)
+SUBSCRIPTION_CACHE_MAX = get_env_int("SUBSCRIPTION_CACHE_MAX", 50000)
+
+# ============= مراقبة الاستعلامات =============
+
+# تجميع إحصائيات الاستعلامات (عدد، زمن، صفوف) لكل بصمة استعلام
+QUERY_STATS_ENABLED = get_env_bool("QUERY_STATS_ENABLED", True)
+# نسبة الاستعلامات التي تدخل التجميع (1.0 = كلها) - الاستعلامات البطيئة تُسجل دائماً
+QUERY_SAMPLE_RATE = get_env_float("QUERY_SAMPLE_RATE", 1.0)
+# حد الاستعلام البطيء بالمللي ثانية
+SLOW_QUERY_MS = get_env_int("SLOW_QUERY_MS", 200)
+# رمز بديل لسحب /metrics و /metrics/queries (Authorization: Bearer) - بيانات دخول لوحة التحكم تعمل دائماً
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # ============= دوال تحميل الإعدادات الديناميكية =============
 
 async def load_exchange_rate(pool) -> bool:
@@ -369,8 +453,18 @@ __all__ = [
     'TOKEN',
     'ADMIN_ID',
     'MODERATORS',
+    'REFERRAL_CODE_KEY',
     'DATABASE_URL',
     'DB_CONFIG',
+    'DB_ACQUIRE_TIMEOUT',
+    'DB_POOL_MAX_WAITERS',
+    'DB_POOL_TARGET_WAIT_MS',
+    'DB_POOL_ADJUST_SECONDS',
+    'DB_STATEMENT_MODE',
+    'DB_STATEMENT_CACHE_SIZE',
+    'DB_LISTEN_URL',
+    'SETTINGS_POLL_SECONDS',
+    'SETTINGS_MAX_AGE_SECONDS',
     'SYRIATEL_NUMS',
     'SHAM_CASH_NUM',
     'SHAM_CASH_NUM_USD',
@@ -381,8 +475,20 @@ __all__ = [
     'WEBHOOK_PATH',
     'WEBHOOK_PORT',
     'WEBHOOK_HOST',
+    'TELEGRAM_API_URL',
+    'WEBHOOK_QUEUE_ENABLED',
+    'WEBHOOK_WORKERS',
+    'WEBHOOK_QUEUE_SIZE',
+    'WEBHOOK_QUEUE_POLICY',
+    'WEBHOOK_ENQUEUE_TIMEOUT',
+    'TELEGRAM_GLOBAL_RATE',
+    'TELEGRAM_CHAT_RATE',
+    'TELEGRAM_GROUP_RATE_PER_MINUTE',
+    'TELEGRAM_MAX_RETRIES',
     'WEB_USERNAME',
     'WEB_PASSWORD',
+    'DASHBOARD_ASYNC',
+    'DASHBOARD_WSGI_THREADS',
     'DEBUG',
     'USD_TO_SYP',
     'DEFAULT_USD_TO_SYP',
@@ -396,6 +502,17 @@ __all__ = [
     'AUTO_SYNC_SERVICES',
     'SYNC_INTERVAL_HOURS',
     'DEFAULT_API_PROFIT',
+    'METRICS_REFRESH_MINUTES',
+    'METRICS_TRAILING_DAYS',
+    'WALLET_SNAPSHOT_MINUTES',
+    'SCHEDULER_LEADER_RENEW_SECONDS',
+    'SUBSCRIPTION_TTL_MINUTES',
+    'SUBSCRIPTION_NEGATIVE_TTL_SECONDS',
+    'SUBSCRIPTION_CACHE_MAX',
+    'QUERY_STATS_ENABLED',
+    'QUERY_SAMPLE_RATE',
+    'SLOW_QUERY_MS',
+    'METRICS_TOKEN',
     'load_exchange_rate',
     'load_bot_settings',
     'load_api_settings'
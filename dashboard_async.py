@@ -0,0 +1,326 @@
+# dashboard_async.py
+"""
+وضع غير متزامن للوحة التحكم داخل خادم البوت (aiohttp)
+
+- صفحات القراءة الثقيلة (الرئيسية، المستخدمين، الشحن، الطلبات، الإحصائيات، البحث)
+  تُخدم مباشرة عبر asyncpg ودوال database.* باستخدام مجمع اتصالات البوت
+- باقي مسارات لوحة التحكم (تسجيل الدخول والإجراءات) تمر إلى تطبيق Flask نفسه
+  عبر جسر WSGI في مجموعة خيوط صغيرة، فيعمل البوت واللوحة في عملية واحدة
+- الجلسات متوافقة مع Flask (نفس الكوكي ونفس المفتاح السري)
+
+التفعيل: DASHBOARD_ASYNC=true
+"""
+import asyncio
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from io import BytesIO
+
+from aiohttp import web
+from multidict import CIMultiDict
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+
+import dashboard as flask_dashboard
+from config import DASHBOARD_WSGI_THREADS
+from database.listing import fetch_list_page, default_status, LIST_KINDS, LIST_PAGE_SIZE
+from database.search import search as search_kind, SEARCH_KINDS
+from database.stats import get_dashboard_overview, get_users_summary, get_pending_counts, get_dashboard_statistics
+from database.products import get_all_applications
+
+logger = logging.getLogger(__name__)
+
+flask_app = flask_dashboard.app
+
+_session_interface = SecureCookieSessionInterface()
+_wsgi_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WSGI_THREADS, thread_name_prefix="dashboard-wsgi")
+
+# عدد نتائج البحث في كل صفحة (نفس لوحة Flask)
+SEARCH_PAGE_SIZE = flask_dashboard.SEARCH_PAGE_SIZE
+
+
+# ============= الجلسات (متوافقة مع Flask) =============
+
+def load_session(request: web.Request) -> dict:
+    """قراءة جلسة Flask من الكوكي"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    serializer = _session_interface.get_signing_serializer(flask_app)
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return dict(serializer.loads(cookie, max_age=max_age))
+    except BadSignature:
+        return {}
+
+
+def save_session(response: web.StreamResponse, data: dict):
+    """كتابة الجلسة بنفس صيغة Flask"""
+    serializer = _session_interface.get_signing_serializer(flask_app)
+    response.set_cookie(
+        flask_app.config['SESSION_COOKIE_NAME'],
+        serializer.dumps(data),
+        httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+        secure=flask_app.config['SESSION_COOKIE_SECURE'],
+        samesite=flask_app.config['SESSION_COOKIE_SAMESITE'],
+        path='/'
+    )
+
+
+def flash(session: dict, message: str, category: str = 'message'):
+    """إضافة رسالة flash بنفس تخزين Flask"""
+    session.setdefault('_flashes', []).append((category, message))
+
+
+def login_required(handler):
+    """التحقق من تسجيل الدخول (نفس سلوك login_required في Flask)"""
+    @wraps(handler)
+    async def wrapper(request: web.Request):
+        session = load_session(request)
+        if 'logged_in' not in session:
+            flash(session, 'الرجاء تسجيل الدخول أولاً', 'warning')
+            response = web.HTTPFound('/login')
+            save_session(response, session)
+            raise response
+        request['session'] = session
+        return await handler(request)
+    return wrapper
+
+
+# ============= عرض القوالب =============
+
+class _TemplateRequest:
+    """واجهة request المستخدمة داخل القوالب (request.args فقط)"""
+
+    def __init__(self, request: web.Request):
+        self.args = request.query
+        self.path = request.path
+
+
+def url_for(endpoint, **values):
+    """بناء رابط من اسم دالة Flask دون الحاجة لسياق تطبيق"""
+    return flask_app.url_map.bind('').build(endpoint, values)
+
+
+def render(request: web.Request, template: str, **context) -> web.Response:
+    """عرض قالب Jinja نفسه المستخدم في Flask"""
+    session = request.get('session', {})
+    flashes = session.pop('_flashes', None)
+
+    def get_flashed_messages(with_categories=False, category_filter=()):
+        messages = flashes or []
+        if category_filter:
+            messages = [m for m in messages if m[0] in category_filter]
+        return messages if with_categories else [m[1] for m in messages]
+
+    html = flask_app.jinja_env.get_template(template).render(
+        request=_TemplateRequest(request),
+        session=session,
+        url_for=url_for,
+        get_flashed_messages=get_flashed_messages,
+        **context
+    )
+    response = web.Response(text=html, content_type='text/html')
+    if flashes is not None:
+        save_session(response, session)
+    return response
+
+
+# ============= الصفحات غير المتزامنة =============
+
+@login_required
+async def index(request):
+    """الصفحة الرئيسية"""
+    pool = request.app['dashboard_db_pool']
+    overview = await get_dashboard_overview(pool)
+    if overview is None:
+        flash(request['session'], '❌ خطأ في جلب البيانات', 'danger')
+        overview = {
+            'total_users': 0, 'total_balances': 0, 'pending_deposits_count': 0, 'pending_orders_count': 0,
+            'banned_users': 0, 'total_points': 0, 'new_users_today': 0,
+            'recent_users': [], 'recent_deposits': [], 'recent_orders': [], 'rate': None, 'error': True
+        }
+    if overview['rate'] is None:
+        overview['rate'] = flask_dashboard.config.USD_TO_SYP
+    return render(request, 'index.html', **overview)
+
+
+@login_required
+async def users_management(request):
+    """إدارة المستخدمين"""
+    pool = request.app['dashboard_db_pool']
+    users, next_cursor = await fetch_list_page(pool, 'users', request.query, request.query.get('cursor'))
+    user_stats = await get_users_summary(pool)
+    return render(request, 'users.html', users=users, user_stats=user_stats, next_cursor=next_cursor)
+
+
+@login_required
+async def deposits_management(request):
+    """إدارة طلبات الشحن"""
+    pool = request.app['dashboard_db_pool']
+    pending = await get_pending_counts(pool)
+    status = default_status('deposits', request.query, pending['deposits'])
+    if status:
+        raise web.HTTPFound(request.rel_url.update_query(status=status))
+    deposits, next_cursor = await fetch_list_page(pool, 'deposits', request.query, request.query.get('cursor'))
+    return render(request, 'deposits.html', deposits=deposits, next_cursor=next_cursor,
+                  pending_count=pending['deposits'])
+
+
+@login_required
+async def orders_management(request):
+    """إدارة طلبات التطبيقات"""
+    pool = request.app['dashboard_db_pool']
+    pending = await get_pending_counts(pool)
+    status = default_status('orders', request.query, pending['open_orders'])
+    if status:
+        raise web.HTTPFound(request.rel_url.update_query(status=status))
+    orders, next_cursor = await fetch_list_page(pool, 'orders', request.query, request.query.get('cursor'))
+    applications = await get_all_applications(pool)
+    return render(request, 'orders.html', orders=orders, applications=applications,
+                  next_cursor=next_cursor, pending_count=pending['open_orders'])
+
+
+@login_required
+async def list_page_api(request):
+    """الصفحة التالية من قائمة (للتحميل التدريجي عند التمرير)"""
+    kind = request.match_info['kind']
+    if kind not in LIST_KINDS:
+        return web.json_response({'error': 'Unknown list'}, status=404)
+
+    pool = request.app['dashboard_db_pool']
+    rows, next_cursor = await fetch_list_page(pool, kind, request.query, request.query.get('cursor'))
+    rows_template, var_name = flask_dashboard.LIST_PAGES[kind]
+    html = flask_app.jinja_env.get_template(rows_template).render(**{var_name: rows})
+    return web.json_response({'html': html, 'count': len(rows), 'next_cursor': next_cursor})
+
+
+@login_required
+async def statistics_page(request):
+    """صفحة الإحصائيات"""
+    try:
+        days = int(request.query.get('days', 7))
+    except ValueError:
+        days = 7
+    if days not in flask_dashboard.STATISTICS_RANGES:
+        days = 7
+
+    stats = await get_dashboard_statistics(request.app['dashboard_db_pool'], days)
+    if stats is None:
+        flash(request['session'], '❌ خطأ في جلب الإحصائيات', 'danger')
+        stats = {
+            'users_stats': {}, 'orders_stats': {}, 'deposits_stats': {}, 'points_stats': {},
+            'daily_stats': [], 'top_apps': [], 'top_spenders': []
+        }
+    return render(request, 'statistics.html', days=days,
+                  range_options=flask_dashboard.STATISTICS_RANGES, **stats)
+
+
+@login_required
+async def search(request):
+    """صفحة البحث"""
+    query = request.query.get('q', '')
+    search_type = request.query.get('type', 'all')
+    try:
+        page = max(1, int(request.query.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    results, has_more = {}, {}
+    if query:
+        pool = request.app['dashboard_db_pool']
+        offset = (page - 1) * SEARCH_PAGE_SIZE
+        for kind in SEARCH_KINDS:
+            if search_type not in ['all', kind]:
+                continue
+            result = await search_kind(pool, kind, query, SEARCH_PAGE_SIZE, offset)
+            results[kind] = result['items']
+            has_more[kind] = result['has_more']
+
+    return render(request, 'search.html', results=results, query=query, page=page, has_more=has_more)
+
+
+# ============= جسر WSGI لباقي مسارات Flask =============
+
+def _call_wsgi(environ):
+    """تشغيل تطبيق Flask لطلب واحد (داخل خيط)"""
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result['status'] = status
+        result['headers'] = headers
+
+    chunks = flask_app.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return result['status'], result['headers'], body
+
+
+async def wsgi_fallback(request: web.Request):
+    """تمرير الطلب إلى Flask (تسجيل الدخول، الإجراءات، الصفحات غير المنقولة)"""
+    body = await request.read()
+    host = request.host.split(':')[0]
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': request.path,
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': host,
+        'SERVER_PORT': str(request.url.port or ''),
+        'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in request.headers.items():
+        name = key.upper().replace('-', '_')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            continue
+        name = f'HTTP_{name}'
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+
+    loop = asyncio.get_running_loop()
+    status, headers, payload = await loop.run_in_executor(_wsgi_executor, _call_wsgi, environ)
+
+    response_headers = CIMultiDict(
+        (k, v) for k, v in headers if k.lower() not in ('content-length', 'transfer-encoding')
+    )
+    return web.Response(status=int(status.split(' ', 1)[0]), headers=response_headers, body=payload)
+
+
+# ============= التسجيل في تطبيق الويب =============
+
+def setup_async_dashboard(app: web.Application, db_pool):
+    """
+    تسجيل مسارات لوحة التحكم في تطبيق aiohttp الخاص بالبوت
+
+    القوالب تستخدم روابط مطلقة (/users، /search ...) لذلك تُسجَّل المسارات
+    من الجذر، ويُسجَّل مسار Flask الاحتياطي أخيراً حتى لا يغطي مسارات البوت.
+    """
+    app['dashboard_db_pool'] = db_pool
+
+    app.router.add_get('/', index)
+    app.router.add_get('/users', users_management)
+    app.router.add_get('/deposits', deposits_management)
+    app.router.add_get('/orders', orders_management)
+    app.router.add_get('/statistics', statistics_page)
+    app.router.add_get('/search', search)
+    app.router.add_get('/api/list/{kind}', list_page_api)
+    app.router.add_route('*', '/{tail:.*}', wsgi_fallback)
+
+    async def close_executor(app):
+        _wsgi_executor.shutdown(wait=False)
+
+    app.on_cleanup.append(close_executor)
+    logger.info(f"✅ تم تفعيل لوحة التحكم غير المتزامنة (خيوط Flask: {DASHBOARD_WSGI_THREADS}, حجم الصفحة: {LIST_PAGE_SIZE})")
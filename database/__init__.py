@@ -1,26 +1,40 @@
 # database/__init__.py
 from .connection import get_pool, init_db, set_database_timezone, update_old_records_timezone, DAMASCUS_TZ, format_local_time
 from .core import get_bot_status, set_bot_status, get_maintenance_message, get_exchange_rate, set_exchange_rate, get_syriatel_numbers, set_syriatel_numbers
+from .settings import SettingsSnapshot, current_settings, load_settings, get_settings
 from .users import get_user_profile, get_user_full_stats, get_user_by_id, update_user_balance, get_all_users, is_admin_user
-from .referrals import generate_referral_code, check_duplicate_referral, process_referral, get_referral_stats, detect_suspicious_referrals, get_user_referral_info
+from .referrals import generate_referral_code, encode_referral_code, find_user_by_referral_code, check_duplicate_referral, process_referral, record_referral, get_referral_stats, detect_suspicious_referrals, get_user_referral_info
 from .products import get_app_variants, get_app_variant, delete_app_variant, get_product_options, get_product_option, update_product_option, add_product_option, get_product_options_cached, get_all_applications, get_applications_by_category, get_all_categories, update_category, get_category_by_id, delete_category, reorder_categories, add_category
 from .orders import create_deposit_request, create_order, create_order_with_variant, update_order_group_message, update_deposit_group_message
 from .points import get_user_points, get_points_history, add_points_history, create_redemption_request, approve_redemption, reject_redemption, calculate_points_value, add_points, deduct_points, get_points_per_order, get_points_per_deposit, get_points_per_referral, get_user_points_summary, get_total_points_redeemed, get_redemption_rate
 from .admin import get_all_admins, add_admin, remove_admin, get_admin_info, get_admin_logs, fix_manual_vip_for_existing_users
-from .stats import get_bot_stats, get_top_users_by_deposits, get_top_users_by_orders, get_top_users_by_referrals, get_top_users_by_points, get_report_settings, update_report_setting
+from .stats import get_bot_stats, get_top_users_by_deposits, get_top_users_by_orders, get_top_users_by_referrals, get_top_users_by_points, get_report_settings, update_report_setting, get_profits_by_app, get_users_summary, get_pending_counts, get_dashboard_overview, get_dashboard_statistics
+from .metrics import refresh_daily_metrics, get_daily_metrics, get_metrics_totals, get_metrics_top_apps
+from .search import search, search_users, search_orders, search_deposits, build_search_sql
+from .listing import fetch_list_page, build_list_sql
+from .query_stats import get_query_stats, reset_query_stats
+from .pool import AdaptivePool, PoolBusyError
 from .vip import get_vip_levels, get_user_vip, update_user_vip, get_next_vip_level
+from .wallet import debit, credit, adjust, refund_order, InsufficientFunds, get_wallet_history, snapshot_wallets
 from .cache_utils import invalidate_user_cache, invalidate_exchange_rate, invalidate_categories
 
 __all__ = [
     'get_pool', 'init_db', 'set_database_timezone', 'update_old_records_timezone', 'DAMASCUS_TZ', 'format_local_time',
     'get_bot_status', 'set_bot_status', 'get_maintenance_message', 'get_exchange_rate', 'set_exchange_rate', 'get_syriatel_numbers', 'set_syriatel_numbers',
+    'SettingsSnapshot', 'current_settings', 'load_settings', 'get_settings',
     'get_user_profile', 'get_user_full_stats', 'get_user_by_id', 'update_user_balance', 'get_all_users', 'is_admin_user',
-    'generate_referral_code', 'check_duplicate_referral', 'process_referral', 'get_referral_stats', 'detect_suspicious_referrals', 'get_user_referral_info',
+    'generate_referral_code', 'encode_referral_code', 'find_user_by_referral_code', 'check_duplicate_referral', 'process_referral', 'record_referral', 'get_referral_stats', 'detect_suspicious_referrals', 'get_user_referral_info',
     'get_app_variants', 'get_app_variant', 'delete_app_variant', 'get_product_options', 'get_product_option', 'update_product_option', 'add_product_option', 'get_product_options_cached', 'get_all_applications', 'get_applications_by_category', 'get_all_categories', 'update_category', 'get_category_by_id', 'delete_category', 'reorder_categories', 'add_category',
     'create_deposit_request', 'create_order', 'create_order_with_variant', 'update_order_group_message', 'update_deposit_group_message',
     'get_user_points', 'get_points_history', 'add_points_history', 'create_redemption_request', 'approve_redemption', 'reject_redemption', 'calculate_points_value', 'add_points', 'deduct_points', 'get_points_per_order', 'get_points_per_deposit', 'get_points_per_referral', 'get_user_points_summary', 'get_total_points_redeemed', 'get_redemption_rate',
     'get_all_admins', 'add_admin', 'remove_admin', 'get_admin_info', 'get_admin_logs', 'fix_manual_vip_for_existing_users',
-    'get_bot_stats', 'get_top_users_by_deposits', 'get_top_users_by_orders', 'get_top_users_by_referrals', 'get_top_users_by_points', 'get_report_settings', 'update_report_setting',
+    'get_bot_stats', 'get_top_users_by_deposits', 'get_top_users_by_orders', 'get_top_users_by_referrals', 'get_top_users_by_points', 'get_report_settings', 'update_report_setting', 'get_profits_by_app', 'get_users_summary', 'get_pending_counts', 'get_dashboard_overview', 'get_dashboard_statistics',
+    'refresh_daily_metrics', 'get_daily_metrics', 'get_metrics_totals', 'get_metrics_top_apps',
+    'search', 'search_users', 'search_orders', 'search_deposits', 'build_search_sql',
+    'fetch_list_page', 'build_list_sql',
+    'get_query_stats', 'reset_query_stats',
+    'AdaptivePool', 'PoolBusyError',
     'get_vip_levels', 'get_user_vip', 'update_user_vip', 'get_next_vip_level',
+    'debit', 'credit', 'adjust', 'refund_order', 'InsufficientFunds', 'get_wallet_history', 'snapshot_wallets',
     'invalidate_user_cache', 'invalidate_exchange_rate', 'invalidate_categories'
 ]
@@ -4,6 +4,16 @@ import logging
 import pytz
 from datetime import datetime
 from config import DB_CONFIG, DATABASE_URL
+from .metrics import init_metrics_tables
+from .wallet import init_wallet_tables
+from .referrals import init_referrals_table, backfill_referral_codes
+from .subscriptions import init_channel_members_table
+from .settings_events import init_settings_notify
+from .scheduler_runs import init_scheduler_runs_table
+from .search import init_search_indexes
+from .query_stats import InstrumentedConnection
+from .pool import AdaptivePool
+from .statement_mode import strip_pooler_flag, looks_like_pooler, resolve_statement_mode, statement_settings
 
 DAMASCUS_TZ = pytz.timezone('Asia/Damascus')
 
@@ -40,40 +50,103 @@ async def set_database_timezone(pool):
         return False
 
 async def get_pool():
-    """إنشاء مجمع اتصالات عالي الأداء لسرعة استجابة أفضل"""
+    """إنشاء مجمع اتصالات متكيف: الحد النشط يتحرك بين DB_POOL_MIN_SIZE و DB_POOL_MAX_SIZE حسب الانتظار"""
     try:
-        from config import DATABASE_URL, DB_CONFIG
+        from config import (
+            DATABASE_URL, DB_CONFIG, QUERY_STATS_ENABLED,
+            DB_ACQUIRE_TIMEOUT, DB_POOL_MAX_WAITERS, DB_POOL_TARGET_WAIT_MS, DB_POOL_ADJUST_SECONDS,
+            DB_STATEMENT_MODE, DB_STATEMENT_CACHE_SIZE
+        )
         
-        dsn_link = DATABASE_URL if DATABASE_URL else DB_CONFIG.get("dsn")
+        dsn_link, pooler_flag = strip_pooler_flag(DATABASE_URL if DATABASE_URL else DB_CONFIG.get("dsn"))
+        min_size = DB_CONFIG.get("min_size", 5)
+        max_size = max(min_size, DB_CONFIG.get("max_size", 20))
+        # إعدادات الاتصال فقط (الحجم والمهلة تُضبط أدناه)
+        connect_args = {
+            k: v for k, v in DB_CONFIG.items()
+            if k not in ("dsn", "min_size", "max_size", "command_timeout")
+        }
+        
+        # ✅ كاش الـ prepared statements عند الاتصال المباشر، وstatements غير مسماة خلف PgBouncer
+        statement_mode = await resolve_statement_mode(
+            DB_STATEMENT_MODE, {"dsn": dsn_link} if dsn_link else connect_args, pooler_flag
+        )
         
         async def init_connection(conn):
             await conn.execute("SET TIMEZONE TO 'Asia/Damascus'")
 
-        # زيادة حجم المجمع لتحسين سرعة الاستجابة للأزرار الإنلاين
+        # المجمع يُنشأ بالحد الأعلى، والحد النشط يديره AdaptivePool
         pool_settings = {
-            "min_size": 5,           # 5 اتصالات جاهزة دائماً
-            "max_size": 20,           # 20 اتصال كحد أقصى
+            "min_size": min_size,
+            "max_size": max_size,
             "max_queries": 50000,
+            # الاتصالات الخاملة فوق min_size تُغلق بعد دقيقتين (بعد تقليص الحد)
+            "max_inactive_connection_lifetime": 120,
             "command_timeout": 30,
             "init": init_connection,
-            "statement_cache_size": 0,
-            "max_cached_statement_lifetime": 0,
+            **statement_settings(statement_mode, DB_STATEMENT_CACHE_SIZE),
             "server_settings": {'timezone': 'Asia/Damascus'}
         }
+        if QUERY_STATS_ENABLED:
+            # ✅ قياس زمن كل استعلام وتجميعه حسب البصمة (database/query_stats.py)
+            pool_settings["connection_class"] = InstrumentedConnection
 
         if dsn_link:
             logging.info(f"🔌 محاولة الاتصال باستخدام DSN مع pool محسّن: {dsn_link[:50]}...")
             pool = await asyncpg.create_pool(dsn=dsn_link, **pool_settings)
         else:
             logging.info(f"🔌 محاولة الاتصال باستخدام الإعدادات: {DB_CONFIG.get('host')}")
-            pool = await asyncpg.create_pool(**DB_CONFIG, **pool_settings)
+            pool = await asyncpg.create_pool(**connect_args, **pool_settings)
+        
+        adaptive = AdaptivePool(
+            pool,
+            min_limit=min_size,
+            max_limit=max_size,
+            acquire_timeout=DB_ACQUIRE_TIMEOUT,
+            max_waiters=DB_POOL_MAX_WAITERS,
+            target_wait_ms=DB_POOL_TARGET_WAIT_MS,
+            adjust_seconds=DB_POOL_ADJUST_SECONDS,
+        )
+        adaptive.statement_mode = statement_mode
+        adaptive.start()
             
-        logging.info(f"✅ تم إنشاء مجمع اتصالات عالي الأداء (min=5, max=20) - لسرعة استجابة أفضل")
-        return pool
+        logging.info(
+            f"✅ تم إنشاء مجمع اتصالات متكيف (min={min_size}, max={max_size}, "
+            f"مهلة الانتظار {DB_ACQUIRE_TIMEOUT}s، وضع الـ statements: {statement_mode})"
+        )
+        return adaptive
     except Exception as e:
         logging.error(f"❌ فشل إنشاء مجمع الاتصالات: {e}")
         return None
 
+def direct_connection_pooled() -> bool:
+    """هل يمر اتصال connect_direct عبر pooler؟ (LISTEN والأقفال على مستوى الجلسة لا تعمل خلفه)"""
+    from config import DB_LISTEN_URL
+    
+    dsn_link, pooler_flag = strip_pooler_flag(DB_LISTEN_URL or DATABASE_URL or DB_CONFIG.get("dsn"))
+    if dsn_link:
+        return pooler_flag or looks_like_pooler(dsn_link)
+    return looks_like_pooler(host=DB_CONFIG.get("host"), port=DB_CONFIG.get("port"))
+
+async def connect_direct():
+    """اتصال مستقل خارج المجمع (للاستماع LISTEN) - DB_LISTEN_URL إن وجد وإلا نفس إعدادات المجمع"""
+    from config import DB_LISTEN_URL
+    
+    dsn_link, _ = strip_pooler_flag(DB_LISTEN_URL or DATABASE_URL or DB_CONFIG.get("dsn"))
+    if direct_connection_pooled():
+        logging.error(
+            "❌ الاتصال المباشر يمر عبر pooler (PgBouncer/Supabase) - تنبيهات LISTEN لا تصل بوضع transaction. "
+            "حدد DB_LISTEN_URL باتصال مباشر بـ Postgres (الإعدادات تُحدّث حالياً بالفحص الدوري فقط)"
+        )
+    server_settings = {'timezone': 'Asia/Damascus'}
+    if dsn_link:
+        return await asyncpg.connect(dsn=dsn_link, server_settings=server_settings)
+    connect_args = {
+        k: v for k, v in DB_CONFIG.items()
+        if k not in ("dsn", "min_size", "max_size", "command_timeout")
+    }
+    return await asyncpg.connect(**connect_args, server_settings=server_settings)
+
 async def update_old_records_timezone(pool):
     """تحديث السجلات القديمة إلى التوقيت الصحيح (مرة واحدة)"""
     try:
@@ -368,6 +441,70 @@ async def init_db(pool=None):
             ON CONFLICT (setting_key) DO NOTHING;
         ''')
 
+        # جدول الإحصائيات اليومية (daily_metrics) وفهارس created_at
+        try:
+            await init_metrics_tables(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء جدول daily_metrics: {e}")
+
+        # جدول الإحالات (مع ترحيل الإحالات السابقة عند أول إنشاء)
+        try:
+            await init_referrals_table(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء جدول الإحالات: {e}")
+
+        # سجل تشغيل المهام المجدولة (المواعيد الفائتة بين إعادة التشغيل ونسخ البوت)
+        try:
+            await init_scheduler_runs_table(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء جدول سجل المهام: {e}")
+
+        # حالة الاشتراك في قناة البوت (من تحديثات chat_member)
+        try:
+            await init_channel_members_table(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء جدول اشتراكات القناة: {e}")
+
+        # سجل حركات الرصيد ولقطات الأرصدة (wallet_ledger / wallet_snapshots)
+        try:
+            await init_wallet_tables(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء جداول سجل الرصيد: {e}")
+
+        # الفهارس الجزئية للطلبات المكتملة يغطيها idx_orders_status_keyset (status, created_at, id)
+        # و idx_orders_updated_at - حذفها يخفف تكلفة الكتابة على مسار الشراء
+        for index_name in ('idx_orders_completed_created_at', 'idx_orders_completed_updated_at'):
+            try:
+                await conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+            except Exception as e:
+                logging.warning(f"⚠️ لم يتم حذف الفهرس المكرر {index_name}: {e}")
+
+        # فهارس مركبة لقوائم لوحة التحكم (تقسيم الصفحات بالمؤشر created_at, id مع الفلاتر)
+        keyset_indexes = [
+            ('idx_users_keyset', 'users (created_at, user_id)'),
+            ('idx_users_banned_keyset', 'users (is_banned, created_at, user_id)'),
+            ('idx_users_vip_keyset', 'users (vip_level, created_at, user_id)'),
+            ('idx_deposits_keyset', 'deposit_requests (created_at, id)'),
+            ('idx_deposits_status_keyset', 'deposit_requests (status, created_at, id)'),
+            ('idx_deposits_user_keyset', 'deposit_requests (user_id, created_at, id)'),
+            ('idx_orders_keyset', 'orders (created_at, id)'),
+            ('idx_orders_status_keyset', 'orders (status, created_at, id)'),
+            ('idx_orders_app_keyset', 'orders (app_id, created_at, id)'),
+            ('idx_orders_user_keyset', 'orders (user_id, created_at, id)'),
+        ]
+        for index_name, target in keyset_indexes:
+            try:
+                await conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {target}")
+            except Exception as e:
+                logging.warning(f"⚠️ خطأ في إنشاء الفهرس {index_name}: {e}")
+        logging.info("✅ تم التأكد من فهارس قوائم لوحة التحكم")
+
+        # فهارس البحث (pg_trgm)
+        try:
+            await init_search_indexes(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء فهارس البحث: {e}")
+
         # إضافة قسم تطبيقات الدردشة فقط إذا لم تكن هناك أقسام
         existing_cats = await conn.fetchval("SELECT COUNT(*) FROM categories")
         if existing_cats == 0:
@@ -398,6 +535,12 @@ async def init_db(pool=None):
             ON CONFLICT (key) DO NOTHING;
         ''')
         
+        # تنبيه bot_settings_changed مع كل تعديل على الإعدادات (LISTEN في البوت)
+        try:
+            await init_settings_notify(conn)
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إنشاء تنبيه تغيير الإعدادات: {e}")
+        
         # إضافة الأعمدة إذا لم تكن موجودة (للتحديثات)
         tables_columns = {
             'applications': [
@@ -456,15 +599,7 @@ async def init_db(pool=None):
 
         # إنشاء كود إحالة فريد لكل مستخدم موجود
         try:
-            users = await conn.fetch("SELECT user_id FROM users WHERE referral_code IS NULL")
-            for user in users:
-                import random
-                import string
-                code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-                await conn.execute(
-                    "UPDATE users SET referral_code = $1 WHERE user_id = $2",
-                    code, user['user_id']
-                )
+            await backfill_referral_codes(conn)
         except Exception as e:
             logging.warning(f"⚠️ لم يتم إنشاء أكواد الإحالة للمستخدمين الحاليين: {e}")
 
@@ -500,7 +635,14 @@ async def init_db(pool=None):
             logging.info("✅ تم إضافة عمود description إلى جدول applications")
         except Exception as e:
             logging.warning(f"⚠️ خطأ في إضافة عمود description: {e}")
-            
+
+        # عمود updated_at (تستخدمه مزامنة Mousa Card عند تحديث الأسعار)
+        try:
+            await conn.execute('ALTER TABLE applications ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+            logging.info("✅ تم التأكد من وجود updated_at في applications")
+        except Exception as e:
+            logging.warning(f"⚠️ خطأ في إضافة updated_at إلى applications: {e}")
+
         # إصلاح الأعمدة المفقودة
         try:
             await conn.execute('ALTER TABLE app_variants ADD COLUMN IF NOT EXISTS display_name TEXT')
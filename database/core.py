@@ -1,6 +1,6 @@
 # database/core.py
 import logging
-from cache import cached
+from .settings import current_settings, load_settings
 
 # ============= حالة البوت =============
 
@@ -42,11 +42,25 @@ async def get_maintenance_message(pool):
         logging.error(f"❌ خطأ في جلب رسالة الصيانة: {e}")
         return "البوت قيد الصيانة حالياً"
 
+async def get_bot_status_settings(pool):
+    """حالة البوت ورسالة الصيانة في استعلام واحد - (يعمل؟, الرسالة). الأخطاء تُرفع للمستدعي"""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT key, value FROM bot_settings WHERE key IN ('bot_status', 'maintenance_message')"
+        )
+    values = {row['key']: row['value'] for row in rows}
+    return (
+        values.get('bot_status', 'running') == 'running',
+        values.get('maintenance_message') or "البوت قيد الصيانة حالياً"
+    )
+
 # ============= سعر الصرف =============
 
-@cached(ttl=30, key_prefix="exchange_rate")
 async def get_exchange_rate(pool):
-    """جلب سعر الصرف مع كاش 30 ثانية"""
+    """سعر الصرف من نسخة الإعدادات (استعلام فقط قبل أول تحميل)"""
+    settings = current_settings()
+    if settings.loaded:
+        return settings.usd_to_syp
     try:
         async with pool.acquire() as conn:
             rate = await conn.fetchval(
@@ -66,8 +80,9 @@ async def set_exchange_rate(pool, rate):
                 VALUES ('usd_to_syp', $1, 'سعر صرف الدولار مقابل الليرة')
                 ON CONFLICT (key) DO UPDATE SET value = $2, updated_at = CURRENT_TIMESTAMP
             ''', str(rate), str(rate))
-            logging.info(f"✅ تم تحديث سعر الصرف إلى {rate}")
-            return True
+        await load_settings(pool)
+        logging.info(f"✅ تم تحديث سعر الصرف إلى {rate}")
+        return True
     except Exception as e:
         logging.error(f"❌ خطأ في تحديث سعر الصرف: {e}")
         return False
@@ -75,7 +90,10 @@ async def set_exchange_rate(pool, rate):
 # ============= أرقام سيرياتل =============
 
 async def get_syriatel_numbers(pool):
-    """جلب أرقام سيرياتل من قاعدة البيانات"""
+    """أرقام سيرياتل من نسخة الإعدادات (استعلام فقط قبل أول تحميل)"""
+    settings = current_settings()
+    if settings.loaded:
+        return list(settings.syriatel_nums)
     try:
         async with pool.acquire() as conn:
             numbers_str = await conn.fetchval(
@@ -105,8 +123,9 @@ async def set_syriatel_numbers(pool, numbers):
                 VALUES ('syriatel_nums', $1, 'أرقام سيرياتل كاش')
                 ON CONFLICT (key) DO UPDATE SET value = $1
             ''', numbers_str)
-            logging.info(f"✅ تم تحديث أرقام سيرياتل: {numbers_str}")
-            return True
+        await load_settings(pool)
+        logging.info(f"✅ تم تحديث أرقام سيرياتل: {numbers_str}")
+        return True
     except Exception as e:
         logging.error(f"❌ خطأ في حفظ أرقام سيرياتل: {e}")
         return False
@@ -0,0 +1,200 @@
+# database/listing.py
+import base64
+import logging
+from datetime import datetime, timedelta
+
+from .search import _compile
+
+# ============= قوائم لوحة التحكم بتقسيم الصفحات بالمؤشر (keyset) =============
+# الترتيب دائماً (created_at, id) تنازلياً، والصفحة التالية تبدأ بعد آخر صف
+# بدلاً من OFFSET، فيبقى زمن الصفحة ثابتاً مهما كبر الجدول.
+# تُستخدم من لوحة التحكم المتزامنة (psycopg2) والوضع غير المتزامن (asyncpg).
+
+LIST_PAGE_SIZE = 50
+
+LIST_KINDS = ('users', 'deposits', 'orders')
+
+DEPOSIT_STATUSES = ('pending', 'approved', 'rejected')
+ORDER_STATUSES = ('pending', 'processing', 'completed', 'failed', 'rejected')
+
+# حالة مركبة للطلبات: بانتظار التنفيذ (معلقة أو قيد المعالجة)
+OPEN_ORDER_STATUSES = ('pending', 'processing')
+
+# القائمة تفتح على الطلبات المعلقة إذا وُجدت (بدلاً من ترتيب CASE الذي لا يخدمه فهرس)
+DEFAULT_STATUS = {'deposits': 'pending', 'orders': 'open'}
+
+# النوع -> (الاستعلام الأساسي، عمود التاريخ، عمود المعرف، مفتاح المعرف في النتيجة)
+_LISTS = {
+    'users': ('''
+        SELECT user_id, username, first_name, last_name, balance, is_banned,
+               created_at, total_deposits, total_orders, total_points, vip_level,
+               discount_percent, referral_count
+        FROM users
+    ''', 'created_at', 'user_id', 'user_id'),
+    'deposits': ('''
+        SELECT d.*, u.username, u.first_name
+        FROM deposit_requests d
+        JOIN users u ON d.user_id = u.user_id
+    ''', 'd.created_at', 'd.id', 'id'),
+    'orders': ('''
+        SELECT o.*, u.username, u.first_name, a.name as app_name
+        FROM orders o
+        JOIN users u ON o.user_id = u.user_id
+        JOIN applications a ON o.app_id = a.id
+    ''', 'o.created_at', 'o.id', 'id'),
+}
+
+
+def encode_cursor(created_at, row_id):
+    """ترميز آخر صف في الصفحة كمؤشر للصفحة التالية"""
+    if created_at is None:
+        return None
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """فك ترميز المؤشر - يعيد (created_at, id) أو None إذا كان غير صالح"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        return None
+
+
+def _parse_date(value, end=False):
+    """قراءة تاريخ (YYYY-MM-DD) - تاريخ النهاية يشمل اليوم كاملاً"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return day + timedelta(days=1) if end else day
+
+
+def _build_filters(kind, args):
+    """تحويل معاملات الرابط إلى شروط WHERE بمعاملات مسماة"""
+    filters, params = [], {}
+    prefix = {'users': '', 'deposits': 'd.', 'orders': 'o.'}[kind]
+
+    if kind == 'users':
+        banned = args.get('banned', '')
+        if banned in ('0', '1'):
+            filters.append("is_banned = :banned")
+            params['banned'] = banned == '1'
+
+        vip = args.get('vip', '')
+        if vip.isdigit():
+            filters.append("vip_level = :vip")
+            params['vip'] = int(vip)
+    else:
+        statuses = DEPOSIT_STATUSES if kind == 'deposits' else ORDER_STATUSES
+        status = args.get('status', '')
+        if status in statuses:
+            filters.append(f"{prefix}status = :status")
+            params['status'] = status
+        elif kind == 'orders' and status == 'open':
+            filters.append("o.status IN ('pending', 'processing')")
+
+        if kind == 'deposits':
+            method = args.get('method', '').strip()
+            if method:
+                filters.append("d.method = :method")
+                params['method'] = method
+        else:
+            app_id = args.get('app_id', '')
+            if app_id.isdigit():
+                filters.append("o.app_id = :app_id")
+                params['app_id'] = int(app_id)
+
+        # البحث: آيدي المستخدم أو رقم الطلب أو رقم المعاملة / الهدف (مطابقة تامة على أعمدة مفهرسة)
+        text_column = 'd.tx_info' if kind == 'deposits' else 'o.target_id'
+        search = args.get('search', '').strip()
+        if search.isdigit() and len(search) < 19:
+            number = int(search)
+            filters.append(f"({prefix}user_id = :search_user OR {prefix}id = :search_id OR {text_column} = :search)")
+            params['search_user'] = number
+            params['search_id'] = number if number <= 2147483647 else -1
+            params['search'] = search
+        elif search:
+            filters.append(f"{text_column} = :search")
+            params['search'] = search
+
+    date_from = _parse_date(args.get('date_from'))
+    date_to = _parse_date(args.get('date_to'), end=True)
+    if date_from:
+        filters.append(f"{prefix}created_at >= :date_from")
+        params['date_from'] = date_from
+    if date_to:
+        filters.append(f"{prefix}created_at < :date_to")
+        params['date_to'] = date_to
+
+    return filters, params
+
+
+def default_status(kind, args, pending_count):
+    """الحالة التي تُفتح عليها القائمة بدون فلتر حالة في الرابط: المعلقة إن وُجدت، وإلا None (الكل)"""
+    if 'status' in args or args.get('cursor') or not pending_count:
+        return None
+    return DEFAULT_STATUS.get(kind)
+
+
+def build_list_sql(kind, args, cursor=None, limit=LIST_PAGE_SIZE, style='asyncpg'):
+    """
+    بناء استعلام صفحة من قائمة
+
+    Args:
+        kind: users / deposits / orders
+        args: معاملات الرابط (أي كائن يدعم get)
+        cursor: مؤشر الصفحة السابقة (None للصفحة الأولى)
+        limit: حجم الصفحة (يُجلب صف إضافي لمعرفة وجود صفحة تالية)
+        style: asyncpg أو psycopg2
+
+    Returns:
+        tuple: (sql, params)
+    """
+    if kind not in _LISTS:
+        raise ValueError(f"نوع قائمة غير معروف: {kind}")
+
+    base_sql, created_col, id_col, _ = _LISTS[kind]
+    filters, params = _build_filters(kind, args)
+
+    position = decode_cursor(cursor)
+    if position:
+        filters.append(f"({created_col}, {id_col}) < (CAST(:cursor_at AS timestamp), :cursor_id)")
+        params['cursor_at'], params['cursor_id'] = position
+
+    sql = base_sql
+    if filters:
+        sql += " WHERE " + " AND ".join(filters)
+    sql += f" ORDER BY {created_col} DESC, {id_col} DESC LIMIT :limit"
+    params['limit'] = limit + 1
+
+    return _compile(sql, params, style)
+
+
+def split_page(kind, rows, limit=LIST_PAGE_SIZE):
+    """فصل الصف الإضافي وحساب مؤشر الصفحة التالية - يعيد (rows, next_cursor)"""
+    rows = [dict(row) for row in rows]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    id_key = _LISTS[kind][3]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1][id_key])
+
+
+async def fetch_list_page(pool, kind, args, cursor=None, limit=LIST_PAGE_SIZE):
+    """جلب صفحة من قائمة عبر asyncpg - يعيد (rows, next_cursor)"""
+    try:
+        sql, params = build_list_sql(kind, args, cursor, limit)
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(sql, *params)
+        return split_page(kind, rows, limit)
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب صفحة {kind}: {e}")
+        return [], None
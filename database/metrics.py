@@ -0,0 +1,443 @@
+# database/metrics.py
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from config import METRICS_TRAILING_DAYS
+
+# ============= جدول الإحصائيات اليومية (daily_metrics) =============
+# كل صف يمثل يوماً بتوقيت دمشق (created_at مخزن بتوقيت دمشق لأن جلسة الاتصال مضبوطة عليه)
+# يتم تحديث الجدول تدريجياً: نبحث فقط عن الأيام التي تغيرت صفوفها منذ آخر علامة (watermark)
+# ونعيد حساب هذه الأيام فقط، فتصبح تكلفة التقارير O(عدد الأيام) بدل O(عدد الصفوف)
+# بعض التعديلات على صفوف قائمة لا تمس updated_at، لذلك آخر METRICS_TRAILING_DAYS يوماً
+# يُعاد حسابها دائماً، والأقدم منها يُصحح بإعادة البناء الكاملة (full=True)
+
+WATERMARK_NAME = 'daily_metrics'
+
+# هامش تداخل لالتقاط المعاملات التي تم تثبيتها متأخرة بوقت إنشاء أقدم من العلامة
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# أقصى عدد أيام في دفعة واحدة عند إعادة الحساب (لتبقى استعلامات النطاق صغيرة)
+MAX_BATCH_DAYS = 31
+
+_refresh_lock = asyncio.Lock()
+_last_refresh = 0.0
+
+METRIC_COLUMNS = (
+    'new_users',
+    'deposits_count', 'deposits_pending', 'deposits_approved', 'deposits_rejected',
+    'deposits_amount_syp', 'deposits_requested_syp',
+    'orders_count', 'orders_pending', 'orders_processing', 'orders_completed',
+    'orders_failed', 'orders_rejected',
+    'revenue_syp', 'order_points',
+    'points_granted', 'points_redeemed',
+    'redemptions_count', 'redemptions_points', 'redemptions_amount_syp',
+)
+
+# أعمدة أضيفت بعد إنشاء الجدول - عند إضافتها تُعاد الأيام السابقة بإعادة بناء كاملة
+_ADDED_COLUMNS = (
+    ('deposits_requested_syp', 'FLOAT DEFAULT 0'),
+    ('redemptions_points', 'INTEGER DEFAULT 0'),
+)
+
+_DIRTY_DAYS_SQL = '''
+    SELECT DISTINCT day FROM (
+        SELECT created_at::date AS day FROM users WHERE created_at >= $1
+        UNION ALL
+        SELECT created_at::date FROM deposit_requests WHERE created_at >= $1 OR updated_at >= $1
+        UNION ALL
+        SELECT created_at::date FROM orders WHERE created_at >= $1 OR updated_at >= $1
+        UNION ALL
+        SELECT created_at::date FROM points_history WHERE created_at >= $1
+        UNION ALL
+        SELECT created_at::date FROM redemption_requests WHERE created_at >= $1 OR updated_at >= $1
+    ) changed
+    WHERE day IS NOT NULL
+'''
+
+_FIRST_DAY_SQL = '''
+    SELECT MIN(day) FROM (
+        SELECT MIN(created_at)::date AS day FROM users
+        UNION ALL SELECT MIN(created_at)::date FROM deposit_requests
+        UNION ALL SELECT MIN(created_at)::date FROM orders
+        UNION ALL SELECT MIN(created_at)::date FROM points_history
+        UNION ALL SELECT MIN(created_at)::date FROM redemption_requests
+    ) firsts
+'''
+
+# كل سلسلة تُحسب في استعلام فرعي مستقل مجمّع حسب اليوم ثم تُربط 1:1 مع الأيام
+# ($2, $3) نطاق زمني يسمح باستخدام فهارس created_at بدل DATE(created_at)
+_REFRESH_SQL = '''
+    WITH days AS (
+        SELECT unnest($1::date[]) AS day
+    ),
+    u AS (
+        SELECT created_at::date AS day, COUNT(*) AS new_users
+        FROM users
+        WHERE created_at >= $2 AND created_at < $3
+        GROUP BY 1
+    ),
+    d AS (
+        SELECT created_at::date AS day,
+               COUNT(*) AS deposits_count,
+               COUNT(*) FILTER (WHERE status = 'pending') AS deposits_pending,
+               COUNT(*) FILTER (WHERE status = 'approved') AS deposits_approved,
+               COUNT(*) FILTER (WHERE status = 'rejected') AS deposits_rejected,
+               COALESCE(SUM(amount_syp) FILTER (WHERE status = 'approved'), 0) AS deposits_amount_syp,
+               COALESCE(SUM(amount_syp), 0) AS deposits_requested_syp
+        FROM deposit_requests
+        WHERE created_at >= $2 AND created_at < $3
+        GROUP BY 1
+    ),
+    dm AS (
+        SELECT day, jsonb_object_agg(method, jsonb_build_object(
+                   'count', cnt, 'approved', approved, 'amount_syp', amount_syp
+               )) AS deposits_by_method
+        FROM (
+            SELECT created_at::date AS day,
+                   COALESCE(method, 'unknown') AS method,
+                   COUNT(*) AS cnt,
+                   COUNT(*) FILTER (WHERE status = 'approved') AS approved,
+                   COALESCE(SUM(amount_syp) FILTER (WHERE status = 'approved'), 0) AS amount_syp
+            FROM deposit_requests
+            WHERE created_at >= $2 AND created_at < $3
+            GROUP BY 1, 2
+        ) per_method
+        GROUP BY day
+    ),
+    o AS (
+        SELECT created_at::date AS day,
+               COUNT(*) AS orders_count,
+               COUNT(*) FILTER (WHERE status = 'pending') AS orders_pending,
+               COUNT(*) FILTER (WHERE status = 'processing') AS orders_processing,
+               COUNT(*) FILTER (WHERE status = 'completed') AS orders_completed,
+               COUNT(*) FILTER (WHERE status = 'failed') AS orders_failed,
+               COUNT(*) FILTER (WHERE status = 'rejected') AS orders_rejected,
+               COALESCE(SUM(total_amount_syp) FILTER (WHERE status = 'completed'), 0) AS revenue_syp,
+               COALESCE(SUM(points_earned) FILTER (WHERE status = 'completed'), 0) AS order_points
+        FROM orders
+        WHERE created_at >= $2 AND created_at < $3
+        GROUP BY 1
+    ),
+    oa AS (
+        SELECT day, jsonb_object_agg(app_key, jsonb_build_object(
+                   'name', app_name, 'count', cnt, 'completed', completed, 'amount_syp', amount_syp
+               )) AS orders_by_app
+        FROM (
+            SELECT created_at::date AS day,
+                   COALESCE(app_id::text, 'unknown') AS app_key,
+                   MAX(app_name) AS app_name,
+                   COUNT(*) AS cnt,
+                   COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+                   COALESCE(SUM(total_amount_syp) FILTER (WHERE status = 'completed'), 0) AS amount_syp
+            FROM orders
+            WHERE created_at >= $2 AND created_at < $3
+            GROUP BY 1, 2
+        ) per_app
+        GROUP BY day
+    ),
+    p AS (
+        SELECT created_at::date AS day,
+               COALESCE(SUM(points) FILTER (WHERE points > 0), 0) AS points_granted,
+               COALESCE(SUM(-points) FILTER (WHERE points < 0), 0) AS points_redeemed
+        FROM points_history
+        WHERE created_at >= $2 AND created_at < $3
+        GROUP BY 1
+    ),
+    r AS (
+        SELECT created_at::date AS day,
+               COUNT(*) AS redemptions_count,
+               COALESCE(SUM(points), 0) AS redemptions_points,
+               COALESCE(SUM(amount_syp), 0) AS redemptions_amount_syp
+        FROM redemption_requests
+        WHERE status = 'approved' AND created_at >= $2 AND created_at < $3
+        GROUP BY 1
+    )
+    INSERT INTO daily_metrics (
+        day, new_users,
+        deposits_count, deposits_pending, deposits_approved, deposits_rejected,
+        deposits_amount_syp, deposits_requested_syp, deposits_by_method,
+        orders_count, orders_pending, orders_processing, orders_completed,
+        orders_failed, orders_rejected, orders_by_app,
+        revenue_syp, order_points,
+        points_granted, points_redeemed,
+        redemptions_count, redemptions_points, redemptions_amount_syp, updated_at
+    )
+    SELECT
+        days.day,
+        COALESCE(u.new_users, 0),
+        COALESCE(d.deposits_count, 0), COALESCE(d.deposits_pending, 0),
+        COALESCE(d.deposits_approved, 0), COALESCE(d.deposits_rejected, 0),
+        COALESCE(d.deposits_amount_syp, 0), COALESCE(d.deposits_requested_syp, 0),
+        COALESCE(dm.deposits_by_method, '{}'::jsonb),
+        COALESCE(o.orders_count, 0), COALESCE(o.orders_pending, 0),
+        COALESCE(o.orders_processing, 0), COALESCE(o.orders_completed, 0),
+        COALESCE(o.orders_failed, 0), COALESCE(o.orders_rejected, 0),
+        COALESCE(oa.orders_by_app, '{}'::jsonb),
+        COALESCE(o.revenue_syp, 0),
+        COALESCE(o.order_points, 0),
+        COALESCE(p.points_granted, 0), COALESCE(p.points_redeemed, 0),
+        COALESCE(r.redemptions_count, 0), COALESCE(r.redemptions_points, 0),
+        COALESCE(r.redemptions_amount_syp, 0),
+        CURRENT_TIMESTAMP
+    FROM days
+    LEFT JOIN u USING (day)
+    LEFT JOIN d USING (day)
+    LEFT JOIN dm USING (day)
+    LEFT JOIN o USING (day)
+    LEFT JOIN oa USING (day)
+    LEFT JOIN p USING (day)
+    LEFT JOIN r USING (day)
+    ON CONFLICT (day) DO UPDATE SET
+        new_users = EXCLUDED.new_users,
+        deposits_count = EXCLUDED.deposits_count,
+        deposits_pending = EXCLUDED.deposits_pending,
+        deposits_approved = EXCLUDED.deposits_approved,
+        deposits_rejected = EXCLUDED.deposits_rejected,
+        deposits_amount_syp = EXCLUDED.deposits_amount_syp,
+        deposits_requested_syp = EXCLUDED.deposits_requested_syp,
+        deposits_by_method = EXCLUDED.deposits_by_method,
+        orders_count = EXCLUDED.orders_count,
+        orders_pending = EXCLUDED.orders_pending,
+        orders_processing = EXCLUDED.orders_processing,
+        orders_completed = EXCLUDED.orders_completed,
+        orders_failed = EXCLUDED.orders_failed,
+        orders_rejected = EXCLUDED.orders_rejected,
+        orders_by_app = EXCLUDED.orders_by_app,
+        revenue_syp = EXCLUDED.revenue_syp,
+        order_points = EXCLUDED.order_points,
+        points_granted = EXCLUDED.points_granted,
+        points_redeemed = EXCLUDED.points_redeemed,
+        redemptions_count = EXCLUDED.redemptions_count,
+        redemptions_points = EXCLUDED.redemptions_points,
+        redemptions_amount_syp = EXCLUDED.redemptions_amount_syp,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+async def init_metrics_tables(conn):
+    """إنشاء جدول daily_metrics وجدول العلامات والفهارس اللازمة للتحديث التدريجي"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_metrics (
+            day DATE PRIMARY KEY,
+            new_users INTEGER DEFAULT 0,
+            deposits_count INTEGER DEFAULT 0,
+            deposits_pending INTEGER DEFAULT 0,
+            deposits_approved INTEGER DEFAULT 0,
+            deposits_rejected INTEGER DEFAULT 0,
+            deposits_amount_syp FLOAT DEFAULT 0,
+            deposits_requested_syp FLOAT DEFAULT 0,
+            deposits_by_method JSONB DEFAULT '{}'::jsonb,
+            orders_count INTEGER DEFAULT 0,
+            orders_pending INTEGER DEFAULT 0,
+            orders_processing INTEGER DEFAULT 0,
+            orders_completed INTEGER DEFAULT 0,
+            orders_failed INTEGER DEFAULT 0,
+            orders_rejected INTEGER DEFAULT 0,
+            orders_by_app JSONB DEFAULT '{}'::jsonb,
+            revenue_syp FLOAT DEFAULT 0,
+            order_points INTEGER DEFAULT 0,
+            points_granted INTEGER DEFAULT 0,
+            points_redeemed INTEGER DEFAULT 0,
+            redemptions_count INTEGER DEFAULT 0,
+            redemptions_points INTEGER DEFAULT 0,
+            redemptions_amount_syp FLOAT DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_watermarks (
+            name TEXT PRIMARY KEY,
+            last_run TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+    existing = {row['column_name'] for row in await conn.fetch(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'daily_metrics'"
+    )}
+    missing = [(name, ddl) for name, ddl in _ADDED_COLUMNS if name not in existing]
+    # الإيرادات تُخزن بالليرة فقط (التحويل للدولار عند القراءة بسعر الصرف الحالي)، فلا تتغير
+    # قيم الأيام السابقة مع كل تغيير لسعر الصرف عند إعادة حسابها
+    if 'revenue_usd' in existing:
+        await conn.execute('ALTER TABLE daily_metrics DROP COLUMN IF EXISTS revenue_usd')
+    for name, ddl in missing:
+        await conn.execute(f'ALTER TABLE daily_metrics ADD COLUMN IF NOT EXISTS {name} {ddl}')
+    if missing:
+        # الأيام المحسوبة سابقاً فيها أصفار للأعمدة الجديدة - حذف العلامة يعيد بناءها كلها
+        await conn.execute("DELETE FROM metrics_watermarks WHERE name = $1", WATERMARK_NAME)
+        logging.info(f"📊 أعمدة جديدة في daily_metrics ({', '.join(n for n, _ in missing)}) - ستُعاد كل الأيام")
+
+    # نطاقات created_at على users / deposit_requests / orders تخدمها فهارس القوائم
+    # (created_at, id) في init_db - فهرس created_at منفصل تكلفة كتابة مكررة
+    for name in ('idx_users_created_at', 'idx_deposit_requests_created_at', 'idx_orders_created_at'):
+        try:
+            await conn.execute(f'DROP INDEX IF EXISTS {name}')
+        except Exception as e:
+            logging.warning(f"⚠️ لم يتم حذف الفهرس المكرر {name}: {e}")
+
+    indexes = [
+        ('idx_deposit_requests_updated_at', 'deposit_requests (updated_at)'),
+        ('idx_orders_updated_at', 'orders (updated_at)'),
+        ('idx_points_history_created_at', 'points_history (created_at)'),
+        ('idx_redemption_requests_created_at', 'redemption_requests (created_at)'),
+        ('idx_redemption_requests_updated_at', 'redemption_requests (updated_at)'),
+    ]
+    for name, target in indexes:
+        try:
+            await conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+        except Exception as e:
+            logging.warning(f"⚠️ لم يتم إنشاء الفهرس {name}: {e}")
+
+    logging.info("✅ تم التأكد من وجود جدول daily_metrics وفهارسه")
+
+
+def _batch_days(days):
+    """تقسيم الأيام المتغيرة إلى دفعات متقاربة حتى لا يتسع نطاق المسح"""
+    batches = []
+    current = []
+    for day in sorted(days):
+        if current and (day - current[0]).days >= MAX_BATCH_DAYS:
+            batches.append(current)
+            current = []
+        current.append(day)
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def refresh_daily_metrics(pool, full=False, max_age=0, raise_errors=False):
+    """
+    تحديث جدول daily_metrics تدريجياً
+
+    Args:
+        full: إعادة بناء كل الأيام من أول سجل
+        max_age: تخطي التحديث إذا تم خلال هذا العدد من الثواني (للاستدعاء من مسار القراءة)
+        raise_errors: إعادة رفع الخطأ بدل إرجاع None (للمهمة المجدولة حتى يُسجل الفشل)
+
+    Returns:
+        int: عدد الأيام التي أعيد حسابها، أو None عند الخطأ
+    """
+    global _last_refresh
+
+    if not full and max_age and time.time() - _last_refresh < max_age:
+        return 0
+
+    async with _refresh_lock:
+        if not full and max_age and time.time() - _last_refresh < max_age:
+            return 0
+
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    # منع عمليتين متزامنتين من عمليات مختلفة (البوت ولوحة التحكم مثلاً)
+                    locked = await conn.fetchval(
+                        "SELECT pg_try_advisory_xact_lock(hashtext('daily_metrics'))"
+                    )
+                    if not locked:
+                        logging.info("⏭️ تحديث daily_metrics قيد التنفيذ في عملية أخرى")
+                        return 0
+
+                    run_started = await conn.fetchval("SELECT LOCALTIMESTAMP")
+                    today = run_started.date()
+
+                    watermark = None
+                    if not full:
+                        watermark = await conn.fetchval(
+                            "SELECT last_run FROM metrics_watermarks WHERE name = $1",
+                            WATERMARK_NAME
+                        )
+
+                    if watermark is None:
+                        first_day = await conn.fetchval(_FIRST_DAY_SQL) or today
+                        days = {first_day + timedelta(days=i) for i in range((today - first_day).days + 1)}
+                    else:
+                        rows = await conn.fetch(_DIRTY_DAYS_SQL, watermark - WATERMARK_OVERLAP)
+                        days = {row['day'] for row in rows}
+
+                    # الأيام الأخيرة (ومنها اليوم الحالي حتى تظهر الأيام الخالية في الرسوم البيانية)
+                    # تُعاد دائماً لالتقاط التعديلات التي لا تحدّث updated_at
+                    days.update(today - timedelta(days=i) for i in range(max(METRICS_TRAILING_DAYS, 1)))
+
+                    for batch in _batch_days(days):
+                        start = datetime.combine(batch[0], datetime.min.time())
+                        end = datetime.combine(batch[-1] + timedelta(days=1), datetime.min.time())
+                        await conn.execute(_REFRESH_SQL, batch, start, end)
+
+                    await conn.execute('''
+                        INSERT INTO metrics_watermarks (name, last_run, updated_at)
+                        VALUES ($1, $2, CURRENT_TIMESTAMP)
+                        ON CONFLICT (name) DO UPDATE
+                        SET last_run = GREATEST(metrics_watermarks.last_run, EXCLUDED.last_run),
+                            updated_at = CURRENT_TIMESTAMP
+                    ''', WATERMARK_NAME, run_started)
+
+            _last_refresh = time.time()
+            logging.info(f"📊 تم تحديث daily_metrics: {len(days)} يوم")
+            return len(days)
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث daily_metrics: {e}")
+            if raise_errors:
+                raise
+            return None
+
+
+async def get_daily_metrics(pool, start_date: date, end_date: date):
+    """جلب صفوف daily_metrics لكل يوم في النطاق (الأيام الخالية تعود بأصفار)"""
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(f'''
+                SELECT d.day::date AS day,
+                       {", ".join(f"COALESCE(m.{c}, 0) AS {c}" for c in METRIC_COLUMNS)},
+                       COALESCE(m.deposits_by_method, '{{}}'::jsonb) AS deposits_by_method,
+                       COALESCE(m.orders_by_app, '{{}}'::jsonb) AS orders_by_app
+                FROM generate_series($1::date, $2::date, INTERVAL '1 day') AS d(day)
+                LEFT JOIN daily_metrics m ON m.day = d.day::date
+                ORDER BY d.day
+            ''', start_date, end_date)
+            return [dict(row) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب daily_metrics: {e}")
+        return []
+
+
+async def get_metrics_totals(pool, start_date: date = None, end_date: date = None):
+    """مجموع أعمدة daily_metrics في نطاق (أو لكل الأيام إذا لم يحدد النطاق)"""
+    try:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(f'''
+                SELECT {", ".join(f"COALESCE(SUM({c}), 0) AS {c}" for c in METRIC_COLUMNS)}
+                FROM daily_metrics
+                WHERE ($1::date IS NULL OR day >= $1)
+                  AND ($2::date IS NULL OR day <= $2)
+            ''', start_date, end_date)
+            return dict(row) if row else {c: 0 for c in METRIC_COLUMNS}
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب مجاميع daily_metrics: {e}")
+        return {c: 0 for c in METRIC_COLUMNS}
+
+
+async def get_metrics_top_apps(pool, limit=5, start_date: date = None, end_date: date = None):
+    """أكثر التطبيقات طلباً (طلبات مكتملة) من daily_metrics"""
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT COALESCE(MAX(a.name), MAX(app.value->>'name'), app.key) AS name,
+                       SUM((app.value->>'completed')::int) AS order_count,
+                       SUM((app.value->>'amount_syp')::float) AS total_revenue
+                FROM daily_metrics m
+                CROSS JOIN LATERAL jsonb_each(m.orders_by_app) AS app
+                LEFT JOIN applications a ON a.id::text = app.key
+                WHERE ($2::date IS NULL OR m.day >= $2)
+                  AND ($3::date IS NULL OR m.day <= $3)
+                GROUP BY app.key
+                HAVING SUM((app.value->>'completed')::int) > 0
+                ORDER BY order_count DESC, total_revenue DESC
+                LIMIT $1
+            ''', limit, start_date, end_date)
+            return [dict(row) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب أكثر التطبيقات من daily_metrics: {e}")
+        return []
@@ -2,6 +2,8 @@
 import logging
 import pytz
 from .connection import DAMASCUS_TZ
+from .wallet import credit
+from .settings import current_settings
 
 async def get_user_points(pool, user_id):
     """جلب عدد نقاط المستخدم"""
@@ -166,10 +168,7 @@ async def approve_redemption(pool, request_id, admin_id):
                 VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
             ''', req['user_id'], -req['points'], 'redemption', f'استرداد نقاط بقيمة {req["amount_syp"]:,.0f} ل.س')
             
-            await conn.execute(
-                "UPDATE users SET balance = balance + $1 WHERE user_id = $2",
-                req['amount_syp'], req['user_id']
-            )
+            await credit(conn, req['user_id'], req['amount_syp'], reason='redemption', ref_id=request_id)
             
             return True, None
     except Exception as e:
@@ -192,26 +191,28 @@ async def reject_redemption(pool, request_id, admin_id, reason=""):
 async def calculate_points_value(pool, points):
     """حساب قيمة النقاط بالليرة السورية حسب سعر الصرف الحالي"""
     try:
-        async with pool.acquire() as conn:
-            exchange_rate = await get_exchange_rate(pool)
-            redemption_rate = await get_redemption_rate(pool)
-            
-            usd_value = (points / redemption_rate) 
-            syp_value = usd_value * exchange_rate
-            
-            return {
-                'points': points,
-                'redemption_rate': redemption_rate,
-                'exchange_rate': exchange_rate,
-                'usd_value': usd_value,
-                'syp_value': syp_value
-            }
+        exchange_rate = await get_exchange_rate(pool)
+        redemption_rate = await get_redemption_rate(pool)
+        
+        usd_value = (points / redemption_rate) 
+        syp_value = usd_value * exchange_rate
+        
+        return {
+            'points': points,
+            'redemption_rate': redemption_rate,
+            'exchange_rate': exchange_rate,
+            'usd_value': usd_value,
+            'syp_value': syp_value
+        }
     except Exception as e:
         logging.error(f"❌ خطأ في حساب قيمة النقاط: {e}")
         return None
 
 async def get_points_per_order(pool):
-    """جلب عدد النقاط لكل عملية شراء من الإعدادات"""
+    """عدد النقاط لكل عملية شراء من نسخة الإعدادات (استعلام فقط قبل أول تحميل)"""
+    settings = current_settings()
+    if settings.loaded:
+        return settings.points_per_order
     try:
         async with pool.acquire() as conn:
             points = await conn.fetchval(
@@ -223,7 +224,10 @@ async def get_points_per_order(pool):
         return 1
 
 async def get_points_per_deposit(pool):
-    """جلب عدد النقاط لكل عملية شحن من الإعدادات"""
+    """عدد النقاط لكل عملية شحن من نسخة الإعدادات (استعلام فقط قبل أول تحميل)"""
+    settings = current_settings()
+    if settings.loaded:
+        return settings.points_per_deposit
     try:
         async with pool.acquire() as conn:
             points = await conn.fetchval(
@@ -235,7 +239,10 @@ async def get_points_per_deposit(pool):
         return 1
 
 async def get_points_per_referral(pool):
-    """جلب عدد النقاط لكل إحالة من الإعدادات"""
+    """عدد النقاط لكل إحالة من نسخة الإعدادات (استعلام فقط قبل أول تحميل)"""
+    settings = current_settings()
+    if settings.loaded:
+        return settings.points_per_referral
     try:
         async with pool.acquire() as conn:
             points = await conn.fetchval(
@@ -296,7 +303,10 @@ async def get_total_points_redeemed(pool, user_id):
         return 0
 
 async def get_redemption_rate(pool):
-    """جلب معدل استرداد النقاط (كم نقطة مقابل 1 دولار)"""
+    """معدل استرداد النقاط (كم نقطة مقابل 1 دولار) من نسخة الإعدادات"""
+    settings = current_settings()
+    if settings.loaded:
+        return settings.redemption_rate
     try:
         async with pool.acquire() as conn:
             rate = await conn.fetchval(
@@ -0,0 +1,321 @@
+# database/pool.py
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from monitoring import registry
+
+logger = logging.getLogger(__name__)
+
+# ============= مجمع اتصالات متكيف =============
+# مجمع asyncpg يُنشأ بالحد الأعلى المسموح، وفوقه "حد نشط" (limit) يتحكم بعدد
+# الاتصالات المستخدمة في نفس الوقت. المتحكم يرفع الحد عند تزايد انتظار
+# الاتصالات ويخفضه عند الخمول، والاتصالات الزائدة تُغلق تلقائياً بعد
+# max_inactive_connection_lifetime. الطلب الذي لا يجد اتصالاً خلال المهلة
+# (أو يجد طابور الانتظار ممتلئاً) يفشل بـ PoolBusyError بدلاً من الانتظار بلا حد.
+#
+# الحجز المتداخل (مهمة تحمل اتصالاً وتستدعي دالة تحجز اتصالاً آخر) لا ينتظر
+# الحد النشط: لو انتظر لبقي الاتصال الأول محجوزاً بانتظار مكان لن يتحرر إلا
+# بتحريره، وعند حد صغير (1 محلياً) تتعطل كل المعالجات بـ PoolBusyError.
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+POOL_WAIT = registry.histogram(
+    'db_pool_acquire_wait_seconds', 'Time spent waiting for a pool connection', ('pool',), WAIT_BUCKETS)
+POOL_HOLD = registry.histogram(
+    'db_pool_hold_seconds', 'Time a connection is held, per call site', ('site',))
+POOL_REJECTED = registry.counter(
+    'db_pool_acquire_rejected_total', 'Acquires rejected with PoolBusyError', ('pool', 'reason'))
+POOL_RESIZES = registry.counter(
+    'db_pool_resizes_total', 'Adaptive limit changes', ('pool', 'direction'))
+POOL_NESTED = registry.counter(
+    'db_pool_nested_acquires_total', 'Acquires by a task already holding a connection', ('pool',))
+
+# (اسم المجمع, المهمة) لكل اتصال تحمله المهمة الحالية - المهمة جزء من المفتاح لأن
+# المهام الجديدة ترث السياق (create_task) لكنها لا تحمل اتصالات الأب
+_holding: ContextVar[tuple] = ContextVar('db_pool_holding', default=())
+
+_pools: Dict[str, 'AdaptivePool'] = {}
+
+
+def _read(getter):
+    def callback():
+        return {(name,): getter(pool) for name, pool in _pools.items()}
+    return callback
+
+
+registry.gauge('db_pool_limit', 'Current adaptive connection limit', ('pool',),
+               callback=_read(lambda p: p.limit))
+registry.gauge('db_pool_waiting', 'Callers waiting for a connection', ('pool',),
+               callback=_read(lambda p: len(p._waiters)))
+registry.gauge('db_pool_saturation', 'Connections in use divided by the adaptive limit', ('pool',),
+               callback=_read(lambda p: round(p.in_use / p.limit, 3) if p.limit else 0))
+
+
+class PoolBusyError(Exception):
+    """لا يوجد اتصال متاح خلال مهلة الانتظار - يجب على المستخدم إعادة المحاولة"""
+
+
+def _call_site(depth: int = 2) -> str:
+    frame = sys._getframe(depth)
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class _AcquireContext:
+    """يدعم الصيغتين: async with pool.acquire() as conn / conn = await pool.acquire()"""
+    __slots__ = ('_pool', '_timeout', '_site', '_conn')
+
+    def __init__(self, pool: 'AdaptivePool', timeout: Optional[float], site: str):
+        self._pool = pool
+        self._timeout = timeout
+        self._site = site
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire(self._timeout, self._site).__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire(self._timeout, self._site)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class AdaptivePool:
+    """غلاف حول asyncpg.Pool: حد نشط متكيف، مهلة انتظار، وقياس الانتظار والاحتجاز"""
+
+    def __init__(self, pool, min_limit: int, max_limit: int, acquire_timeout: float = 5.0,
+                 max_waiters: int = 200, target_wait_ms: int = 50, adjust_seconds: int = 15,
+                 name: str = 'main'):
+        self._pool = pool
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = self.min_limit
+        self.acquire_timeout = acquire_timeout
+        self.max_waiters = max_waiters
+        self.target_wait = target_wait_ms / 1000
+        self.adjust_seconds = adjust_seconds
+
+        self.in_use = 0
+        self._waiters = deque()
+        self._held: Dict[int, tuple] = {}
+        self._controller: Optional[asyncio.Task] = None
+        self._last_hold: Optional[float] = None
+        self._reset_window()
+        _pools[name] = self
+
+    def __getattr__(self, item):
+        # get_size / get_idle_size / get_min_size / get_max_size / terminate ...
+        return getattr(self._pool, item)
+
+    # ---------- الحد النشط ----------
+    def _wake(self):
+        while self._waiters and self.in_use < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+    def _release_slot(self):
+        self.in_use -= 1
+        self._wake()
+
+    async def _take_slot(self, timeout: float):
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        if len(self._waiters) >= self.max_waiters:
+            POOL_REJECTED.inc(self.name, 'queue_full')
+            self._window['rejected'] += 1
+            raise PoolBusyError("طابور انتظار الاتصالات ممتلئ")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # حصلنا على المكان في نفس لحظة الإلغاء - نعيده
+                self._release_slot()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                POOL_REJECTED.inc(self.name, 'timeout')
+                self._window['rejected'] += 1
+                raise PoolBusyError(f"لا يوجد اتصال متاح خلال {timeout:.1f} ثانية") from None
+            raise
+
+    # ---------- الحجز والإرجاع ----------
+    def acquire(self, *, timeout: Optional[float] = None) -> _AcquireContext:
+        return _AcquireContext(self, timeout, _call_site())
+
+    def _holds_connection(self, task) -> bool:
+        return (self.name, task) in _holding.get()
+
+    async def _acquire(self, timeout: Optional[float], site: str):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        task = asyncio.current_task()
+        if task is not None and self._holds_connection(task):
+            # حجز متداخل: يتجاوز الحد النشط (يُحسب في in_use فقط)
+            self.in_use += 1
+            POOL_NESTED.inc(self.name)
+        else:
+            await self._take_slot(timeout)
+        try:
+            remaining = max(0.1, timeout - (time.perf_counter() - started))
+            conn = await self._pool.acquire(timeout=remaining)
+        except asyncio.TimeoutError:
+            self._release_slot()
+            POOL_REJECTED.inc(self.name, 'timeout')
+            self._window['rejected'] += 1
+            raise PoolBusyError("انتهت مهلة فتح اتصال جديد") from None
+        except BaseException:
+            self._release_slot()
+            raise
+
+        acquired = time.perf_counter()
+        wait = acquired - started
+        POOL_WAIT.observe(wait, self.name)
+        window = self._window
+        window['acquires'] += 1
+        window['wait_total'] += wait
+        if wait > window['wait_max']:
+            window['wait_max'] = wait
+        if self.in_use > window['peak']:
+            window['peak'] = self.in_use
+        self._held[id(conn)] = (acquired, site)
+        if task is not None:
+            _holding.set(_holding.get() + ((self.name, task),))
+        return conn
+
+    async def release(self, conn, *, timeout: Optional[float] = None):
+        held = self._held.pop(id(conn), None)
+        holding = _holding.get()
+        entry = (self.name, asyncio.current_task())
+        if entry in holding:
+            index = holding.index(entry)
+            _holding.set(holding[:index] + holding[index + 1:])
+        try:
+            await self._pool.release(conn, timeout=timeout)
+        finally:
+            self._release_slot()
+            if held is not None:
+                hold = time.perf_counter() - held[0]
+                POOL_HOLD.observe(hold, held[1])
+                self._window['hold_total'] += hold
+                self._window['holds'] += 1
+
+    # ---------- اختصارات بنفس واجهة asyncpg.Pool ----------
+    async def execute(self, query, *args, timeout=None):
+        async with _AcquireContext(self, None, _call_site()) as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command, args, *, timeout=None):
+        async with _AcquireContext(self, None, _call_site()) as conn:
+            return await conn.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        async with _AcquireContext(self, None, _call_site()) as conn:
+            return await conn.fetch(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        async with _AcquireContext(self, None, _call_site()) as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout, record_class=record_class)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        async with _AcquireContext(self, None, _call_site()) as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    # ---------- المتحكم ----------
+    def _reset_window(self):
+        self._window = {
+            'acquires': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'rejected': 0,
+            'peak': self.in_use, 'hold_total': 0.0, 'holds': 0,
+        }
+
+    def adjust(self) -> int:
+        """
+        تعديل الحد النشط حسب النافذة الأخيرة - يعيد التغيير (+n / -1 / 0)
+
+        - توسيع: الانتظار تجاوز الهدف (أو رُفضت طلبات) والحد ممتلئ، بشرط ألا يكون
+          زمن الاحتجاز قد تضاعف (قاعدة البيانات نفسها بطيئة: التوسيع يزيد الحمل عليها)
+        - تقليص: لا انتظار والاستخدام الأقصى أقل من نصف الحد
+        """
+        window = self._window
+        mean_wait = window['wait_total'] / window['acquires'] if window['acquires'] else 0.0
+        mean_hold = window['hold_total'] / window['holds'] if window['holds'] else None
+        db_slower = (
+            mean_hold is not None and self._last_hold is not None
+            and mean_hold > self._last_hold * 1.5
+        )
+        change = 0
+
+        pressured = window['rejected'] > 0 or mean_wait >= self.target_wait
+        if pressured and window['peak'] >= self.limit and self.limit < self.max_limit:
+            if db_slower:
+                logger.warning(
+                    f"🐢 الانتظار مرتفع لكن الاستعلامات أبطأ ({mean_hold * 1000:.0f}ms) - "
+                    f"لن يتم توسيع المجمع ({self.limit})"
+                )
+            else:
+                change = min(self.max_limit - self.limit, max(1, self.limit // 4))
+        elif (not pressured and window['wait_max'] < self.target_wait
+              and window['peak'] <= self.limit // 2 and self.limit > self.min_limit):
+            change = -1
+
+        if change:
+            old = self.limit
+            self.limit += change
+            POOL_RESIZES.inc(self.name, 'up' if change > 0 else 'down')
+            logger.info(
+                f"📐 حد مجمع الاتصالات: {old} -> {self.limit} "
+                f"(انتظار {mean_wait * 1000:.1f}ms، ذروة {window['peak']}، مرفوض {window['rejected']})"
+            )
+            self._wake()
+
+        if mean_hold is not None:
+            self._last_hold = mean_hold
+        self._reset_window()
+        return change
+
+    async def _run_controller(self):
+        while True:
+            await asyncio.sleep(self.adjust_seconds)
+            try:
+                self.adjust()
+            except Exception as e:
+                logger.error(f"❌ خطأ في متحكم مجمع الاتصالات: {e}")
+
+    def start(self):
+        """تشغيل المتحكم (مرة واحدة)"""
+        if self._controller is None or self._controller.done():
+            self._controller = asyncio.get_running_loop().create_task(self._run_controller())
+
+    def stats(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'in_use': self.in_use,
+            'waiting': len(self._waiters),
+            'size': self._pool.get_size(),
+            'idle': self._pool.get_idle_size(),
+        }
+
+    async def close(self):
+        if self._controller is not None:
+            self._controller.cancel()
+            self._controller = None
+        _pools.pop(self.name, None)
+        await self._pool.close()
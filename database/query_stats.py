@@ -0,0 +1,285 @@
+# database/query_stats.py
+import logging
+import re
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from config import QUERY_SAMPLE_RATE, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+# ============= إحصائيات الاستعلامات =============
+# كل اتصال في المجمع من نوع InstrumentedConnection: يقيس زمن كل استعلام
+# ويجمعه حسب بصمة الاستعلام (النص بعد استبدال القيم الحرفية بـ ?).
+# البصمة تُحسب مرة واحدة لكل نص استعلام وتُحفظ، فالكلفة لكل استعلام
+# هي قراءتان للساعة وبحث في قاموس.
+
+# عدد آخر الأزمنة المحفوظة لكل بصمة (لحساب p99)
+SAMPLES_PER_QUERY = 256
+# أقصى عدد لنصوص الاستعلامات المحفوظة بصماتها (الاستعلامات المبنية بـ f-string تتنوع)
+MAX_FINGERPRINT_CACHE = 4096
+# أقصى عدد للبصمات المتتبعة
+MAX_TRACKED_QUERIES = 1000
+
+SORT_KEYS = ('total', 'count', 'mean', 'p99', 'rows')
+
+# الوحدات التي لا تُعتبر "مستدعياً" عند البحث عن مصدر الاستعلام
+_INTERNAL_MODULES = ('asyncpg', 'asyncio', 'contextlib', 'aiogram', 'database.pool', __name__)
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w$.])-?\d+(?:\.\d+)?\b')
+_PARAMS = re.compile(r'\$\d+')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+_fingerprints: Dict[str, str] = {}
+
+# عداد الاستعلامات داخل سياق واحد (تحديث تيليجرام مثلاً) - يفعّله track_round_trips
+_round_trips: ContextVar[Optional[List[int]]] = ContextVar('db_round_trips', default=None)
+
+
+def track_round_trips() -> List[int]:
+    """بدء عد الاستعلامات في السياق الحالي (والمهام المتفرعة منه) - يعيد العداد [n]"""
+    counter = [0]
+    _round_trips.set(counter)
+    return counter
+
+
+def current_round_trips() -> Optional[int]:
+    """عدد الاستعلامات حتى الآن في السياق الحالي (None إذا لم يبدأ العد)"""
+    counter = _round_trips.get()
+    return None if counter is None else counter[0]
+
+
+def normalize_query(query: str) -> str:
+    """توحيد نص الاستعلام: حذف التعليقات، القيم الحرفية والمعاملات -> ?، القوائم -> (?...)"""
+    text = _COMMENTS.sub(' ', query)
+    text = _STRINGS.sub('?', text)
+    text = _PARAMS.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _LISTS.sub('(?...)', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def fingerprint(query: str) -> str:
+    """بصمة الاستعلام (محفوظة لكل نص)"""
+    result = _fingerprints.get(query)
+    if result is None:
+        result = normalize_query(query)
+        if len(_fingerprints) < MAX_FINGERPRINT_CACHE:
+            _fingerprints[query] = result
+    return result
+
+
+def find_callers(limit: int = 2) -> List[str]:
+    """أقرب دوال التطبيق في سلسلة الاستدعاء (تُستخدم فقط للاستعلامات الجديدة أو البطيئة)"""
+    callers = []
+    frame = sys._getframe(1)
+    while frame is not None and len(callers) < limit:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_INTERNAL_MODULES):
+            callers.append(f"{module}.{frame.f_code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return callers
+
+
+class QueryStat:
+    """إحصائيات بصمة واحدة"""
+    __slots__ = ('query', 'count', 'errors', 'total', 'max', 'rows', 'samples', 'position', 'caller')
+
+    def __init__(self, query: str, caller: str):
+        self.query = query
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples: List[float] = []
+        self.position = 0
+        self.caller = caller
+
+    def add(self, elapsed: float, rows: int, error: bool):
+        self.count += 1
+        self.total += elapsed
+        self.rows += rows
+        if error:
+            self.errors += 1
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.samples) < SAMPLES_PER_QUERY:
+            self.samples.append(elapsed)
+        else:
+            self.samples[self.position] = elapsed
+            self.position = (self.position + 1) % SAMPLES_PER_QUERY
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class QueryStats:
+    """تجميع إحصائيات كل البصمات داخل العملية (بدون أقفال - حلقة asyncio واحدة)"""
+
+    def __init__(self, sample_rate: float = 1.0, slow_ms: int = 200):
+        self.configure(sample_rate, slow_ms)
+        self.reset()
+
+    def configure(self, sample_rate: float, slow_ms: int):
+        # أخذ العينات بالعد: كل N-ـة استعلام تدخل التجميع، والعدادات تُضرب بـ N عند العرض
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.slow_threshold = slow_ms / 1000
+
+    def reset(self):
+        self._stats: Dict[str, QueryStat] = {}
+        self._tick = 0
+        self.since = time.time()
+        self.slow_count = 0
+
+    def record(self, query: str, elapsed: float, rows: int, error: bool = False):
+        counter = _round_trips.get()
+        if counter is not None:
+            counter[0] += 1
+        if elapsed >= self.slow_threshold:
+            self._log_slow(query, elapsed, rows, error)
+
+        if not self.sample_every:
+            return
+        self._tick += 1
+        if self._tick % self.sample_every:
+            return
+
+        key = fingerprint(query)
+        stat = self._stats.get(key)
+        if stat is None:
+            if len(self._stats) >= MAX_TRACKED_QUERIES:
+                return
+            callers = find_callers(1)
+            stat = self._stats[key] = QueryStat(key, callers[0] if callers else 'unknown')
+        stat.add(elapsed, rows, error)
+
+    def _log_slow(self, query: str, elapsed: float, rows: int, error: bool):
+        self.slow_count += 1
+        callers = ' ← '.join(find_callers(2)) or 'unknown'
+        logger.warning(
+            f"🐢 استعلام بطيء ({elapsed * 1000:.0f}ms, {rows} صف{', فشل' if error else ''}) "
+            f"من {callers}: {fingerprint(query)[:300]}"
+        )
+
+    def top(self, limit: int = 20, sort: str = 'total') -> List[Dict]:
+        """أعلى البصمات حسب معيار الترتيب"""
+        scale = self.sample_every or 1
+        rows = []
+        for stat in self._stats.values():
+            rows.append({
+                'query': stat.query,
+                'caller': stat.caller,
+                'count': stat.count * scale,
+                'errors': stat.errors * scale,
+                'total_ms': round(stat.total * scale * 1000, 2),
+                'mean_ms': round(stat.total / stat.count * 1000, 3) if stat.count else 0,
+                'p99_ms': round(stat.percentile(99) * 1000, 3),
+                'max_ms': round(stat.max * 1000, 3),
+                'rows': stat.rows * scale,
+                'rows_per_call': round(stat.rows / stat.count, 1) if stat.count else 0,
+            })
+        key = {'total': 'total_ms', 'count': 'count', 'mean': 'mean_ms',
+               'p99': 'p99_ms', 'rows': 'rows'}.get(sort, 'total_ms')
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def summary(self) -> Dict:
+        """ملخص عام"""
+        scale = self.sample_every or 1
+        return {
+            'since': self.since,
+            'queries': sum(stat.count for stat in self._stats.values()) * scale,
+            'total_ms': round(sum(stat.total for stat in self._stats.values()) * scale * 1000, 2),
+            'fingerprints': len(self._stats),
+            'slow_queries': self.slow_count,
+            'slow_threshold_ms': round(self.slow_threshold * 1000),
+            'sample_every': self.sample_every,
+        }
+
+
+query_stats = QueryStats(QUERY_SAMPLE_RATE, SLOW_QUERY_MS)
+
+
+def _status_rows(status: str) -> int:
+    """عدد الصفوف من نص الحالة (UPDATE 3 / INSERT 0 1 / DELETE 2)"""
+    try:
+        return int(status.rsplit(' ', 1)[-1])
+    except (AttributeError, ValueError):
+        return 0
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """اتصال asyncpg يقيس زمن الاستعلامات وعدد صفوفها ويرسلها لـ query_stats"""
+
+    async def execute(self, query, *args, timeout=None):
+        started = time.perf_counter()
+        try:
+            status = await super().execute(query, *args, timeout=timeout)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - started, 0, True)
+            raise
+        query_stats.record(query, time.perf_counter() - started, _status_rows(status))
+        return status
+
+    async def executemany(self, command, args, *, timeout=None):
+        args = list(args)
+        started = time.perf_counter()
+        try:
+            result = await super().executemany(command, args, timeout=timeout)
+        except Exception:
+            query_stats.record(command, time.perf_counter() - started, 0, True)
+            raise
+        query_stats.record(command, time.perf_counter() - started, len(args))
+        return result
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        started = time.perf_counter()
+        try:
+            rows = await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - started, 0, True)
+            raise
+        query_stats.record(query, time.perf_counter() - started, len(rows))
+        return rows
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        started = time.perf_counter()
+        try:
+            row = await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - started, 0, True)
+            raise
+        query_stats.record(query, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        started = time.perf_counter()
+        try:
+            value = await super().fetchval(query, *args, column=column, timeout=timeout)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - started, 0, True)
+            raise
+        query_stats.record(query, time.perf_counter() - started, 0 if value is None else 1)
+        return value
+
+
+def get_query_stats(limit: int = 20, sort: str = 'total') -> Dict:
+    """تقرير أعلى الاستعلامات مع الملخص"""
+    return {'summary': query_stats.summary(), 'top': query_stats.top(limit, sort)}
+
+
+def reset_query_stats():
+    """تصفير الإحصائيات"""
+    query_stats.reset()
+    logger.info("🔄 تم تصفير إحصائيات الاستعلامات")
@@ -1,53 +1,235 @@
 # database/referrals.py
-import random
-import string
+import hashlib
 import logging
+from typing import Optional
+
+from config import REFERRAL_CODE_KEY
+
+# ============= أكواد الإحالة =============
+# الكود = تبديل مفتاحي (شبكة Feistel بأربع جولات على 60 بت) لرقم المستخدم، مرمّز
+# base32 (أبجدية Crockford) بطول 12 رمزاً. التبديل واحد لواحد، فلا تصادم ولا حاجة
+# لحلقة "ولّد ثم تحقق"، والكود يُحسب قبل INSERT ويُفك مباشرة إلى رقم المستخدم.
+# الأكواد القديمة (8 رموز عشوائية) تبقى صالحة عبر الفهرس الفريد.
+
+CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 12
+_HALF_BITS = 30
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+_KEY = hashlib.sha256(f"referral:{REFERRAL_CODE_KEY}".encode()).digest()
+
+
+def _round(index: int, value: int) -> int:
+    digest = hashlib.blake2b(
+        value.to_bytes(4, 'big'), digest_size=4, key=_KEY, person=b'ref-round' + bytes([index])
+    ).digest()
+    return int.from_bytes(digest, 'big') & _HALF_MASK
+
+
+def encode_referral_code(user_id: int) -> str:
+    """كود الإحالة الحتمي لمستخدم (12 رمزاً)"""
+    if not 0 < user_id < 1 << (2 * _HALF_BITS):
+        raise ValueError(f"رقم مستخدم خارج النطاق: {user_id}")
+    left, right = user_id >> _HALF_BITS, user_id & _HALF_MASK
+    for index in range(_ROUNDS):
+        left, right = right, left ^ _round(index, right)
+    value = (left << _HALF_BITS) | right
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode_referral_code(code: str) -> Optional[int]:
+    """رقم المستخدم من كود بالصيغة الحالية، أو None (كود قديم أو غير صالح)"""
+    if not code or len(code) != CODE_LENGTH:
+        return None
+    value = 0
+    for char in code.upper():
+        digit = CODE_ALPHABET.find(char)
+        if digit < 0:
+            return None
+        value = value * 32 + digit
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for index in reversed(range(_ROUNDS)):
+        left, right = right ^ _round(index, left), left
+    user_id = (left << _HALF_BITS) | right
+    return user_id or None
+
+
+async def find_user_by_referral_code(db, code: str, columns: str = 'user_id'):
+    """
+    المستخدم صاحب الكود: فك الكود والبحث بالمفتاح الأساسي، ثم الفهرس الفريد للأكواد القديمة
+
+    التحقق من تطابق الكود المحفوظ يمنع قبول كود مفكوك لمستخدم كوده مختلف.
+    """
+    user_id = decode_referral_code(code)
+    if user_id is not None:
+        row = await db.fetchrow(
+            f"SELECT {columns} FROM users WHERE user_id = $1 AND referral_code = $2",
+            user_id, code.upper()
+        )
+        if row:
+            return row
+    return await db.fetchrow(f"SELECT {columns} FROM users WHERE referral_code = $1", code)
+
 
 async def generate_referral_code(pool, user_id):
-    """إنشاء كود إحالة فريد للمستخدم"""
+    """تعيين كود الإحالة للمستخدم إذا لم يكن له كود - يعيد الكود المحفوظ"""
     async with pool.acquire() as conn:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        
-        existing = await conn.fetchval(
-            "SELECT user_id FROM users WHERE referral_code = $1",
-            code
+        return await conn.fetchval(
+            "UPDATE users SET referral_code = COALESCE(referral_code, $1) WHERE user_id = $2 RETURNING referral_code",
+            encode_referral_code(user_id), user_id
+        )
+
+
+async def backfill_referral_codes(conn):
+    """أكواد للمستخدمين بدون كود في UPDATE واحد، والتأكد من الفهرس الفريد"""
+    user_ids = await conn.fetch("SELECT user_id FROM users WHERE referral_code IS NULL AND user_id > 0")
+    if user_ids:
+        ids = [row['user_id'] for row in user_ids]
+        result = await conn.execute('''
+            UPDATE users u SET referral_code = c.code
+            FROM unnest($1::bigint[], $2::text[]) AS c(user_id, code)
+            WHERE u.user_id = c.user_id AND u.referral_code IS NULL
+        ''', ids, [encode_referral_code(user_id) for user_id in ids])
+        logging.info(f"✅ أكواد إحالة لـ {result.split()[-1]} مستخدم")
+
+    # العمود المضاف بـ ALTER في القواعد القديمة بدون قيد UNIQUE
+    indexed = await conn.fetchval('''
+        SELECT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = 'users'::regclass AND i.indisunique
+              AND i.indnatts = 1 AND a.attname = 'referral_code'
         )
-        while existing:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            existing = await conn.fetchval(
-                "SELECT user_id FROM users WHERE referral_code = $1",
-                code
-            )
-        
+    ''')
+    if not indexed:
+        await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code)")
+        logging.info("✅ تم إنشاء فهرس فريد لأكواد الإحالة")
+
+# ============= جدول الإحالات =============
+# كل إحالة صف في referrals (referred_id فريد)، فالتحقق من التكرار بحث بالمفتاح
+# بدلاً من LIKE على وصف points_history، والتسجيل استعلام واحد بـ ON CONFLICT DO NOTHING
+# (طلبا /start متزامنان لنفس المستخدم لا يمنحان النقاط مرتين).
+
+async def init_referrals_table(conn):
+    """إنشاء جدول الإحالات، وترحيل الإحالات السابقة مرة واحدة عند أول إنشاء"""
+    async with conn.transaction():
+        exists = await conn.fetchval("SELECT to_regclass('referrals') IS NOT NULL")
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS referrals (
+                referred_id BIGINT PRIMARY KEY,
+                referrer_id BIGINT NOT NULL,
+                points INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CHECK (referrer_id <> referred_id)
+            );
+        ''')
         await conn.execute(
-            "UPDATE users SET referral_code = $1 WHERE user_id = $2",
-            code, user_id
+            "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals (referrer_id, created_at DESC)"
         )
-        return code
+        if exists:
+            return
+
+        # users.referred_by هو المرجع للمُحيل؛ النقاط ووقت الإحالة من سجل النقاط إن وجد
+        from_users = await conn.execute('''
+            INSERT INTO referrals (referred_id, referrer_id, points, created_at)
+            SELECT u.user_id, u.referred_by, COALESCE(h.points, 0),
+                   COALESCE(h.created_at, u.created_at, CURRENT_TIMESTAMP)
+            FROM users u
+            LEFT JOIN LATERAL (
+                SELECT points, created_at FROM points_history p
+                WHERE p.user_id = u.referred_by AND p.action = 'referral'
+                  AND p.description = 'إحالة المستخدم ' || u.user_id
+                ORDER BY created_at
+                LIMIT 1
+            ) h ON TRUE
+            WHERE u.referred_by IS NOT NULL AND u.referred_by <> u.user_id
+            ON CONFLICT (referred_id) DO NOTHING
+        ''')
+        # ثم إحالات في سجل النقاط لم يُسجل لها referred_by (أول إحالة لكل مستخدم هي المعتمدة)
+        from_history = await conn.execute(r'''
+            INSERT INTO referrals (referred_id, referrer_id, points, created_at)
+            SELECT DISTINCT ON (referred_id) referred_id, user_id, points, created_at
+            FROM (
+                SELECT substring(description FROM '(\d+)')::bigint AS referred_id,
+                       user_id, points, created_at
+                FROM points_history
+                WHERE action = 'referral'
+            ) h
+            WHERE referred_id IS NOT NULL AND referred_id <> user_id
+            ORDER BY referred_id, created_at
+            ON CONFLICT (referred_id) DO NOTHING
+        ''')
+    logging.info(
+        f"✅ ترحيل الإحالات: {from_users.split()[-1]} من referred_by، "
+        f"{from_history.split()[-1]} من سجل النقاط"
+    )
+
+
+async def record_referral(db, referrer_id, referred_id, points=None):
+    """
+    تسجيل إحالة في استعلام واحد: صف الإحالة، referred_by، نقاط وعداد المُحيل، سجل النقاط
+
+    points الافتراضي من إعداد points_per_referral. يقبل المجمع أو اتصالاً.
+
+    Returns:
+        dict: referrer_id, points, new_total - أو None إذا كان المستخدم محالاً مسبقاً
+    """
+    if referrer_id == referred_id:
+        return None
+    row = await db.fetchrow('''
+        WITH inserted AS (
+            INSERT INTO referrals (referrer_id, referred_id, points)
+            VALUES ($1, $2, COALESCE(
+                $3::integer,
+                (SELECT value::integer FROM bot_settings WHERE key = 'points_per_referral'),
+                1
+            ))
+            ON CONFLICT (referred_id) DO NOTHING
+            RETURNING referrer_id, referred_id, points
+        ), referred AS (
+            UPDATE users SET referred_by = inserted.referrer_id
+            FROM inserted
+            WHERE users.user_id = inserted.referred_id
+        ), referrer AS (
+            UPDATE users
+            SET referral_count = referral_count + 1,
+                total_points = total_points + inserted.points,
+                referral_earnings = referral_earnings + inserted.points
+            FROM inserted
+            WHERE users.user_id = inserted.referrer_id
+            RETURNING users.total_points
+        ), history AS (
+            INSERT INTO points_history (user_id, points, action, description, created_at)
+            SELECT referrer_id, points, 'referral', 'إحالة المستخدم ' || referred_id, CURRENT_TIMESTAMP
+            FROM inserted
+        )
+        SELECT inserted.referrer_id, inserted.points, (SELECT total_points FROM referrer) AS new_total
+        FROM inserted
+    ''', referrer_id, referred_id, points)
+    if row is None:
+        return None
+    logging.info(f"✅ إحالة جديدة: {referrer_id} ← {referred_id} (+{row['points']} نقاط)")
+    return dict(row)
+
+
+async def get_referrer_of(db, referred_id):
+    """معرف المُحيل لمستخدم (بحث بالمفتاح) أو None"""
+    return await db.fetchval("SELECT referrer_id FROM referrals WHERE referred_id = $1", referred_id)
+
 
 async def check_duplicate_referral(pool, referrer_id, referred_id):
     """التحقق من عدم تكرار الإحالة"""
     try:
-        async with pool.acquire() as conn:
-            count = await conn.fetchval('''
-                SELECT COUNT(*) FROM points_history 
-                WHERE user_id = $1 
-                  AND action = 'referral' 
-                  AND description LIKE $2
-            ''', referrer_id, f'%{referred_id}%')
-            
-            if count > 0:
-                return True, "تمت إحالة هذا المستخدم مسبقاً"
-            
-            referred_by = await conn.fetchval(
-                "SELECT referred_by FROM users WHERE user_id = $1",
-                referred_id
-            )
-            
-            if referred_by:
-                return True, f"المستخدم لديه إحالة سابقة ({referred_by})"
-            
-            return False, None
+        referred_by = await get_referrer_of(pool, referred_id)
+        if referred_by == referrer_id:
+            return True, "تمت إحالة هذا المستخدم مسبقاً"
+        if referred_by:
+            return True, f"المستخدم لديه إحالة سابقة ({referred_by})"
+        return False, None
     except Exception as e:
         logging.error(f"❌ خطأ في التحقق من تكرار الإحالة: {e}")
         return True, str(e)
@@ -55,26 +237,10 @@ async def check_duplicate_referral(pool, referrer_id, referred_id):
 async def check_existing_referral(pool, referrer_id, referred_id):
     """التحقق إذا كان المستخدم قد تمت إحالته مسبقاً"""
     try:
-        async with pool.acquire() as conn:
-            referred_by = await conn.fetchval(
-                "SELECT referred_by FROM users WHERE user_id = $1",
-                referred_id
-            )
-            
-            if referred_by:
-                return True, f"هذا المستخدم تمت إحالته مسبقاً بواسطة {referred_by}"
-            
-            exists = await conn.fetchval('''
-                SELECT COUNT(*) FROM points_history 
-                WHERE user_id = $1 
-                  AND action = 'referral' 
-                  AND description LIKE $2
-            ''', referrer_id, f'%{referred_id}%')
-            
-            if exists > 0:
-                return True, "تم تسجيل هذه الإحالة مسبقاً"
-            
-            return False, None
+        referred_by = await get_referrer_of(pool, referred_id)
+        if referred_by:
+            return True, f"هذا المستخدم تمت إحالته مسبقاً بواسطة {referred_by}"
+        return False, None
     except Exception as e:
         logging.error(f"❌ خطأ في التحقق من الإحالة: {e}")
         return True, str(e)
@@ -83,64 +249,18 @@ async def process_referral(pool, referred_user_id, referrer_code):
     """معالجة الإحالة عند تسجيل مستخدم جديد - مع منع التكرار"""
     try:
         async with pool.acquire() as conn:
-            referrer = await conn.fetchrow(
-                "SELECT user_id FROM users WHERE referral_code = $1",
-                referrer_code
-            )
+            referrer = await find_user_by_referral_code(conn, referrer_code)
+            referrer_id = referrer['user_id'] if referrer else None
             
-            if not referrer or referrer['user_id'] == referred_user_id:
+            if not referrer_id or referrer_id == referred_user_id:
                 return None, "كود إحالة غير صالح"
             
-            existing = await conn.fetchval(
-                "SELECT referred_by FROM users WHERE user_id = $1",
-                referred_user_id
-            )
-            
-            if existing:
+            result = await record_referral(conn, referrer_id, referred_user_id)
+            if result is None:
+                existing = await get_referrer_of(conn, referred_user_id)
                 return None, f"المستخدم لديه إحالة سابقة ({existing})"
             
-            already_referred = await conn.fetchval('''
-                SELECT COUNT(*) FROM points_history 
-                WHERE user_id = $1 
-                  AND action = 'referral' 
-                  AND description LIKE $2
-            ''', referrer['user_id'], f'%{referred_user_id}%')
-            
-            if already_referred > 0:
-                return None, "تمت إحالة هذا المستخدم مسبقاً"
-            
-            points = await conn.fetchval(
-                "SELECT value::integer FROM bot_settings WHERE key = 'points_per_referral'"
-            ) or 1
-            
-            await conn.execute('''
-                UPDATE users 
-                SET referral_count = referral_count + 1,
-                    total_points = total_points + $1,
-                    referral_earnings = referral_earnings + $1
-                WHERE user_id = $2
-            ''', points, referrer['user_id'])
-            
-            await conn.execute(
-                "UPDATE users SET referred_by = $1 WHERE user_id = $2",
-                referrer['user_id'], referred_user_id
-            )
-            
-            await conn.execute('''
-                INSERT INTO points_history (user_id, points, action, description)
-                VALUES ($1, $2, $3, $4)
-            ''', referrer['user_id'], points, 'referral', f'إحالة المستخدم {referred_user_id}')
-            
-            new_points = await conn.fetchval(
-                "SELECT total_points FROM users WHERE user_id = $1",
-                referrer['user_id']
-            )
-            
-            return {
-                'referrer_id': referrer['user_id'],
-                'points': points,
-                'new_total': new_points
-            }, None
+            return result, None
             
     except Exception as e:
         logging.error(f"❌ خطأ في معالجة الإحالة: {e}")
@@ -150,29 +270,23 @@ async def get_referral_stats(pool, user_id):
     """إحصائيات مفصلة عن الإحالات"""
     try:
         async with pool.acquire() as conn:
-            unique_referrals = await conn.fetchval('''
-                SELECT COUNT(DISTINCT description) 
-                FROM points_history 
-                WHERE user_id = $1 AND action = 'referral'
-            ''', user_id) or 0
+            totals = await conn.fetchrow('''
+                SELECT COUNT(*) AS unique_referrals, COALESCE(SUM(points), 0) AS total_points
+                FROM referrals
+                WHERE referrer_id = $1
+            ''', user_id)
             
             recent = await conn.fetch('''
-                SELECT description, created_at 
-                FROM points_history 
-                WHERE user_id = $1 AND action = 'referral'
+                SELECT referred_id, points, created_at
+                FROM referrals
+                WHERE referrer_id = $1
                 ORDER BY created_at DESC
                 LIMIT 5
             ''', user_id)
             
-            total_points = await conn.fetchval('''
-                SELECT COALESCE(SUM(points), 0)
-                FROM points_history 
-                WHERE user_id = $1 AND action = 'referral'
-            ''', user_id) or 0
-            
             return {
-                'unique_referrals': unique_referrals,
-                'total_points': total_points,
+                'unique_referrals': totals['unique_referrals'],
+                'total_points': totals['total_points'],
                 'recent': recent
             }
     except Exception as e:
@@ -180,19 +294,22 @@ async def get_referral_stats(pool, user_id):
         return None
 
 async def detect_suspicious_referrals(pool, user_id, threshold=5):
-    """كشف محاولات الإحالة المشبوهة (نفس المستخدم عدة مرات)"""
+    """
+    كشف نشاط الإحالة المشبوه: أكثر من threshold إحالة للمُحيل خلال ساعة واحدة
+
+    (تكرار إحالة نفس المستخدم لم يعد ممكناً - referred_id فريد)
+    """
     try:
         async with pool.acquire() as conn:
             suspicious = await conn.fetch('''
                 SELECT 
-                    description,
+                    date_trunc('hour', created_at) as hour,
                     COUNT(*) as attempts,
                     MIN(created_at) as first_attempt,
                     MAX(created_at) as last_attempt
-                FROM points_history 
-                WHERE user_id = $1 
-                  AND action = 'referral'
-                GROUP BY description
+                FROM referrals 
+                WHERE referrer_id = $1
+                GROUP BY 1
                 HAVING COUNT(*) > $2
                 ORDER BY attempts DESC
             ''', user_id, threshold)
@@ -217,9 +334,11 @@ async def get_user_referral_info(pool, user_id):
             
             if info:
                 referrals = await conn.fetch('''
-                    SELECT user_id, username, created_at AT TIME ZONE 'Asia/Damascus' as created_at
-                    FROM users WHERE referred_by = $1
-                    ORDER BY created_at DESC
+                    SELECT u.user_id, u.username, r.created_at AT TIME ZONE 'Asia/Damascus' as created_at
+                    FROM referrals r
+                    JOIN users u ON u.user_id = r.referred_id
+                    WHERE r.referrer_id = $1
+                    ORDER BY r.created_at DESC
                     LIMIT 10
                 ''', user_id)
                 
@@ -234,24 +353,11 @@ async def get_user_referral_info(pool, user_id):
     except Exception as e:
         logging.error(f"❌ خطأ في جلب معلومات الإحالة للمستخدم {user_id}: {e}")
         return None
+
 async def update_referrer_stats(pool, referrer_id, points, referred_id):
     """تحديث إحصائيات المُحيل بعد إحالة ناجحة"""
     try:
-        async with pool.acquire() as conn:
-            await conn.execute('''
-                UPDATE users 
-                SET referral_count = referral_count + 1,
-                    total_points = total_points + $1,
-                    referral_earnings = referral_earnings + $1
-                WHERE user_id = $2
-            ''', points, referrer_id)
-            
-            await conn.execute('''
-                INSERT INTO points_history (user_id, points, action, description, created_at)
-                VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
-            ''', referrer_id, points, 'referral', f'إحالة المستخدم {referred_id}')
-            
-            return True
+        return await record_referral(pool, referrer_id, referred_id, points) is not None
     except Exception as e:
         logging.error(f"❌ خطأ في تحديث إحصائيات المُحيل: {e}")
         return False
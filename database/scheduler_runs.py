@@ -0,0 +1,60 @@
+# database/scheduler_runs.py
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+# ============= سجل تشغيل المهام المجدولة =============
+# آخر تشغيل لكل مهمة محفوظ في قاعدة البيانات (وليس في ذاكرة APScheduler فقط)،
+# فبعد إعادة التشغيل أو انتقال القيادة لنسخة أخرى يُعرف إن كان موعد قد فات.
+
+# قفل القيادة (pg_try_advisory_lock) - رقم ثابت مشترك بين كل نسخ البوت
+SCHEDULER_LOCK_KEY = 7_305_041_226_113_001
+
+
+async def init_scheduler_runs_table(conn):
+    """إنشاء جدول سجل تشغيل المهام"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_runs (
+            job_id VARCHAR(64) PRIMARY KEY,
+            last_run_at TIMESTAMP NOT NULL,
+            last_status VARCHAR(20) NOT NULL,
+            last_duration_ms INTEGER,
+            last_error TEXT,
+            last_runner VARCHAR(100),
+            run_count BIGINT DEFAULT 0,
+            failure_count BIGINT DEFAULT 0
+        );
+    ''')
+
+
+async def record_job_run(pool, job_id: str, started_at: datetime, duration_ms: int,
+                         error: Optional[str] = None, runner: Optional[str] = None):
+    """حفظ نتيجة تشغيل مهمة (started_at بتوقيت دمشق بدون منطقة زمنية)"""
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO scheduler_runs
+                    (job_id, last_run_at, last_status, last_duration_ms, last_error, last_runner, run_count, failure_count)
+                VALUES ($1, $2, $3, $4, $5, $6, 1, $7)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    last_run_at = EXCLUDED.last_run_at,
+                    last_status = EXCLUDED.last_status,
+                    last_duration_ms = EXCLUDED.last_duration_ms,
+                    last_error = EXCLUDED.last_error,
+                    last_runner = EXCLUDED.last_runner,
+                    run_count = scheduler_runs.run_count + 1,
+                    failure_count = scheduler_runs.failure_count + EXCLUDED.failure_count
+            ''', job_id, started_at, 'failed' if error else 'ok', duration_ms, error, runner, 1 if error else 0)
+    except Exception as e:
+        logging.error(f"❌ خطأ في حفظ تشغيل المهمة {job_id}: {e}")
+
+
+async def get_last_runs(pool) -> Dict[str, datetime]:
+    """آخر وقت تشغيل لكل مهمة (بتوقيت دمشق بدون منطقة زمنية)"""
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("SELECT job_id, last_run_at FROM scheduler_runs")
+            return {row['job_id']: row['last_run_at'] for row in rows}
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب سجل تشغيل المهام: {e}")
+        return {}
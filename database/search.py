@@ -0,0 +1,281 @@
+# database/search.py
+import logging
+import re
+import time
+from typing import Optional
+
+# ============= خدمة البحث المشتركة (البوت ولوحة التحكم) =============
+# - آيدي رقمي: مطابقة تامة على المفتاح الأساسي (أسرع مسار)
+# - اليوزرنيم: مطابقة بادئة عبر فهرس lower(username) text_pattern_ops
+# - النص الحر: ILIKE '%q%' مدعوم بفهارس GIN من pg_trgm مع ترتيب حسب similarity
+# الاستعلامات مكتوبة بمعاملات مسماة (:name) وتُحوَّل لصيغة asyncpg ($1) أو psycopg2 (%(name)s)
+# pg_trgm اختياري: بدونه يبقى ILIKE (بدون فهرس) ويُرتب بدون درجة similarity
+
+SEARCH_KINDS = ('users', 'orders', 'deposits')
+
+# أقل طول للنص الحر حتى يستفيد من فهرس الـ trigram (أقصر من ذلك نكتفي بالبادئة)
+MIN_TRGM_LENGTH = 3
+
+MAX_PAGE_SIZE = 50
+
+# إعادة فحص وجود pg_trgm بعد هذه المدة إذا كان غير مفعل (قد يُفعّل لاحقاً من init_db)
+TRGM_RECHECK_SECONDS = 300
+
+_TRGM_CHECK_SQL = "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS available"
+
+_PARAM_RE = re.compile(r'(?<!:):([a-z_]+)')
+
+# (مفعل؟, وقت الفحص) - None قبل أول فحص
+_trgm_state: Optional[tuple] = None
+
+_USERS_SQL = '''
+    SELECT user_id, username, first_name, last_name, balance, is_banned, created_at,
+           CASE
+               WHEN user_id = :user_id THEN 0
+               WHEN lower(username) = :exact THEN 1
+               WHEN lower(username) LIKE :prefix THEN 2
+               ELSE 3
+           END as rank,
+           {score} as score
+    FROM users
+    WHERE user_id = :user_id
+       OR lower(username) LIKE :prefix
+       {trgm}
+    ORDER BY rank, score DESC, balance DESC
+    LIMIT :limit OFFSET :offset
+'''
+
+_USERS_TRGM = "OR username ILIKE :contains OR first_name ILIKE :contains"
+_USERS_SCORE = "GREATEST(similarity(COALESCE(username, ''), :q), similarity(COALESCE(first_name, ''), :q))"
+
+_ORDERS_SQL = '''
+    SELECT o.id, o.user_id, u.username, COALESCE(a.name, o.app_name) as name,
+           o.total_amount_syp, o.target_id, o.status, o.created_at,
+           CASE
+               WHEN o.id = :int_id THEN 0
+               WHEN o.target_id = :q THEN 1
+               ELSE 2
+           END as rank,
+           {score} as score
+    FROM orders o
+    LEFT JOIN users u ON o.user_id = u.user_id
+    LEFT JOIN applications a ON o.app_id = a.id
+    WHERE o.id = :int_id
+       OR o.target_id = :q
+       {trgm}
+    ORDER BY rank, score DESC, o.created_at DESC
+    LIMIT :limit OFFSET :offset
+'''
+
+_ORDERS_TRGM = "OR o.target_id ILIKE :contains"
+_ORDERS_SCORE = "similarity(COALESCE(o.target_id, ''), :q)"
+
+_DEPOSITS_SQL = '''
+    SELECT d.id, d.user_id, COALESCE(u.username, d.username) as username,
+           d.method, d.amount_syp, d.tx_info, d.status, d.created_at,
+           CASE
+               WHEN d.id = :int_id THEN 0
+               WHEN d.tx_info = :q THEN 1
+               ELSE 2
+           END as rank,
+           {score} as score
+    FROM deposit_requests d
+    LEFT JOIN users u ON d.user_id = u.user_id
+    WHERE d.id = :int_id
+       OR d.tx_info = :q
+       {trgm}
+    ORDER BY rank, score DESC, d.created_at DESC
+    LIMIT :limit OFFSET :offset
+'''
+
+_DEPOSITS_TRGM = "OR d.tx_info ILIKE :contains"
+_DEPOSITS_SCORE = "similarity(COALESCE(d.tx_info, ''), :q)"
+
+_TEMPLATES = {
+    'users': (_USERS_SQL, _USERS_TRGM, _USERS_SCORE),
+    'orders': (_ORDERS_SQL, _ORDERS_TRGM, _ORDERS_SCORE),
+    'deposits': (_DEPOSITS_SQL, _DEPOSITS_TRGM, _DEPOSITS_SCORE),
+}
+
+
+def _set_trgm(available: bool) -> bool:
+    global _trgm_state
+    _trgm_state = (available, time.monotonic())
+    return available
+
+
+def _trgm_known() -> Optional[bool]:
+    """القيمة المحفوظة، أو None إذا لم يُفحص بعد أو حان وقت إعادة فحص النتيجة السلبية"""
+    if _trgm_state is None:
+        return None
+    available, checked_at = _trgm_state
+    if not available and time.monotonic() - checked_at > TRGM_RECHECK_SECONDS:
+        return None
+    return available
+
+
+async def trgm_available(conn) -> bool:
+    """هل pg_trgm مفعل؟ (asyncpg - النتيجة محفوظة)"""
+    known = _trgm_known()
+    if known is not None:
+        return known
+    return _set_trgm(bool(await conn.fetchval(_TRGM_CHECK_SQL)))
+
+
+def trgm_available_sync(cur) -> bool:
+    """هل pg_trgm مفعل؟ (مؤشر psycopg2 - النتيجة محفوظة)"""
+    known = _trgm_known()
+    if known is not None:
+        return known
+    cur.execute(_TRGM_CHECK_SQL)
+    row = cur.fetchone()
+    return _set_trgm(bool(row['available'] if isinstance(row, dict) else row[0]))
+
+
+def normalize_query(query: str) -> str:
+    """تنظيف نص البحث (إزالة @ والمسافات الزائدة)"""
+    return (query or '').strip().lstrip('@').strip()
+
+
+def _escape_like(value: str) -> str:
+    """تهريب رموز LIKE الخاصة حتى لا يتحول _ في اليوزرنيم إلى حرف بدل"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _compile(sql: str, params: dict, style: str):
+    """تحويل المعاملات المسماة إلى صيغة المكتبة المطلوبة"""
+    if style == 'psycopg2':
+        return _PARAM_RE.sub(lambda m: f"%({m.group(1)})s", sql), params
+
+    order = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+
+    return _PARAM_RE.sub(replace, sql), [params[name] for name in order]
+
+
+def build_search_sql(kind: str, query: str, limit: int = 10, offset: int = 0, style: str = 'asyncpg',
+                     trgm: bool = True):
+    """
+    بناء استعلام البحث لنوع معين
+
+    Args:
+        kind: users / orders / deposits
+        query: نص البحث
+        limit: حجم الصفحة (يُجلب عنصر إضافي لمعرفة وجود صفحة تالية)
+        offset: الإزاحة
+        style: asyncpg أو psycopg2
+        trgm: pg_trgm مفعل (بدونه لا تُستخدم similarity)
+
+    Returns:
+        tuple: (sql, params)
+    """
+    if kind not in _TEMPLATES:
+        raise ValueError(f"نوع بحث غير معروف: {kind}")
+
+    q = normalize_query(query)
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+
+    # آيدي رقمي ضمن مجال BIGINT - وإلا نستخدم قيمة مستحيلة حتى لا يفشل التحويل
+    int_id = int(q) if q.isdigit() and len(q) < 19 else -1
+
+    escaped = _escape_like(q.lower())
+    params = {
+        'q': q,
+        'exact': q.lower(),
+        'prefix': f"{escaped}%",
+        'contains': f"%{_escape_like(q)}%",
+        'user_id': int_id,
+        'int_id': int_id if int_id <= 2147483647 else -1,
+        'limit': limit + 1,
+        'offset': offset,
+    }
+
+    template, contains, score = _TEMPLATES[kind]
+    sql = template.format(
+        trgm=contains if len(q) >= MIN_TRGM_LENGTH else '',
+        score=score if trgm else '0'
+    )
+
+    # إزالة المعاملات غير المستخدمة في هذا الاستعلام (asyncpg لا يقبل معاملات زائدة)
+    used = set(_PARAM_RE.findall(sql))
+    params = {k: v for k, v in params.items() if k in used}
+
+    return _compile(sql, params, style)
+
+
+def paginate(rows, limit: int, offset: int = 0):
+    """تحويل نتائج الاستعلام (limit + 1) إلى صفحة"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    items = [dict(row) for row in rows[:limit]]
+    return {
+        'items': items,
+        'has_more': len(rows) > limit,
+        'offset': offset,
+        'next_offset': offset + limit if len(rows) > limit else None,
+    }
+
+
+async def search(pool, kind: str, query: str, limit: int = 10, offset: int = 0):
+    """البحث في نوع واحد مع ترتيب وتقسيم صفحات"""
+    if not normalize_query(query):
+        return paginate([], limit, offset)
+    try:
+        async with pool.acquire() as conn:
+            sql, params = build_search_sql(kind, query, limit, offset, trgm=await trgm_available(conn))
+            rows = await conn.fetch(sql, *params)
+        return paginate(rows, limit, offset)
+    except Exception as e:
+        logging.error(f"❌ خطأ في البحث ({kind}) عن '{query}': {e}")
+        return paginate([], limit, offset)
+
+
+async def search_users(pool, query: str, limit: int = 10, offset: int = 0):
+    """البحث عن المستخدمين بالآيدي أو اليوزرنيم أو الاسم"""
+    return await search(pool, 'users', query, limit, offset)
+
+
+async def search_orders(pool, query: str, limit: int = 10, offset: int = 0):
+    """البحث عن الطلبات برقم الطلب أو آيدي الحساب المستهدف"""
+    return await search(pool, 'orders', query, limit, offset)
+
+
+async def search_deposits(pool, query: str, limit: int = 10, offset: int = 0):
+    """البحث عن طلبات الشحن برقم الطلب أو رقم المعاملة"""
+    return await search(pool, 'deposits', query, limit, offset)
+
+
+async def init_search_indexes(conn):
+    """تفعيل pg_trgm وإنشاء فهارس البحث (فهارس البادئة والمطابقة التامة تُنشأ في الحالتين)"""
+    indexes = [
+        ('idx_users_username_lower', "users (lower(username) text_pattern_ops)"),
+        ('idx_orders_target_id', "orders (target_id)"),
+        ('idx_deposit_requests_tx_info', "deposit_requests (tx_info)"),
+    ]
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        trgm = _set_trgm(True)
+    except Exception as e:
+        logging.warning(f"⚠️ تعذر تفعيل pg_trgm (سيعمل البحث بدون فهارس trigram وبدون ترتيب similarity): {e}")
+        trgm = await trgm_available(conn)
+
+    if trgm:
+        indexes += [
+            ('idx_users_username_trgm', "users USING gin (username gin_trgm_ops)"),
+            ('idx_users_first_name_trgm', "users USING gin (first_name gin_trgm_ops)"),
+            ('idx_orders_target_id_trgm', "orders USING gin (target_id gin_trgm_ops)"),
+            ('idx_deposit_requests_tx_info_trgm', "deposit_requests USING gin (tx_info gin_trgm_ops)"),
+        ]
+    for name, target in indexes:
+        try:
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        except Exception as e:
+            logging.warning(f"⚠️ لم يتم إنشاء فهرس البحث {name}: {e}")
+
+    logging.info(f"✅ تم التأكد من فهارس البحث ({'pg_trgm' if trgm else 'بدون pg_trgm'})")
+    return trgm
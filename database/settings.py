@@ -0,0 +1,114 @@
+# database/settings.py
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, fields
+from typing import Optional, Tuple
+
+# ============= نسخة الإعدادات في الذاكرة =============
+# bot_settings يُحمّل كاملاً باستعلام واحد إلى SettingsSnapshot (قيم بأنواعها)،
+# وقراءة أي إعداد تصبح الوصول لخاصية بدلاً من رحلة لقاعدة البيانات. النسخة
+# تُستبدل كاملة عند أي تعديل (تنبيه bot_settings_changed عبر SettingsListener)،
+# ومن يملك نسخة يرى قيماً متسقة فيما بينها حتى نهاية معالجته.
+# التنبيهات والفحص الدوري في SettingsListener لا يكفيان وحدهما (قد يتوقف المستمع
+# أو يفشل التحميل)، لذلك النسخة الأقدم من SETTINGS_MAX_AGE_SECONDS تُعاد في الخلفية
+# عند أول استخدام لها.
+
+DEFAULT_SYRIATEL_NUMS = ("74091109", "63826779")
+
+
+def _numbers(value: str) -> Tuple[str, ...]:
+    return tuple(n.strip() for n in value.split(',') if n.strip())
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """إعدادات البوت بأنواعها (loaded = False تعني القيم الافتراضية قبل أول تحميل)"""
+    usd_to_syp: float = 118.0
+    points_per_order: int = 1
+    points_per_deposit: int = 1
+    points_per_referral: int = 1
+    points_to_usd: int = 100
+    redemption_rate: int = 100
+    syriatel_nums: Tuple[str, ...] = DEFAULT_SYRIATEL_NUMS
+    api_default_profit: Optional[int] = None
+    loaded: bool = False
+
+    @classmethod
+    def from_rows(cls, rows) -> 'SettingsSnapshot':
+        """بناء النسخة من صفوف (key, value) - القيم المفقودة أو غير الصالحة تأخذ الافتراضي"""
+        values = {row['key']: row['value'] for row in rows}
+        parsed = {}
+        for field in fields(cls):
+            parser = _PARSERS.get(field.name)
+            raw = values.get(field.name)
+            if parser is None or raw is None or raw == '':
+                continue
+            try:
+                parsed[field.name] = parser(raw)
+            except (TypeError, ValueError):
+                logging.warning(f"⚠️ قيمة غير صالحة للإعداد {field.name}: {raw}")
+        return cls(loaded=True, **parsed)
+
+
+_PARSERS = {
+    'usd_to_syp': float,
+    'points_per_order': int,
+    'points_per_deposit': int,
+    'points_per_referral': int,
+    'points_to_usd': int,
+    'redemption_rate': int,
+    'syriatel_nums': _numbers,
+    'api_default_profit': int,
+}
+
+_current = SettingsSnapshot()
+# آخر محاولة تحميل (ناجحة أو فاشلة) - حتى لا تتكرر المحاولة مع كل طلب عند تعطل القاعدة
+_checked_at = 0.0
+_refreshing: Optional[asyncio.Task] = None
+
+
+def current_settings() -> SettingsSnapshot:
+    """النسخة الحالية (بدون I/O)"""
+    return _current
+
+
+async def load_settings(pool) -> SettingsSnapshot:
+    """تحميل bot_settings باستعلام واحد واستبدال النسخة الحالية - عند الخطأ تبقى السابقة"""
+    global _current, _checked_at
+    _checked_at = time.monotonic()
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("SELECT key, value FROM bot_settings")
+        _current = SettingsSnapshot.from_rows(rows)
+        logging.info(f"⚙️ تم تحميل إعدادات البوت ({len(rows)} إعداد)")
+    except Exception as e:
+        logging.error(f"❌ خطأ في تحميل إعدادات البوت: {e}")
+    return _current
+
+
+def settings_listener(pool):
+    """مشترك لـ SettingsListener: أي تغيير (أو إعادة اتصال) يعيد تحميل النسخة"""
+    async def on_settings_changed(key):
+        await load_settings(pool)
+    return on_settings_changed
+
+
+def refresh_if_stale(pool):
+    """إعادة تحميل النسخة في الخلفية إذا تجاوزت SETTINGS_MAX_AGE_SECONDS (بدون انتظار)"""
+    global _refreshing
+    from config import SETTINGS_MAX_AGE_SECONDS
+    
+    if time.monotonic() - _checked_at < SETTINGS_MAX_AGE_SECONDS:
+        return
+    if _refreshing is not None and not _refreshing.done():
+        return
+    _refreshing = asyncio.get_running_loop().create_task(load_settings(pool), name='settings_refresh')
+
+
+async def get_settings(pool) -> SettingsSnapshot:
+    """النسخة الحالية، أو تحميلها أولاً إذا لم تُحمّل بعد"""
+    if _current.loaded:
+        refresh_if_stale(pool)
+        return _current
+    return await load_settings(pool)
@@ -0,0 +1,163 @@
+# database/settings_events.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+# ============= تنبيهات تغيير الإعدادات =============
+# trigger على bot_settings يرسل pg_notify('bot_settings_changed', key) مع كل
+# تعديل، من أي مكان (البوت، لوحة التحكم عبر psycopg2، أو SQL يدوي). المستمع
+# يحتفظ باتصال مستقل خارج المجمع ويستدعي المشتركين بالمفتاح الذي تغير، فتُحدث
+# النسخ المحفوظة في الذاكرة فوراً بدلاً من الاستعلام الدوري.
+# عند (إعادة) الاتصال يُستدعى المشتركون بـ None = إعادة تحميل كاملة (قد تكون
+# تنبيهات فاتت أثناء الانقطاع).
+#
+# خلف pooler بوضع transaction لا تصل التنبيهات إطلاقاً، لذلك يوجد أيضاً فحص دوري
+# لإصدار الجدول (max(updated_at) وعدد الصفوف - updated_at يُختم بـ trigger مع كل
+# تعديل) عبر المجمع العادي: تغيّر الإصدار = إعادة تحميل كاملة.
+
+SETTINGS_CHANNEL = 'bot_settings_changed'
+
+# مدة الانتظار قبل إعادة محاولة الاتصال (ثوانٍ)
+RECONNECT_DELAY = 5
+
+SettingsCallback = Callable[[Optional[str]], Awaitable[None]]
+
+
+async def init_settings_notify(conn):
+    """إنشاء trigger التنبيه وختم updated_at على جدول bot_settings"""
+    # كثير من الكتابات لا تحدّث updated_at - الختم هنا يجعل الإصدار موثوقاً
+    await conn.execute('''
+        CREATE OR REPLACE FUNCTION stamp_bot_settings() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    ''')
+    await conn.execute("DROP TRIGGER IF EXISTS bot_settings_stamp ON bot_settings")
+    await conn.execute('''
+        CREATE TRIGGER bot_settings_stamp
+        BEFORE INSERT OR UPDATE ON bot_settings
+        FOR EACH ROW EXECUTE FUNCTION stamp_bot_settings()
+    ''')
+    await conn.execute(f'''
+        CREATE OR REPLACE FUNCTION notify_bot_settings_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{SETTINGS_CHANNEL}', OLD.key);
+            ELSE
+                PERFORM pg_notify('{SETTINGS_CHANNEL}', NEW.key);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    ''')
+    await conn.execute("DROP TRIGGER IF EXISTS bot_settings_changed ON bot_settings")
+    await conn.execute('''
+        CREATE TRIGGER bot_settings_changed
+        AFTER INSERT OR UPDATE OR DELETE ON bot_settings
+        FOR EACH ROW EXECUTE FUNCTION notify_bot_settings_changed()
+    ''')
+
+
+async def get_settings_version(pool):
+    """إصدار bot_settings: (آخر updated_at, عدد الصفوف) - الحذف يغير العدد"""
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("SELECT max(updated_at) AS changed_at, count(*) AS total FROM bot_settings")
+        return row['changed_at'], row['total']
+
+
+class SettingsListener:
+    """
+    مستمع LISTEN bot_settings_changed على اتصال مستقل مع إعادة اتصال تلقائية
+
+    مع pool و poll_seconds > 0 يُفحص إصدار الجدول دورياً أيضاً (احتياط للتنبيهات
+    الفائتة أو المحجوبة خلف pooler).
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable], pool=None, poll_seconds: float = 0):
+        self._connect = connect
+        self._pool = pool
+        self.poll_seconds = poll_seconds
+        self._callbacks: List[SettingsCallback] = []
+        self._task: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._version = None
+        self._conn = None
+        self._closed: Optional[asyncio.Event] = None
+        self.connected = False
+
+    def subscribe(self, callback: SettingsCallback):
+        """إضافة مشترك: async callback(key) - key = None تعني إعادة تحميل كاملة"""
+        self._callbacks.append(callback)
+
+    async def _dispatch(self, key: Optional[str]):
+        for callback in self._callbacks:
+            try:
+                await callback(key)
+            except Exception as e:
+                logging.error(f"❌ خطأ في معالجة تغيير الإعداد {key}: {e}")
+
+    def _on_notify(self, conn, pid, channel, payload):
+        asyncio.get_running_loop().create_task(self._dispatch(payload or None))
+
+    def _on_terminate(self, conn):
+        if self._closed is not None:
+            self._closed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                self._conn = await self._connect()
+                self._closed = asyncio.Event()
+                self._conn.add_termination_listener(self._on_terminate)
+                await self._conn.add_listener(SETTINGS_CHANNEL, self._on_notify)
+                self.connected = True
+                logging.info(f"👂 الاستماع لتغييرات الإعدادات ({SETTINGS_CHANNEL})")
+                await self._dispatch(None)
+                await self._closed.wait()
+                logging.warning("⚠️ انقطع اتصال الاستماع لتغييرات الإعدادات، إعادة الاتصال...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ خطأ في الاستماع لتغييرات الإعدادات: {e}")
+            self.connected = False
+            if self._conn is not None and not self._conn.is_closed():
+                self._conn.terminate()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _poll(self):
+        while True:
+            try:
+                version = await get_settings_version(self._pool)
+                if self._version is not None and version != self._version:
+                    logging.info("🔄 تغيّرت bot_settings منذ آخر فحص - إعادة التحميل")
+                    await self._dispatch(None)
+                self._version = version
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ خطأ في فحص إصدار الإعدادات: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._run(), name='settings_listener')
+        if self._poll_task is None and self._pool is not None and self.poll_seconds > 0:
+            self._poll_task = loop.create_task(self._poll(), name='settings_poll')
+
+    async def stop(self):
+        for task in (self._task, self._poll_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._poll_task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self.connected = False
@@ -0,0 +1,101 @@
+# database/statement_mode.py
+import logging
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# ============= وضع الـ prepared statements =============
+# cached:   كاش asyncpg الكامل (statement مسماة تُحضّر مرة لكل اتصال) - للاتصال المباشر بـ Postgres
+# unnamed:  بدون كاش - كل استعلام يُرسل كـ statement غير مسماة (parse/bind/execute في رحلة واحدة)،
+#           وهو الوضع الوحيد الآمن خلف PgBouncer بوضع transaction (أقدم من 1.21)
+# protocol: خلف PgBouncer 1.21+ مع max_prepared_statements > 0 - الكاش يعمل لأن PgBouncer
+#           يتتبع الـ prepared statements على مستوى البروتوكول
+# auto:     cached إلا إذا دل الرابط أو الفحص على وجود pooler بوضع transaction
+
+STATEMENT_MODES = ('auto', 'cached', 'unnamed', 'protocol')
+
+# منافذ ومضيفات الـ poolers الشائعة (Supabase 6543، PgBouncer 6432، Neon "-pooler")
+POOLER_PORTS = (6432, 6543)
+POOLER_HOST_MARKERS = ('pooler', 'pgbouncer', 'bouncer')
+
+# عدد المعاملات القصيرة في الفحص - تغيّر pg_backend_pid بينها يعني pooler بوضع transaction
+PROBE_QUERIES = 8
+
+
+def strip_pooler_flag(dsn: Optional[str]) -> Tuple[Optional[str], bool]:
+    """حذف ?pgbouncer=true من الرابط (asyncpg يرسل أي معامل غير معروف كإعداد للخادم)"""
+    if not dsn or 'pgbouncer' not in dsn:
+        return dsn, False
+    parts = urlsplit(dsn)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    flag = any(k.lower() == 'pgbouncer' and v.lower() in ('1', 'true', 'yes') for k, v in params)
+    query = urlencode([(k, v) for k, v in params if k.lower() != 'pgbouncer'])
+    return urlunsplit(parts._replace(query=query)), flag
+
+
+def looks_like_pooler(dsn: Optional[str] = None, host: Optional[str] = None, port=None) -> bool:
+    """التعرف على pooler من الرابط أو المضيف/المنفذ"""
+    if dsn:
+        try:
+            parts = urlsplit(dsn)
+            host = host or parts.hostname
+            port = port or parts.port
+        except ValueError:
+            pass
+    host = (host or '').lower()
+    try:
+        port = int(port) if port else None
+    except (TypeError, ValueError):
+        port = None
+    return port in POOLER_PORTS or any(marker in host for marker in POOLER_HOST_MARKERS)
+
+
+async def probe_transaction_pooler(connect_args: Dict) -> Optional[bool]:
+    """
+    فحص فعلي: عدة معاملات قصيرة على اتصال واحد
+
+    إذا تغيّر pg_backend_pid بينها فالاتصال يمر عبر pooler بوضع transaction.
+    ثبات الـ pid لا يثبت العكس (pooler خامل قد يعيد نفس الاتصال)، لذلك
+    النتيجة True أو None فقط.
+    """
+    conn = None
+    try:
+        conn = await asyncpg.connect(**connect_args, statement_cache_size=0)
+        pids = set()
+        for _ in range(PROBE_QUERIES):
+            pids.add(await conn.fetchval("SELECT pg_backend_pid()"))
+        return True if len(pids) > 1 else None
+    except Exception as e:
+        logger.warning(f"⚠️ تعذر فحص نوع الاتصال بقاعدة البيانات: {e}")
+        return None
+    finally:
+        if conn is not None:
+            await conn.close()
+
+
+async def resolve_statement_mode(mode: str, connect_args: Dict, dsn_flag: bool = False) -> str:
+    """تحديد الوضع الفعلي (auto -> cached أو unnamed)"""
+    mode = (mode or 'auto').lower()
+    if mode not in STATEMENT_MODES:
+        logger.warning(f"⚠️ DB_STATEMENT_MODE غير معروف: {mode} - استخدام auto")
+        mode = 'auto'
+    if mode != 'auto':
+        return mode
+
+    if dsn_flag or looks_like_pooler(connect_args.get('dsn'), connect_args.get('host'), connect_args.get('port')):
+        logger.info("🔎 الرابط يشير إلى pooler (PgBouncer/Supabase) - statements غير مسماة")
+        return 'unnamed'
+    if await probe_transaction_pooler(connect_args):
+        logger.info("🔎 pg_backend_pid يتغير بين المعاملات (pooler بوضع transaction) - statements غير مسماة")
+        return 'unnamed'
+    return 'cached'
+
+
+def statement_settings(mode: str, cache_size: int) -> Dict:
+    """إعدادات asyncpg للوضع"""
+    if mode == 'unnamed':
+        return {"statement_cache_size": 0, "max_cached_statement_lifetime": 0}
+    return {"statement_cache_size": cache_size, "max_cached_statement_lifetime": 300}
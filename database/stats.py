@@ -1,18 +1,30 @@
 # database/stats.py
 import logging
+from datetime import datetime, timedelta
+from .connection import DAMASCUS_TZ
+from cache import cached
+from .settings import get_settings
+from .metrics import refresh_daily_metrics, get_metrics_totals, get_daily_metrics, get_metrics_top_apps
 
 async def get_bot_stats(pool):
-    """جلب إحصائيات البوت مع توقيت محلي"""
+    """جلب إحصائيات البوت مع توقيت محلي (العدادات من جدول daily_metrics)"""
     try:
+        # تحديث تدريجي سريع قبل القراءة (يتخطى إذا تم التحديث خلال الدقيقة الأخيرة)
+        await refresh_daily_metrics(pool, max_age=60)
+        
+        today = datetime.now(DAMASCUS_TZ).date()
+        totals = await get_metrics_totals(pool)
+        today_totals = await get_metrics_totals(pool, today, today)
+        
         async with pool.acquire() as conn:
             await conn.execute("SET TIMEZONE TO 'Asia/Damascus'")
             
+            # الأرصدة والنقاط الحالية حالة لحظية وليست أحداثاً يومية، لذلك تبقى من جدول المستخدمين
             users_stats = await conn.fetchrow('''
                 SELECT 
                     COUNT(*) as total_users,
                     COALESCE(SUM(balance), 0) as total_balance,
                     COUNT(CASE WHEN is_banned THEN 1 END) as banned_users,
-                    COUNT(CASE WHEN DATE(created_at) = CURRENT_DATE THEN 1 END) as new_users_today,
                     COALESCE(SUM(total_points), 0) as total_points,
                     COALESCE(SUM(total_points_earned), 0) as total_points_earned,
                     COALESCE(SUM(total_points_redeemed), 0) as total_points_redeemed,
@@ -20,37 +32,6 @@ async def get_bot_stats(pool):
                 FROM users
             ''')
             
-            deposits_stats = await conn.fetchrow('''
-                SELECT 
-                    COUNT(*) as total_deposits,
-                    COALESCE(SUM(amount_syp), 0) as total_deposit_amount,
-                    COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_deposits,
-                    COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved_deposits,
-                    COUNT(CASE WHEN status = 'rejected' THEN 1 END) as rejected_deposits
-                FROM deposit_requests
-            ''')
-            
-            orders_stats = await conn.fetchrow('''
-                SELECT 
-                    COUNT(*) as total_orders,
-                    COALESCE(SUM(CASE WHEN status = 'completed' THEN total_amount_syp END), 0) as total_completed_amount,
-                    COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_orders,
-                    COUNT(CASE WHEN status = 'processing' THEN 1 END) as processing_orders,
-                    COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_orders,
-                    COUNT(CASE WHEN status = 'failed' THEN 1 END) as failed_orders,
-                    COALESCE(SUM(CASE WHEN status = 'completed' THEN points_earned END), 0) as total_points_given
-                FROM orders
-            ''')
-            
-            points_stats = await conn.fetchrow('''
-                SELECT 
-                    COUNT(*) as total_redemptions,
-                    COALESCE(SUM(points), 0) as total_points_redeemed,
-                    COALESCE(SUM(amount_syp), 0) as total_redemption_amount
-                FROM redemption_requests
-                WHERE status = 'approved'
-            ''')
-            
             apps_stats = await conn.fetchrow('''
                 SELECT 
                     COUNT(*) as total_apps,
@@ -60,29 +41,45 @@ async def get_bot_stats(pool):
                 FROM applications
                 WHERE is_active = TRUE
             ''')
-            
-            points_per_order = await conn.fetchval(
-                "SELECT value FROM bot_settings WHERE key = 'points_per_order'"
-            ) or 1
-            
-            points_per_deposit = await conn.fetchval(
-                "SELECT value FROM bot_settings WHERE key = 'points_per_deposit'"
-            ) or 1
-            
-            points_per_referral = await conn.fetchval(
-                "SELECT value FROM bot_settings WHERE key = 'points_per_referral'"
-            ) or 1
-            
-            return {
-                'users': dict(users_stats) if users_stats else {},
-                'deposits': dict(deposits_stats) if deposits_stats else {},
-                'orders': dict(orders_stats) if orders_stats else {},
-                'points': dict(points_stats) if points_stats else {},
-                'apps': dict(apps_stats) if apps_stats else {},
-                'points_per_order': int(points_per_order),
-                'points_per_deposit': int(points_per_deposit),
-                'points_per_referral': int(points_per_referral)
-            }
+        
+        settings = await get_settings(pool)
+        users = dict(users_stats) if users_stats else {}
+        users['new_users_today'] = today_totals['new_users']
+        
+        deposits = {
+            'total_deposits': totals['deposits_count'],
+            'total_deposit_amount': totals['deposits_requested_syp'],
+            'pending_deposits': totals['deposits_pending'],
+            'approved_deposits': totals['deposits_approved'],
+            'rejected_deposits': totals['deposits_rejected']
+        }
+        
+        orders = {
+            'total_orders': totals['orders_count'],
+            'total_completed_amount': totals['revenue_syp'],
+            'pending_orders': totals['orders_pending'],
+            'processing_orders': totals['orders_processing'],
+            'completed_orders': totals['orders_completed'],
+            'failed_orders': totals['orders_failed'],
+            'total_points_given': totals['order_points']
+        }
+        
+        points = {
+            'total_redemptions': totals['redemptions_count'],
+            'total_points_redeemed': totals['redemptions_points'],
+            'total_redemption_amount': totals['redemptions_amount_syp']
+        }
+        
+        return {
+            'users': users,
+            'deposits': deposits,
+            'orders': orders,
+            'points': points,
+            'apps': dict(apps_stats) if apps_stats else {},
+            'points_per_order': settings.points_per_order,
+            'points_per_deposit': settings.points_per_deposit,
+            'points_per_referral': settings.points_per_referral
+        }
     except Exception as e:
         logging.error(f"❌ خطأ في جلب الإحصائيات: {e}")
         return None
@@ -177,4 +174,248 @@ async def update_report_setting(pool, key, value):
             return True
     except Exception as e:
         logging.error(f"❌ خطأ في تحديث إعداد التقرير {key}: {e}")
-        return False
\ No newline at end of file
+        return False
+# ============= تقرير الأرباح =============
+
+async def get_profits_watermark(pool, start_date=None, end_date=None):
+    """
+    علامة مدخلات تقرير الأرباح: الطلبات المكتملة (العدد وآخر تحديث) وبصمة الأسعار ونسب الربح والخصومات
+
+    التعديل قد يأتي من لوحة التحكم (عملية أخرى)، لذلك تُقرأ البصمة من الجداول بدل مسح الكاش عند التعديل
+    """
+    try:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    (SELECT COUNT(*) || ':' || COALESCE(MAX(updated_at)::text, '-')
+                     FROM orders
+                     WHERE status = 'completed'
+                       AND ($1::date IS NULL OR created_at >= $1::date)
+                       AND ($2::date IS NULL OR created_at < $2::date + 1)) as orders,
+                    (SELECT md5(COALESCE(string_agg(
+                         id || ':' || name || ':' || COALESCE(profit_percentage, 0) || ':' || COALESCE(unit_price_usd, 0),
+                         ',' ORDER BY id), ''))
+                     FROM applications) as apps,
+                    (SELECT md5(COALESCE(string_agg(id || ':' || COALESCE(price_usd, 0), ',' ORDER BY id), ''))
+                     FROM product_options) as options,
+                    (SELECT md5(COALESCE(string_agg(user_id || ':' || discount_percent, ',' ORDER BY user_id), ''))
+                     FROM users WHERE COALESCE(discount_percent, 0) <> 0) as discounts
+            ''', start_date, end_date)
+            return f"{row['orders']}:{row['apps']}:{row['options']}:{row['discounts']}"
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب علامة الطلبات المكتملة: {e}")
+        return None
+
+@cached(ttl=3600, key_prefix="profits_report")
+async def _fetch_profits_by_app(pool, exchange_rate, start_date, end_date, watermark):
+    """تجميع الأرباح لكل تطبيق في استعلام واحد (العلامة جزء من مفتاح الكاش)"""
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            WITH per_order AS (
+                SELECT 
+                    a.id as app_id,
+                    a.name as app_name,
+                    COALESCE(a.profit_percentage, 0) as profit_percent,
+                    COALESCE(u.discount_percent, 0) as user_discount,
+                    o.total_amount_syp / $1 as revenue_usd,
+                    COALESCE(CASE 
+                        WHEN o.variant_id IS NOT NULL THEN po.price_usd
+                        ELSE a.unit_price_usd * o.quantity
+                    END, 0) as supplier_usd
+                FROM orders o
+                JOIN applications a ON o.app_id = a.id
+                JOIN users u ON o.user_id = u.user_id
+                LEFT JOIN product_options po ON po.id = o.variant_id
+                WHERE o.status = 'completed'
+                  AND ($2::date IS NULL OR o.created_at >= $2::date)
+                  AND ($3::date IS NULL OR o.created_at < $3::date + 1)
+            )
+            SELECT 
+                app_name,
+                COUNT(*) as orders_count,
+                MAX(profit_percent) as profit_percent,
+                COALESCE(SUM(revenue_usd), 0) as revenue_usd,
+                COALESCE(SUM(supplier_usd), 0) as supplier_usd,
+                COALESCE(SUM(supplier_usd * profit_percent / 100), 0) as profit_before_usd,
+                COALESCE(SUM(supplier_usd * (1 + profit_percent / 100) * user_discount / 100), 0) as discount_usd
+            FROM per_order
+            GROUP BY app_id, app_name
+            ORDER BY app_name
+        ''', exchange_rate, start_date, end_date)
+    
+    apps = []
+    for row in rows:
+        app = dict(row)
+        app['profit_after_usd'] = app['profit_before_usd'] - app['discount_usd']
+        apps.append(app)
+    return apps
+
+async def get_profits_by_app(pool, exchange_rate, start_date=None, end_date=None):
+    """
+    أرباح الطلبات المكتملة مجمعة لكل تطبيق
+    
+    يعاد الحساب فقط عند تغير علامة الطلبات المكتملة أو الأسعار والخصومات، وإلا تُعاد النتيجة من الكاش
+    """
+    try:
+        watermark = await get_profits_watermark(pool, start_date, end_date)
+        if watermark is None:
+            return None
+        return await _fetch_profits_by_app(pool, float(exchange_rate), start_date, end_date, watermark)
+    except Exception as e:
+        logging.error(f"❌ خطأ في حساب تقرير الأرباح: {e}")
+        return None
+
+
+# ============= بيانات لوحة التحكم (الوضع غير المتزامن) =============
+
+async def get_users_summary(pool):
+    """ملخص جدول المستخدمين في استعلام واحد (صفحة المستخدمين والرئيسية)"""
+    try:
+        today_start = datetime.now(DAMASCUS_TZ).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT 
+                    COUNT(*) as total,
+                    COUNT(CASE WHEN is_banned THEN 1 END) as banned,
+                    COALESCE(SUM(balance), 0) as total_balance,
+                    COALESCE(SUM(total_points), 0) as total_points,
+                    COUNT(CASE WHEN created_at >= $1 THEN 1 END) as new_today
+                FROM users
+            ''', today_start)
+            return dict(row)
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب ملخص المستخدمين: {e}")
+        return {'total': 0, 'banned': 0, 'total_balance': 0, 'total_points': 0, 'new_today': 0}
+
+async def get_pending_counts(pool):
+    """عدد طلبات الشحن والطلبات المعلقة (فهارس status)"""
+    try:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT 
+                    (SELECT COUNT(*) FROM deposit_requests WHERE status = 'pending') as deposits,
+                    (SELECT COUNT(*) FROM orders WHERE status = 'pending') as orders,
+                    (SELECT COUNT(*) FROM orders WHERE status IN ('pending', 'processing')) as open_orders
+            ''')
+            return dict(row)
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب الطلبات المعلقة: {e}")
+        return {'deposits': 0, 'orders': 0, 'open_orders': 0}
+
+async def get_dashboard_overview(pool):
+    """بيانات الصفحة الرئيسية للوحة التحكم (نفس مفاتيح قالب index.html)"""
+    try:
+        users = await get_users_summary(pool)
+        pending = await get_pending_counts(pool)
+        settings = await get_settings(pool)
+        
+        async with pool.acquire() as conn:
+            recent_users = await conn.fetch('''
+                SELECT user_id, username, first_name, balance, is_banned, created_at 
+                FROM users ORDER BY created_at DESC LIMIT 5
+            ''')
+            recent_deposits = await conn.fetch('''
+                SELECT id, user_id, username, method, amount_syp, created_at
+                FROM deposit_requests 
+                WHERE status = 'pending' 
+                ORDER BY created_at DESC LIMIT 5
+            ''')
+            recent_orders = await conn.fetch('''
+                SELECT o.id, u.username, a.name, o.quantity, o.total_amount_syp, o.created_at
+                FROM orders o
+                JOIN users u ON o.user_id = u.user_id
+                JOIN applications a ON o.app_id = a.id
+                WHERE o.status = 'pending'
+                ORDER BY o.created_at DESC LIMIT 5
+            ''')
+        
+        return {
+            'total_users': users['total'],
+            'total_balances': users['total_balance'],
+            'pending_deposits_count': pending['deposits'],
+            'pending_orders_count': pending['orders'],
+            'banned_users': users['banned'],
+            'total_points': users['total_points'],
+            'new_users_today': users['new_today'],
+            'recent_users': [dict(r) for r in recent_users],
+            'recent_deposits': [dict(r) for r in recent_deposits],
+            'recent_orders': [dict(r) for r in recent_orders],
+            'rate': settings.usd_to_syp
+        }
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب بيانات الصفحة الرئيسية: {e}")
+        return None
+
+async def get_dashboard_statistics(pool, days=7):
+    """بيانات صفحة الإحصائيات (نفس مفاتيح قالب statistics.html) من daily_metrics وجدول المستخدمين"""
+    try:
+        today = datetime.now(DAMASCUS_TZ).date()
+        start = today - timedelta(days=days - 1)
+        totals = await get_metrics_totals(pool)
+        daily = await get_daily_metrics(pool, start, today)
+        top_apps = await get_metrics_top_apps(pool, 10, start, today)
+        
+        async with pool.acquire() as conn:
+            users_row = await conn.fetchrow('''
+                SELECT 
+                    COUNT(*) as total_users,
+                    COUNT(CASE WHEN is_banned THEN 1 END) as banned_users,
+                    COALESCE(SUM(balance), 0) as total_balance,
+                    COALESCE(SUM(total_deposits), 0) as total_deposits,
+                    COALESCE(SUM(total_orders), 0) as total_orders_count,
+                    COALESCE(SUM(total_spent), 0) as total_spent,
+                    COALESCE(SUM(total_points), 0) as total_points,
+                    COALESCE(SUM(total_points_earned), 0) as total_earned,
+                    COALESCE(SUM(total_points_redeemed), 0) as total_redeemed,
+                    COUNT(CASE WHEN total_points > 0 THEN 1 END) as users_with_points
+                FROM users
+            ''')
+            top_spenders = await conn.fetch('''
+                SELECT user_id, username, first_name, total_spent
+                FROM users
+                WHERE total_spent > 0
+                ORDER BY total_spent DESC
+                LIMIT 10
+            ''')
+        
+        return {
+            'users_stats': {k: users_row[k] for k in ('total_users', 'banned_users', 'total_balance',
+                                                      'total_deposits', 'total_orders_count', 'total_spent')},
+            'orders_stats': {
+                'total_orders': totals['orders_count'],
+                'total_amount': totals['revenue_syp'],
+                'completed_orders': totals['orders_completed'],
+                'pending_orders': totals['orders_pending'],
+                'failed_orders': totals['orders_failed'],
+                'total_points_given': totals['order_points']
+            },
+            'deposits_stats': {
+                'total_deposits': totals['deposits_count'],
+                'total_amount': totals['deposits_requested_syp'],
+                'approved_deposits': totals['deposits_approved'],
+                'pending_deposits': totals['deposits_pending']
+            },
+            'points_stats': {
+                'total_points': users_row['total_points'],
+                'total_earned': users_row['total_earned'],
+                'users_with_points': users_row['users_with_points'],
+                'total_redeemed': users_row['total_redeemed']
+            },
+            'daily_stats': [{
+                'date': d['day'],
+                'new_users': d['new_users'],
+                'orders_count': d['orders_count'],
+                'orders_amount': d['revenue_syp'],
+                'deposits_count': d['deposits_approved'],
+                'deposits_amount': d['deposits_amount_syp']
+            } for d in daily],
+            'top_apps': [{
+                'name': app['name'],
+                'order_count': app['order_count'],
+                'total_amount': app['total_revenue']
+            } for app in top_apps],
+            'top_spenders': [dict(r) for r in top_spenders]
+        }
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب بيانات صفحة الإحصائيات: {e}")
+        return None
@@ -0,0 +1,102 @@
+# database/subscriptions.py
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from config import SUBSCRIPTION_TTL_MINUTES, SUBSCRIPTION_NEGATIVE_TTL_SECONDS, SUBSCRIPTION_CACHE_MAX
+
+# ============= حالة الاشتراك في قناة البوت =============
+# بدلاً من get_chat_member مع كل /start، تُحفظ حالة كل مستخدم في الذاكرة
+# (وفي جدول channel_members حتى تبقى بعد إعادة التشغيل). تحديثات chat_member
+# من تيليجرام تُحدث الحالة فور الانضمام أو المغادرة، والاستعلام من API يبقى
+# فقط عند عدم وجود الحالة أو بعد انتهاء صلاحيتها (احتياطاً لتحديثات فائتة).
+# الذاكرة خاصة بكل نسخة من البوت وتحديث chat_member يصل لنسخة واحدة فقط، لذلك
+# حالة "غير مشترك" صلاحيتها قصيرة (SUBSCRIPTION_NEGATIVE_TTL_SECONDS).
+
+MEMBER_STATUSES = frozenset({'member', 'administrator', 'creator'})
+
+# user_id -> (مشترك؟, وقت آخر تحقق)
+_members: Dict[int, Tuple[bool, float]] = {}
+
+
+def _ttl(is_member: bool) -> float:
+    return SUBSCRIPTION_TTL_MINUTES * 60 if is_member else SUBSCRIPTION_NEGATIVE_TTL_SECONDS
+
+
+def _remember(user_id: int, is_member: bool, checked_at: float):
+    """حفظ الحالة في الذاكرة مع حذف الأقدم عند تجاوز SUBSCRIPTION_CACHE_MAX"""
+    _members.pop(user_id, None)
+    _members[user_id] = (is_member, checked_at)
+    while len(_members) > SUBSCRIPTION_CACHE_MAX:
+        del _members[next(iter(_members))]
+
+
+async def init_channel_members_table(conn):
+    """إنشاء جدول حالة الاشتراك في القناة"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS channel_members (
+            user_id BIGINT PRIMARY KEY,
+            status VARCHAR(20) NOT NULL,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+
+
+async def load_channel_members(pool) -> int:
+    """تحميل حالات الاشتراك غير المنتهية (الأحدث أولاً) من الجدول إلى الذاكرة عند بدء التشغيل"""
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT user_id, status, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP::timestamp - checked_at) AS age
+                FROM channel_members
+                WHERE checked_at > CURRENT_TIMESTAMP::timestamp - make_interval(mins => $1)
+                  AND status = ANY($2::text[])
+                ORDER BY checked_at DESC
+                LIMIT $3
+            ''', SUBSCRIPTION_TTL_MINUTES, list(MEMBER_STATUSES), SUBSCRIPTION_CACHE_MAX)
+        now = time.time()
+        for row in reversed(rows):
+            _remember(row['user_id'], True, now - float(row['age']))
+        logging.info(f"📢 تم تحميل حالة الاشتراك لـ {len(rows)} مستخدم")
+        return len(rows)
+    except Exception as e:
+        logging.error(f"❌ خطأ في تحميل حالة الاشتراك في القناة: {e}")
+        return 0
+
+
+def get_cached_membership(user_id: int) -> Optional[bool]:
+    """الحالة المحفوظة إذا كانت ضمن الصلاحية، وإلا None"""
+    entry = _members.get(user_id)
+    if entry is None:
+        return None
+    if time.time() - entry[1] > _ttl(entry[0]):
+        _members.pop(user_id, None)
+        return None
+    return entry[0]
+
+
+def _status_value(status) -> str:
+    return str(getattr(status, 'value', status))
+
+
+def remember_membership(user_id: int, status) -> bool:
+    """تحديث الحالة في الذاكرة فوراً (من تحديث chat_member أو من get_chat_member) - يعيد هل هو مشترك"""
+    is_member = _status_value(status) in MEMBER_STATUSES
+    _remember(user_id, is_member, time.time())
+    return is_member
+
+
+async def save_membership(pool, user_id: int, status):
+    """حفظ الحالة في جدول channel_members (يُشغل في الخلفية خارج مسار الرد)"""
+    status = _status_value(status)
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO channel_members (user_id, status, checked_at)
+                VALUES ($1, $2, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE
+                SET status = EXCLUDED.status, checked_at = EXCLUDED.checked_at
+            ''', user_id, status)
+    except Exception as e:
+        logging.error(f"❌ خطأ في حفظ حالة اشتراك المستخدم {user_id}: {e}")
+
@@ -3,6 +3,7 @@ import logging
 import pytz
 from datetime import datetime
 from .connection import DAMASCUS_TZ
+from .wallet import credit
 
 async def get_user_profile(pool, user_id):
     """جلب معلومات الملف الشخصي للمستخدم بشكل كامل مع توقيت محلي"""
@@ -52,10 +53,11 @@ async def get_user_profile(pool, user_id):
             referrals = await conn.fetchrow('''
                 SELECT 
                     COUNT(*) as total_referrals,
-                    COALESCE(SUM(total_deposits), 0) as referrals_deposits,
-                    COALESCE(SUM(total_orders), 0) as referrals_orders
-                FROM users 
-                WHERE referred_by = $1
+                    COALESCE(SUM(u.total_deposits), 0) as referrals_deposits,
+                    COALESCE(SUM(u.total_orders), 0) as referrals_orders
+                FROM referrals r
+                JOIN users u ON u.user_id = r.referred_id
+                WHERE r.referrer_id = $1
             ''', user_id)
             
             recent_orders = await conn.fetch('''
@@ -98,10 +100,7 @@ async def update_user_balance(pool, user_id, amount):
     """تحديث رصيد المستخدم"""
     try:
         async with pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE users SET balance = balance + $1, last_activity = CURRENT_TIMESTAMP WHERE user_id = $2",
-                amount, user_id
-            )
+            await credit(conn, user_id, amount, reason='admin')
             logging.info(f"✅ تم تحديث رصيد المستخدم {user_id}")
             return True
     except Exception as e:
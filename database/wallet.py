@@ -0,0 +1,255 @@
+# database/wallet.py
+import logging
+from typing import Dict, List, Optional
+
+from .referrals import encode_referral_code
+
+# ============= عمليات الرصيد الذرية =============
+# كل عملية استعلام واحد: الشرط والتعديل والقيمة الجديدة في نفس الجملة، فلا يوجد
+# SELECT ثم مقارنة في بايثون ثم UPDATE (نقرتان متزامنتان كانتا تمرّان معاً من الفحص).
+# الدوال تقبل مجمع الاتصالات أو اتصالاً داخل معاملة قائمة (conn.transaction()).
+#
+# كل تعديل يُسجل في wallet_ledger ضمن نفس الاستعلام (CTE)، فلا يوجد تعديل رصيد
+# بدون قيد ولا قيد بدون تعديل. ref_id يشير إلى الطلب أو طلب الشحن أو طلب
+# الاسترداد حسب السبب، أو إلى المشرف في التعديل اليدوي.
+
+# حالات الطلب التي يمكن إرجاع مبلغها (الطلب لم يُنفذ بعد)
+REFUNDABLE_STATUSES = ('pending', 'processing')
+
+# أسباب القيود في السجل
+LEDGER_REASONS = {
+    'opening': 'رصيد افتتاحي',
+    'order': 'شراء',
+    'deposit': 'شحن',
+    'refund': 'استرجاع',
+    'admin': 'تعديل من الإدارة',
+    'redemption': 'استرداد نقاط',
+}
+
+
+class InsufficientFunds(Exception):
+    """الرصيد لا يكفي للخصم (أو المستخدم غير موجود)"""
+
+    def __init__(self, user_id: int, amount: float):
+        self.user_id = user_id
+        self.amount = amount
+        super().__init__(f"رصيد غير كافٍ للمستخدم {user_id} لخصم {amount:,.0f} ل.س")
+
+
+async def init_wallet_tables(conn):
+    """إنشاء سجل الحركات ولقطات الأرصدة، وقيد افتتاحي لكل رصيد موجود عند أول إنشاء"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS wallet_ledger (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            delta FLOAT NOT NULL,
+            reason VARCHAR(20) NOT NULL,
+            ref_id BIGINT,
+            balance_after FLOAT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_ledger_user ON wallet_ledger (user_id, id)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_ledger_ref ON wallet_ledger (reason, ref_id)")
+
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS wallet_snapshots (
+            user_id BIGINT NOT NULL,
+            ledger_id BIGINT NOT NULL,
+            balance FLOAT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, ledger_id)
+        );
+    ''')
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_wallet_snapshots_ledger ON wallet_snapshots (ledger_id)")
+
+    # الأرصدة السابقة للسجل تدخل كقيد افتتاحي (مرة واحدة، عندما يكون السجل فارغاً)
+    opened = await conn.execute('''
+        INSERT INTO wallet_ledger (user_id, delta, reason, balance_after)
+        SELECT user_id, balance, 'opening', balance
+        FROM users
+        WHERE balance <> 0 AND NOT EXISTS (SELECT 1 FROM wallet_ledger)
+    ''')
+    count = int(opened.split()[-1])
+    if count:
+        logging.info(f"📒 تم إنشاء {count} قيد افتتاحي في wallet_ledger")
+
+
+def _logged(change_sql: str, delta_sql: str = '$1') -> str:
+    """
+    تغليف استعلام تعديل الرصيد بقيد في السجل
+
+    change_sql يجب أن يعيد user_id, balance. المعاملات: $1 المبلغ، $2 المستخدم،
+    $3 السبب، $4 المرجع.
+    """
+    return f'''
+        WITH changed AS ({change_sql}),
+        logged AS (
+            INSERT INTO wallet_ledger (user_id, delta, reason, ref_id, balance_after)
+            SELECT user_id, {delta_sql}, $3, $4, balance FROM changed
+        )
+        SELECT balance FROM changed
+    '''
+
+
+async def debit(db, user_id: int, amount: float, *, reason: str = 'order',
+                ref_id: Optional[int] = None, count_order: bool = False) -> float:
+    """
+    خصم مشروط: ينجح فقط إذا كان الرصيد >= المبلغ
+
+    Returns:
+        float: الرصيد الجديد
+    Raises:
+        InsufficientFunds: الرصيد غير كافٍ أو المستخدم غير موجود
+    """
+    new_balance = await db.fetchval(_logged(f'''
+        UPDATE users
+        SET balance = balance - $1{', total_orders = total_orders + 1' if count_order else ''}
+        WHERE user_id = $2 AND balance >= $1
+        RETURNING user_id, balance
+    ''', '-$1'), amount, user_id, reason, ref_id)
+    if new_balance is None:
+        raise InsufficientFunds(user_id, amount)
+    return new_balance
+
+
+async def credit(db, user_id: int, amount: float, *, reason: str = 'deposit', ref_id: Optional[int] = None,
+                 deposit: bool = False, create: bool = False) -> Optional[float]:
+    """
+    إضافة للرصيد
+
+    Args:
+        deposit: احتساب المبلغ في total_deposits (شحن)
+        create: إنشاء المستخدم إذا لم يكن موجوداً (نفس الاستعلام)
+    Returns:
+        float: الرصيد الجديد، أو None إذا لم يكن المستخدم موجوداً (بدون create)
+    """
+    deposits = ', total_deposits = users.total_deposits + $1' if deposit else ''
+    if create:
+        change = f'''
+            INSERT INTO users (user_id, balance, total_deposits, referral_code, created_at, last_activity)
+            VALUES ($2, $1, {'$1' if deposit else '0'}, $5, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE
+            SET balance = users.balance + $1{deposits}, last_activity = CURRENT_TIMESTAMP
+            RETURNING user_id, balance
+        '''
+        # المستخدم الجديد يأخذ كود إحالته في نفس الإدخال
+        extra = (encode_referral_code(user_id),)
+    else:
+        change = f'''
+            UPDATE users
+            SET balance = users.balance + $1{deposits}, last_activity = CURRENT_TIMESTAMP
+            WHERE user_id = $2
+            RETURNING user_id, balance
+        '''
+        extra = ()
+    return await db.fetchval(_logged(change), amount, user_id, reason, ref_id, *extra)
+
+
+async def adjust(db, user_id: int, delta: float, *, reason: str = 'admin', ref_id: Optional[int] = None,
+                 deposit: bool = False) -> float:
+    """
+    تعديل بإشارة (موجب أو سالب) بشرط ألا يصبح الرصيد سالباً - للتعديل اليدوي من الإدارة
+
+    Raises:
+        InsufficientFunds: الخصم أكبر من الرصيد أو المستخدم غير موجود
+    """
+    new_balance = await db.fetchval(_logged(f'''
+        UPDATE users
+        SET balance = balance + $1{', total_deposits = total_deposits + $1' if deposit else ''}
+        WHERE user_id = $2 AND balance + $1 >= 0
+        RETURNING user_id, balance
+    '''), delta, user_id, reason, ref_id)
+    if new_balance is None:
+        raise InsufficientFunds(user_id, -delta)
+    return new_balance
+
+
+async def refund_order(db, order_id: int, status: str = 'failed', note: Optional[str] = None) -> Optional[Dict]:
+    """
+    إغلاق طلب غير منفذ وإرجاع مبلغه في استعلام واحد
+
+    تغيير الحالة مشروط بأن يكون الطلب pending/processing، فالضغط المكرر على
+    "رفض" أو "تعذر التنفيذ" لا يعيد المبلغ مرتين.
+
+    Returns:
+        dict: id, user_id, total_amount_syp, balance - أو None إذا كان الطلب مغلقاً مسبقاً
+    """
+    row = await db.fetchrow('''
+        WITH closed AS (
+            UPDATE orders
+            SET status = $2,
+                admin_notes = COALESCE($3, admin_notes),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1 AND status = ANY($4::text[])
+            RETURNING id, user_id, total_amount_syp
+        ), refunded AS (
+            UPDATE users u
+            SET balance = u.balance + closed.total_amount_syp
+            FROM closed
+            WHERE u.user_id = closed.user_id
+            RETURNING u.user_id, u.balance, closed.id, closed.total_amount_syp
+        ), logged AS (
+            INSERT INTO wallet_ledger (user_id, delta, reason, ref_id, balance_after)
+            SELECT user_id, total_amount_syp, 'refund', id, balance FROM refunded
+        )
+        SELECT closed.id, closed.user_id, closed.total_amount_syp,
+               (SELECT balance FROM refunded) AS balance
+        FROM closed
+    ''', order_id, status, note, list(REFUNDABLE_STATUSES))
+    if row is None:
+        logging.warning(f"⚠️ الطلب {order_id} مغلق مسبقاً - لم يتم إرجاع المبلغ")
+        return None
+    logging.info(f"↩️ إرجاع {row['total_amount_syp']:,.0f} ل.س للمستخدم {row['user_id']} (الطلب #{order_id})")
+    return dict(row)
+
+
+# ============= السجل واللقطات =============
+
+async def get_wallet_history(pool, user_id: int, limit: int = 10, before_id: Optional[int] = None) -> List[Dict]:
+    """
+    آخر حركات المستخدم (مدى محدود من فهرس user_id, id) مع اسم التطبيق للطلبات
+
+    before_id للصفحة التالية (معرف آخر قيد في الصفحة السابقة)
+    """
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT w.id, w.delta, w.reason, w.ref_id, w.balance_after, w.created_at,
+                       o.app_name
+                FROM wallet_ledger w
+                LEFT JOIN orders o ON w.reason IN ('order', 'refund') AND o.id = w.ref_id
+                WHERE w.user_id = $1 AND ($2::bigint IS NULL OR w.id < $2)
+                ORDER BY w.id DESC
+                LIMIT $3
+            ''', user_id, before_id, limit)
+            return [dict(row) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ خطأ في جلب سجل حركات المستخدم {user_id}: {e}")
+        return []
+
+
+async def snapshot_wallets(pool) -> int:
+    """
+    لقطة رصيد لكل مستخدم تغير رصيده منذ آخر لقطة (آخر قيد له بعد العلامة)
+
+    اللقطة نقطة مرجعية: الرصيد = رصيد اللقطة + مجموع القيود بعد ledger_id، فلا
+    تحتاج المراجعة لقراءة السجل كاملاً.
+    """
+    try:
+        async with pool.acquire() as conn:
+            result = await conn.execute('''
+                INSERT INTO wallet_snapshots (user_id, ledger_id, balance)
+                SELECT DISTINCT ON (user_id) user_id, id, balance_after
+                FROM wallet_ledger
+                WHERE id > (SELECT COALESCE(MAX(ledger_id), 0) FROM wallet_snapshots)
+                ORDER BY user_id, id DESC
+                ON CONFLICT DO NOTHING
+            ''')
+            count = int(result.split()[-1])
+            if count:
+                logging.info(f"📸 تم حفظ {count} لقطة رصيد")
+            return count
+    except Exception as e:
+        logging.error(f"❌ خطأ في حفظ لقطات الأرصدة: {e}")
+        return 0
@@ -9,6 +9,7 @@ from handlers.time_utils import get_damascus_time_now, format_damascus_time, DAM
 from datetime import datetime
 from handlers.keyboards import get_main_menu_keyboard
 from database.users import is_admin_user
+from database.referrals import encode_referral_code
 from utils import get_formatted_damascus_time, format_amount, is_valid_positive_number, parse_number
 
 # ✅ استيراد config مباشرة
@@ -429,12 +430,12 @@ async def confirm_deposit(callback: types.CallbackQuery, state: FSMContext, bot:
     async with db_pool.acquire() as conn:
         # إضافة أو تحديث المستخدم
         await conn.execute('''
-            INSERT INTO users (user_id, username, balance, created_at) 
-            VALUES ($1, $2, 0, CURRENT_TIMESTAMP) 
+            INSERT INTO users (user_id, username, balance, referral_code, created_at) 
+            VALUES ($1, $2, 0, $3, CURRENT_TIMESTAMP) 
             ON CONFLICT (user_id) DO UPDATE SET 
                 username = EXCLUDED.username,
                 last_activity = CURRENT_TIMESTAMP
-        ''', callback.from_user.id, callback.from_user.username)
+        ''', callback.from_user.id, callback.from_user.username, encode_referral_code(callback.from_user.id))
         
         # إنشاء طلب الشحن
         deposit_id = await conn.fetchval('''
@@ -573,12 +574,12 @@ async def confirm_deposit_photo(callback: types.CallbackQuery, state: FSMContext
     async with db_pool.acquire() as conn:
         # إضافة أو تحديث المستخدم
         await conn.execute('''
-            INSERT INTO users (user_id, username, balance, created_at) 
-            VALUES ($1, $2, 0, CURRENT_TIMESTAMP) 
+            INSERT INTO users (user_id, username, balance, referral_code, created_at) 
+            VALUES ($1, $2, 0, $3, CURRENT_TIMESTAMP) 
             ON CONFLICT (user_id) DO UPDATE SET 
                 username = EXCLUDED.username,
                 last_activity = CURRENT_TIMESTAMP
-        ''', callback.from_user.id, callback.from_user.username)
+        ''', callback.from_user.id, callback.from_user.username, encode_referral_code(callback.from_user.id))
         
         # إنشاء طلب الشحن مع الصورة
         deposit_id = await conn.fetchval('''
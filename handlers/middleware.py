@@ -1,42 +1,87 @@
 # handlers/middleware.py
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message, CallbackQuery, Update
 from typing import Callable, Dict, Any, Awaitable, Union
 import logging
+import re
 import time
-import asyncio
+
+from config import ADMIN_ID, MODERATORS
+from database.core import get_bot_status_settings
+from database.settings import current_settings, refresh_if_stale
+from database.pool import PoolBusyError
+from database.query_stats import track_round_trips
+from monitoring import (
+    HANDLER_LATENCY, HANDLER_ERRORS, HANDLER_DB_QUERIES,
+    TELEGRAM_REQUESTS, TELEGRAM_LATENCY, TELEGRAM_RETRY_AFTER
+)
 
 logger = logging.getLogger(__name__)
 
-# كاش لحالة البوت - خارج الكلاس
-bot_status_cache = {
-    'status': True, 
-    'last_check': 0,
-    'maintenance_message': 'البوت قيد الصيانة حالياً'
-}
+# ============= حالة البوت ووضع الصيانة =============
+# نسخة واحدة مشتركة في الذاكرة تُحدث فور أي تعديل على bot_settings (تنبيه
+# LISTEN bot_settings_changed من database/settings_events.py)، فالميدل وير لا
+# يستعلم من قاعدة البيانات أبداً أثناء معالجة الرسائل.
+
+DEFAULT_MAINTENANCE_MESSAGE = 'البوت قيد الصيانة حالياً'
 
-# مدة صلاحية الكاش بالثواني (60 ثانية)
-CACHE_TTL = 60
+# مفاتيح bot_settings التي تؤثر على الحالة
+STATUS_SETTING_KEYS = frozenset({'bot_status', 'maintenance_message'})
 
-# ✅ قائمة بالأوامر المسموح بها حتى عند توقف البوت
-ALLOWED_COMMANDS = {
+# ✅ الأوامر المسموح بها حتى عند توقف البوت
+ALLOWED_COMMANDS = frozenset({
     '/cancel', '/الغاء', '/رجوع', '/start', '/help',
     '❌ إلغاء', '🔙 رجوع للقائمة', '🏠 القائمة الرئيسية'
-}
+})
 
-# ✅ قائمة بالـ callback data المسموح بها
-ALLOWED_CALLBACKS = {
+# ✅ الـ callback data المسموح بها
+ALLOWED_CALLBACKS = frozenset({
     'back_to_main', 'back_to_admin', 'check_subscription', 'cancel',
     'back_to_categories', 'back_to_account'
-}
+})
+
+
+class BotStatusHolder:
+    """حالة البوت الحالية (تُقرأ بدون I/O وتُحدث من التنبيهات)"""
+
+    __slots__ = ('active', 'maintenance_message', 'updated_at')
+
+    def __init__(self):
+        self.active = True
+        self.maintenance_message = DEFAULT_MAINTENANCE_MESSAGE
+        self.updated_at = 0.0
+
+    async def reload(self, db_pool) -> bool:
+        """إعادة التحميل من قاعدة البيانات (استعلام واحد) - عند الخطأ تبقى القيم السابقة"""
+        try:
+            self.active, self.maintenance_message = await get_bot_status_settings(db_pool)
+            self.updated_at = time.time()
+            logger.info(f"✅ تم تحديث حالة البوت: {'يعمل' if self.active else 'متوقف'}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث حالة البوت: {e}")
+            return False
+
+
+bot_status = BotStatusHolder()
+
+
+def bot_status_listener(db_pool):
+    """مشترك لـ SettingsListener: يعيد التحميل عند تغير حالة البوت أو رسالة الصيانة"""
+    async def on_settings_changed(key):
+        if key is None or key in STATUS_SETTING_KEYS:
+            await bot_status.reload(db_pool)
+    return on_settings_changed
+
 
 class BotStatusMiddleware(BaseMiddleware):
-    """ميدل وير للتحقق من حالة البوت قبل معالجة الرسائل مع نظام كاش"""
+    """ميدل وير للتحقق من حالة البوت قبل معالجة الرسائل (من النسخة المشتركة، بدون استعلامات)"""
     
-    def __init__(self, db_pool):
-        self.db_pool = db_pool
-        # ✅ قفل لمنع تحديث الكاش عدة مرات في نفس الوقت
-        self._cache_lock = asyncio.Lock()
+    def __init__(self, status: BotStatusHolder = bot_status):
+        self.status = status
         super().__init__()
     
     async def __call__(
@@ -45,51 +90,21 @@ class BotStatusMiddleware(BaseMiddleware):
         event: Union[Message, CallbackQuery],
         data: Dict[str, Any]
     ) -> Any:
-        # التحقق من حالة البوت من قاعدة البيانات مع استخدام الكاش
-        from database import get_bot_status, get_maintenance_message
-        
-        # استثناء المشرفين من التحقق
-        from config import ADMIN_ID, MODERATORS
-        
-        user_id = event.from_user.id
-        is_admin = user_id == ADMIN_ID or user_id in MODERATORS
-        
-        # إذا كان المستخدم مشرف، يسمح له بالدخول دائماً
-        if is_admin:
+        if self.status.active:
             return await handler(event, data)
         
-        # التحقق من الأوامر المسموح بها
-        if self._is_allowed_event(event):
+        # المشرفون والأوامر المسموح بها تمر دائماً (MODERATORS قائمة تتغير أثناء التشغيل)
+        user_id = event.from_user.id
+        if user_id == ADMIN_ID or user_id in MODERATORS or self._is_allowed_event(event):
             return await handler(event, data)
         
-        # استخدام الكاش - التحقق كل 60 ثانية فقط
-        current_time = time.time()
-        bot_status = bot_status_cache['status']
-        
-        # إذا انتهت صلاحية الكاش، قم بتحديثه
-        if current_time - bot_status_cache['last_check'] >= CACHE_TTL:
-            # ✅ استخدام lock لمنع التحديث المتزامن
-            async with self._cache_lock:
-                # التحقق مرة أخرى بعد الحصول على القفل
-                if current_time - bot_status_cache['last_check'] >= CACHE_TTL:
-                    await self._refresh_cache()
-        
-        # استخدام القيمة المخزنة (قد تكون محدثة أو قديمة)
-        bot_status = bot_status_cache['status']
-        maintenance_msg = bot_status_cache.get('maintenance_message', 'البوت قيد الصيانة حالياً')
-        
-        if not bot_status:
-            # البوت متوقف - إرسال رسالة الصيانة
-            await self._send_maintenance_message(event, maintenance_msg)
-            return  # منع معالجة الرسالة
-        
-        # البوت يعمل - السماح بمعالجة الرسالة
-        return await handler(event, data)
+        # البوت متوقف - إرسال رسالة الصيانة ومنع معالجة الرسالة
+        await self._send_maintenance_message(event, self.status.maintenance_message)
     
     def _is_allowed_event(self, event: Union[Message, CallbackQuery]) -> bool:
         """التحقق مما إذا كان الحدث مسموحاً به حتى عند توقف البوت"""
         if isinstance(event, Message):
-            return event.text and event.text in ALLOWED_COMMANDS
+            return event.text in ALLOWED_COMMANDS
         elif isinstance(event, CallbackQuery):
             return event.data in ALLOWED_CALLBACKS
         return False
@@ -103,81 +118,184 @@ class BotStatusMiddleware(BaseMiddleware):
                 await event.answer(message, show_alert=True)
         except Exception as e:
             logger.error(f"❌ فشل إرسال رسالة الصيانة: {e}")
-    
-    async def _refresh_cache(self):
-        """تحديث الكاش من قاعدة البيانات"""
-        from database import get_bot_status, get_maintenance_message
-        
-        try:
-            bot_status = await get_bot_status(self.db_pool)
-            maintenance_msg = await get_maintenance_message(self.db_pool)
-            
-            bot_status_cache['status'] = bot_status
-            bot_status_cache['maintenance_message'] = maintenance_msg
-            bot_status_cache['last_check'] = time.time()
-            
-            logger.info(f"✅ تم تحديث كاش حالة البوت: {'يعمل' if bot_status else 'متوقف'}")
-            return True
-        except Exception as e:
-            logger.error(f"❌ خطأ في تحديث كاش حالة البوت: {e}")
-            # في حالة الخطأ، نبقي على القيم القديمة
-            bot_status_cache['last_check'] = time.time()  # نحدث الوقت لمنع المحاولات المتكررة
-            return False
 
 
 async def refresh_bot_status_cache(db_pool):
-    """تحديث كاش حالة البوت يدوياً"""
-    from database import get_bot_status, get_maintenance_message
-    
-    try:
-        bot_status = await get_bot_status(db_pool)
-        maintenance_msg = await get_maintenance_message(db_pool)
-        
-        bot_status_cache['status'] = bot_status
-        bot_status_cache['maintenance_message'] = maintenance_msg
-        bot_status_cache['last_check'] = time.time()
-        
-        logger.info(f"✅ تم تحديث كاش حالة البوت يدوياً: {'يعمل' if bot_status else 'متوقف'}")
-        return True
-    except Exception as e:
-        logger.error(f"❌ فشل تحديث كاش حالة البوت: {e}")
-        return False
+    """تحديث حالة البوت يدوياً (بعد التعديل من البوت نفسه، دون انتظار التنبيه)"""
+    return await bot_status.reload(db_pool)
 
 
 def reset_bot_status_cache():
-    """إعادة ضبط كاش حالة البوت"""
-    global bot_status_cache
-    bot_status_cache = {
-        'status': True,
-        'last_check': 0,
-        'maintenance_message': 'البوت قيد الصيانة حالياً'
-    }
+    """إعادة ضبط حالة البوت للقيم الافتراضية"""
+    bot_status.__init__()
     logger.info("🔄 تم إعادة ضبط كاش حالة البوت")
 
 
 # دالة مساعدة للحصول على حالة البوت من الكاش
 def get_cached_bot_status():
     """الحصول على حالة البوت من الكاش"""
-    return bot_status_cache.get('status', True)
+    return bot_status.active
 
 
 # دالة مساعدة للحصول على رسالة الصيانة من الكاش
 def get_cached_maintenance_message():
     """الحصول على رسالة الصيانة من الكاش"""
-    return bot_status_cache.get('maintenance_message', 'البوت قيد الصيانة حالياً')
+    return bot_status.maintenance_message
 
 
-# ✅ دوال جديدة للتحكم بالكاش
 def is_bot_active() -> bool:
     """التحقق مما إذا كان البوت نشطاً"""
-    return get_cached_bot_status()
+    return bot_status.active
 
 
 def get_cache_stats() -> dict:
     """الحصول على إحصائيات الكاش"""
     return {
-        'status': bot_status_cache.get('status'),
-        'last_check': bot_status_cache.get('last_check'),
-        'cache_age': time.time() - bot_status_cache.get('last_check', 0) if bot_status_cache.get('last_check') else None,
-        'ttl': CACHE_TTL
-    }
\ No newline at end of file
+        'status': bot_status.active,
+        'last_check': bot_status.updated_at,
+        'cache_age': time.time() - bot_status.updated_at if bot_status.updated_at else None,
+    }
+
+
+# ============= مقاييس المعالجة =============
+
+# مفتاح في data يحمل تسميات المسار من الميدل وير الخارجي إلى الداخلي
+METRICS_ROUTE_KEY = 'metrics_route'
+
+_CALLBACK_SEPARATORS = re.compile(r'[_:|]')
+
+
+def callback_prefix(data: str) -> str:
+    """بادئة الـ callback بدون المعرفات (مثال: confirm_deposit_15 -> confirm_deposit)"""
+    parts = []
+    for part in _CALLBACK_SEPARATORS.split(data or ''):
+        if not part or any(ch.isdigit() for ch in part):
+            break
+        parts.append(part)
+    return '_'.join(parts)[:40] or 'other'
+
+
+def message_prefix(message: Message) -> str:
+    """بادئة الرسالة: الأمر (/start) أو نوع المحتوى"""
+    text = message.text or ''
+    if text.startswith('/'):
+        return text.split()[0].split('@')[0][:32]
+    return message.content_type or 'other'
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    ميدل وير خارجي على update: زمن المعالجة والأخطاء لكل (نوع الحدث، الراوتر، البادئة)
+
+    الراوتر والبادئة يملؤهما HandlerLabelMiddleware بعد اختيار الهاندلر،
+    والتحديثات التي لم يطابقها أي هاندلر تُسجل تحت router="unhandled".
+    عدد استعلامات قاعدة البيانات لكل تحديث يُعد عبر track_round_trips.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        event_type = event.event_type
+        route = {'router': 'unhandled', 'prefix': '-'}
+        data[METRICS_ROUTE_KEY] = route
+        queries = track_round_trips()
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            if result is UNHANDLED:
+                route['router'] = 'unhandled'
+            return result
+        except Exception as e:
+            HANDLER_ERRORS.inc(event_type, route['router'], route['prefix'], type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, event_type, route['router'], route['prefix'])
+            HANDLER_DB_QUERIES.observe(queries[0], event_type, route['router'], route['prefix'])
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """ميدل وير داخلي: يسجل وحدة الهاندلر المختار وبادئة الحدث لـ MetricsMiddleware"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        route = data.get(METRICS_ROUTE_KEY)
+        handler_object = data.get('handler')
+        if route is not None and handler_object is not None:
+            route['router'] = getattr(handler_object.callback, '__module__', None) or 'unknown'
+            if isinstance(event, CallbackQuery):
+                route['prefix'] = callback_prefix(event.data)
+            elif isinstance(event, Message):
+                route['prefix'] = message_prefix(event)
+        return await handler(event, data)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """ميدل وير لجلسة البوت: عدد وزمن استدعاءات Bot API وحالات 429"""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, '__api_method__', type(method).__name__)
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            status = 'retry_after'
+            TELEGRAM_RETRY_AFTER.inc(api_method)
+            raise
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            TELEGRAM_REQUESTS.inc(api_method, status)
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, api_method)
+
+
+# ============= الضغط على قاعدة البيانات =============
+
+BUSY_MESSAGE = "⏳ الضغط مرتفع حالياً، يرجى إعادة المحاولة بعد لحظات"
+
+
+class PoolBusyMiddleware(BaseMiddleware):
+    """ميدل وير خارجي: إذا لم يتوفر اتصال بقاعدة البيانات خلال المهلة يُرد على المستخدم بدلاً من الانتظار"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Union[Message, CallbackQuery], Dict[str, Any]], Awaitable[Any]],
+        event: Union[Message, CallbackQuery],
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        except PoolBusyError as e:
+            logger.warning(f"⏳ رفض طلب من {event.from_user.id if event.from_user else '?'}: {e}")
+            try:
+                if isinstance(event, CallbackQuery):
+                    await event.answer(BUSY_MESSAGE, show_alert=False)
+                elif isinstance(event, Message):
+                    await event.answer(BUSY_MESSAGE)
+            except Exception as send_error:
+                logger.error(f"❌ فشل إرسال رسالة الانشغال: {send_error}")
+
+
+class SettingsMiddleware(BaseMiddleware):
+    """ميدل وير خارجي: يمرر نسخة الإعدادات الحالية للهاندلرز كـ settings (بدون I/O)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        # نسخة واحدة لكل تحديث - القيم متسقة حتى لو أُعيد التحميل أثناء المعالجة
+        db_pool = data.get("db_pool")
+        if db_pool is not None:
+            refresh_if_stale(db_pool)
+        data["settings"] = current_settings()
+        return await handler(event, data)
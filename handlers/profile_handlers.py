@@ -7,11 +7,14 @@ from handlers.time_utils import get_damascus_time_now
 from handlers.keyboards import get_main_menu_keyboard
 from database.points import get_redemption_rate, create_redemption_request
 from database.core import get_exchange_rate
+from database.settings import SettingsSnapshot
 from database.vip import get_next_vip_level
 from database.referrals import generate_referral_code
 from database.users import get_user_profile, get_user_points 
+from database.wallet import get_wallet_history, LEDGER_REASONS
 from utils import format_datetime, is_admin
 from cache import cached, clear_cache  # ✅ استيراد الكاش
+from telegram_gateway import run_in_background
 
 logger = logging.getLogger(__name__)
 router = Router(name="profile")
@@ -265,18 +268,17 @@ async def show_referral_button(callback: types.CallbackQuery, db_pool):
     link = f"https://t.me/{bot_username}?start={code}"
     
     # ✅ استخدام الكاش لإحصائيات الإحالة
+    # العدد والنقاط من جدول الإحالات بمسح واحد لفهرس المُحيل
     async with db_pool.acquire() as conn:
-        referrals_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM users WHERE referred_by = $1",
-            callback.from_user.id
-        ) or 0
-        
         try:
-            points_from_referrals = await conn.fetchval(
-                "SELECT COALESCE(SUM(points), 0) FROM points_history WHERE user_id = $1 AND action = 'referral'",
+            totals = await conn.fetchrow(
+                "SELECT COUNT(*) AS count, COALESCE(SUM(points), 0) AS points FROM referrals WHERE referrer_id = $1",
                 callback.from_user.id
-            ) or 0
+            )
+            referrals_count = totals['count']
+            points_from_referrals = totals['points']
         except:
+            referrals_count = 0
             points_from_referrals = 0
     
     base_syp = 1 * exchange_rate
@@ -303,12 +305,12 @@ async def show_referral_button(callback: types.CallbackQuery, db_pool):
 
 # ========== قائمة استرداد النقاط ==========
 @router.callback_query(F.data == "redeem_points_menu")
-async def redeem_points_menu(callback: types.CallbackQuery, db_pool):
+async def redeem_points_menu(callback: types.CallbackQuery, db_pool, settings: SettingsSnapshot):
     """قائمة استرداد النقاط"""
     
     # 1. جلب البيانات أولاً قبل الرد على الـ callback
     points = await get_cached_user_points(db_pool, callback.from_user.id)
-    redemption_rate = await get_redemption_rate(db_pool)
+    redemption_rate = settings.redemption_rate
     
     # 2. التحقق من النقاط
     if points < redemption_rate:
@@ -321,7 +323,7 @@ async def redeem_points_menu(callback: types.CallbackQuery, db_pool):
     # 3. إذا كانت نقاطه كافية، "نطفي" الزر ونكمل العمل
     await callback.answer()
     
-    exchange_rate = await get_exchange_rate(db_pool)
+    exchange_rate = settings.usd_to_syp
     base_syp = 1 * exchange_rate
     max_redemptions = min(points // redemption_rate, 20)
     
@@ -397,8 +399,9 @@ async def process_redeem_from_menu(callback: types.CallbackQuery, db_pool):
                 f"📋 رقم الطلب: #{request_id}"
             )
             
+            # إشعار المشرفين في الخلفية (لا ينتظره المستخدم)
             from .start import notify_admins
-            await notify_admins(
+            run_in_background(notify_admins(
                 callback.bot,
                 f"🆕 **طلب استرداد نقاط جديد**\n\n"
                 f"👤 المستخدم: @{callback.from_user.username or 'غير معروف'}\n"
@@ -408,7 +411,7 @@ async def process_redeem_from_menu(callback: types.CallbackQuery, db_pool):
                 f"💵 سعر الصرف: {exchange_rate:.0f} ل.س\n"
                 f"🕐 وقت الطلب: {current_time} (دمشق)\n"
                 f"📋 رقم الطلب: #{request_id}"
-            )
+            ), name='notify_admins')
             
             builder = InlineKeyboardBuilder()
             builder.row(types.InlineKeyboardButton(
@@ -429,7 +432,7 @@ async def back_to_account(callback: types.CallbackQuery, db_pool):
 
 # ========== رصيد النقاط ==========
 @router.callback_query(F.data == "show_points_balance")
-async def show_points_balance(callback: types.CallbackQuery, db_pool):
+async def show_points_balance(callback: types.CallbackQuery, db_pool, settings: SettingsSnapshot):
     """عرض رصيد النقاط وتفاصيله"""
     # ✅ إطفاء الزر فوراً
     await callback.answer()
@@ -442,8 +445,8 @@ async def show_points_balance(callback: types.CallbackQuery, db_pool):
     points_from_orders = points_stats['from_orders']
     points_redeemed = points_stats['redeemed']
     
-    exchange_rate = await get_exchange_rate(db_pool)
-    redemption_rate = await get_redemption_rate(db_pool)
+    exchange_rate = settings.usd_to_syp
+    redemption_rate = settings.redemption_rate
     
     points_value_usd = (current_points / redemption_rate) if redemption_rate > 0 else 0
     points_value_syp = points_value_usd * exchange_rate
@@ -473,36 +476,21 @@ async def show_points_balance(callback: types.CallbackQuery, db_pool):
 # ========== سجل العمليات ==========
 @router.callback_query(F.data == "transactions_history")
 async def transactions_history(callback: types.CallbackQuery, db_pool):
-    """عرض سجل العمليات (آخر 3 شحن + آخر 3 شراء)"""
+    """عرض سجل العمليات (آخر حركات الرصيد من wallet_ledger)"""
     # ✅ إطفاء الزر فوراً
     await callback.answer()
     
     user_id = callback.from_user.id
     
-    async with db_pool.acquire() as conn:
-        deposits = await conn.fetch('''
-            SELECT amount_syp, status, created_at
-            FROM deposit_requests 
-            WHERE user_id = $1 
-            ORDER BY created_at DESC 
-            LIMIT 3
-        ''', user_id)
-        
-        orders = await conn.fetch('''
-            SELECT o.total_amount_syp, a.name as app_name, o.status, o.created_at
-            FROM orders o
-            JOIN applications a ON o.app_id = a.id
-            WHERE o.user_id = $1 
-            ORDER BY o.created_at DESC 
-            LIMIT 3
-        ''', user_id)
-        
-        # ✅ استخدام الكاش للإحصائيات
-        operations_stats = await get_cached_user_operations(db_pool, user_id)
-        deposits_count = operations_stats['deposits_count']
-        orders_count = operations_stats['orders_count']
-        deposits_total = operations_stats['deposits_total']
-        orders_total = operations_stats['orders_total']
+    # مدى محدود من فهرس (user_id, id) بدلاً من دمج جداول الشحن والطلبات
+    entries = await get_wallet_history(db_pool, user_id, limit=8)
+    
+    # ✅ استخدام الكاش للإحصائيات
+    operations_stats = await get_cached_user_operations(db_pool, user_id)
+    deposits_count = operations_stats['deposits_count']
+    orders_count = operations_stats['orders_count']
+    deposits_total = operations_stats['deposits_total']
+    orders_total = operations_stats['orders_total']
     
     # ✅ استخدام HTML بدلاً من Markdown
     text = (
@@ -512,25 +500,20 @@ async def transactions_history(callback: types.CallbackQuery, db_pool):
         f"🛒 إجمالي الشراء: {orders_count} عملية | {orders_total:,.0f} ل.س\n\n"
     )
     
-    if deposits:
-        text += "<b>🟢 آخر عمليات الشحن:</b>\n"
-        for d in deposits:
-            status_icon = "✅" if d['status'] == 'approved' else "⏳" if d['status'] == 'pending' else "❌"
-            date = format_datetime(d['created_at'], "%Y-%m-%d %H:%M")
-            text += f"{status_icon} {d['amount_syp']:,.0f} ل.س - {date}\n"
-    else:
-        text += "<b>🟢 آخر عمليات الشحن:</b>\nلا توجد عمليات شحن بعد.\n"
-    
-    text += "\n"
-    
-    if orders:
-        text += "<b>🔵 آخر عمليات الشراء:</b>\n"
-        for o in orders:
-            status_icon = "✅" if o['status'] == 'completed' else "⏳" if o['status'] == 'pending' else "❌"
-            date = format_datetime(o['created_at'], "%Y-%m-%d %H:%M")
-            text += f"{status_icon} {o['app_name']} - {o['total_amount_syp']:,.0f} ل.س - {date}\n"
+    text += "<b>📒 آخر حركات الرصيد:</b>\n"
+    if entries:
+        for entry in entries:
+            icon = "🟢" if entry['delta'] > 0 else "🔵"
+            label = LEDGER_REASONS.get(entry['reason'], entry['reason'])
+            if entry['app_name']:
+                label = f"{label} - {entry['app_name']}"
+            date = format_datetime(entry['created_at'], "%Y-%m-%d %H:%M")
+            text += (
+                f"{icon} {label}: {entry['delta']:+,.0f} ل.س "
+                f"(الرصيد {entry['balance_after']:,.0f}) - {date}\n"
+            )
     else:
-        text += "<b>🔵 آخر عمليات الشراء:</b>\nلا توجد عمليات شراء بعد.\n"
+        text += "لا توجد عمليات بعد.\n"
     
     builder = InlineKeyboardBuilder()
     builder.row(types.InlineKeyboardButton(text="🔙 رجوع للحساب", callback_data="back_to_account"))
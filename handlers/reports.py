@@ -16,10 +16,12 @@ from io import BytesIO
 from config import ADMIN_ID, MODERATORS
 from handlers.time_utils import format_damascus_time, get_damascus_time_now
 from handlers.keyboards import get_back_inline_keyboard
-from database.stats import get_report_settings, update_report_setting
+from database.stats import get_report_settings, update_report_setting, get_profits_by_app
 from database.core import get_exchange_rate
+from database.metrics import refresh_daily_metrics, get_metrics_totals
 from utils import is_admin
 from cache import cached, clear_cache  # ✅ استيراد الكاش
+from telegram_gateway import send_document_to_many
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -28,9 +30,13 @@ class ReportStates(StatesGroup):
     waiting_report_period = State()
     waiting_report_time = State()
 
-# ✅ كاش لتقارير الأرباح (لمدة 5 دقائق لأنها ثقيلة)
-_profits_report_cache = {}
-_profits_report_cache_time = {}
+# ✅ فترات تقرير الأرباح (عدد الأيام، None = كل الفترة)
+PROFITS_PERIODS = {
+    'day': (0, "اليوم"),
+    'week': (6, "آخر 7 أيام"),
+    'month': (29, "آخر 30 يوم"),
+    'all': (None, "كل الفترة"),
+}
 
 @cached(ttl=120, key_prefix="report_settings")
 async def get_cached_report_settings(db_pool):
@@ -57,6 +63,9 @@ async def generate_excel_report(db_pool, period='all'):
     try:
         output = BytesIO()
         
+        # ✅ تحديث جدول الإحصائيات اليومية قبل قراءة الملخص
+        await refresh_daily_metrics(db_pool, max_age=60)
+        
         async with db_pool.acquire() as conn:
             # ضبط المنطقة الزمنية
             await conn.execute("SET TIMEZONE TO 'Asia/Damascus'")
@@ -84,7 +93,7 @@ async def generate_excel_report(db_pool, period='all'):
                 FROM deposit_requests 
             '''
             if period == 'day':
-                deposits_query += " WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE"
+                deposits_query += " WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1"
             deposits_query += " ORDER BY created_at DESC"
             deposits_df = pd.DataFrame(await conn.fetch(deposits_query))
             
@@ -101,7 +110,7 @@ async def generate_excel_report(db_pool, period='all'):
                 LEFT JOIN applications a ON o.app_id = a.id
             '''
             if period == 'day':
-                orders_query += " WHERE DATE(o.created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE"
+                orders_query += " WHERE o.created_at >= CURRENT_DATE AND o.created_at < CURRENT_DATE + 1"
             orders_query += " ORDER BY o.created_at DESC"
             orders_df = pd.DataFrame(await conn.fetch(orders_query))
             
@@ -113,7 +122,7 @@ async def generate_excel_report(db_pool, period='all'):
                 FROM points_history 
             '''
             if period == 'day':
-                points_query += " WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE"
+                points_query += " WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1"
             points_query += " ORDER BY created_at DESC LIMIT 1000"
             points_df = pd.DataFrame(await conn.fetch(points_query))
             
@@ -126,88 +135,89 @@ async def generate_excel_report(db_pool, period='all'):
                 FROM redemption_requests 
             '''
             if period == 'day':
-                redemptions_query += " WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE"
+                redemptions_query += " WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1"
             redemptions_query += " ORDER BY created_at DESC"
             redemptions_df = pd.DataFrame(await conn.fetch(redemptions_query))
             
-            # 6. إحصائيات عامة
-            if period == 'day':
-                stats = await conn.fetchrow('''
-                    SELECT 
-                        (SELECT COUNT(*) FROM users) as total_users,
-                        (SELECT COUNT(*) FROM users WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as new_users_today,
-                        (SELECT COALESCE(SUM(balance), 0) FROM users) as total_balance,
-                        (SELECT COALESCE(SUM(total_points), 0) FROM users) as total_points,
-                        (SELECT COUNT(*) FROM deposit_requests WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as total_deposits,
-                        (SELECT COALESCE(SUM(amount_syp), 0) FROM deposit_requests WHERE status = 'approved' AND DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as total_deposit_amount,
-                        (SELECT COUNT(*) FROM orders WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as total_orders,
-                        (SELECT COALESCE(SUM(total_amount_syp), 0) FROM orders WHERE status = 'completed' AND DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as total_order_amount,
-                        (SELECT COALESCE(SUM(points_earned), 0) FROM orders WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as total_points_given
-                ''')
-            else:
-                stats = await conn.fetchrow('''
-                    SELECT 
-                        (SELECT COUNT(*) FROM users) as total_users,
-                        (SELECT COUNT(*) FROM users WHERE DATE(created_at AT TIME ZONE 'Asia/Damascus') = CURRENT_DATE) as new_users_today,
-                        (SELECT COALESCE(SUM(balance), 0) FROM users) as total_balance,
-                        (SELECT COALESCE(SUM(total_points), 0) FROM users) as total_points,
-                        (SELECT COUNT(*) FROM deposit_requests) as total_deposits,
-                        (SELECT COALESCE(SUM(amount_syp), 0) FROM deposit_requests WHERE status = 'approved') as total_deposit_amount,
-                        (SELECT COUNT(*) FROM orders) as total_orders,
-                        (SELECT COALESCE(SUM(total_amount_syp), 0) FROM orders WHERE status = 'completed') as total_order_amount,
-                        (SELECT COALESCE(SUM(points_earned), 0) FROM orders) as total_points_given
-                ''')
-            
-            # إزالة المنطقة الزمنية من جميع البيانات
-            users_df = remove_timezone_from_df(users_df)
-            deposits_df = remove_timezone_from_df(deposits_df)
-            orders_df = remove_timezone_from_df(orders_df)
-            points_df = remove_timezone_from_df(points_df)
-            redemptions_df = remove_timezone_from_df(redemptions_df)
-            
-            # إنشاء ملف Excel
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                # ملخص عام
-                if stats:
-                    summary_data = {
-                        'البيان': [
-                            'إجمالي المستخدمين',
-                            'مستخدمين جدد اليوم',
-                            'إجمالي الأرصدة',
-                            'إجمالي النقاط',
-                            'إجمالي الإيداعات',
-                            'قيمة الإيداعات (ل.س)',
-                            'إجمالي الطلبات',
-                            'قيمة الطلبات (ل.س)',
-                            'نقاط ممنوحة'
-                        ],
-                        'القيمة': [
-                            stats['total_users'],
-                            stats['new_users_today'],
-                            f"{stats['total_balance']:,.0f} ل.س" if stats['total_balance'] else "0 ل.س",
-                            stats['total_points'] or 0,
-                            stats['total_deposits'] or 0,
-                            f"{stats['total_deposit_amount']:,.0f} ل.س" if stats['total_deposit_amount'] else "0 ل.س",
-                            stats['total_orders'] or 0,
-                            f"{stats['total_order_amount']:,.0f} ل.س" if stats['total_order_amount'] else "0 ل.س",
-                            stats['total_points_given'] or 0
-                        ]
-                    }
-                    summary_df = pd.DataFrame(summary_data)
-                    summary_df.to_excel(writer, sheet_name='ملخص عام', index=False)
-                
-                # باقي الأوراق
-                if not users_df.empty:
-                    users_df.to_excel(writer, sheet_name='المستخدمين', index=False)
-                if not deposits_df.empty:
-                    deposits_df.to_excel(writer, sheet_name='الإيداعات', index=False)
-                if not orders_df.empty:
-                    orders_df.to_excel(writer, sheet_name='الطلبات', index=False)
-                if not points_df.empty:
-                    points_df.to_excel(writer, sheet_name='النقاط', index=False)
-                if not redemptions_df.empty:
-                    redemptions_df.to_excel(writer, sheet_name='استرداد النقاط', index=False)
+            # 6. إحصائيات عامة (العدادات من جدول daily_metrics)
+            state = await conn.fetchrow('''
+                SELECT 
+                    COUNT(*) as total_users,
+                    COALESCE(SUM(balance), 0) as total_balance,
+                    COALESCE(SUM(total_points), 0) as total_points
+                FROM users
+            ''')
+        
+        today = get_damascus_time_now().date()
+        if period == 'day':
+            totals = await get_metrics_totals(db_pool, today, today)
+            today_totals = totals
+        else:
+            totals = await get_metrics_totals(db_pool)
+            today_totals = await get_metrics_totals(db_pool, today, today)
+        
+        stats = {
+            'total_users': state['total_users'] if state else 0,
+            'new_users_today': today_totals['new_users'],
+            'total_balance': state['total_balance'] if state else 0,
+            'total_points': state['total_points'] if state else 0,
+            'total_deposits': totals['deposits_count'],
+            'total_deposit_amount': totals['deposits_amount_syp'],
+            'total_orders': totals['orders_count'],
+            'total_order_amount': totals['revenue_syp'],
+            'total_points_given': totals['order_points']
+        }
+        
+        # إزالة المنطقة الزمنية من جميع البيانات
+        users_df = remove_timezone_from_df(users_df)
+        deposits_df = remove_timezone_from_df(deposits_df)
+        orders_df = remove_timezone_from_df(orders_df)
+        points_df = remove_timezone_from_df(points_df)
+        redemptions_df = remove_timezone_from_df(redemptions_df)
+        
+        # إنشاء ملف Excel
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            # ملخص عام
+            if stats:
+                summary_data = {
+                    'البيان': [
+                        'إجمالي المستخدمين',
+                        'مستخدمين جدد اليوم',
+                        'إجمالي الأرصدة',
+                        'إجمالي النقاط',
+                        'إجمالي الإيداعات',
+                        'قيمة الإيداعات (ل.س)',
+                        'إجمالي الطلبات',
+                        'قيمة الطلبات (ل.س)',
+                        'نقاط ممنوحة'
+                    ],
+                    'القيمة': [
+                        stats['total_users'],
+                        stats['new_users_today'],
+                        f"{stats['total_balance']:,.0f} ل.س" if stats['total_balance'] else "0 ل.س",
+                        stats['total_points'] or 0,
+                        stats['total_deposits'] or 0,
+                        f"{stats['total_deposit_amount']:,.0f} ل.س" if stats['total_deposit_amount'] else "0 ل.س",
+                        stats['total_orders'] or 0,
+                        f"{stats['total_order_amount']:,.0f} ل.س" if stats['total_order_amount'] else "0 ل.س",
+                        stats['total_points_given'] or 0
+                    ]
+                }
+                summary_df = pd.DataFrame(summary_data)
+                summary_df.to_excel(writer, sheet_name='ملخص عام', index=False)
             
+            # باقي الأوراق
+            if not users_df.empty:
+                users_df.to_excel(writer, sheet_name='المستخدمين', index=False)
+            if not deposits_df.empty:
+                deposits_df.to_excel(writer, sheet_name='الإيداعات', index=False)
+            if not orders_df.empty:
+                orders_df.to_excel(writer, sheet_name='الطلبات', index=False)
+            if not points_df.empty:
+                points_df.to_excel(writer, sheet_name='النقاط', index=False)
+            if not redemptions_df.empty:
+                redemptions_df.to_excel(writer, sheet_name='استرداد النقاط', index=False)
+        
         output.seek(0)
         return output
         
@@ -240,23 +250,17 @@ async def send_daily_report(bot: Bot, db_pool):
             
             today = get_damascus_time_now().strftime('%Y-%m-%d')
             
-            for admin_id in recipients:
-                if admin_id:
-                    try:
-                        file = types.BufferedInputFile(
-                            file=excel_file.getvalue(),
-                            filename=f'report_{today}.xlsx'
-                        )
-                        
-                        await bot.send_document(
-                            chat_id=admin_id,
-                            document=file,
-                            caption=f"📊 **التقرير اليومي - {today}**\n\n"
-                                   f"✅ تم توليد التقرير بنجاح\n"
-                                   f"⏰ وقت الإرسال: {get_damascus_time_now().strftime('%H:%M:%S')}"
-                        )
-                    except Exception as e:
-                        logger.error(f"❌ فشل إرسال التقرير للمشرف {admin_id}: {e}")
+            # رفع الملف مرة واحدة ثم الإرسال للباقين بـ file_id (بالتوازي، بأولوية البث)
+            sent_count = await send_document_to_many(
+                bot,
+                recipients,
+                types.BufferedInputFile(file=excel_file.getvalue(), filename=f'report_{today}.xlsx'),
+                priority='bulk',
+                caption=f"📊 **التقرير اليومي - {today}**\n\n"
+                        f"✅ تم توليد التقرير بنجاح\n"
+                        f"⏰ وقت الإرسال: {get_damascus_time_now().strftime('%H:%M:%S')}"
+            )
+            logger.info(f"📊 تم إرسال التقرير اليومي لـ {sent_count} من {len(recipients)} مشرف")
     except Exception as e:
         logger.error(f"❌ خطأ في إرسال التقرير اليومي: {e}")
 
@@ -363,177 +367,140 @@ async def daily_report(callback: types.CallbackQuery, db_pool):
         await callback.message.edit_text(f"❌ خطأ: {str(e)}")
 
 @router.callback_query(F.data == "profits_report")
+async def profits_report_menu(callback: types.CallbackQuery):
+    """اختيار فترة تقرير الأرباح"""
+    if not is_admin(callback.from_user.id):
+        return await callback.answer("غير مصرح", show_alert=True)
+    
+    # ✅ إطفاء الزر فوراً
+    await callback.answer()
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        types.InlineKeyboardButton(text="📅 اليوم", callback_data="profits_report_day"),
+        types.InlineKeyboardButton(text="🗓 آخر 7 أيام", callback_data="profits_report_week")
+    )
+    builder.row(
+        types.InlineKeyboardButton(text="📆 آخر 30 يوم", callback_data="profits_report_month"),
+        types.InlineKeyboardButton(text="♾ كل الفترة", callback_data="profits_report_all")
+    )
+    builder.row(types.InlineKeyboardButton(text="🔙 رجوع", callback_data="reports_menu"))
+    
+    await callback.message.edit_text(
+        "💰 **تقرير الأرباح**\n\n"
+        "اختر الفترة المطلوبة:",
+        reply_markup=builder.as_markup()
+    )
+
+@router.callback_query(F.data.startswith("profits_report_"))
 async def profits_report(callback: types.CallbackQuery, db_pool):
     """تقرير الأرباح المفصل لكل تطبيق مع إجماليات (كملف)"""
     if not is_admin(callback.from_user.id):
         return await callback.answer("غير مصرح", show_alert=True)
     
+    period = callback.data.replace("profits_report_", "")
+    if period not in PROFITS_PERIODS:
+        return await callback.answer("فترة غير معروفة", show_alert=True)
+    
     # ✅ إطفاء الزر فوراً
     await callback.answer()
     
     await callback.message.edit_text("⏳ جاري حساب الأرباح...")
     
+    days, period_label = PROFITS_PERIODS[period]
+    end_date = get_damascus_time_now().date()
+    start_date = end_date - timedelta(days=days) if days is not None else None
+    if days is None:
+        end_date = None
+    
     exchange_rate = await get_exchange_rate(db_pool)
     
-    async with db_pool.acquire() as conn:
-        # نجيب كل الطلبات المكتملة
-        orders = await conn.fetch('''
-            SELECT 
-                o.id,
-                o.quantity,
-                o.total_amount_syp as final_price_syp,
-                o.total_amount_syp / $1 as final_price_usd,
-                -- سعر المورد حسب نوع الطلب
-                CASE 
-                    WHEN o.variant_id IS NOT NULL THEN 
-                        (SELECT price_usd FROM product_options WHERE id = o.variant_id)
-                    ELSE 
-                        a.unit_price_usd * o.quantity
-                END as supplier_total_usd,
-                a.profit_percentage as app_profit_percent,
-                a.name as app_name,
-                u.vip_level,
-                u.discount_percent as user_discount
-            FROM orders o
-            JOIN applications a ON o.app_id = a.id
-            JOIN users u ON o.user_id = u.user_id
-            WHERE o.status = 'completed'
-            ORDER BY a.name, o.created_at DESC
-        ''', exchange_rate)
-        
-        if not orders:
-            await callback.message.edit_text("📊 لا توجد مبيعات مكتملة بعد.")
-            return
-        
-        # هيكل البيانات لكل تطبيق
-        apps_data = {}
-        
-        # متغيرات للإجماليات الكلية
-        total_all_revenue_usd = 0
-        total_all_supplier_usd = 0
-        total_all_profit_before_discount_usd = 0
-        total_all_profit_after_discount_usd = 0
-        total_all_discount_usd = 0
-        
-        for order in orders:
-            app_name = order['app_name']
-            final_price_usd = float(order['final_price_usd'] or 0)
-            supplier_total_usd = float(order['supplier_total_usd'] or 0)
-            app_profit_percent = float(order['app_profit_percent'] or 0)
-            user_discount = float(order['user_discount'] or 0)
-            
-            # السعر بعد الربح (قبل الخصم)
-            price_after_profit_usd = supplier_total_usd * (1 + app_profit_percent / 100)
-            
-            # الخصم
-            discount_usd = price_after_profit_usd * (user_discount / 100)
-            
-            # الربح قبل الخصم
-            profit_before_discount_usd = price_after_profit_usd - supplier_total_usd
-            
-            # الربح بعد الخصم
-            profit_after_discount_usd = (price_after_profit_usd - discount_usd) - supplier_total_usd
-            
-            # إذا التطبيق جديد في القاموس
-            if app_name not in apps_data:
-                apps_data[app_name] = {
-                    'orders_count': 0,
-                    'revenue_usd': 0,
-                    'supplier_usd': 0,
-                    'profit_before_usd': 0,
-                    'profit_after_usd': 0,
-                    'discount_usd': 0,
-                    'profit_percent': app_profit_percent
-                }
-            
-            # تحديث إحصائيات التطبيق
-            apps_data[app_name]['orders_count'] += 1
-            apps_data[app_name]['revenue_usd'] += final_price_usd
-            apps_data[app_name]['supplier_usd'] += supplier_total_usd
-            apps_data[app_name]['profit_before_usd'] += profit_before_discount_usd
-            apps_data[app_name]['profit_after_usd'] += profit_after_discount_usd
-            apps_data[app_name]['discount_usd'] += discount_usd
-            
-            # تحديث الإجماليات الكلية
-            total_all_revenue_usd += final_price_usd
-            total_all_supplier_usd += supplier_total_usd
-            total_all_profit_before_discount_usd += profit_before_discount_usd
-            total_all_profit_after_discount_usd += profit_after_discount_usd
-            total_all_discount_usd += discount_usd
-        
-        # بناء التقرير
-        report_lines = []
-        report_lines.append("=" * 60)
-        report_lines.append("📊 تقرير الأرباح التفصيلي")
-        report_lines.append(f"💵 سعر الصرف: {exchange_rate:,.0f} ل.س = 1$")
-        report_lines.append(f"📅 التاريخ: {get_damascus_time_now().strftime('%Y-%m-%d %H:%M')}")
-        report_lines.append("=" * 60)
-        report_lines.append("")
-        
-        # تفاصيل كل تطبيق
-        report_lines.append("📱 تفاصيل التطبيقات:")
-        report_lines.append("-" * 60)
-        
-        for app_name, data in apps_data.items():
-            revenue_syp = data['revenue_usd'] * exchange_rate
-            supplier_syp = data['supplier_usd'] * exchange_rate
-            profit_before_syp = data['profit_before_usd'] * exchange_rate
-            profit_after_syp = data['profit_after_usd'] * exchange_rate
-            discount_syp = data['discount_usd'] * exchange_rate
-            
-            profit_margin = (data['profit_after_usd'] / data['revenue_usd'] * 100) if data['revenue_usd'] > 0 else 0
-            
-            report_lines.append(f"🔸 {app_name}")
-            report_lines.append(f"   • عدد الطلبات: {data['orders_count']}")
-            report_lines.append(f"   • نسبة ربح التطبيق: {data['profit_percent']}%")
-            report_lines.append(f"   • الإيرادات: ${data['revenue_usd']:,.2f} ({revenue_syp:,.0f} ل.س)")
-            report_lines.append(f"   • سعر المورد: ${data['supplier_usd']:,.2f} ({supplier_syp:,.0f} ل.س)")
-            report_lines.append(f"   • الخصم الممنوح: ${data['discount_usd']:,.2f} ({discount_syp:,.0f} ل.س)")
-            report_lines.append(f"   • الربح قبل الخصم: ${data['profit_before_usd']:,.2f} ({profit_before_syp:,.0f} ل.س)")
-            report_lines.append(f"   • الربح بعد الخصم: ${data['profit_after_usd']:,.2f} ({profit_after_syp:,.0f} ل.س) (نسبة {profit_margin:.1f}%)")
-            report_lines.append("")
-        
-        # الإجماليات الكلية
-        report_lines.append("=" * 60)
-        report_lines.append("📈 الإجماليات الكلية:")
-        report_lines.append("-" * 60)
-        
-        total_revenue_syp = total_all_revenue_usd * exchange_rate
-        total_supplier_syp = total_all_supplier_usd * exchange_rate
-        total_profit_before_syp = total_all_profit_before_discount_usd * exchange_rate
-        total_profit_after_syp = total_all_profit_after_discount_usd * exchange_rate
-        total_discount_syp = total_all_discount_usd * exchange_rate
+    # ✅ التجميع يتم في قاعدة البيانات ويُعاد من الكاش ما لم تكتمل طلبات جديدة
+    apps_data = await get_profits_by_app(db_pool, exchange_rate, start_date, end_date)
+    
+    if apps_data is None:
+        await callback.message.edit_text("❌ فشل في حساب الأرباح")
+        return
+    
+    if not apps_data:
+        await callback.message.edit_text(f"📊 لا توجد مبيعات مكتملة ({period_label}).")
+        return
+    
+    total_all_revenue_usd = sum(app['revenue_usd'] for app in apps_data)
+    total_all_supplier_usd = sum(app['supplier_usd'] for app in apps_data)
+    total_all_profit_before_discount_usd = sum(app['profit_before_usd'] for app in apps_data)
+    total_all_profit_after_discount_usd = sum(app['profit_after_usd'] for app in apps_data)
+    total_all_discount_usd = sum(app['discount_usd'] for app in apps_data)
+    
+    # بناء التقرير
+    report_lines = []
+    report_lines.append("=" * 60)
+    report_lines.append("📊 تقرير الأرباح التفصيلي")
+    report_lines.append(f"🗓 الفترة: {period_label}")
+    report_lines.append(f"💵 سعر الصرف: {exchange_rate:,.0f} ل.س = 1$")
+    report_lines.append(f"📅 التاريخ: {get_damascus_time_now().strftime('%Y-%m-%d %H:%M')}")
+    report_lines.append("=" * 60)
+    report_lines.append("")
+    
+    # تفاصيل كل تطبيق
+    report_lines.append("📱 تفاصيل التطبيقات:")
+    report_lines.append("-" * 60)
+    
+    for data in apps_data:
+        revenue_syp = data['revenue_usd'] * exchange_rate
+        supplier_syp = data['supplier_usd'] * exchange_rate
+        profit_before_syp = data['profit_before_usd'] * exchange_rate
+        profit_after_syp = data['profit_after_usd'] * exchange_rate
+        discount_syp = data['discount_usd'] * exchange_rate
         
-        total_profit_margin = (total_all_profit_after_discount_usd / total_all_revenue_usd * 100) if total_all_revenue_usd > 0 else 0
-        total_discount_percent = (total_all_discount_usd / (total_all_supplier_usd + total_all_profit_before_discount_usd) * 100) if (total_all_supplier_usd + total_all_profit_before_discount_usd) > 0 else 0
+        profit_margin = (data['profit_after_usd'] / data['revenue_usd'] * 100) if data['revenue_usd'] > 0 else 0
         
-        report_lines.append(f"💰 إجمالي الإيرادات: ${total_all_revenue_usd:,.2f} ({total_revenue_syp:,.0f} ل.س)")
-        report_lines.append(f"📦 إجمالي سعر المورد: ${total_all_supplier_usd:,.2f} ({total_supplier_syp:,.0f} ل.س)")
-        report_lines.append(f"🎁 إجمالي الخصم: ${total_all_discount_usd:,.2f} ({total_discount_syp:,.0f} ل.س) (نسبة {total_discount_percent:.1f}%)")
-        report_lines.append(f"💎 إجمالي الربح قبل الخصم: ${total_all_profit_before_discount_usd:,.2f} ({total_profit_before_syp:,.0f} ل.س)")
-        report_lines.append(f"✅ إجمالي الربح بعد الخصم: ${total_all_profit_after_discount_usd:,.2f} ({total_profit_after_syp:,.0f} ل.س)")
-        report_lines.append(f"📊 هامش الربح الإجمالي: {total_profit_margin:.1f}%")
-        report_lines.append("=" * 60)
+        report_lines.append(f"🔸 {data['app_name']}")
+        report_lines.append(f"   • عدد الطلبات: {data['orders_count']}")
+        report_lines.append(f"   • نسبة ربح التطبيق: {data['profit_percent']}%")
+        report_lines.append(f"   • الإيرادات: ${data['revenue_usd']:,.2f} ({revenue_syp:,.0f} ل.س)")
+        report_lines.append(f"   • سعر المورد: ${data['supplier_usd']:,.2f} ({supplier_syp:,.0f} ل.س)")
+        report_lines.append(f"   • الخصم الممنوح: ${data['discount_usd']:,.2f} ({discount_syp:,.0f} ل.س)")
+        report_lines.append(f"   • الربح قبل الخصم: ${data['profit_before_usd']:,.2f} ({profit_before_syp:,.0f} ل.س)")
+        report_lines.append(f"   • الربح بعد الخصم: ${data['profit_after_usd']:,.2f} ({profit_after_syp:,.0f} ل.س) (نسبة {profit_margin:.1f}%)")
         report_lines.append("")
-        report_lines.append("✨ التقرير من إعداد LINK BOT")
-        
-        # تحويل النص لملف
-        report_text = "\n".join(report_lines)
-        
-        from io import BytesIO
-        file = BytesIO()
-        file.write(report_text.encode('utf-8'))
-        file.seek(0)
-        
-        filename = f"profits_report_{get_damascus_time_now().strftime('%Y-%m-%d_%H-%M')}.txt"
-        
-        await callback.message.answer_document(
-            types.BufferedInputFile(
-                file=file.getvalue(),
-                filename=filename
-            ),
-            caption="✅ تم إنشاء تقرير الأرباح المفصل"
-        )
+    
+    # الإجماليات الكلية
+    report_lines.append("=" * 60)
+    report_lines.append("📈 الإجماليات الكلية:")
+    report_lines.append("-" * 60)
+    
+    total_revenue_syp = total_all_revenue_usd * exchange_rate
+    total_supplier_syp = total_all_supplier_usd * exchange_rate
+    total_profit_before_syp = total_all_profit_before_discount_usd * exchange_rate
+    total_profit_after_syp = total_all_profit_after_discount_usd * exchange_rate
+    total_discount_syp = total_all_discount_usd * exchange_rate
+    
+    total_profit_margin = (total_all_profit_after_discount_usd / total_all_revenue_usd * 100) if total_all_revenue_usd > 0 else 0
+    total_discount_percent = (total_all_discount_usd / (total_all_supplier_usd + total_all_profit_before_discount_usd) * 100) if (total_all_supplier_usd + total_all_profit_before_discount_usd) > 0 else 0
+    
+    report_lines.append(f"💰 إجمالي الإيرادات: ${total_all_revenue_usd:,.2f} ({total_revenue_syp:,.0f} ل.س)")
+    report_lines.append(f"📦 إجمالي سعر المورد: ${total_all_supplier_usd:,.2f} ({total_supplier_syp:,.0f} ل.س)")
+    report_lines.append(f"🎁 إجمالي الخصم: ${total_all_discount_usd:,.2f} ({total_discount_syp:,.0f} ل.س) (نسبة {total_discount_percent:.1f}%)")
+    report_lines.append(f"💎 إجمالي الربح قبل الخصم: ${total_all_profit_before_discount_usd:,.2f} ({total_profit_before_syp:,.0f} ل.س)")
+    report_lines.append(f"✅ إجمالي الربح بعد الخصم: ${total_all_profit_after_discount_usd:,.2f} ({total_profit_after_syp:,.0f} ل.س)")
+    report_lines.append(f"📊 هامش الربح الإجمالي: {total_profit_margin:.1f}%")
+    report_lines.append("=" * 60)
+    report_lines.append("")
+    report_lines.append("✨ التقرير من إعداد LINK BOT")
+    
+    # تحويل النص لملف
+    report_text = "\n".join(report_lines)
+    
+    filename = f"profits_report_{period}_{get_damascus_time_now().strftime('%Y-%m-%d_%H-%M')}.txt"
+    
+    await callback.message.answer_document(
+        types.BufferedInputFile(
+            file=report_text.encode('utf-8'),
+            filename=filename
+        ),
+        caption=f"✅ تم إنشاء تقرير الأرباح المفصل ({period_label})"
+    )
 
 @router.callback_query(F.data == "users_report")
 async def users_report(callback: types.CallbackQuery, db_pool):
@@ -544,6 +511,10 @@ async def users_report(callback: types.CallbackQuery, db_pool):
     # ✅ إطفاء الزر فوراً
     await callback.answer()
     
+    await refresh_daily_metrics(db_pool, max_age=60)
+    today = get_damascus_time_now().date()
+    today_totals = await get_metrics_totals(db_pool, today, today)
+    
     async with db_pool.acquire() as conn:
         users_stats = await conn.fetchrow('''
             SELECT 
@@ -551,8 +522,7 @@ async def users_report(callback: types.CallbackQuery, db_pool):
                 COUNT(CASE WHEN is_banned THEN 1 END) as banned_users,
                 COUNT(CASE WHEN vip_level > 0 THEN 1 END) as vip_users,
                 COALESCE(AVG(balance), 0) as avg_balance,
-                COALESCE(SUM(balance), 0) as total_balance,
-                COUNT(CASE WHEN DATE(created_at) = CURRENT_DATE THEN 1 END) as new_today
+                COALESCE(SUM(balance), 0) as total_balance
             FROM users
         ''')
         
@@ -568,7 +538,7 @@ async def users_report(callback: types.CallbackQuery, db_pool):
         f"👥 **تقرير المستخدمين**\n\n"
         f"📊 **إحصائيات:**\n"
         f"• إجمالي المستخدمين: {users_stats['total_users']}\n"
-        f"• مستخدمين جدد اليوم: {users_stats['new_today']}\n"
+        f"• مستخدمين جدد اليوم: {today_totals['new_users']}\n"
         f"• المحظورين: {users_stats['banned_users']}\n"
         f"• أعضاء VIP: {users_stats['vip_users']}\n"
         f"• متوسط الرصيد: {users_stats['avg_balance']:,.0f} ل.س\n"
@@ -625,6 +595,10 @@ async def points_report(callback: types.CallbackQuery, db_pool):
     # ✅ إطفاء الزر فوراً
     await callback.answer()
     
+    # ✅ عمليات الاسترداد من جدول daily_metrics، ومجاميع النقاط من جدول المستخدمين
+    await refresh_daily_metrics(db_pool, max_age=60)
+    totals = await get_metrics_totals(db_pool)
+    
     async with db_pool.acquire() as conn:
         points_stats = await conn.fetchrow('''
             SELECT 
@@ -634,14 +608,6 @@ async def points_report(callback: types.CallbackQuery, db_pool):
                 COUNT(CASE WHEN total_points > 0 THEN 1 END) as users_with_points
             FROM users
         ''')
-        
-        redemptions = await conn.fetchrow('''
-            SELECT 
-                COUNT(*) as redemption_count,
-                COALESCE(SUM(amount_syp), 0) as total_redemption_value
-            FROM redemption_requests
-            WHERE status = 'approved'
-        ''')
     
     text = (
         f"⭐ **تقرير النقاط**\n\n"
@@ -651,8 +617,8 @@ async def points_report(callback: types.CallbackQuery, db_pool):
         f"• نقاط مستردة: {points_stats['total_redeemed']}\n"
         f"• مستخدمين لديهم نقاط: {points_stats['users_with_points']}\n\n"
         f"💰 **الاسترداد:**\n"
-        f"• عدد عمليات الاسترداد: {redemptions['redemption_count']}\n"
-        f"• قيمة المستردة: {redemptions['total_redemption_value']:,.0f} ل.س"
+        f"• عدد عمليات الاسترداد: {totals['redemptions_count']}\n"
+        f"• قيمة المستردة: {totals['redemptions_amount_syp']:,.0f} ل.س"
     )
     
     await callback.message.edit_text(text)
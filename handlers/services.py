@@ -6,6 +6,7 @@ from aiogram.fsm.state import State, StatesGroup
 import config
 from config import ORDERS_GROUP, USD_TO_SYP
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+import json
 import logging
 from datetime import datetime
 from handlers.time_utils import get_damascus_time_now, format_damascus_time, DAMASCUS_TZ
@@ -13,11 +14,13 @@ from handlers.keyboards import get_main_menu_keyboard
 from database.users import is_admin_user
 from database.core import get_exchange_rate
 from database.vip import get_user_vip
-from database.points import get_points_per_order
+from database.settings import SettingsSnapshot
 from database.products import get_product_options, get_product_option
+from database.wallet import debit, refund_order, InsufficientFunds
 from utils import get_formatted_damascus_time, format_amount, is_valid_positive_number
 from api.client import get_api_client
 import uuid
+from telegram_gateway import run_in_background
 logger = logging.getLogger(__name__)
 router = Router()
 
@@ -80,6 +83,15 @@ async def back_to_main_callback(callback: types.CallbackQuery, state: FSMContext
         reply_markup=get_main_menu_keyboard(is_admin)
     )
 
+async def post_order_to_group(bot: Bot, db_pool, order_data: dict):
+    """إرسال الطلب للمجموعة ثم حفظ رقم رسالتها بتحديث قصير منفصل"""
+    group_msg_id = await send_order_to_group(bot, order_data)
+    if group_msg_id:
+        await db_pool.execute(
+            "UPDATE orders SET group_message_id = $1 WHERE id = $2",
+            group_msg_id, order_data['order_id']
+        )
+
 async def send_order_to_group(bot: Bot, order_data: dict):
     """إرسال طلب التطبيق للمجموعة مع أزرار - بتوقيت دمشق (HTML)"""
     try:
@@ -170,7 +182,7 @@ async def handle_disabled_app(callback: types.CallbackQuery):
 # ============= عرض التطبيقات داخل القسم =============
 
 @router.callback_query(F.data.startswith("cat_"))
-async def show_apps_by_category(callback: types.CallbackQuery, db_pool):
+async def show_apps_by_category(callback: types.CallbackQuery, db_pool, settings: SettingsSnapshot):
     """عرض التطبيقات في قسم معين - الأيقونة والاسم فقط"""
     cat_id = int(callback.data.split("_")[1])
     
@@ -183,11 +195,12 @@ async def show_apps_by_category(callback: types.CallbackQuery, db_pool):
             "SELECT display_name FROM categories WHERE id = $1",
             cat_id
         )
-        current_rate = await get_exchange_rate(db_pool)
-        user_vip = await get_user_vip(db_pool, callback.from_user.id)
-        discount = user_vip.get('discount_percent', 0)
-        vip_icon = user_vip.get('icon', '⚪')
-        vip_name = user_vip.get('name', 'عادي')
+    
+    current_rate = settings.usd_to_syp
+    user_vip = await get_user_vip(db_pool, callback.from_user.id)
+    discount = user_vip.get('discount_percent', 0)
+    vip_icon = user_vip.get('icon', '⚪')
+    vip_name = user_vip.get('name', 'عادي')
     
     if not apps:
         await callback.answer("لا توجد تطبيقات في هذا القسم حالياً", show_alert=True)
@@ -271,7 +284,7 @@ async def back_to_categories(callback: types.CallbackQuery, db_pool):
 # ============= بدء الطلب =============
 
 @router.callback_query(F.data.startswith("buy_"))
-async def start_order(callback: types.CallbackQuery, state: FSMContext, db_pool):
+async def start_order(callback: types.CallbackQuery, state: FSMContext, db_pool, settings: SettingsSnapshot):
     """بدء طلب شراء مع تطبيق الخصم - عرض جميع الخيارات مع تمييز المعطل"""
     parts = callback.data.split("_")
     app_id = int(parts[1])
@@ -291,11 +304,11 @@ async def start_order(callback: types.CallbackQuery, state: FSMContext, db_pool)
                 show_alert=True
             )
             return
-
-        current_rate = await get_exchange_rate(db_pool)
-        user_vip = await get_user_vip(db_pool, callback.from_user.id)
-        discount = user_vip.get('discount_percent', 0)
-        vip_level = user_vip.get('vip_level', 0)
+    
+    current_rate = settings.usd_to_syp
+    user_vip = await get_user_vip(db_pool, callback.from_user.id)
+    discount = user_vip.get('discount_percent', 0)
+    vip_level = user_vip.get('vip_level', 0)
     
     # تحويل القيم إلى float
     app_dict = dict(app)
@@ -717,11 +730,11 @@ async def back_to_options(callback: types.CallbackQuery, state: FSMContext, db_p
             "SELECT * FROM product_options WHERE product_id = $1 ORDER BY is_active DESC, sort_order, price_usd",
             app_id
         )
-        
-        current_rate = await get_exchange_rate(db_pool)
-        user_vip = await get_user_vip(db_pool, callback.from_user.id)
-        discount = user_vip.get('discount_percent', 0)
-        vip_level = user_vip.get('vip_level', 0)
+    
+    current_rate = await get_exchange_rate(db_pool)
+    user_vip = await get_user_vip(db_pool, callback.from_user.id)
+    discount = user_vip.get('discount_percent', 0)
+    vip_level = user_vip.get('vip_level', 0)
     
     if not app:
         await callback.answer("التطبيق غير موجود", show_alert=True)
@@ -926,7 +939,7 @@ async def confirm_order(message: types.Message, state: FSMContext, db_pool):
 # ============= تنفيذ الطلب =============
 
 @router.callback_query(F.data == "execute_buy")
-async def execute_order(callback: types.CallbackQuery, state: FSMContext, db_pool, bot: Bot):
+async def execute_order(callback: types.CallbackQuery, state: FSMContext, db_pool, bot: Bot, settings: SettingsSnapshot):
     """تنفيذ الطلب (لجميع الأنواع) مع تطبيق الخصم"""
     data = await state.get_data()
     
@@ -935,98 +948,88 @@ async def execute_order(callback: types.CallbackQuery, state: FSMContext, db_poo
         await state.clear()
         return
     
-    points = await get_points_per_order(db_pool)
+    points = settings.points_per_order
     discount = data.get('discount', 0)
     vip_level = data.get('vip_level', 0)
     total_syp = float(data['total_syp'])
     
-    async with db_pool.acquire() as conn:
-        async with conn.transaction():
-            current_balance = await conn.fetchval(
-                "SELECT balance FROM users WHERE user_id = $1",
-                callback.from_user.id
-            )
-            
-            if current_balance < total_syp:
-                await callback.answer("❌ رصيد غير كافي", show_alert=True)
-                await state.clear()
-                return
-            
-            await conn.execute(
-                "UPDATE users SET balance = balance - $1, total_orders = total_orders + 1 WHERE user_id = $2",
-                total_syp, callback.from_user.id
-            )
-            
-            if 'variant' in data:
-                variant = data['variant']
-                order_id = await conn.fetchval('''
-                    INSERT INTO orders 
-                    (user_id, username, app_id, app_name, variant_id, variant_name, 
-                     quantity, duration_days, unit_price_usd, total_amount_syp, target_id, status, points_earned)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, 'pending', $12)
-                    RETURNING id
-                ''',
-                callback.from_user.id,
-                callback.from_user.username,
-                data['app']['id'],
-                data['app']['name'],
-                variant['id'],
-                variant['name'],
-                int(variant.get('quantity', 1) or 1),
-                int(variant.get('duration_days', 0) or 0),
-                float(data.get('final_price_usd', 0)),
-                total_syp,
-                data['target_id'],
-                points
-                )
+    try:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                if 'variant' in data:
+                    variant = data['variant']
+                    order_id = await conn.fetchval('''
+                        INSERT INTO orders 
+                        (user_id, username, app_id, app_name, variant_id, variant_name, 
+                         quantity, duration_days, unit_price_usd, total_amount_syp, target_id, status, points_earned)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, 'pending', $12)
+                        RETURNING id
+                    ''',
+                    callback.from_user.id,
+                    callback.from_user.username,
+                    data['app']['id'],
+                    data['app']['name'],
+                    variant['id'],
+                    variant['name'],
+                    int(variant.get('quantity', 1) or 1),
+                    int(variant.get('duration_days', 0) or 0),
+                    float(data.get('final_price_usd', 0)),
+                    total_syp,
+                    data['target_id'],
+                    points
+                    )
                 
-                order_data = {
-                    'order_id': order_id,
-                    'user_id': callback.from_user.id,
-                    'username': callback.from_user.username or 'غير معروف',
-                    'app_name': data['app']['name'],
-                    'variant_name': variant['name'],
-                    'quantity': int(variant.get('quantity', 1) or 1),
-                    'total_syp': total_syp,
-                    'target_id': data['target_id'],
-                }
-            else:
-                # للتوافق مع الخدمات القديمة
-                order_id = await conn.fetchval('''
-                    INSERT INTO orders 
-                    (user_id, username, app_id, app_name, quantity, unit_price_usd, 
-                     total_amount_syp, target_id, status, points_earned)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'pending', $9)
-                    RETURNING id
-                ''',
-                callback.from_user.id,
-                callback.from_user.username,
-                data['app']['id'],
-                data['app']['name'],
-                data['qty'],
-                data.get('discounted_unit_price_usd', 0),
-                total_syp,
-                data['target_id'],
-                points
-                )
+                    order_data = {
+                        'order_id': order_id,
+                        'user_id': callback.from_user.id,
+                        'username': callback.from_user.username or 'غير معروف',
+                        'app_name': data['app']['name'],
+                        'variant_name': variant['name'],
+                        'quantity': int(variant.get('quantity', 1) or 1),
+                        'total_syp': total_syp,
+                        'target_id': data['target_id'],
+                    }
+                else:
+                    # للتوافق مع الخدمات القديمة
+                    order_id = await conn.fetchval('''
+                        INSERT INTO orders 
+                        (user_id, username, app_id, app_name, quantity, unit_price_usd, 
+                         total_amount_syp, target_id, status, points_earned)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'pending', $9)
+                        RETURNING id
+                    ''',
+                    callback.from_user.id,
+                    callback.from_user.username,
+                    data['app']['id'],
+                    data['app']['name'],
+                    data['qty'],
+                    data.get('discounted_unit_price_usd', 0),
+                    total_syp,
+                    data['target_id'],
+                    points
+                    )
                 
-                order_data = {
-                    'order_id': order_id,
-                    'user_id': callback.from_user.id,
-                    'username': callback.from_user.username or 'غير معروف',
-                    'app_name': data['app']['name'],
-                    'quantity': data['qty'],
-                    'total_syp': total_syp,
-                    'target_id': data['target_id'],
-                }
-            
-            group_msg_id = await send_order_to_group(bot, order_data)
+                    order_data = {
+                        'order_id': order_id,
+                        'user_id': callback.from_user.id,
+                        'username': callback.from_user.username or 'غير معروف',
+                        'app_name': data['app']['name'],
+                        'quantity': data['qty'],
+                        'total_syp': total_syp,
+                        'target_id': data['target_id'],
+                    }
             
-            if group_msg_id:
-                await conn.execute(
-                    "UPDATE orders SET group_message_id = $1 WHERE id = $2",
-                    group_msg_id, order_id
-                )
+                # خصم مشروط في استعلام واحد مع قيد في السجل (نقرتان متزامنتان لا تخصمان
+                # مرتين من نفس الرصيد)؛ عند عدم كفاية الرصيد تُلغى المعاملة مع الطلب
+                await debit(conn, callback.from_user.id, total_syp, ref_id=order_id, count_order=True)
+    except InsufficientFunds:
+        await callback.answer("❌ رصيد غير كافي", show_alert=True)
+        await state.clear()
+        return
+    
+    # الإرسال للمجموعة بعد إتمام المعاملة: حد المجموعة (20/دقيقة) وانتظار retry_after
+    # لا يبقيان قفل صف المستخدم واتصال المجمع محجوزين
+    run_in_background(post_order_to_group(bot, db_pool, order_data), name=f"order_group_{order_id}")
     
     if discount > 0:
         saved_amount = data.get('original_total_syp', total_syp) - total_syp
@@ -1148,30 +1151,21 @@ async def send_order_to_mousa_api(order_id: int, db_pool, bot: Bot) -> bool:
             logger.info(f"✅ تم إرسال الطلب {order_id} إلى Mousa Card API بنجاح")
             return True
         else:
-            # فشل الإرسال
-            await conn.execute('''
-                UPDATE orders 
-                SET status = 'failed',
-                    admin_notes = $1,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = $2
-            ''', f"فشل الإرسال إلى Mousa Card API: {result.get('error')}", order_id)
-            
-            # إشعار المستخدم
-            await bot.send_message(
-                order['user_id'],
-                f"❌ **عذراً، تعذر تنفيذ طلبك #{order_id}**\n\n"
-                f"🔸 **السبب:** {result.get('error', 'خطأ في الاتصال بالموقع')}\n\n"
-                f"💰 **تم إعادة المبلغ إلى رصيدك.**\n"
-                f"📞 للاستفسار، تواصل مع الدعم.",
-                parse_mode="Markdown"
+            # فشل الإرسال: إغلاق الطلب وإرجاع المبلغ في استعلام واحد (قبل إشعار المستخدم)
+            refunded = await refund_order(
+                conn, order_id, 'failed', f"فشل الإرسال إلى Mousa Card API: {result.get('error')}"
             )
             
-            # إعادة الرصيد
-            await conn.execute(
-                "UPDATE users SET balance = balance + $1 WHERE user_id = $2",
-                order['total_amount_syp'], order['user_id']
-            )
+            if refunded:
+                # إشعار المستخدم
+                await bot.send_message(
+                    order['user_id'],
+                    f"❌ **عذراً، تعذر تنفيذ طلبك #{order_id}**\n\n"
+                    f"🔸 **السبب:** {result.get('error', 'خطأ في الاتصال بالموقع')}\n\n"
+                    f"💰 **تم إعادة المبلغ إلى رصيدك.**\n"
+                    f"📞 للاستفسار، تواصل مع الدعم.",
+                    parse_mode="Markdown"
+                )
             
             logger.error(f"❌ فشل إرسال الطلب {order_id} إلى Mousa Card API: {result.get('error')}")
             return False
@@ -7,8 +7,6 @@ from config import ADMIN_ID, MODERATORS
 import logging
 from datetime import datetime
 import pytz
-import random
-import string
 from handlers.time_utils import format_damascus_time, get_damascus_time_now
 from handlers.keyboards import get_main_menu_keyboard, get_back_inline_keyboard
 from utils import is_admin
@@ -16,10 +14,14 @@ from .profile_handlers import router as profile_router
 from database.points import get_redemption_rate, create_redemption_request
 from database.core import get_exchange_rate
 from database.vip import get_next_vip_level
-from database.referrals import generate_referral_code
+from database.referrals import (
+    generate_referral_code, record_referral, get_referrer_of, encode_referral_code, find_user_by_referral_code
+)
 from database.users import is_admin_user 
+from database.subscriptions import get_cached_membership, remember_membership, save_membership
 from aiogram.fsm.state import State, StatesGroup
 from cache import cached, clear_cache  # ✅ استيراد الكاش
+from telegram_gateway import fan_out, run_in_background
 
 class ReferralStates(StatesGroup):
     waiting_subscription = State()
@@ -28,6 +30,40 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = Router()
+
+# قناة البوت (الاشتراك فيها شرط لاستخدام البوت)
+CHANNEL_USERNAME = "@LINKcharger22"
+
+
+async def is_channel_member(bot, db_pool, user_id, trust_negative=True):
+    """
+    التحقق من اشتراك المستخدم في القناة من الحالة المحفوظة، ثم من API عند عدم وجودها
+
+    trust_negative=False: الحالة المحفوظة "غير مشترك" لا تكفي (زر التحقق بعد الانضمام)
+    """
+    cached_status = get_cached_membership(user_id)
+    if cached_status or (cached_status is False and trust_negative):
+        return cached_status
+    try:
+        member = await bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
+    except Exception as e:
+        logger.warning(f"⚠️ خطأ في التحقق من القناة: {e}")
+        return False
+    # الذاكرة تُحدث فوراً، والحفظ في الجدول خارج مسار /start
+    is_member = remember_membership(user_id, member.status)
+    run_in_background(save_membership(db_pool, user_id, member.status), name='save_membership')
+    return is_member
+
+
+@router.chat_member()
+async def on_channel_member_update(event: types.ChatMemberUpdated, db_pool):
+    """تحديث حالة الاشتراك فور الانضمام للقناة أو مغادرتها"""
+    if (event.chat.username or '').lower() != CHANNEL_USERNAME.lstrip('@').lower():
+        return
+    user_id = event.new_chat_member.user.id
+    is_member = remember_membership(user_id, event.new_chat_member.status)
+    run_in_background(save_membership(db_pool, user_id, event.new_chat_member.status), name='save_membership')
+    logger.info(f"📢 تحديث اشتراك القناة للمستخدم {user_id}: {'مشترك' if is_member else 'غير مشترك'}")
 router.include_router(profile_router)
 
 # ✅ كاش للمستخدمين - يمنع جلب نفس المستخدم عدة مرات
@@ -45,22 +81,11 @@ async def get_cached_user_ban_status(db_pool, user_id):
         return await conn.fetchval("SELECT is_banned FROM users WHERE user_id = $1", user_id)
 
 async def notify_admins(bot, message_text, db_pool=None):
-    """إرسال إشعار لجميع المشرفين"""
-    from config import ADMIN_ID, MODERATORS
-    
-    admin_ids = set()
-    admin_ids.add(ADMIN_ID)
-    for mod_id in MODERATORS:
-        if mod_id:
-            admin_ids.add(mod_id)
-    
-    sent_count = 0
-    for admin_id in admin_ids:
-        try:
-            await bot.send_message(admin_id, message_text, parse_mode="Markdown")
-            sent_count += 1
-        except Exception as e:
-            logger.error(f"فشل إرسال إشعار للمشرف {admin_id}: {e}")
+    """إرسال إشعار لجميع المشرفين (بالتوازي)"""
+    sent_count = await fan_out(
+        [ADMIN_ID] + MODERATORS,
+        lambda admin_id: bot.send_message(admin_id, message_text, parse_mode="Markdown")
+    )
     
     logger.info(f"✅ تم إرسال إشعار لـ {sent_count} مشرف")
     return sent_count
@@ -137,14 +162,8 @@ async def cmd_start(message: types.Message, state: FSMContext, db_pool):
     total_points = 0
     is_new_user = False
     
-    # التحقق من اشتراك القناة أولاً
-    channel_username = "@LINKcharger22"
-    try:
-        member = await message.bot.get_chat_member(chat_id=channel_username, user_id=user_id)
-        is_member = member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        logger.warning(f"⚠️ خطأ في التحقق من القناة: {e}")
-        is_member = False
+    # التحقق من اشتراك القناة أولاً (من الحالة المحفوظة، وAPI فقط عند عدم وجودها)
+    is_member = await is_channel_member(message.bot, db_pool, user_id)
     
     # إذا لم يكن مشتركاً في القناة
     if not is_member:
@@ -175,26 +194,18 @@ async def cmd_start(message: types.Message, state: FSMContext, db_pool):
         return
     
     # ========== المستخدم مشترك في القناة ==========
+    try:
+        # ✅ استخدام الكاش (قبل حجز الاتصال حتى لا يُحجز اتصال ثانٍ داخله)
+        user = await get_cached_user(db_pool, user_id)
+    except Exception as e:
+        logger.error(f"خطأ في جلب المستخدم: {e}")
+        user = None
+    
     async with db_pool.acquire() as conn:
-        try:
-            # ✅ استخدام الكاش
-            user = await get_cached_user(db_pool, user_id)
-        except Exception as e:
-            logger.error(f"خطأ في جلب المستخدم: {e}")
-            user = None
-        
         # ===== إذا كان المستخدم غير موجود (مستخدم جديد) =====
         if not user:
-            # إنشاء كود إحالة فريد للمستخدم الجديد
-            new_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            while True:
-                check = await conn.fetchval(
-                    "SELECT user_id FROM users WHERE referral_code = $1",
-                    new_code
-                )
-                if not check:
-                    break
-                new_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+            # كود الإحالة حتمي من رقم المستخدم (بدون بحث عن كود حر) ويُحفظ في نفس INSERT
+            new_code = encode_referral_code(user_id)
             
             # إنشاء المستخدم في قاعدة البيانات
             try:
@@ -226,10 +237,7 @@ async def cmd_start(message: types.Message, state: FSMContext, db_pool):
                 logger.info(f"🔍 محاولة معالجة إحالة بكود: {referral_code}")
                 
                 try:
-                    referrer = await conn.fetchrow(
-                        "SELECT user_id, username, total_points FROM users WHERE referral_code = $1",
-                        referral_code
-                    )
+                    referrer = await find_user_by_referral_code(conn, referral_code, 'user_id, username, total_points')
                     
                     if referrer:
                         logger.info(f"✅ تم العثور على المُحيل: {referrer['user_id']}")
@@ -239,70 +247,36 @@ async def cmd_start(message: types.Message, state: FSMContext, db_pool):
                             logger.warning("⚠️ المستخدم يحاول إحالة نفسه!")
                             welcome_text += "\n\n⚠️ **لا يمكنك استخدام رابط الإحالة الخاص بك!**"
                         else:
-                            # التحقق من تكرار الإحالة
-                            from database.referrals import check_existing_referral
-                            exists, msg = await check_existing_referral(db_pool, referrer['user_id'], user_id)
+                            # تسجيل الإحالة في استعلام واحد (لا شيء إذا كان المستخدم محالاً مسبقاً)
+                            referral = await record_referral(conn, referrer['user_id'], user_id)
                             
-                            if exists:
+                            if referral is None:
+                                referred_by = await get_referrer_of(conn, user_id)
+                                msg = f"هذا المستخدم تمت إحالته مسبقاً بواسطة {referred_by}"
                                 logger.warning(f"⚠️ إحالة مكررة: {msg}")
                                 welcome_text += f"\n\n⚠️ **{msg}**"
                             else:
-                                # إحالة جديدة - تنفيذها
-                                await conn.execute(
-                                    "UPDATE users SET referred_by = $1 WHERE user_id = $2",
-                                    referrer['user_id'], user_id
-                                )
-                                logger.info(f"✅ تم تسجيل referred_by للمستخدم الجديد")
-                                
-                                # جلب عدد النقاط من الإعدادات
-                                points = await conn.fetchval(
-                                    "SELECT value::integer FROM bot_settings WHERE key = 'points_per_referral'"
-                                ) or 1
-                                
-                                # تحديث بيانات المُحيل (نقاط + عدد الإحالات)
-                                await conn.execute('''
-                                    UPDATE users 
-                                    SET referral_count = referral_count + 1,
-                                        total_points = total_points + $1,
-                                        referral_earnings = referral_earnings + $1
-                                    WHERE user_id = $2
-                                ''', points, referrer['user_id'])
-                                
+                                points = referral['points']
                                 logger.info(f"✅ تم إضافة {points} نقاط للمُحيل")
                                 
                                 # مسح كاش المُحيل
                                 clear_cache(f"user:{referrer['user_id']}")
                                 clear_cache(f"user_points:{referrer['user_id']}")
                                 
-                                # تسجيل في سجل النقاط
-                                try:
-                                    await conn.execute('''
-                                        INSERT INTO points_history (user_id, points, action, description, created_at)
-                                        VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
-                                    ''', referrer['user_id'], points, 'referral', f'إحالة المستخدم {user_id}')
-                                    logger.info(f"✅ تم تسجيل النقاط في سجل النقاط")
-                                except Exception as e:
-                                    logger.error(f"⚠️ فشل تسجيل النقاط في السجل: {e}")
-                                
                                 # إرسال إشعار للمُحيل
                                 try:
-                                    new_points = await conn.fetchval(
-                                        "SELECT total_points FROM users WHERE user_id = $1",
-                                        referrer['user_id']
-                                    )
                                     await message.bot.send_message(
                                         referrer['user_id'],
                                         f"🎉 **مبروك! لديك إحالة جديدة**\n\n"
                                         f"👤 المستخدم: @{username or first_name or 'مستخدم جديد'}\n"
                                         f"⭐ نقاط مكتسبة: +{points}\n"
-                                        f"💰 رصيد النقاط الحالي: {new_points}",
+                                        f"💰 رصيد النقاط الحالي: {referral['new_total']}",
                                         parse_mode="Markdown"
                                     )
                                     logger.info(f"✅ تم إرسال إشعار للمُحيل: {referrer['user_id']}")
                                 except Exception as e:
                                     logger.error(f"⚠️ فشل إرسال إشعار للمحيل: {e}")
                                 
-                                # تحديث نص الترحيب للمستخدم الجديد
                                 welcome_text += f"\n\n🎁 **تم تسجيل دخولك عن طريق رابط إحالة!** صديقك حصل على {points} نقاط إضافية."
                     
                     else:
@@ -326,58 +300,31 @@ async def cmd_start(message: types.Message, state: FSMContext, db_pool):
                 logger.info(f"🔍 مستخدم قديم يحاول استخدام كود إحالة: {referral_code}")
                 
                 try:
-                    referrer = await conn.fetchrow(
-                        "SELECT user_id, username FROM users WHERE referral_code = $1",
-                        referral_code
-                    )
+                    referrer = await find_user_by_referral_code(conn, referral_code, 'user_id, username')
                     
                     if referrer:
                         if referrer['user_id'] == user_id:
                             # إحالة النفس
                             await message.answer("⚠️ **لا يمكنك استخدام رابط الإحالة الخاص بك!**")
                         else:
-                            # التحقق إذا كان قد تمت إحالته سابقاً
-                            if user.get('referred_by'):
+                            # إحالة لمستخدم قديم (نادر) - لا شيء إذا كان قد تمت إحالته سابقاً
+                            referral = await record_referral(conn, referrer['user_id'], user_id)
+                            if referral is None:
                                 await message.answer("⚠️ **لقد تمت إحالتك مسبقاً!**")
                             else:
-                                # إحالة جديدة لمستخدم قديم (نادر)
-                                await conn.execute(
-                                    "UPDATE users SET referred_by = $1 WHERE user_id = $2",
-                                    referrer['user_id'], user_id
-                                )
-                                
-                                points = await conn.fetchval(
-                                    "SELECT value::integer FROM bot_settings WHERE key = 'points_per_referral'"
-                                ) or 1
-                                
-                                await conn.execute('''
-                                    UPDATE users 
-                                    SET referral_count = referral_count + 1,
-                                        total_points = total_points + $1,
-                                        referral_earnings = referral_earnings + $1
-                                    WHERE user_id = $2
-                                ''', points, referrer['user_id'])
+                                points = referral['points']
                                 
                                 # مسح كاش المُحيل
                                 clear_cache(f"user:{referrer['user_id']}")
                                 clear_cache(f"user_points:{referrer['user_id']}")
                                 
-                                await conn.execute('''
-                                    INSERT INTO points_history (user_id, points, action, description, created_at)
-                                    VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
-                                ''', referrer['user_id'], points, 'referral', f'إحالة المستخدم {user_id}')
-                                
                                 try:
-                                    new_points = await conn.fetchval(
-                                        "SELECT total_points FROM users WHERE user_id = $1",
-                                        referrer['user_id']
-                                    )
                                     await message.bot.send_message(
                                         referrer['user_id'],
                                         f"🎉 **مبروك! لديك إحالة جديدة** (لمستخدم قديم)\n\n"
                                         f"👤 المستخدم: @{username or first_name or 'مستخدم'}\n"
                                         f"⭐ نقاط مكتسبة: +{points}\n"
-                                        f"💰 رصيد النقاط الحالي: {new_points}",
+                                        f"💰 رصيد النقاط الحالي: {referral['new_total']}",
                                         parse_mode="Markdown"
                                     )
                                 except Exception as e:
@@ -467,14 +414,9 @@ async def check_subscription(callback: types.CallbackQuery, state: FSMContext, d
     await callback.answer()
     
     user_id = callback.from_user.id
-    channel_username = "@LINKcharger22"
     
-    try:
-        member = await callback.bot.get_chat_member(chat_id=channel_username, user_id=user_id)
-        is_member = member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        logger.error(f"⚠️ خطأ في التحقق من القناة: {e}")
-        is_member = False
+    # المستخدم ضغط بعد الانضمام: "غير مشترك" المحفوظة لا تكفي
+    is_member = await is_channel_member(callback.bot, db_pool, user_id, trust_negative=False)
     
     if is_member:
         await callback.message.delete()
@@ -509,16 +451,8 @@ async def check_subscription(callback: types.CallbackQuery, state: FSMContext, d
                 return
             
             # ===== مستخدم جديد =====
-            # إنشاء كود إحالة فريد للمستخدم الجديد
-            new_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-            while True:
-                check = await conn.fetchval(
-                    "SELECT user_id FROM users WHERE referral_code = $1",
-                    new_code
-                )
-                if not check:
-                    break
-                new_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+            # كود الإحالة حتمي من رقم المستخدم (بدون بحث عن كود حر) ويُحفظ في نفس INSERT
+            new_code = encode_referral_code(user_id)
             
             # إنشاء المستخدم في قاعدة البيانات
             try:
@@ -552,10 +486,7 @@ async def check_subscription(callback: types.CallbackQuery, state: FSMContext, d
                 logger.info(f"🔍 محاولة معالجة إحالة بكود: {referral_code}")
                 
                 try:
-                    referrer = await conn.fetchrow(
-                        "SELECT user_id, username, total_points FROM users WHERE referral_code = $1",
-                        referral_code
-                    )
+                    referrer = await find_user_by_referral_code(conn, referral_code, 'user_id, username, total_points')
                     
                     if referrer:
                         logger.info(f"✅ تم العثور على المُحيل: {referrer['user_id']}")
@@ -564,58 +495,30 @@ async def check_subscription(callback: types.CallbackQuery, state: FSMContext, d
                             logger.warning("⚠️ المستخدم يحاول إحالة نفسه!")
                             welcome_text += "\n\n⚠️ **لا يمكنك استخدام رابط الإحالة الخاص بك!**"
                         else:
-                            from database.referrals import check_existing_referral
-                            exists, msg = await check_existing_referral(db_pool, referrer['user_id'], user_id)
+                            # تسجيل الإحالة في استعلام واحد (لا شيء إذا كان المستخدم محالاً مسبقاً)
+                            referral = await record_referral(conn, referrer['user_id'], user_id)
                             
-                            if exists:
+                            if referral is None:
+                                referred_by = await get_referrer_of(conn, user_id)
+                                msg = f"هذا المستخدم تمت إحالته مسبقاً بواسطة {referred_by}"
                                 logger.warning(f"⚠️ إحالة مكررة: {msg}")
                                 welcome_text += f"\n\n⚠️ **{msg}**"
                             else:
-                                # تسجيل الإحالة
-                                await conn.execute(
-                                    "UPDATE users SET referred_by = $1 WHERE user_id = $2",
-                                    referrer['user_id'], user_id
-                                )
-                                logger.info(f"✅ تم تسجيل referred_by للمستخدم الجديد")
-                                
-                                points = await conn.fetchval(
-                                    "SELECT value::integer FROM bot_settings WHERE key = 'points_per_referral'"
-                                ) or 1
-                                
-                                await conn.execute('''
-                                    UPDATE users 
-                                    SET referral_count = referral_count + 1,
-                                        total_points = total_points + $1,
-                                        referral_earnings = referral_earnings + $1
-                                    WHERE user_id = $2
-                                ''', points, referrer['user_id'])
-                                
+                                points = referral['points']
                                 logger.info(f"✅ تم إضافة {points} نقاط للمُحيل")
                                 
                                 # مسح كاش المُحيل
                                 clear_cache(f"user:{referrer['user_id']}")
                                 clear_cache(f"user_points:{referrer['user_id']}")
                                 
+                                # إرسال إشعار للمُحيل
                                 try:
-                                    await conn.execute('''
-                                        INSERT INTO points_history (user_id, points, action, description, created_at)
-                                        VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
-                                    ''', referrer['user_id'], points, 'referral', f'إحالة المستخدم {user_id}')
-                                    logger.info(f"✅ تم تسجيل النقاط في سجل النقاط")
-                                except Exception as e:
-                                    logger.error(f"⚠️ فشل تسجيل النقاط في السجل: {e}")
-                                
-                                try:
-                                    new_points = await conn.fetchval(
-                                        "SELECT total_points FROM users WHERE user_id = $1",
-                                        referrer['user_id']
-                                    )
                                     await callback.bot.send_message(
                                         referrer['user_id'],
                                         f"🎉 **مبروك! لديك إحالة جديدة**\n\n"
                                         f"👤 المستخدم: @{callback.from_user.username or callback.from_user.first_name or 'مستخدم جديد'}\n"
                                         f"⭐ نقاط مكتسبة: +{points}\n"
-                                        f"💰 رصيد النقاط الحالي: {new_points}",
+                                        f"💰 رصيد النقاط الحالي: {referral['new_total']}",
                                         parse_mode="Markdown"
                                     )
                                     logger.info(f"✅ تم إرسال إشعار للمُحيل: {referrer['user_id']}")
@@ -0,0 +1,272 @@
+# monitoring.py
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ============= مقاييس التشغيل (صيغة Prometheus النصية) =============
+# التجميع داخل العملية فقط وبدون أقفال: كل التحديثات تحدث على حلقة asyncio
+# (خيط واحد) وكل تحديث هو عملية قاموس/قائمة واحدة لا يتخللها await.
+# العرض عبر /metrics في run_bot_webhook.py (بيانات دخول لوحة التحكم أو METRICS_TOKEN).
+
+# حدود الـ histogram الافتراضية بالثواني
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# أقصى عدد لمجموعات التسميات لكل مقياس (حماية من انفجار التسميات)
+MAX_LABEL_SETS = 500
+OVERFLOW_LABEL = '__other__'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """أساس مشترك: اسم، وصف، وأسماء التسميات"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Tuple, store: Dict) -> Tuple:
+        labels = tuple(str(v) for v in labels)
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name}: عدد التسميات {len(labels)} بدلاً من {len(self.label_names)}")
+        if labels not in store and len(store) >= MAX_LABEL_SETS:
+            return (OVERFLOW_LABEL,) * len(labels)
+        return labels
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """عداد تراكمي"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels, self._values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(tuple(str(v) for v in labels), 0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """قيمة لحظية - تُضبط يدوياً أو تُقرأ من دالة عند العرض"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+        # الدالة تعيد قيمة واحدة (بدون تسميات) أو قاموس {tuple_labels: value}
+        self._callback = callback
+
+    def set(self, value: float, *labels):
+        self._values[self._key(labels, self._values)] = value
+
+    def render(self) -> List[str]:
+        values = dict(self._values)
+        if self._callback is not None:
+            try:
+                result = self._callback()
+            except Exception as e:
+                logger.error(f"❌ خطأ في قراءة المقياس {self.name}: {e}")
+                result = None
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in k): v for k, v in result.items()})
+            elif result is not None:
+                values[()] = result
+
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """توزيع القيم على حدود ثابتة - لكل مجموعة تسميات: [عدادات الحدود..., المجموع, العدد]"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels, self._values)
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            row[index] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def count(self, *labels) -> int:
+        row = self._values.get(tuple(str(v) for v in labels))
+        return int(row[-1]) if row else 0
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, row in sorted(self._values.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets, row):
+                cumulative += hits
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            inf = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {int(row[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {int(row[-1])}")
+        return lines
+
+
+class Registry:
+    """سجل المقاييس - كل مقياس يُسجل مرة واحدة بالاسم"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# ============= السجل العام والمقاييس الأساسية =============
+registry = Registry()
+
+PROCESS_START_TIME = time.time()
+
+registry.gauge('bot_uptime_seconds', 'Seconds since the bot process started',
+               callback=lambda: round(time.time() - PROCESS_START_TIME, 3))
+
+# معالجة التحديثات (ميدل وير aiogram)
+HANDLER_LATENCY = registry.histogram(
+    'bot_handler_duration_seconds', 'Update handling latency per router and callback prefix',
+    ('event', 'router', 'prefix'))
+HANDLER_DB_QUERIES = registry.histogram(
+    'bot_handler_db_queries', 'Database round-trips per update', ('event', 'router', 'prefix'),
+    (0, 1, 2, 3, 5, 8, 13, 20, 30, 50, 100))
+HANDLER_ERRORS = registry.counter(
+    'bot_handler_errors_total', 'Unhandled exceptions raised by handlers',
+    ('event', 'router', 'prefix', 'error'))
+
+# استدعاءات Telegram Bot API
+TELEGRAM_REQUESTS = registry.counter(
+    'telegram_api_requests_total', 'Telegram Bot API calls by method and outcome',
+    ('method', 'status'))
+TELEGRAM_LATENCY = registry.histogram(
+    'telegram_api_duration_seconds', 'Telegram Bot API call latency', ('method',))
+TELEGRAM_RETRY_AFTER = registry.counter(
+    'telegram_api_retry_after_total', 'Telegram 429 (flood control) responses', ('method',))
+
+# الكاش (cache.cached)
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'In-process cache lookups by key prefix', ('prefix', 'result'))
+
+
+# ============= مجمع الاتصالات =============
+# المجمعات المسجلة بالاسم - تُقرأ قيمها لحظة العرض فقط
+_pools: Dict[str, object] = {}
+
+
+def _pool_reader(getter: Callable) -> Callable:
+    def callback():
+        return {(name,): getter(pool) for name, pool in _pools.items()}
+    return callback
+
+
+registry.gauge('db_pool_size', 'Open connections in the asyncpg pool', ('pool',),
+               callback=_pool_reader(lambda p: p.get_size()))
+registry.gauge('db_pool_idle', 'Idle connections in the asyncpg pool', ('pool',),
+               callback=_pool_reader(lambda p: p.get_idle_size()))
+registry.gauge('db_pool_in_use', 'Connections currently acquired from the asyncpg pool', ('pool',),
+               callback=_pool_reader(lambda p: p.get_size() - p.get_idle_size()))
+registry.gauge('db_pool_min_size', 'Configured minimum pool size', ('pool',),
+               callback=_pool_reader(lambda p: p.get_min_size()))
+registry.gauge('db_pool_max_size', 'Configured maximum pool size', ('pool',),
+               callback=_pool_reader(lambda p: p.get_max_size()))
+
+
+def register_pool(pool, name: str = 'main'):
+    """تسجيل مجمع اتصالات asyncpg لعرض مقاييسه (الحجم، الخامل، المستخدم، الحدود)"""
+    _pools[name] = pool
+
+
+def render_metrics() -> str:
+    """نص المقاييس بصيغة Prometheus"""
+    return registry.render()
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+__all__ = [
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'Registry',
+    'registry',
+    'HANDLER_LATENCY',
+    'HANDLER_DB_QUERIES',
+    'HANDLER_ERRORS',
+    'TELEGRAM_REQUESTS',
+    'TELEGRAM_LATENCY',
+    'TELEGRAM_RETRY_AFTER',
+    'CACHE_REQUESTS',
+    'register_pool',
+    'render_metrics',
+    'CONTENT_TYPE',
+]
@@ -1,5 +1,8 @@
 # run_bot_webhook.py
 import asyncio
+import base64
+import binascii
+import hmac
 import logging
 import os
 import sys
@@ -9,6 +12,8 @@ from typing import Optional
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.types import BotCommand
 from aiohttp import web
@@ -17,21 +22,38 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from config import (
     TOKEN, ADMIN_ID, DEBUG, LOG_LEVEL, LOG_FORMAT, LOG_FILE,
-    WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_HOST, WEBHOOK_URL,
+    WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_HOST, WEBHOOK_URL, TELEGRAM_API_URL,
+    WEBHOOK_QUEUE_ENABLED, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_QUEUE_POLICY, WEBHOOK_ENQUEUE_TIMEOUT,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE_PER_MINUTE, TELEGRAM_MAX_RETRIES,
     load_exchange_rate, load_bot_settings, load_api_settings,
-    AUTO_SYNC_SERVICES, SYNC_INTERVAL_HOURS
+    AUTO_SYNC_SERVICES, SYNC_INTERVAL_HOURS, METRICS_REFRESH_MINUTES, WALLET_SNAPSHOT_MINUTES, DASHBOARD_ASYNC,
+    SCHEDULER_LEADER_RENEW_SECONDS, SETTINGS_POLL_SECONDS, WEB_USERNAME, WEB_PASSWORD, METRICS_TOKEN
 )
-from database.connection import get_pool, init_db, DAMASCUS_TZ
+from database.connection import get_pool, init_db, connect_direct, direct_connection_pooled, DAMASCUS_TZ
+from database.settings_events import SettingsListener
+from database.settings import load_settings, get_settings, settings_listener as snapshot_listener
 from database.points import fix_points_history_table
 from database.stats import get_report_settings
 from database.admin import fix_manual_vip_for_existing_users
+from database.metrics import refresh_daily_metrics
+from database.wallet import snapshot_wallets
+from database.subscriptions import load_channel_members
+from database.query_stats import get_query_stats
 
 from handlers import start, deposit, services, reports
 from admin import router as admin_router
-from handlers.middleware import BotStatusMiddleware, refresh_bot_status_cache
+from handlers.middleware import (
+    BotStatusMiddleware, refresh_bot_status_cache, bot_status_listener,
+    MetricsMiddleware, HandlerLabelMiddleware, TelegramMetricsMiddleware, PoolBusyMiddleware,
+    SettingsMiddleware
+)
 from handlers.reports import send_daily_report
 from cache import clear_cache, get_cache_stats
+from monitoring import register_pool, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from api.client import get_api_client, close_api_client
+from webhook_queue import QueuedRequestHandler
+from telegram_gateway import SendGatewayMiddleware
+from scheduler_leader import SchedulerLeader, leader_job, run_missed_jobs, set_leader
 
 # ============= إعداد التسجيل (Logging) =============
 
@@ -53,6 +75,8 @@ bot: Optional[Bot] = None
 dp: Optional[Dispatcher] = None
 app: Optional[web.Application] = None
 runner: Optional[web.AppRunner] = None
+settings_listener: Optional[SettingsListener] = None
+scheduler_leader: Optional[SchedulerLeader] = None
 start_time = time.time()
 
 # ============= معالجة إشارات الإيقاف =============
@@ -101,6 +125,7 @@ async def init_database():
         if not db_pool:
             logger.error("❌ فشل إنشاء مجمع الاتصالات")
             return False
+        register_pool(db_pool)
 
         # ✅ التحقق من الاتصال
         async with db_pool.acquire() as conn:
@@ -121,6 +146,12 @@ async def init_database():
         except Exception as e:
             logger.warning(f"⚠️ خطأ في إصلاح جداول النقاط: {e}")
         
+        # ✅ تحميل نسخة الإعدادات (سعر الصرف، النقاط، أرقام سيرياتل...) باستعلام واحد
+        await load_settings(db_pool)
+        
+        # ✅ تحميل حالة الاشتراك في القناة (حتى لا يبدأ /start بـ get_chat_member بعد إعادة التشغيل)
+        await load_channel_members(db_pool)
+        
         # ✅ إصلاح الـ VIP اليدوي
         try:
             await fix_manual_vip_for_existing_users(db_pool)
@@ -156,15 +187,36 @@ async def init_bot():
     
     try:
         # ✅ إنشاء البوت
-        bot = Bot(token=TOKEN)
+        if TELEGRAM_API_URL:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+            bot = Bot(token=TOKEN, session=session)
+            logger.info(f"🔌 استخدام خادم Bot API: {TELEGRAM_API_URL}")
+        else:
+            bot = Bot(token=TOKEN)
+        # بوابة الإرسال أولاً (خارجية) حتى تُحسب كل محاولة في المقاييس بما فيها 429
+        bot.session.middleware(SendGatewayMiddleware(
+            global_rate=TELEGRAM_GLOBAL_RATE,
+            chat_rate=TELEGRAM_CHAT_RATE,
+            group_rate_per_minute=TELEGRAM_GROUP_RATE_PER_MINUTE,
+            max_retries=TELEGRAM_MAX_RETRIES
+        ))
+        bot.session.middleware(TelegramMetricsMiddleware())
         
         # ✅ إنشاء Dispatcher
         dp = Dispatcher()
         dp["db_pool"] = db_pool
         
-        # ✅ إضافة ميدل وير
-        dp.message.middleware(BotStatusMiddleware(db_pool))
-        dp.callback_query.middleware(BotStatusMiddleware(db_pool))
+        # ✅ إضافة ميدل وير (المقاييس أولاً حتى تشمل الأحداث التي يوقفها وضع الصيانة)
+        dp.update.outer_middleware(MetricsMiddleware())
+        dp.update.outer_middleware(SettingsMiddleware())
+        dp.message.outer_middleware(PoolBusyMiddleware())
+        dp.callback_query.outer_middleware(PoolBusyMiddleware())
+        dp.message.middleware(HandlerLabelMiddleware())
+        dp.callback_query.middleware(HandlerLabelMiddleware())
+        # نسخة واحدة للرسائل والأزرار (الحالة مشتركة وتُحدث من تنبيهات bot_settings)
+        status_middleware = BotStatusMiddleware()
+        dp.message.middleware(status_middleware)
+        dp.callback_query.middleware(status_middleware)
         
         # ✅ تسجيل الهاندلرز
         dp.include_routers(
@@ -185,8 +237,12 @@ async def init_bot():
         return False
 
 async def init_scheduler():
-    """تهيئة جدولة التقرير اليومي والمزامنة التلقائية"""
-    global scheduler
+    """
+    تهيئة جدولة التقرير اليومي والمزامنة التلقائية
+    
+    كل نسخة من البوت تجدول نفس المهام، والتنفيذ فقط في قائد الجدولة (scheduler_leader.py)
+    """
+    global scheduler, scheduler_leader
     
     try:
         if scheduler and scheduler.running:
@@ -200,7 +256,7 @@ async def init_scheduler():
         
         # ✅ جدولة التقرير اليومي
         scheduler.add_job(
-            send_daily_report,
+            leader_job('daily_report', send_daily_report, db_pool),
             'cron',
             hour=hour,
             minute=minute,
@@ -210,6 +266,30 @@ async def init_scheduler():
             misfire_grace_time=3600
         )
         
+        # ✅ تحديث جدول الإحصائيات اليومية تدريجياً (أول تشغيل يبني كل الأيام السابقة)
+        scheduler.add_job(
+            leader_job('refresh_daily_metrics', refresh_daily_metrics, db_pool),
+            'interval',
+            minutes=METRICS_REFRESH_MINUTES,
+            args=[db_pool],
+            kwargs={'raise_errors': True},
+            id='refresh_daily_metrics',
+            replace_existing=True,
+            next_run_time=datetime.now(DAMASCUS_TZ),
+            misfire_grace_time=3600
+        )
+        
+        # ✅ لقطات الأرصدة من سجل الحركات (نقاط مرجعية للمراجعة)
+        scheduler.add_job(
+            leader_job('snapshot_wallets', snapshot_wallets, db_pool),
+            'interval',
+            minutes=WALLET_SNAPSHOT_MINUTES,
+            args=[db_pool],
+            id='snapshot_wallets',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+        
         # ✅ جدولة مزامنة خدمات API التلقائية (إذا كانت مفعلة)
         if AUTO_SYNC_SERVICES:
             from api.client import get_api_client
@@ -221,10 +301,7 @@ async def init_scheduler():
                 try:
                     api = get_api_client()
                     # جلب نسبة الربح الافتراضية من قاعدة البيانات
-                    async with db_pool.acquire() as conn:
-                        default_profit = await conn.fetchval(
-                            "SELECT value::int FROM bot_settings WHERE key = 'api_default_profit'"
-                        ) or DEFAULT_API_PROFIT
+                    default_profit = (await get_settings(db_pool)).api_default_profit or DEFAULT_API_PROFIT
                     
                     synced_count = await api.sync_services_to_db(db_pool, default_profit)
                     if synced_count > 0:
@@ -236,7 +313,7 @@ async def init_scheduler():
             
             # جدولة المزامنة كل X ساعات
             scheduler.add_job(
-                auto_sync_services,
+                leader_job('auto_sync_services', auto_sync_services, db_pool),
                 'interval',
                 hours=SYNC_INTERVAL_HOURS,
                 id='auto_sync_services',
@@ -246,7 +323,21 @@ async def init_scheduler():
             logger.info(f"✅ تم تفعيل المزامنة التلقائية للخدمات (كل {SYNC_INTERVAL_HOURS} ساعات)")
         
         scheduler.start()
+        
+        # ✅ انتخاب قائد الجدولة (القائد الجديد ينفذ المواعيد الفائتة ضمن misfire_grace_time)
+        if scheduler_leader is None:
+            scheduler_leader = SchedulerLeader(
+                connect_direct, renew_seconds=SCHEDULER_LEADER_RENEW_SECONDS,
+                pooled=direct_connection_pooled()
+            )
+            set_leader(scheduler_leader)
+            scheduler_leader.start()
+        scheduler_leader.on_elected(lambda: run_missed_jobs(scheduler, db_pool))
+        if scheduler_leader.is_leader:
+            await run_missed_jobs(scheduler, db_pool)
+        
         logger.info(f"✅ تم تفعيل التقرير اليومي (الساعة {report_time})")
+        logger.info(f"📊 تحديث الإحصائيات اليومية كل {METRICS_REFRESH_MINUTES} دقائق")
         return True
     except Exception as e:
         logger.error(f"❌ خطأ في تهيئة الجدولة: {e}")
@@ -285,11 +376,23 @@ async def create_web_app(base_url: str) -> web.Application:
     
     app = web.Application()
     
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-        **{"db_pool": db_pool}
-    )
+    if WEBHOOK_QUEUE_ENABLED:
+        # ✅ رد فوري على تيليجرام ومعالجة مرتبة لكل مستخدم بعدد عمال محدود
+        webhook_requests_handler = QueuedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=WEBHOOK_WORKERS,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+            policy=WEBHOOK_QUEUE_POLICY,
+            enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT,
+            **{"db_pool": db_pool}
+        )
+    else:
+        webhook_requests_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            **{"db_pool": db_pool}
+        )
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
     
@@ -315,6 +418,7 @@ async def create_web_app(base_url: str) -> web.Application:
                 "hit_rate": cache_stats.get('hit_rate', '0%')
             },
             "bot": "running",
+            "updates_queue": webhook_requests_handler.stats() if WEBHOOK_QUEUE_ENABLED else None,
             "api": {
                 "status": api_status,
                 "balance": api_balance
@@ -322,6 +426,34 @@ async def create_web_app(base_url: str) -> web.Application:
         })
     app.router.add_get('/health', health)
     
+    def unauthorized():
+        return web.Response(
+            status=401, text="Unauthorized",
+            headers={'WWW-Authenticate': 'Basic realm="bot-metrics"'}
+        )
+    
+    async def metrics(request):
+        # المجمع والطابور وبادئات المعالجات - محمية مثل /metrics/queries
+        if not metrics_credentials_ok(request):
+            return unauthorized()
+        return web.Response(
+            body=render_metrics().encode('utf-8'),
+            headers={'Content-Type': METRICS_CONTENT_TYPE}
+        )
+    app.router.add_get('/metrics', metrics)
+    
+    async def query_stats(request):
+        # ?limit=20&sort=total|count|mean|p99|rows
+        # بصمات SQL وأسماء الدوال المستدعية - محمية ببيانات دخول لوحة التحكم (HTTP Basic)
+        if not metrics_credentials_ok(request):
+            return unauthorized()
+        try:
+            limit = min(int(request.query.get('limit', 20)), 200)
+        except ValueError:
+            limit = 20
+        return web.json_response(get_query_stats(limit, request.query.get('sort', 'total')))
+    app.router.add_get('/metrics/queries', query_stats)
+    
     async def info(request):
         return web.json_response({
             "name": "LINK Charger Bot",
@@ -356,11 +488,39 @@ async def create_web_app(base_url: str) -> web.Application:
             """,
             content_type="text/html"
         )
-    app.router.add_get('/', index)
+    
+    # صفحة الحالة متاحة دائماً على /status (قبل مسار لوحة التحكم الاحتياطي الذي يلتقط كل المسارات)
+    app.router.add_get('/status', index)
+    
+    if DASHBOARD_ASYNC:
+        # ✅ لوحة التحكم في نفس العملية وعلى نفس مجمع الاتصالات (/ للوحة، وصفحة الحالة على /status)
+        from dashboard_async import setup_async_dashboard
+        setup_async_dashboard(app, db_pool)
+    else:
+        app.router.add_get('/', index)
     
     logger.info(f"✅ تم إنشاء تطبيق الويب على {base_url}")
     return app
 
+def dashboard_credentials_ok(request) -> bool:
+    """التحقق من ترويسة Authorization: Basic مقابل WEB_USERNAME / WEB_PASSWORD"""
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Basic '):
+        return False
+    try:
+        username, _, password = base64.b64decode(header[6:]).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return False
+    return (hmac.compare_digest(username.encode(), WEB_USERNAME.encode())
+            and hmac.compare_digest(password.encode(), WEB_PASSWORD.encode()))
+
+def metrics_credentials_ok(request) -> bool:
+    """بيانات دخول لوحة التحكم، أو Authorization: Bearer METRICS_TOKEN إذا كان محدداً"""
+    header = request.headers.get('Authorization', '')
+    if METRICS_TOKEN and header.startswith('Bearer '):
+        return hmac.compare_digest(header[7:].strip().encode(), METRICS_TOKEN.encode())
+    return dashboard_credentials_ok(request)
+
 async def start_server(port: int):
     """تشغيل الخادم"""
     global runner
@@ -381,10 +541,18 @@ async def shutdown():
         scheduler.shutdown()
         logger.info("✅ تم إيقاف الجدولة")
     
+    if scheduler_leader:
+        # تحرير قفل القيادة فوراً لنسخة أخرى
+        await scheduler_leader.stop()
+    
     if runner:
         await runner.cleanup()
         logger.info("✅ تم إيقاف خادم الويب")
     
+    if settings_listener:
+        await settings_listener.stop()
+        logger.info("✅ تم إيقاف الاستماع لتغييرات الإعدادات")
+    
     if db_pool:
         await db_pool.close()
         logger.info("✅ تم إغلاق مجمع اتصالات قاعدة البيانات")
@@ -409,7 +577,7 @@ async def shutdown():
 
 async def main():
     """الدالة الرئيسية لتشغيل البوت"""
-    global start_time
+    global start_time, settings_listener
     start_time = time.time()
     
     logger.info("🚀 بدأ تشغيل البوت...")
@@ -452,8 +620,12 @@ async def main():
             logger.error("❌ فشل تهيئة البوت")
             return
         
-        # ✅ 6. تحديث كاش حالة البوت
+        # ✅ 6. تحميل حالة البوت ثم الاستماع لتغييرات bot_settings (تحديث فوري + فحص دوري احتياطي)
         await refresh_bot_status_cache(db_pool)
+        settings_listener = SettingsListener(connect_direct, db_pool, SETTINGS_POLL_SECONDS)
+        settings_listener.subscribe(bot_status_listener(db_pool))
+        settings_listener.subscribe(snapshot_listener(db_pool))
+        settings_listener.start()
         
         # ✅ 7. مسح الكاش
         clear_cache()
@@ -486,10 +658,7 @@ async def main():
             logger.info("🔄 جاري إجراء مزامنة أولية للخدمات...")
             try:
                 api = get_api_client()
-                async with db_pool.acquire() as conn:
-                    default_profit = await conn.fetchval(
-                        "SELECT value::int FROM bot_settings WHERE key = 'api_default_profit'"
-                    ) or DEFAULT_API_PROFIT
+                default_profit = (await get_settings(db_pool)).api_default_profit or DEFAULT_API_PROFIT
                 await api.sync_services_to_db(db_pool, default_profit)
                 logger.info("✅ تمت المزامنة الأولية للخدمات")
             except Exception as e:
@@ -8,6 +8,8 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from config import DB_CONFIG, WEB_USERNAME, WEB_PASSWORD
 import config
+from database.search import build_search_sql, trgm_available_sync, SEARCH_KINDS
+from database.listing import build_list_sql, split_page, default_status, LIST_PAGE_SIZE
 from functools import wraps
 import urllib.parse
 import random
@@ -116,6 +118,32 @@ def log_admin_action(user_id, action, details):
     except Exception as e:
         logger.error(f"Failed to log admin action: {e}")
 
+def apply_wallet_change(cur, user_id, delta, reason, ref_id=None, extra_set='', extra_params=None, claim=None):
+    """
+    تعديل الرصيد مع قيد في wallet_ledger في نفس الاستعلام - يعيد الرصيد الجديد (أو None)
+
+    claim: UPDATE ... WHERE status = 'pending' RETURNING id لانتقال حالة الطلب، يُنفذ في
+    نفس الاستعلام ولا يتغير الرصيد إلا إذا أعاد صفاً. الضغط المكرر أو التزامن مع البوت
+    ينتظر قفل الصف ثم لا يجد الطلب pending، فيعيد None بدون إضافة المبلغ مرتين.
+    """
+    params = {'delta': delta, 'user_id': user_id, 'reason': reason, 'ref_id': ref_id}
+    params.update(extra_params or {})
+    claimed = f"claimed AS ({claim}), " if claim else ''
+    guard = ' AND EXISTS (SELECT 1 FROM claimed)' if claim else ''
+    cur.execute(f"""
+        WITH {claimed}changed AS (
+            UPDATE users SET balance = balance + %(delta)s{extra_set}
+            WHERE user_id = %(user_id)s{guard}
+            RETURNING user_id, balance
+        ), logged AS (
+            INSERT INTO wallet_ledger (user_id, delta, reason, ref_id, balance_after)
+            SELECT user_id, %(delta)s, %(reason)s, %(ref_id)s, balance FROM changed
+        )
+        SELECT balance FROM changed
+    """, params)
+    row = cur.fetchone()
+    return row['balance'] if row else None
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """صفحة تسجيل الدخول"""
@@ -304,6 +332,49 @@ def update_rate():
     
     return redirect(request.referrer or url_for('index'))
 
+# ============= تقسيم الصفحات بالمؤشر (keyset) =============
+
+def query_list_page(cur, kind, cursor=None):
+    """صفحة من قائمة (users / deposits / orders) حسب فلاتر الرابط - يعيد (rows, next_cursor)"""
+    sql, params = build_list_sql(kind, request.args, cursor, LIST_PAGE_SIZE, style='psycopg2')
+    cur.execute(sql, params)
+    return split_page(kind, cur.fetchall(), LIST_PAGE_SIZE)
+
+# نوع القائمة -> (قالب الصفوف، اسم المتغير في القالب)
+LIST_PAGES = {
+    'users': ('partials/users_rows.html', 'users'),
+    'deposits': ('partials/deposits_rows.html', 'deposits'),
+    'orders': ('partials/orders_rows.html', 'orders'),
+}
+
+@app.route('/api/list/<kind>')
+@login_required
+def list_page_api(kind):
+    """الصفحة التالية من قائمة (للتحميل التدريجي عند التمرير)"""
+    if kind not in LIST_PAGES:
+        return jsonify({'error': 'Unknown list'}), 404
+    
+    rows_template, var_name = LIST_PAGES[kind]
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 500
+
+    cur = conn.cursor()
+    
+    try:
+        rows, next_cursor = query_list_page(cur, kind, request.args.get('cursor'))
+        return jsonify({
+            'html': render_template(rows_template, **{var_name: rows}),
+            'count': len(rows),
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        logger.error(f"Error in list_page_api ({kind}): {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
+
 # ============= إدارة المستخدمين =============
 
 @app.route('/users')
@@ -313,20 +384,14 @@ def users_management():
     conn = get_db_connection()
     if not conn:
         flash('❌ خطأ في الاتصال بقاعدة البيانات', 'danger')
-        return render_template('users.html', users=[], user_stats={})
+        return render_template('users.html', users=[], user_stats={}, next_cursor=None)
 
     cur = conn.cursor()
+    next_cursor = None
     
     try:
-        # جلب جميع المستخدمين
-        cur.execute("""
-            SELECT user_id, username, first_name, last_name, balance, is_banned, 
-                   created_at, total_deposits, total_orders, total_points, vip_level,
-                   discount_percent, referral_count
-            FROM users 
-            ORDER BY created_at DESC
-        """)
-        users = cur.fetchall()
+        # الصفحة الأولى فقط - الباقي يُحمَّل عبر /api/list/users
+        users, next_cursor = query_list_page(cur, 'users', request.args.get('cursor'))
         
         # إحصائيات المستخدمين
         cur.execute("""
@@ -349,7 +414,7 @@ def users_management():
         cur.close()
         conn.close()
     
-    return render_template('users.html', users=users, user_stats=user_stats)
+    return render_template('users.html', users=users, user_stats=user_stats, next_cursor=next_cursor)
 
 @app.route('/api/user/<int:user_id>')
 @login_required
@@ -520,7 +585,7 @@ def update_user_balance(user_id):
     cur = conn.cursor()
     
     try:
-        cur.execute("SELECT balance, username FROM users WHERE user_id = %s", (user_id,))
+        cur.execute("SELECT balance, username FROM users WHERE user_id = %s FOR UPDATE", (user_id,))
         user = cur.fetchone()
         
         if not user:
@@ -541,7 +606,7 @@ def update_user_balance(user_id):
             flash('❌ إجراء غير معروف', 'danger')
             return redirect(url_for('users_management'))
         
-        cur.execute("UPDATE users SET balance = %s WHERE user_id = %s", (new_balance, user_id))
+        apply_wallet_change(cur, user_id, new_balance - user['balance'], 'admin', session.get('user_id'))
         conn.commit()
         
         action_text = {
@@ -1594,19 +1659,23 @@ def approve_redemption(redemption_id):
             flash('❌ طلب الاسترداد غير موجود أو تمت معالجته مسبقاً', 'danger')
             return redirect(url_for('points_management'))
         
-        # تحديث رصيد المستخدم
-        cur.execute("""
-            UPDATE users 
-            SET balance = balance + %s, total_points = total_points - %s, total_points_redeemed = total_points_redeemed + %s
-            WHERE user_id = %s
-        """, (req['amount_syp'], req['points'], req['points'], req['user_id']))
+        # تحديث حالة الطلب ورصيد المستخدم في استعلام واحد (فقط إذا كان الطلب ما زال pending)
+        balance = apply_wallet_change(
+            cur, req['user_id'], req['amount_syp'], 'redemption', redemption_id,
+            extra_set=', total_points = total_points - %(points)s, total_points_redeemed = total_points_redeemed + %(points)s',
+            extra_params={'points': req['points'], 'admin_id': session.get('user_id'), 'notes': notes},
+            claim="""
+                UPDATE redemption_requests 
+                SET status = 'approved', processed_by = %(admin_id)s, processed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, admin_notes = %(notes)s
+                WHERE id = %(ref_id)s AND status = 'pending'
+                RETURNING id
+            """
+        )
         
-        # تحديث حالة الطلب
-        cur.execute("""
-            UPDATE redemption_requests 
-            SET status = 'approved', processed_by = %s, processed_at = CURRENT_TIMESTAMP, admin_notes = %s
-            WHERE id = %s
-        """, (session.get('user_id'), notes, redemption_id))
+        if balance is None:
+            conn.rollback()
+            flash('❌ طلب الاسترداد غير موجود أو تمت معالجته مسبقاً', 'danger')
+            return redirect(url_for('points_management'))
         
         # تسجيل في سجل النقاط
         cur.execute('''
@@ -1659,7 +1728,7 @@ def reject_redemption(redemption_id):
         # تحديث حالة الطلب
         cur.execute("""
             UPDATE redemption_requests 
-            SET status = 'rejected', processed_by = %s, processed_at = CURRENT_TIMESTAMP, admin_notes = %s
+            SET status = 'rejected', processed_by = %s, processed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, admin_notes = %s
             WHERE id = %s
         """, (session.get('user_id'), notes, redemption_id))
         
@@ -2011,14 +2080,21 @@ def send_broadcast():
 
 # ============= الإحصائيات =============
 
+# الفترات المتاحة في صفحة الإحصائيات (بالأيام)
+STATISTICS_RANGES = (7, 30, 90, 365)
+
 @app.route('/statistics')
 @login_required
 def statistics_page():
     """صفحة الإحصائيات"""
+    days = request.args.get('days', 7, type=int)
+    if days not in STATISTICS_RANGES:
+        days = 7
+    
     conn = get_db_connection()
     if not conn:
         flash('❌ خطأ في الاتصال بقاعدة البيانات', 'danger')
-        return render_template('statistics.html')
+        return render_template('statistics.html', days=days, range_options=STATISTICS_RANGES)
 
     cur = conn.cursor()
     
@@ -2036,29 +2112,38 @@ def statistics_page():
         """)
         users_stats = cur.fetchone()
         
-        # إحصائيات الطلبات
+        # ✅ إحصائيات الطلبات والإيداعات من جدول daily_metrics (يحدّثه البوت تدريجياً)
         cur.execute("""
             SELECT 
-                COUNT(*) as total_orders,
-                COALESCE(SUM(total_amount_syp), 0) as total_amount,
-                COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_orders,
-                COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_orders,
-                COUNT(CASE WHEN status = 'failed' THEN 1 END) as failed_orders,
-                COALESCE(SUM(points_earned), 0) as total_points_given
-            FROM orders
+                COALESCE(SUM(orders_count), 0) as total_orders,
+                COALESCE(SUM(revenue_syp), 0) as total_amount,
+                COALESCE(SUM(orders_completed), 0) as completed_orders,
+                COALESCE(SUM(orders_pending), 0) as pending_orders,
+                COALESCE(SUM(orders_failed), 0) as failed_orders,
+                COALESCE(SUM(order_points), 0) as total_points_given,
+                COALESCE(SUM(deposits_count), 0) as total_deposits,
+                COALESCE(SUM(deposits_requested_syp), 0) as deposits_amount,
+                COALESCE(SUM(deposits_approved), 0) as approved_deposits,
+                COALESCE(SUM(deposits_pending), 0) as pending_deposits
+            FROM daily_metrics
         """)
-        orders_stats = cur.fetchone()
+        totals = cur.fetchone()
+        
+        orders_stats = {
+            'total_orders': totals['total_orders'],
+            'total_amount': totals['total_amount'],
+            'completed_orders': totals['completed_orders'],
+            'pending_orders': totals['pending_orders'],
+            'failed_orders': totals['failed_orders'],
+            'total_points_given': totals['total_points_given']
+        }
         
-        # إحصائيات الإيداعات
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_deposits,
-                COALESCE(SUM(amount_syp), 0) as total_amount,
-                COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved_deposits,
-                COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_deposits
-            FROM deposit_requests
-        """)
-        deposits_stats = cur.fetchone()
+        deposits_stats = {
+            'total_deposits': totals['total_deposits'],
+            'total_amount': totals['deposits_amount'],
+            'approved_deposits': totals['approved_deposits'],
+            'pending_deposits': totals['pending_deposits']
+        }
         
         # إحصائيات النقاط
         cur.execute("""
@@ -2066,46 +2151,41 @@ def statistics_page():
                 COALESCE(SUM(total_points), 0) as total_points,
                 COALESCE(SUM(total_points_earned), 0) as total_earned,
                 COALESCE(SUM(total_points_redeemed), 0) as total_redeemed,
-                COUNT(DISTINCT user_id) as users_with_points
+                COUNT(CASE WHEN total_points > 0 THEN 1 END) as users_with_points
             FROM users
         """)
-        points_stats = cur.fetchone()
+        points_stats = dict(cur.fetchone())
         
-        # إحصائيات يومية لآخر 7 أيام
+        # إحصائيات يومية للفترة المختارة: صف واحد لكل يوم من daily_metrics
+        # (بدون ربط جداول المستخدمين والطلبات والإيداعات معاً، فلا تتضاعف الصفوف ولا تتضخم المجاميع)
         cur.execute("""
-            WITH dates AS (
-                SELECT generate_series(
-                    CURRENT_DATE - INTERVAL '6 days',
-                    CURRENT_DATE,
-                    INTERVAL '1 day'
-                )::date AS date
-            )
             SELECT 
-                d.date,
-                COUNT(DISTINCT u.user_id) as new_users,
-                COUNT(DISTINCT o.id) as orders_count,
-                COALESCE(SUM(o.total_amount_syp), 0) as orders_amount,
-                COUNT(DISTINCT dr.id) as deposits_count,
-                COALESCE(SUM(dr.amount_syp), 0) as deposits_amount
-            FROM dates d
-            LEFT JOIN users u ON DATE(u.created_at) = d.date
-            LEFT JOIN orders o ON DATE(o.created_at) = d.date
-            LEFT JOIN deposit_requests dr ON DATE(dr.created_at) = d.date AND dr.status = 'approved'
-            GROUP BY d.date
-            ORDER BY d.date
-        """)
+                d.day::date as date,
+                COALESCE(m.new_users, 0) as new_users,
+                COALESCE(m.orders_count, 0) as orders_count,
+                COALESCE(m.revenue_syp, 0) as orders_amount,
+                COALESCE(m.deposits_approved, 0) as deposits_count,
+                COALESCE(m.deposits_amount_syp, 0) as deposits_amount
+            FROM generate_series(CURRENT_DATE - %s, CURRENT_DATE, INTERVAL '1 day') AS d(day)
+            LEFT JOIN daily_metrics m ON m.day = d.day::date
+            ORDER BY d.day
+        """, (days - 1,))
         daily_stats = cur.fetchall()
         
-        # أكثر التطبيقات طلباً
+        # أكثر التطبيقات طلباً خلال الفترة
         cur.execute("""
-            SELECT a.name, COUNT(o.id) as order_count, COALESCE(SUM(o.total_amount_syp), 0) as total_amount
-            FROM orders o
-            JOIN applications a ON o.app_id = a.id
-            WHERE o.status = 'completed'
-            GROUP BY a.name
+            SELECT COALESCE(MAX(a.name), MAX(app.value->>'name'), app.key) as name,
+                   SUM((app.value->>'completed')::int) as order_count,
+                   SUM((app.value->>'amount_syp')::float) as total_amount
+            FROM daily_metrics m
+            CROSS JOIN LATERAL jsonb_each(m.orders_by_app) AS app
+            LEFT JOIN applications a ON a.id::text = app.key
+            WHERE m.day > CURRENT_DATE - %s
+            GROUP BY app.key
+            HAVING SUM((app.value->>'completed')::int) > 0
             ORDER BY order_count DESC
             LIMIT 10
-        """)
+        """, (days,))
         top_apps = cur.fetchall()
         
         # أكثر المستخدمين إنفاقاً
@@ -2134,7 +2214,9 @@ def statistics_page():
                           points_stats=points_stats,
                           daily_stats=daily_stats,
                           top_apps=top_apps,
-                          top_spenders=top_spenders)
+                          top_spenders=top_spenders,
+                          days=days,
+                          range_options=STATISTICS_RANGES)
 
 # ============= إعدادات البوت =============
 
@@ -2283,9 +2365,15 @@ def reset_bot():
     try:
         # حذف جميع البيانات
         cur.execute("DELETE FROM points_history")
+        cur.execute("DELETE FROM referrals")
+        cur.execute("DELETE FROM wallet_snapshots")
+        cur.execute("DELETE FROM wallet_ledger")
         cur.execute("DELETE FROM redemption_requests")
         cur.execute("DELETE FROM deposit_requests")
         cur.execute("DELETE FROM orders")
+        # الإحصائيات اليومية وعلامة تحديثها (يُعاد بناؤها من الصفر بعد التصفير)
+        cur.execute("DELETE FROM daily_metrics")
+        cur.execute("DELETE FROM metrics_watermarks")
         
         # الاحتفاظ بالمشرفين فقط
         admin_ids = [config.ADMIN_ID] + config.MODERATORS
@@ -2351,21 +2439,23 @@ def deposits_management():
     conn = get_db_connection()
     if not conn:
         flash('❌ خطأ في الاتصال بقاعدة البيانات', 'danger')
-        return render_template('deposits.html', deposits=[])
+        return render_template('deposits.html', deposits=[], next_cursor=None, pending_count=0)
 
     cur = conn.cursor()
+    next_cursor = None
+    pending_count = 0
     
     try:
-        cur.execute("""
-            SELECT d.*, u.username, u.first_name
-            FROM deposit_requests d
-            JOIN users u ON d.user_id = u.user_id
-            ORDER BY 
-                CASE WHEN d.status = 'pending' THEN 1 ELSE 2 END,
-                d.created_at DESC
-            LIMIT 100
-        """)
-        deposits = cur.fetchall()
+        # عدد المعلقة (فهرس status, created_at) بدلاً من ترتيب CASE لا يخدمه أي فهرس
+        cur.execute("SELECT COUNT(*) as count FROM deposit_requests WHERE status = 'pending'")
+        pending_count = cur.fetchone()['count']
+        
+        # بدون فلتر حالة تُفتح القائمة على المعلقة أولاً
+        status = default_status('deposits', request.args, pending_count)
+        if status:
+            return redirect(url_for('deposits_management', **request.args.to_dict(), status=status))
+        
+        deposits, next_cursor = query_list_page(cur, 'deposits', request.args.get('cursor'))
         
     except Exception as e:
         logger.error(f"Error in deposits_management: {e}")
@@ -2375,7 +2465,7 @@ def deposits_management():
         cur.close()
         conn.close()
     
-    return render_template('deposits.html', deposits=deposits)
+    return render_template('deposits.html', deposits=deposits, next_cursor=next_cursor, pending_count=pending_count)
 
 @app.route('/deposit/<int:deposit_id>/process', methods=['POST'])
 @login_required
@@ -2401,27 +2491,26 @@ def process_deposit(deposit_id):
             """, (deposit_id,))
             deposit = cur.fetchone()
             
-            if deposit:
-                # تحديث رصيد المستخدم
-                cur.execute("""
-                    UPDATE users 
-                    SET balance = balance + %s, total_deposits = total_deposits + %s 
-                    WHERE user_id = %s
-                """, (deposit['amount_syp'], deposit['amount_syp'], deposit['user_id']))
-                
-                # تحديث حالة الطلب
-                cur.execute("""
+            # تحديث حالة الطلب ورصيد المستخدم في استعلام واحد (فقط إذا كان الطلب ما زال pending)
+            if deposit and apply_wallet_change(
+                cur, deposit['user_id'], deposit['amount_syp'], 'deposit', deposit_id,
+                extra_set=', total_deposits = total_deposits + %(delta)s',
+                extra_params={'admin_id': session.get('user_id'), 'notes': notes},
+                claim="""
                     UPDATE deposit_requests 
-                    SET status = 'approved', processed_by = %s, processed_at = CURRENT_TIMESTAMP, admin_notes = %s
-                    WHERE id = %s
-                """, (session.get('user_id'), notes, deposit_id))
-                
+                    SET status = 'approved', processed_by = %(admin_id)s, processed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, admin_notes = %(notes)s
+                    WHERE id = %(ref_id)s AND status = 'pending'
+                    RETURNING id
+                """
+            ) is not None:
                 flash(f'✅ تمت الموافقة على طلب الشحن #{deposit_id}', 'success')
+            else:
+                flash(f'⚠️ طلب الشحن #{deposit_id} غير موجود أو تمت معالجته مسبقاً', 'warning')
         
         elif action == 'reject':
             cur.execute("""
                 UPDATE deposit_requests 
-                SET status = 'rejected', processed_by = %s, processed_at = CURRENT_TIMESTAMP, admin_notes = %s
+                SET status = 'rejected', processed_by = %s, processed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, admin_notes = %s
                 WHERE id = %s
             """, (session.get('user_id'), notes, deposit_id))
             flash(f'✅ تم رفض طلب الشحن #{deposit_id}', 'info')
@@ -2449,24 +2538,27 @@ def orders_management():
     conn = get_db_connection()
     if not conn:
         flash('❌ خطأ في الاتصال بقاعدة البيانات', 'danger')
-        return render_template('orders.html', orders=[])
+        return render_template('orders.html', orders=[], applications=[], next_cursor=None, pending_count=0)
 
     cur = conn.cursor()
+    next_cursor = None
+    pending_count = 0
+    applications = []
     
     try:
-        cur.execute("""
-            SELECT o.*, u.username, u.first_name, a.name as app_name
-            FROM orders o
-            JOIN users u ON o.user_id = u.user_id
-            JOIN applications a ON o.app_id = a.id
-            ORDER BY 
-                CASE WHEN o.status = 'pending' THEN 1 
-                     WHEN o.status = 'processing' THEN 2
-                     ELSE 3 END,
-                o.created_at DESC
-            LIMIT 100
-        """)
-        orders = cur.fetchall()
+        cur.execute("SELECT COUNT(*) as count FROM orders WHERE status IN ('pending', 'processing')")
+        pending_count = cur.fetchone()['count']
+        
+        # بدون فلتر حالة تُفتح القائمة على الطلبات بانتظار التنفيذ أولاً
+        status = default_status('orders', request.args, pending_count)
+        if status:
+            return redirect(url_for('orders_management', **request.args.to_dict(), status=status))
+        
+        orders, next_cursor = query_list_page(cur, 'orders', request.args.get('cursor'))
+        
+        # قائمة التطبيقات لفلتر التطبيق
+        cur.execute("SELECT id, name FROM applications ORDER BY name")
+        applications = cur.fetchall()
         
     except Exception as e:
         logger.error(f"Error in orders_management: {e}")
@@ -2476,7 +2568,8 @@ def orders_management():
         cur.close()
         conn.close()
     
-    return render_template('orders.html', orders=orders)
+    return render_template('orders.html', orders=orders, applications=applications,
+                           next_cursor=next_cursor, pending_count=pending_count)
 
 @app.route('/order/<int:order_id>/process', methods=['POST'])
 @login_required
@@ -2496,7 +2589,7 @@ def process_order(order_id):
         if action == 'approve':
             cur.execute("""
                 UPDATE orders 
-                SET status = 'processing', admin_notes = %s, processed_at = CURRENT_TIMESTAMP
+                SET status = 'processing', admin_notes = %s, processed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
             """, (notes, order_id))
             flash(f'✅ تمت الموافقة على الطلب #{order_id}', 'success')
@@ -2519,7 +2612,7 @@ def process_order(order_id):
             
             cur.execute("""
                 UPDATE orders 
-                SET status = 'completed', admin_notes = %s, completed_at = CURRENT_TIMESTAMP
+                SET status = 'completed', admin_notes = %s, completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
             """, (notes, order_id))
             flash(f'✅ تم تأكيد تنفيذ الطلب #{order_id}', 'success')
@@ -2533,19 +2626,20 @@ def process_order(order_id):
             """, (order_id,))
             order = cur.fetchone()
             
-            if order:
-                cur.execute("""
-                    UPDATE users 
-                    SET balance = balance + %s 
-                    WHERE user_id = %s
-                """, (order['total_amount_syp'], order['user_id']))
-            
-            cur.execute("""
-                UPDATE orders 
-                SET status = 'failed', admin_notes = %s, completed_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (notes, order_id))
-            flash(f'✅ تم إلغاء الطلب #{order_id} وإعادة الرصيد', 'info')
+            # إغلاق الطلب وإعادة الرصيد في استعلام واحد (لا شيء إذا أغلقه البوت أو ضغطة سابقة)
+            if order and apply_wallet_change(
+                cur, order['user_id'], order['total_amount_syp'], 'refund', order_id,
+                extra_params={'notes': notes},
+                claim="""
+                    UPDATE orders 
+                    SET status = 'failed', admin_notes = %(notes)s, completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %(ref_id)s AND status IN ('pending', 'processing')
+                    RETURNING id
+                """
+            ) is not None:
+                flash(f'✅ تم إلغاء الطلب #{order_id} وإعادة الرصيد', 'info')
+            else:
+                flash(f'⚠️ الطلب #{order_id} مغلق مسبقاً - لم يتم إرجاع الرصيد', 'warning')
         
         conn.commit()
         
@@ -2563,59 +2657,41 @@ def process_order(order_id):
 
 # ============= البحث =============
 
+# عدد نتائج البحث في كل صفحة لكل نوع
+SEARCH_PAGE_SIZE = 20
+
 @app.route('/search')
 @login_required
 def search():
     """صفحة البحث"""
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'all')
+    page = max(1, request.args.get('page', 1, type=int))
     
     if not query:
-        return render_template('search.html', results={}, query=query)
+        return render_template('search.html', results={}, query=query, page=page, has_more={})
     
     conn = get_db_connection()
     if not conn:
         flash('❌ خطأ في الاتصال بقاعدة البيانات', 'danger')
-        return render_template('search.html', results={}, query=query)
+        return render_template('search.html', results={}, query=query, page=page, has_more={})
 
     cur = conn.cursor()
     results = {}
+    has_more = {}
+    offset = (page - 1) * SEARCH_PAGE_SIZE
     
     try:
-        # البحث في المستخدمين
-        if search_type in ['all', 'users']:
-            cur.execute("""
-                SELECT user_id, username, first_name, last_name, balance, is_banned, created_at
-                FROM users
-                WHERE user_id::text LIKE %s 
-                   OR username ILIKE %s 
-                   OR first_name ILIKE %s
-                LIMIT 20
-            """, (f'%{query}%', f'%{query}%', f'%{query}%'))
-            results['users'] = cur.fetchall()
-        
-        # البحث في الطلبات
-        if search_type in ['all', 'orders']:
-            cur.execute("""
-                SELECT o.id, o.user_id, u.username, a.name, o.status, o.created_at
-                FROM orders o
-                JOIN users u ON o.user_id = u.user_id
-                JOIN applications a ON o.app_id = a.id
-                WHERE o.id::text LIKE %s OR o.target_id ILIKE %s
-                LIMIT 20
-            """, (f'%{query}%', f'%{query}%'))
-            results['orders'] = cur.fetchall()
-        
-        # البحث في طلبات الشحن
-        if search_type in ['all', 'deposits']:
-            cur.execute("""
-                SELECT d.id, d.user_id, u.username, d.amount_syp, d.status, d.created_at
-                FROM deposit_requests d
-                JOIN users u ON d.user_id = u.user_id
-                WHERE d.id::text LIKE %s OR d.tx_info ILIKE %s
-                LIMIT 20
-            """, (f'%{query}%', f'%{query}%'))
-            results['deposits'] = cur.fetchall()
+        # ✅ خدمة البحث المشتركة مع بوت التليجرام (فهارس pg_trgm + مسار سريع للآيدي)
+        trgm = trgm_available_sync(cur)
+        for kind in SEARCH_KINDS:
+            if search_type not in ['all', kind]:
+                continue
+            sql, params = build_search_sql(kind, query, SEARCH_PAGE_SIZE, offset, style='psycopg2', trgm=trgm)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            results[kind] = rows[:SEARCH_PAGE_SIZE]
+            has_more[kind] = len(rows) > SEARCH_PAGE_SIZE
         
     except Exception as e:
         logger.error(f"Error in search: {e}")
@@ -2624,7 +2700,7 @@ def search():
         cur.close()
         conn.close()
     
-    return render_template('search.html', results=results, query=query)
+    return render_template('search.html', results=results, query=query, page=page, has_more=has_more)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
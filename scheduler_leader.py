@@ -0,0 +1,184 @@
+# scheduler_leader.py
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Awaitable, Callable, Optional
+
+from database.connection import DAMASCUS_TZ
+from database.scheduler_runs import SCHEDULER_LOCK_KEY, record_job_run, get_last_runs
+from monitoring import registry
+
+logger = logging.getLogger(__name__)
+
+# ============= قيادة الجدولة بين عدة نسخ =============
+# كل نسخة من البوت تشغل APScheduler بنفس المهام، لكن المهمة تُنفذ فقط في النسخة
+# التي تملك قفل pg_try_advisory_lock على اتصال مستقل. القفل مرتبط بجلسة الاتصال:
+# إذا توقفت النسخة أو انقطع اتصالها يتحرر القفل تلقائياً وتأخذه نسخة أخرى في
+# الجولة التالية. التجديد يتحقق من أن الجلسة حية كل renew_seconds، ويُعاد التحقق
+# قبل تنفيذ كل مهمة.
+#
+# خلف pooler بوضع transaction لا يرتبط القفل بهذه النسخة (قد يبقى على اتصال خادم
+# تستخدمه نسخة أخرى أو لا يملكه أحد)، فتكون النتيجة بلا قائد أو قائدين. لذلك
+# إذا كان connect يمر عبر pooler لا يوجد انتخاب: كل نسخة تعتبر نفسها القائد وتنفذ
+# المهام محلياً (الإعداد المعتاد نسخة واحدة) مع تحذير - لعدة نسخ حدد DB_LISTEN_URL مباشراً.
+#
+# بعد الفوز بالقيادة تُراجع سجلات scheduler_runs: موعد cron فات (النسخة السابقة
+# توقفت أو كان البوت مطفأ) وما زال ضمن misfire_grace_time يُنفذ الآن مرة واحدة.
+
+JOB_RUNS = registry.counter(
+    'scheduler_job_runs_total', 'Scheduled job executions by result', ('job', 'result'))
+JOB_DURATION = registry.histogram(
+    'scheduler_job_duration_seconds', 'Scheduled job execution time', ('job',))
+
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SchedulerLeader:
+    """انتخاب قائد الجدولة عبر pg_try_advisory_lock مع تجديد دوري"""
+
+    def __init__(self, connect: Callable[[], Awaitable], renew_seconds: float = 15,
+                 lock_key: int = SCHEDULER_LOCK_KEY, pooled: bool = False):
+        self._connect = connect
+        self.renew_seconds = renew_seconds
+        self.lock_key = lock_key
+        self.pooled = pooled
+        self._conn = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Optional[Callable[[], Awaitable]] = None
+        self.is_leader = False
+
+    def on_elected(self, callback: Callable[[], Awaitable]):
+        """استدعاء callback() في كل مرة تصبح فيها هذه النسخة القائد"""
+        self._on_elected = callback
+
+    async def _drop(self):
+        self.is_leader = False
+        if self._conn is not None and not self._conn.is_closed():
+            self._conn.terminate()
+        self._conn = None
+
+    async def _try_acquire(self) -> bool:
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await self._connect()
+        return bool(await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key, timeout=5))
+
+    async def check(self) -> bool:
+        """التحقق من أن جلسة القفل ما زالت حية (يُستدعى قبل تنفيذ كل مهمة)"""
+        if not self.is_leader:
+            return False
+        if self.pooled:
+            return True
+        try:
+            await self._conn.fetchval("SELECT 1", timeout=5)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ فقدان قيادة الجدولة: {e}")
+            await self._drop()
+            return False
+
+    async def _run(self):
+        while True:
+            try:
+                if self.is_leader:
+                    await self.check()
+                elif await self._try_acquire():
+                    self.is_leader = True
+                    logger.info(f"👑 هذه النسخة ({RUNNER_ID}) هي قائد الجدولة")
+                    if self._on_elected:
+                        await self._on_elected()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ خطأ في انتخاب قائد الجدولة: {e}")
+                await self._drop()
+            await asyncio.sleep(self.renew_seconds)
+
+    def start(self):
+        if self.pooled:
+            self.is_leader = True
+            logger.warning(
+                "⚠️ اتصال قفل الجدولة يمر عبر pooler - لا يمكن انتخاب قائد، ستُنفذ هذه النسخة المهام المجدولة محلياً. "
+                "مع أكثر من نسخة حدد DB_LISTEN_URL باتصال مباشر بـ Postgres حتى لا تتكرر المهام"
+            )
+            return
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name='scheduler_leader')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # إغلاق الجلسة يحرر القفل فوراً لنسخة أخرى
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+        self.is_leader = False
+
+
+_leader: Optional[SchedulerLeader] = None
+
+registry.gauge('scheduler_is_leader', 'Whether this replica runs scheduled jobs',
+               callback=lambda: 1 if _leader is not None and _leader.is_leader else 0)
+
+
+def set_leader(leader: Optional[SchedulerLeader]):
+    """تحديد قائد الجدولة الذي تتحقق منه المهام المغلفة بـ leader_job"""
+    global _leader
+    _leader = leader
+
+
+def leader_job(job_id: str, func: Callable[..., Awaitable], db_pool):
+    """
+    تغليف مهمة مجدولة: تُنفذ في القائد فقط، ويُسجل زمنها ونتيجتها في المقاييس و scheduler_runs
+
+    بدون قائد معرّف (set_leader لم يُستدعَ) تُنفذ المهمة كالسابق.
+    """
+    @wraps(func)
+    async def run(*args, **kwargs):
+        if _leader is not None and not await _leader.check():
+            JOB_RUNS.inc(job_id, 'skipped')
+            return
+        started_at = datetime.now(DAMASCUS_TZ).replace(tzinfo=None)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"❌ فشل تنفيذ المهمة {job_id}: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            JOB_RUNS.inc(job_id, 'failed' if error else 'ok')
+            JOB_DURATION.observe(elapsed, job_id)
+            await record_job_run(db_pool, job_id, started_at, int(elapsed * 1000), error, RUNNER_ID)
+    return run
+
+
+async def run_missed_jobs(scheduler, db_pool) -> int:
+    """تنفيذ المواعيد التي فاتت منذ آخر تشغيل مسجل وما زالت ضمن misfire_grace_time"""
+    last_runs = await get_last_runs(db_pool)
+    now = datetime.now(DAMASCUS_TZ)
+    missed = 0
+    for job in scheduler.get_jobs():
+        last_run = last_runs.get(job.id)
+        if last_run is None:
+            continue
+        # أول موعد بعد آخر تشغيل (+ ثانية حتى لا يُعد موعد التشغيل نفسه فائتاً)
+        due = job.trigger.get_next_fire_time(None, DAMASCUS_TZ.localize(last_run) + timedelta(seconds=1))
+        grace = job.misfire_grace_time
+        if due is None or due > now or (grace is not None and (now - due).total_seconds() > grace):
+            continue
+        if job.next_run_time is not None and job.next_run_time <= now:
+            continue
+        logger.info(f"⏰ تنفيذ موعد فائت للمهمة {job.id} (كان مقرراً {due:%Y-%m-%d %H:%M})")
+        job.modify(next_run_time=now)
+        missed += 1
+    return missed
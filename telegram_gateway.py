@@ -0,0 +1,299 @@
+# telegram_gateway.py
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from monitoring import registry
+
+logger = logging.getLogger(__name__)
+
+# ============= بوابة الإرسال إلى تيليجرام =============
+# ميدل وير على جلسة البوت، فكل استدعاء إرسال أو تعديل من أي مكان (إشعارات،
+# مجموعات، بث، تقارير) يمر من نفس الحدود بدلاً من أن يتسابق كل مكان وحده:
+# - دلو رموز عام (~30 رسالة/ثانية) ودلو لكل محادثة خاصة (~1/ثانية) ولكل مجموعة (~20/دقيقة)
+# - أولويات: الردود على المستخدمين قبل الإشعارات، والإشعارات قبل البث. الأولوية
+#   الأقل لا تستهلك الدلو العام تحت نسبة محجوزة للأعلى منها
+# - عند 429 تُوقف المحادثة (أو الكل) لمدة retry_after ثم يُعاد الطلب تلقائياً
+# - تعديلات متتالية لنفس الرسالة وهي تنتظر دورها تُدمج في آخر تعديل فقط
+
+PRIORITIES = ('interactive', 'notify', 'bulk')
+
+# نسبة الدلو العام المحجوزة لما هو أعلى من كل أولوية
+_RESERVE = {'interactive': 0.0, 'notify': 0.2, 'bulk': 0.5}
+
+# الطرق التي تخضع للحدود (إرسال/تعديل رسائل في محادثة)
+_LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+# التعديلات التي يمكن دمجها (الأحدث يلغي الأقدم)
+_COALESCED_METHODS = frozenset({'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'})
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar('telegram_send_priority', default='interactive')
+
+GATEWAY_WAIT = registry.histogram(
+    'telegram_gateway_wait_seconds', 'Time a Bot API call waited for rate-limit tokens', ('priority',))
+GATEWAY_COALESCED = registry.counter(
+    'telegram_gateway_coalesced_total', 'Message edits replaced by a newer edit before sending', ())
+GATEWAY_RETRIES = registry.counter(
+    'telegram_gateway_retries_total', 'Bot API calls retried after retry_after', ('method',))
+
+
+@contextmanager
+def send_priority(priority: str):
+    """
+    تحديد أولوية كل ما يُرسل داخل الكتلة (ويرثها ما يُنشأ فيها من مهام)
+
+    with send_priority('bulk'):
+        await asyncio.gather(*(bot.send_message(uid, text) for uid in users))
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"أولوية غير معروفة: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """دلو رموز: rate رمز/ثانية بسعة capacity، مع إيقاف مؤقت بعد 429"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, reserve: float = 0.0) -> float:
+        """الوقت اللازم حتى يتوفر رمز فوق الحد المحجوز (0 = متاح الآن)"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        floor = self.capacity * reserve
+        if self.tokens - 1 >= floor:
+            return 0.0
+        return (floor + 1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle(self, now: float) -> bool:
+        """الدلو ممتلئ ولا يوجد إيقاف (يمكن حذفه وإعادة إنشائه لاحقاً)"""
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _PendingEdit:
+    """تعديل ينتظر دوره - من يصل بعده لنفس الرسالة وبنفس الدالة يستبدل method وينتظر النتيجة"""
+
+    __slots__ = ('method', 'waiters')
+
+    def __init__(self, method):
+        self.method = method
+        self.waiters: List[asyncio.Future] = []
+
+
+class SendGatewayMiddleware(BaseRequestMiddleware):
+    """ميدل وير جلسة البوت: حدود الإرسال والأولويات وإعادة المحاولة ودمج التعديلات"""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate_per_minute: float = 20,
+                 max_retries: int = 3, max_chat_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._edits: Dict[Tuple[Any, Any, str], _PendingEdit] = {}
+
+    # ----- الدلاء -----
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                now = time.monotonic()
+                for key in [k for k, b in self._chats.items() if b.idle(now)]:
+                    del self._chats[key]
+            # المجموعات والقنوات بمعرف سالب أو @username، المحادثات الخاصة بمعرف موجب
+            is_group = isinstance(chat_id, str) or int(chat_id) < 0
+            bucket = TokenBucket(self.group_rate, 5) if is_group else TokenBucket(self.chat_rate, 3)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id, priority: str):
+        """انتظار رمز من دلو المحادثة ثم من الدلو العام (بدون حجز أحدهما أثناء انتظار الآخر)"""
+        started = time.monotonic()
+        chat = self._chat_bucket(chat_id)
+        reserve = _RESERVE[priority]
+        while True:
+            wait = max(chat.wait_time(), self.global_bucket.wait_time(reserve))
+            if wait <= 0:
+                chat.take()
+                self.global_bucket.take()
+                break
+            await asyncio.sleep(wait)
+        GATEWAY_WAIT.observe(time.monotonic() - started, priority)
+
+    # ----- الإرسال -----
+
+    async def _send(self, make_request, bot, method, api_method: str, chat_id, priority: str,
+                    acquired: bool = False):
+        """الإرسال مع إعادة المحاولة بعد 429 (acquired: الرمز الأول محجوز مسبقاً)"""
+        attempt = 0
+        while True:
+            if not acquired:
+                await self._acquire(chat_id, priority)
+            acquired = False
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                # الحد العام أو حد المحادثة - في الحالتين توقف المحادثة، ويتوقف الكل إذا كانت المدة طويلة
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                if e.retry_after >= 5:
+                    self.global_bucket.pause(e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                GATEWAY_RETRIES.inc(api_method)
+                logger.warning(f"⏳ {api_method} للمحادثة {chat_id}: انتظار {e.retry_after} ثانية (محاولة {attempt})")
+
+    async def _send_edit(self, make_request, bot, method, api_method: str, chat_id, priority: str):
+        # الدالة جزء من المفتاح: editMessageReplyMarkup لا يستبدل editMessageText لنفس الرسالة
+        key = (chat_id, getattr(method, 'message_id', None) or getattr(method, 'inline_message_id', None), api_method)
+        pending = self._edits.get(key)
+        if pending is not None:
+            # تعديل أقدم لنفس الرسالة ما زال ينتظر: يُرسل هذا بدلاً منه
+            pending.method = method
+            GATEWAY_COALESCED.inc()
+            future = asyncio.get_running_loop().create_future()
+            pending.waiters.append(future)
+            return await future
+
+        pending = self._edits[key] = _PendingEdit(method)
+        try:
+            await self._acquire(chat_id, priority)
+        except BaseException:
+            self._edits.pop(key, None)
+            for future in pending.waiters:
+                future.cancel()
+            raise
+        # من هنا لا يُدمج شيء في هذا الطلب: ما يصل بعده ينتظر دوره كتعديل جديد
+        del self._edits[key]
+        try:
+            result = await self._send(make_request, bot, pending.method, api_method, chat_id, priority, acquired=True)
+        except BaseException as e:
+            # إلغاء الطلب الأول (إيقاف البوت أو مهلة المستدعي) يلغي المنتظرين أيضاً حتى لا يعلقوا
+            for future in pending.waiters:
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            raise
+        for future in pending.waiters:
+            if not future.done():
+                future.set_result(result)
+        return result
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, '__api_method__', type(method).__name__)
+        chat_id: Optional[Any] = getattr(method, 'chat_id', None)
+        if chat_id is None or not api_method.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+        priority = _priority.get()
+        if api_method in _COALESCED_METHODS:
+            return await self._send_edit(make_request, bot, method, api_method, chat_id, priority)
+        return await self._send(make_request, bot, method, api_method, chat_id, priority)
+
+
+# ============= الإرسال لعدة محادثات =============
+# الإشعارات والتقارير للمشرفين تُرسل بالتوازي (بحد أقصى FANOUT_CONCURRENCY)
+# بدلاً من رحلة كاملة لكل مشرف بالتسلسل، والمستند يُرفع مرة واحدة ثم يُرسل
+# للباقين بـ file_id. run_in_background يخرجها من مسار الرد على المستخدم.
+
+FANOUT_CONCURRENCY = 8
+
+_background: set = set()
+
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ فشل إرسال في الخلفية ({task.get_name()}): {task.exception()}")
+
+
+def run_in_background(coro, name: Optional[str] = None) -> asyncio.Task:
+    """تشغيل إرسال خارج مسار الطلب (مع الاحتفاظ بمرجع للمهمة وتسجيل أخطائها)"""
+    task = asyncio.get_running_loop().create_task(coro, name=name)
+    _background.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _unique(chat_ids) -> list:
+    return list(dict.fromkeys(chat_id for chat_id in chat_ids if chat_id))
+
+
+async def fan_out(chat_ids, send, priority: str = 'notify', concurrency: int = FANOUT_CONCURRENCY) -> int:
+    """
+    استدعاء send(chat_id) لكل محادثة بالتوازي
+
+    Returns:
+        int: عدد المحادثات التي نجح الإرسال إليها
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(chat_id) -> bool:
+        async with semaphore:
+            try:
+                await send(chat_id)
+                return True
+            except Exception as e:
+                logger.error(f"❌ فشل الإرسال إلى {chat_id}: {e}")
+                return False
+
+    with send_priority(priority):
+        results = await asyncio.gather(*(send_one(chat_id) for chat_id in _unique(chat_ids)))
+    return sum(results)
+
+
+async def send_document_to_many(bot, chat_ids, document, priority: str = 'notify',
+                                concurrency: int = FANOUT_CONCURRENCY, **kwargs) -> int:
+    """
+    رفع المستند مرة واحدة (لأول محادثة ينجح معها) ثم إرساله للباقين بـ file_id
+
+    Returns:
+        int: عدد المحادثات التي وصلها المستند
+    """
+    chat_ids = _unique(chat_ids)
+    for index, chat_id in enumerate(chat_ids):
+        try:
+            with send_priority(priority):
+                message = await bot.send_document(chat_id=chat_id, document=document, **kwargs)
+        except Exception as e:
+            logger.error(f"❌ فشل رفع المستند إلى {chat_id}: {e}")
+            continue
+        file_id = message.document.file_id
+        return 1 + await fan_out(
+            chat_ids[index + 1:],
+            lambda other: bot.send_document(chat_id=other, document=file_id, **kwargs),
+            priority, concurrency
+        )
+    return 0
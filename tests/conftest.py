@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import sys
+
+# config.py يتوقف بدون BOT_TOKEN - قيمة وهمية تكفي للاختبارات التي لا تتصل بتيليجرام
+os.environ.setdefault("BOT_TOKEN", "123456789:TEST-TOKEN-FOR-UNIT-TESTS-ONLY")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
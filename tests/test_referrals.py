@@ -0,0 +1,82 @@
+# tests/test_referrals.py
+import asyncio
+
+import pytest
+
+from database.referrals import (
+    CODE_ALPHABET, CODE_LENGTH, decode_referral_code, encode_referral_code, find_user_by_referral_code,
+)
+
+MAX_USER_ID = (1 << 60) - 1
+
+
+@pytest.mark.parametrize("user_id", [1, 2, 123456789, 7_000_000_000, MAX_USER_ID])
+def test_round_trip(user_id):
+    code = encode_referral_code(user_id)
+    assert len(code) == CODE_LENGTH
+    assert set(code) <= set(CODE_ALPHABET)
+    assert decode_referral_code(code) == user_id
+
+
+@pytest.mark.parametrize("user_id", [0, -1, 1 << 60])
+def test_encode_out_of_range(user_id):
+    with pytest.raises(ValueError):
+        encode_referral_code(user_id)
+
+
+def test_codes_are_distinct():
+    codes = {encode_referral_code(user_id) for user_id in range(1, 5001)}
+    assert len(codes) == 5000
+
+
+def test_decode_lowercase():
+    code = encode_referral_code(987654321)
+    assert decode_referral_code(code.lower()) == 987654321
+
+
+@pytest.mark.parametrize("code", [
+    "", None,
+    "AB12CD34",                          # كود قديم بثمانية رموز
+    "I" * CODE_LENGTH, "0000000000U0",   # رموز خارج أبجدية Crockford
+    "0" * (CODE_LENGTH + 1),
+])
+def test_decode_invalid(code):
+    assert decode_referral_code(code) is None
+
+
+class FakeDB:
+    """يسجل الاستعلامات ويعيد الصف إذا طابقت المعاملات أحد المستخدمين"""
+
+    def __init__(self, users):
+        self.users = users  # user_id -> referral_code
+        self.queries = []
+
+    async def fetchrow(self, sql, *args):
+        self.queries.append((sql, args))
+        if "user_id = $1" in sql:
+            user_id, code = args
+            return {'user_id': user_id} if self.users.get(user_id) == code else None
+        (code,) = args
+        for user_id, stored in self.users.items():
+            if stored == code:
+                return {'user_id': user_id}
+        return None
+
+
+def test_find_new_code_by_primary_key():
+    code = encode_referral_code(42)
+    db = FakeDB({42: code})
+    assert asyncio.run(find_user_by_referral_code(db, code.lower())) == {'user_id': 42}
+    assert len(db.queries) == 1
+
+
+def test_find_legacy_code_falls_back_to_unique_index():
+    db = FakeDB({7: "AB12CD34"})
+    assert asyncio.run(find_user_by_referral_code(db, "AB12CD34")) == {'user_id': 7}
+    assert len(db.queries) == 1
+
+
+def test_find_rejects_decoded_code_of_user_with_other_code():
+    # الكود يُفك إلى 42 لكن كود المستخدم 42 المحفوظ مختلف (كود قديم)
+    db = FakeDB({42: "AB12CD34"})
+    assert asyncio.run(find_user_by_referral_code(db, encode_referral_code(42))) is None
@@ -0,0 +1,171 @@
+# webhook_queue.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from monitoring import registry
+
+logger = logging.getLogger(__name__)
+
+# ============= طوابير معالجة التحديثات =============
+# الرد على تيليجرام فوراً بعد وضع التحديث في طابور، ثم معالجته في عمال ثابتين.
+# كل مستخدم يُوجَّه دائماً لنفس الطابور (from_user.id % عدد الطوابير)، فتُعالج
+# تحديثاته بالترتيب (الضغط المزدوج على زر لا يسابق نفسه)، بينما يعمل المستخدمون
+# المختلفون بالتوازي. عدد المعالجات المتزامنة محدود بعدد العمال بدلاً من مهمة
+# asyncio غير محدودة لكل تحديث.
+
+QUEUE_POLICIES = ('reject', 'drop_new', 'drop_oldest')
+
+# الحقول التي تحمل المرسل في التحديث (بترتيب الأولوية)
+_SENDER_FIELDS = (
+    'message', 'callback_query', 'edited_message', 'chat_member', 'my_chat_member',
+    'inline_query', 'chosen_inline_result', 'pre_checkout_query', 'shipping_query',
+    'chat_join_request', 'poll_answer', 'channel_post', 'edited_channel_post',
+)
+
+UPDATES = registry.counter(
+    'webhook_updates_total', 'Webhook updates by ingestion result', ('result',))
+QUEUE_WAIT = registry.histogram(
+    'webhook_queue_wait_seconds', 'Time an update waits in its queue before handling')
+
+_handlers: List['QueuedRequestHandler'] = []
+
+
+def _read(getter):
+    def callback():
+        values = {}
+        for handler in _handlers:
+            values.update(getter(handler))
+        return values
+    return callback
+
+
+registry.gauge('webhook_queue_depth', 'Updates waiting per queue', ('queue',),
+               callback=_read(lambda h: {(i,): q.qsize() for i, q in enumerate(h.queues)}))
+registry.gauge('webhook_queue_busy_workers', 'Workers currently handling an update', (),
+               callback=_read(lambda h: {(): h.busy}))
+
+
+def update_key(update: Dict[str, Any]) -> int:
+    """مفتاح التوجيه: معرف المرسل، ثم معرف المحادثة، ثم update_id"""
+    for field in _SENDER_FIELDS:
+        event = update.get(field)
+        if not isinstance(event, dict):
+            continue
+        sender = event.get('from') or event.get('user')
+        if isinstance(sender, dict) and sender.get('id') is not None:
+            return int(sender['id'])
+        chat = event.get('chat')
+        if isinstance(chat, dict) and chat.get('id') is not None:
+            return int(chat['id'])
+    return int(update.get('update_id') or 0)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    معالج webhook بطوابير مرتبة لكل مستخدم
+
+    عند امتلاء طابور المستخدم ينتظر حتى enqueue_timeout ثم يطبق السياسة:
+    - reject: رد 503 فيعيد تيليجرام إرسال التحديث لاحقاً (لا يضيع شيء)
+    - drop_new: رد 200 وإهمال التحديث الجديد
+    - drop_oldest: إهمال أقدم تحديث في الطابور وإضافة الجديد فوراً
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 16, queue_size: int = 100,
+                 policy: str = 'reject', enqueue_timeout: float = 2.0, drain_timeout: float = 10.0,
+                 secret_token: Optional[str] = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        if policy not in QUEUE_POLICIES:
+            logger.warning(f"⚠️ سياسة طابور غير معروفة: {policy} - استخدام reject")
+            policy = 'reject'
+        self.policy = policy
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self.queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in range(max(1, workers))]
+        self.busy = 0
+        self._workers: List[asyncio.Task] = []
+        self._accepting = True
+        _handlers.append(self)
+
+    def _ensure_workers(self):
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker(i, q)) for i, q in enumerate(self.queues)]
+            logger.info(f"🧵 تشغيل {len(self._workers)} عامل لطوابير التحديثات (سياسة الامتلاء: {self.policy})")
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            bot, update, enqueued = await queue.get()
+            QUEUE_WAIT.observe(time.perf_counter() - enqueued)
+            self.busy += 1
+            try:
+                await self._background_feed_update(bot=bot, update=update)
+            except Exception as e:
+                logger.error(f"❌ خطأ في معالجة التحديث {update.get('update_id')} (طابور {index}): {e}")
+            finally:
+                self.busy -= 1
+                queue.task_done()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if not self._accepting:
+            UPDATES.inc('rejected')
+            return web.Response(status=503, headers={'Retry-After': '5'})
+
+        update = await request.json(loads=bot.session.json_loads)
+        self._ensure_workers()
+        queue = self.queues[update_key(update) % len(self.queues)]
+        item = (bot, update, time.perf_counter())
+
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.policy == 'drop_oldest':
+                queue.get_nowait()
+                queue.task_done()
+                queue.put_nowait(item)
+                UPDATES.inc('dropped_oldest')
+                return web.json_response({}, dumps=bot.session.json_dumps)
+            try:
+                await asyncio.wait_for(queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ طابور التحديثات ممتلئ ({queue.maxsize}) - {self.policy}: {update.get('update_id')}")
+                if self.policy == 'drop_new':
+                    UPDATES.inc('dropped_new')
+                    return web.json_response({}, dumps=bot.session.json_dumps)
+                UPDATES.inc('rejected')
+                return web.Response(status=503, headers={'Retry-After': '1'})
+
+        UPDATES.inc('enqueued')
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def stats(self) -> Dict:
+        depths = [q.qsize() for q in self.queues]
+        return {
+            'workers': len(self.queues),
+            'busy': self.busy,
+            'queued': sum(depths),
+            'max_depth': max(depths) if depths else 0,
+            'policy': self.policy,
+        }
+
+    async def close(self) -> None:
+        """إيقاف الاستقبال، إنهاء التحديثات المنتظرة (حتى drain_timeout)، ثم إيقاف العمال"""
+        self._accepting = False
+        pending = sum(q.qsize() for q in self.queues) + self.busy
+        if pending and self._workers:
+            logger.info(f"⏳ إنهاء {pending} تحديث منتظر قبل الإيقاف...")
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ انتهت مهلة الإيقاف - تجاهل {sum(q.qsize() for q in self.queues)} تحديث")
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        if self in _handlers:
+            _handlers.remove(self)
+        await super().close()